@@ -20,16 +20,16 @@ import sys
 import gettext
 import argparse
 
+import startuptrace
+if startuptrace.enabled():
+    startuptrace.start()
+
+#only import modules which are needed by all commands here. Everything
+#else is imported by the commands to keep startup fast.
 import config
 import logger
-import snapshots
 import tools
-import sshtools
-import mount
-import password
-import encfstools
-import cli
-from exceptions import MountException
+import snapshotlog
 
 _=gettext.gettext
 
@@ -73,8 +73,12 @@ def take_snapshot( cfg, force = True ):
     Returns:
         bool:                   True if successful
     """
+    import snapshots
     tools.load_env(cfg.get_cron_env_file())
-    ret = snapshots.Snapshots( cfg ).take_snapshot( force )
+    sn = snapshots.Snapshots( cfg )
+    ret = sn.take_snapshot( force )
+    if not sn.run_profile is None:
+        print('\n'.join(sn.run_profile.hotspots()))
     return ret
 
 def _mount(cfg):
@@ -84,6 +88,8 @@ def _mount(cfg):
     Args:
         cfg (config.Config):    config that should be used
     """
+    import mount
+    from exceptions import MountException
     try:
         hash_id = mount.Mount(cfg = cfg).mount()
     except MountException as ex:
@@ -99,6 +105,8 @@ def _umount(cfg):
     Args:
         cfg (config.Config):    config that should be used
     """
+    import mount
+    from exceptions import MountException
     try:
         mount.Mount(cfg = cfg).umount(cfg.current_hash_id)
     except MountException as ex:
@@ -156,6 +164,13 @@ def create_parsers(app_name = 'backintime'):
                                  action = 'store_true',
                                  help = 'force to use checksum for checking if files have been changed.')
 
+    #define arguments which are used by backup commands
+    backupArgsParser = argparse.ArgumentParser(add_help = False)
+    backupArgsParser.add_argument('--profile-run',
+                                  action = 'store_true',
+                                  help = 'Profile the backup run. Write a report into the new '
+                                         'snapshot and print the top hotspots at the end.')
+
     #define arguments for snapshot remove
     removeArgsParser = argparse.ArgumentParser(add_help = False)
     removeArgsParser.add_argument('SNAPSHOT_ID',
@@ -169,7 +184,8 @@ def create_parsers(app_name = 'backintime'):
                                      parents = [commonArgsParser],
                                      description = '%(app)s - a simple backup tool for Linux.'
                                                    % {'app': config.Config.APP_NAME},
-                                     epilog = "For backwards compatibility commands can also be used with trailing '--'. "
+                                     epilog = "Use '--startup-trace' to print import times on exit. "
+                                              "For backwards compatibility commands can also be used with trailing '--'. "
                                               "All listed arguments will work with all commands. Some commands have extra arguments. "
                                               "Run '%(app_name)s <COMMAND> -h' to see the extra arguments."
                                               % {'app_name': app_name})
@@ -187,7 +203,7 @@ def create_parsers(app_name = 'backintime'):
     ### define commands ###
     #######################
     epilog = "Run '%(app_name)s -h' to get help for additional arguments. " %{'app_name': app_name}
-    epilogCommon = epilog + 'Additional arguments: --config, --debug, --profile, --profile-id, --quiet'
+    epilogCommon = epilog + 'Additional arguments: --config, --debug, --profile, --profile-id, --quiet, --startup-trace'
     epilogConfig = epilog + 'Additional arguments: --config, --debug'
 
     subparsers = parser.add_subparsers(title = 'Commands', dest = 'command')
@@ -197,7 +213,7 @@ def create_parsers(app_name = 'backintime'):
     description = 'Take a new snapshot. Ignore if the profile ' +\
                   'is not scheduled or if the machine runs on battery.'
     backupCP =             subparsers.add_parser(command,
-                                                 parents = [rsyncArgsParser],
+                                                 parents = [rsyncArgsParser, backupArgsParser],
                                                  epilog = epilogCommon,
                                                  help = description,
                                                  description = description)
@@ -211,7 +227,7 @@ def create_parsers(app_name = 'backintime'):
                   'if the profile is scheduled and the machine ' +\
                   'is not on battery. This is use by cron jobs.'
     backupJobCP =          subparsers.add_parser(command,
-                                                 parents = [rsyncArgsParser],
+                                                 parents = [rsyncArgsParser, backupArgsParser],
                                                  epilog = epilogCommon,
                                                  help = description,
                                                  description = description)
@@ -264,6 +280,62 @@ def create_parsers(app_name = 'backintime'):
                                                  help = 'Decode PATH. If no PATH is specified on command line ' +\
                                                  'a list of filenames will be read from stdin.')
 
+    command = 'diff'
+    description = 'Show the differences between two snapshots.'
+    diffCP =               subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    diffCP.set_defaults(func = diff)
+    parsers[command] = diffCP
+    diffCP.add_argument                         ('SNAPSHOT_ID1',
+                                                 type = str,
+                                                 action = 'store',
+                                                 help = 'Older snapshot. This can be a snapshot ID or ' +\
+                                                 'an integer starting with 0 for the last snapshot, 1 for the overlast, ... ' +\
+                                                 'the very first snapshot is -1')
+    diffCP.add_argument                         ('SNAPSHOT_ID2',
+                                                 type = str,
+                                                 action = 'store',
+                                                 help = 'Newer snapshot.')
+    diffCP.add_argument                         ('PATH',
+                                                 type = str,
+                                                 action = 'store',
+                                                 nargs = '?',
+                                                 default = '/',
+                                                 help = 'Only compare this file or folder.')
+    diffCP.add_argument                         ('--json',
+                                                 action = 'store_true',
+                                                 help = 'Print the differences as JSON.')
+
+    command = 'export'
+    description = 'Export files and folders from a snapshot into a tar archive.'
+    exportCP =             subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    exportCP.set_defaults(func = export)
+    parsers[command] = exportCP
+    exportCP.add_argument                       ('SNAPSHOT_ID',
+                                                 type = str,
+                                                 action = 'store',
+                                                 help = 'Which SNAPSHOT_ID should be used. This can be a snapshot ID or ' +\
+                                                 'an integer starting with 0 for the last snapshot, 1 for the overlast, ... ' +\
+                                                 'the very first snapshot is -1')
+    exportCP.add_argument                       ('PATH',
+                                                 type = str,
+                                                 action = 'store',
+                                                 nargs = '+',
+                                                 help = 'Files or folders which should be exported.')
+    exportCP.add_argument                       ('--to',
+                                                 metavar = 'FILE',
+                                                 type = str,
+                                                 action = 'store',
+                                                 required = True,
+                                                 help = "Write the archive to FILE. Compression depends on the " +\
+                                                 "suffix ('.tar', '.tar.gz', '.tar.xz' or '.tar.bz2'). " +\
+                                                 "'-' will write an uncompressed tar to stdout.")
+
     command = 'last-snapshot'
     nargs = 0
     aliases.append((command, nargs))
@@ -287,6 +359,58 @@ def create_parsers(app_name = 'backintime'):
     lastSnapshotsPathCP.set_defaults(func = lastSnapshotPath)
     parsers[command] = lastSnapshotsPathCP
 
+    command = 'log'
+    description = 'Show the log of a snapshot or of the last take_snapshot run.'
+    logCP =                subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    logCP.set_defaults(func = log)
+    parsers[command] = logCP
+    logCP.add_argument                          ('SNAPSHOT_ID',
+                                                 type = str,
+                                                 action = 'store',
+                                                 nargs = '?',
+                                                 default = None,
+                                                 help = 'Which SNAPSHOT_ID should be used. This can be a snapshot ID or ' +\
+                                                 'an integer starting with 0 for the last snapshot, 1 for the overlast, ... ' +\
+                                                 'the very first snapshot is -1. Show the last take_snapshot log if omitted.')
+    logCP.add_argument                          ('--filter',
+                                                 choices = sorted(snapshotlog.FILTERS),
+                                                 default = 'all',
+                                                 help = 'Only show lines of this level.')
+    logCP.add_argument                          ('--start',
+                                                 type = int,
+                                                 default = 0,
+                                                 metavar = 'N',
+                                                 help = 'Skip the first N lines.')
+    logCP.add_argument                          ('--count',
+                                                 type = int,
+                                                 default = None,
+                                                 metavar = 'N',
+                                                 help = 'Show at most N lines.')
+
+    command = 'ls'
+    description = 'List a folder inside a snapshot with owner, group and permissions from the snapshot.'
+    lsCP =                 subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    lsCP.set_defaults(func = ls)
+    parsers[command] = lsCP
+    lsCP.add_argument                           ('SNAPSHOT_ID',
+                                                 type = str,
+                                                 action = 'store',
+                                                 help = 'Which SNAPSHOT_ID should be used. This can be a snapshot ID or ' +\
+                                                 'an integer starting with 0 for the last snapshot, 1 for the overlast, ... ' +\
+                                                 'the very first snapshot is -1')
+    lsCP.add_argument                           ('PATH',
+                                                 type = str,
+                                                 action = 'store',
+                                                 nargs = '?',
+                                                 default = '/',
+                                                 help = 'Folder which should be listed.')
+
     command = 'pw-cache'
     nargs = '*'
     aliases.append((command, nargs))
@@ -364,6 +488,11 @@ def create_parsers(app_name = 'backintime'):
                                                  help = 'Restore and delete newer files which are not in the snapshot. ' +\
                                                  'WARNING: deleting files in filesystem root could break your whole system!!!')
 
+    restoreCP.add_argument                      ('--dry-run',
+                                                 action = 'store_true',
+                                                 help = 'Only show how many files and how much data would be ' +\
+                                                 'restored and an estimated duration. Nothing will be changed.')
+
     backupGroup.add_argument                    ('--local-backup',
                                                  action = 'store_true',
                                                  help = 'Create backup files before changing local files.')
@@ -373,6 +502,34 @@ def create_parsers(app_name = 'backintime'):
                                                  help = 'Temporary disable creation of backup files before changing local files. ' +\
                                                  'This can be switched of permanently in Settings, too.')
 
+    command = 'scheduler'
+    description = 'Run automatic backups for all profiles from a resident ' +\
+                  'scheduler instead of crontab entries and udev rules.'
+    schedulerCP =          subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    schedulerCP.set_defaults(func = scheduler)
+    parsers[command] = schedulerCP
+
+    command = 'search'
+    description = 'Search for files in all snapshots.'
+    searchCP =             subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    searchCP.set_defaults(func = search)
+    parsers[command] = searchCP
+    searchCP.add_argument                       ('PATTERN',
+                                                 type = str,
+                                                 action = 'store',
+                                                 help = 'Shell-style wildcard matched against file names or against ' +\
+                                                 'the full path if PATTERN contains a slash. A PATTERN without ' +\
+                                                 'wildcards matches every name containing it.')
+    searchCP.add_argument                       ('-i', '--ignore-case',
+                                                 action = 'store_true',
+                                                 help = 'Ignore case distinctions.')
+
     command = 'snapshots-list'
     nargs = 0
     aliases.append((command, nargs))
@@ -409,6 +566,18 @@ def create_parsers(app_name = 'backintime'):
     snapshotsPathCP.set_defaults(func = snapshotsPath)
     parsers[command] = snapshotsPathCP
 
+    command = 'status'
+    description = 'Show state of the scheduler and next and last run of all profiles.'
+    statusCP =             subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    statusCP.set_defaults(func = status)
+    parsers[command] = statusCP
+    statusCP.add_argument                       ('--json',
+                                                 action = 'store_true',
+                                                 help = 'Print the state as JSON.')
+
     command = 'unmount'
     nargs = 0
     aliases.append((command, nargs))
@@ -420,6 +589,18 @@ def create_parsers(app_name = 'backintime'):
     unmountCP.set_defaults(func = unmount)
     parsers[command] = unmountCP
 
+    command = 'watch'
+    description = 'Follow messages and progress of a running backup.'
+    watchCP =              subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    watchCP.set_defaults(func = watch)
+    parsers[command] = watchCP
+    watchCP.add_argument                        ('--json',
+                                                 action = 'store_true',
+                                                 help = 'Print every event as one line of JSON.')
+
     #define aliases for all commands with trailing --
     group = parser.add_mutually_exclusive_group()
     for alias, nargs in aliases:
@@ -447,6 +628,7 @@ def start_app(app_name = 'backintime'):
 
     #parse args
     args = arg_parse(None)
+    startuptrace.mark('parse arguments')
 
     #add source path to $PATH environ if running from source
     if tools.running_from_source():
@@ -461,6 +643,7 @@ def start_app(app_name = 'backintime'):
                        %{'app_name': app_name, 'app': config.Config.APP_NAME})
 
     #call commands
+    startuptrace.mark('start command')
     if 'func' in dir(args):
         args.func(args)
     else:
@@ -501,7 +684,16 @@ def arg_parse(args):
             #remove subparsers
             mainParser._remove_action(i)
             sub.append(i)
+    #'--startup-trace' was already handled by startuptrace before anything
+    #else got imported. It can't be a regular option because argparse would
+    #take an abbreviated '--start' (log command) for it.
+    if args is None:
+        args = sys.argv[1:]
+    startupTrace = startuptrace.enabled(args)
+    args = [i for i in args if i != '--startup-trace']
+
     args, unknownArgs = mainParser.parse_known_args(args)
+    args.startup_trace = startupTrace
     #readd subparsers again
     if sub:
         [mainParser._add_action(i) for i in sub]
@@ -606,6 +798,7 @@ def getConfig(args, check = True):
                         2 if `check` is True and config is not configured
     """
     cfg = config.Config(args.config)
+    startuptrace.mark('load config')
     logger.debug('config file: %s' % cfg._LOCAL_CONFIG_PATH)
     logger.debug('profiles: %s' % cfg.get_profiles())
     if 'profile_id' in args and args.profile_id:
@@ -621,6 +814,8 @@ def getConfig(args, check = True):
         sys.exit(RETURN_NO_CFG)
     if 'checksum' in args:
         cfg.force_use_checksum = args.checksum
+    if 'profile_run' in args:
+        cfg.profile_run = args.profile_run
     return cfg
 
 def setQuiet(args):
@@ -715,6 +910,7 @@ def snapshotsList(args):
     Raises:
         SystemExit:     0
     """
+    import snapshots
     force_stdout = setQuiet(args)
     cfg = getConfig(args)
     _mount(cfg)
@@ -744,6 +940,7 @@ def snapshotsListPath(args):
     Raises:
         SystemExit:     0
     """
+    import snapshots
     force_stdout = setQuiet(args)
     cfg = getConfig(args)
     _mount(cfg)
@@ -773,6 +970,7 @@ def lastSnapshot(args):
     Raises:
         SystemExit:     0
     """
+    import snapshots
     force_stdout = setQuiet(args)
     cfg = getConfig(args)
     _mount(cfg)
@@ -788,6 +986,50 @@ def lastSnapshot(args):
     _umount(cfg)
     sys.exit(RETURN_OK)
 
+def log(args):
+    """
+    Command for printing the log of a snapshot or the last take_snapshot
+    log.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if successful, 1 if not
+    """
+    import cli
+    force_stdout = setQuiet(args)
+    printHeader()
+    cfg = getConfig(args)
+    if args.SNAPSHOT_ID is not None:
+        _mount(cfg)
+    ret = cli.log(cfg, args.SNAPSHOT_ID, snapshotlog.FILTERS[args.filter],
+                  args.start, args.count, out = force_stdout)
+    if args.SNAPSHOT_ID is not None:
+        _umount(cfg)
+    sys.exit(RETURN_OK if ret else RETURN_ERR)
+
+def ls(args):
+    """
+    Command for listing a folder inside a snapshot.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if successful, 1 if not
+    """
+    import cli
+    force_stdout = setQuiet(args)
+    printHeader()
+    cfg = getConfig(args)
+    _mount(cfg)
+    ret = cli.ls(cfg, args.SNAPSHOT_ID, args.PATH, out = force_stdout)
+    _umount(cfg)
+    sys.exit(RETURN_OK if ret else RETURN_ERR)
+
 def lastSnapshotPath(args):
     """
     Command for printing the path of the very last snapshot in
@@ -800,6 +1042,7 @@ def lastSnapshotPath(args):
     Raises:
         SystemExit:     0
     """
+    import snapshots
     force_stdout = setQuiet(args)
     cfg = getConfig(args)
     _mount(cfg)
@@ -833,6 +1076,62 @@ def unmount(args):
     _umount(cfg)
     sys.exit(RETURN_OK)
 
+def watch(args):
+    """
+    Command for following a running backup through the status bus.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if successful or no backup is running, 1 if the
+                        backup failed
+    """
+    import cli
+    force_stdout = setQuiet(args)
+    printHeader()
+    cfg = getConfig(args)
+    ret = cli.watch(cfg, json = args.json, out = force_stdout)
+    sys.exit(RETURN_OK if ret else RETURN_ERR)
+
+def scheduler(args):
+    """
+    Command for running the resident scheduler.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if the scheduler was stopped, 1 if an other
+                        scheduler is already running
+    """
+    import scheduler as _scheduler
+    setQuiet(args)
+    printHeader()
+    cfg = getConfig(args)
+    ret = _scheduler.Scheduler(cfg).run()
+    sys.exit(RETURN_OK if ret else RETURN_ERR)
+
+def status(args):
+    """
+    Command for showing the state of the resident scheduler.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if the scheduler is running, 1 if not
+    """
+    import cli
+    force_stdout = setQuiet(args)
+    printHeader()
+    cfg = getConfig(args)
+    ret = cli.status(cfg, json = args.json, out = force_stdout)
+    sys.exit(RETURN_OK if ret else RETURN_ERR)
+
 def benchmarkCipher(args):
     """
     Command for transfering a file with scp to remote host with all
@@ -845,6 +1144,7 @@ def benchmarkCipher(args):
     Raises:
         SystemExit:     0
     """
+    import sshtools
     setQuiet(args)
     printHeader()
     cfg = getConfig(args)
@@ -867,6 +1167,8 @@ def pwCache(args):
     Raises:
         SystemExit:     0 if daemon is running, 1 if not
     """
+    import password
+    import bcolors
     force_stdout = setQuiet(args)
     printHeader()
     cfg = getConfig(args)
@@ -877,10 +1179,10 @@ def pwCache(args):
     elif args.ACTION == 'status':
         print('%(app)s Password Cache: ' % {'app': cfg.APP_NAME}, end=' ', file = force_stdout)
         if daemon.status():
-            print(cli.bcolors.OKGREEN + 'running' + cli.bcolors.ENDC, file = force_stdout)
+            print(bcolors.OKGREEN + 'running' + bcolors.ENDC, file = force_stdout)
             ret = RETURN_OK
         else:
-            print(cli.bcolors.FAIL + 'not running' + cli.bcolors.ENDC, file = force_stdout)
+            print(bcolors.FAIL + 'not running' + bcolors.ENDC, file = force_stdout)
             ret = RETURN_ERR
     else:
         daemon.run()
@@ -898,6 +1200,7 @@ def decode(args):
     Raises:
         SystemExit:     0
     """
+    import encfstools
     force_stdout = setQuiet(args)
     cfg = getConfig(args)
     if cfg.get_snapshots_mode() not in ('local_encfs', 'ssh_encfs'):
@@ -920,6 +1223,55 @@ def decode(args):
     _umount(cfg)
     sys.exit(RETURN_OK)
 
+def diff(args):
+    """
+    Command for printing the differences between two snapshots.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0
+    """
+    import cli
+    force_stdout = setQuiet(args)
+    if not args.json:
+        printHeader()
+    cfg = getConfig(args)
+    _mount(cfg)
+    cli.diff(cfg, args.SNAPSHOT_ID1, args.SNAPSHOT_ID2, args.PATH,
+             json = args.json, out = force_stdout)
+    _umount(cfg)
+    sys.exit(RETURN_OK)
+
+def export(args):
+    """
+    Command for exporting files and folders from a snapshot into a
+    tar archive.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if successful, 1 if not
+    """
+    import cli
+    force_stdout = setQuiet(args)
+    if args.to == '-':
+        #stdout is reserved for the archive which must not get lost in
+        #--quiet's /dev/null either. Print all other output to stderr.
+        if not args.quiet:
+            sys.stdout = sys.stderr
+    else:
+        printHeader()
+    cfg = getConfig(args)
+    _mount(cfg)
+    ret = cli.export(cfg, args.SNAPSHOT_ID, args.PATH, args.to, force_stdout)
+    _umount(cfg)
+    sys.exit(RETURN_OK if ret else RETURN_ERR)
+
 def remove(args, force = False):
     """
     Command for removing snapshots.
@@ -932,6 +1284,7 @@ def remove(args, force = False):
     Raises:
         SystemExit:     0
     """
+    import cli
     setQuiet(args)
     printHeader()
     cfg = getConfig(args)
@@ -965,6 +1318,7 @@ def restore(args):
     Raises:
         SystemExit:     0
     """
+    import cli
     setQuiet(args)
     printHeader()
     cfg = getConfig(args)
@@ -973,12 +1327,33 @@ def restore(args):
                 args.SNAPSHOT_ID,
                 args.WHAT,
                 args.WHERE,
+                dry_run = args.dry_run,
                 delete = args.delete,
                 backup = args.local_backup,
                 no_backup = args.no_local_backup)
     _umount(cfg)
     sys.exit(RETURN_OK)
 
+def search(args):
+    """
+    Command for searching files in all snapshots.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if files were found, 1 if not
+    """
+    import cli
+    force_stdout = setQuiet(args)
+    printHeader()
+    cfg = getConfig(args)
+    _mount(cfg)
+    ret = cli.search(cfg, args.PATTERN, args.ignore_case, out = force_stdout)
+    _umount(cfg)
+    sys.exit(RETURN_OK if ret else RETURN_ERR)
+
 def checkConfig(args):
     """
     Command for checking the config file.
@@ -990,6 +1365,7 @@ def checkConfig(args):
     Raises:
         SystemExit:     0 if config is okay, 1 if not
     """
+    import cli
     force_stdout = setQuiet(args)
     printHeader()
     cfg = getConfig(args)
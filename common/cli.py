@@ -18,12 +18,23 @@
 
 import os
 import sys
+import stat
+import time
+import sqlite3
+import json as _json
+from collections import OrderedDict
 
 import tools
 import snapshots
+import restoreplan
+import export as _export
+import snapshotdiff
+import snapshotlog
+import statusbus
+import scheduler
 import bcolors
 
-def restore(cfg, snapshot_id = None, what = None, where = None, **kwargs):
+def restore(cfg, snapshot_id = None, what = None, where = None, dry_run = False, **kwargs):
     if what is None:
         what = input('File to restore: ')
     what = tools.prepare_path(os.path.abspath(os.path.expanduser(what)))
@@ -37,8 +48,267 @@ def restore(cfg, snapshot_id = None, what = None, where = None, **kwargs):
 
     sid = selectSnapshot(snapshots_list, snapshot_id, 'SnapshotID to restore')
     print('')
+    if dry_run:
+        restorePlan(sid, [what])
+        return
     RestoreDialog(cfg, sid, what, where, **kwargs).run()
 
+def restorePlan(sid, paths):
+    """
+    Print how much data would be restored from `sid` and how long it
+    will probably take. Planning runs in a background thread while the
+    number of scanned items is shown.
+
+    Args:
+        sid (snapshots.SID):    snapshot to restore from
+        paths (list):           paths to restore
+    """
+    thread = restoreplan.PlannerThread(sid, paths)
+    thread.start()
+    tty = sys.stdout.isatty()
+    try:
+        while thread.is_alive():
+            thread.join(0.5)
+            if tty:
+                print('\rScanning snapshot: %s files, %s folders'
+                      %(thread.plan.files, thread.plan.dirs), end = '')
+    except KeyboardInterrupt:
+        thread.cancel()
+        thread.join()
+        raise
+    if tty:
+        print('\r\033[K', end = '')
+    print('Restore plan for snapshot %s:' % sid.displayName)
+    print(thread.plan)
+
+def diff(cfg, snapshot_id1, snapshot_id2, path = '/', json = False, out = sys.stdout):
+    """
+    Print all differences between snapshots `snapshot_id1` and
+    `snapshot_id2` below `path`. JSON output is written while walking
+    the snapshots so it doesn't need to keep all changes in memory.
+    """
+    path = tools.prepare_path(os.path.abspath(os.path.expanduser(path)))
+    snapshots_list = snapshots.listSnapshots(cfg)
+    sid1 = selectSnapshot(snapshots_list, snapshot_id1, 'SnapshotID to compare')
+    sid2 = selectSnapshot(snapshots_list, snapshot_id2, 'SnapshotID to compare with')
+    changes = snapshotdiff.SnapshotDiff(sid1, sid2, path)
+    if not json:
+        for change in changes:
+            print(snapshotdiff.formatChange(change), file = out)
+        print(snapshotdiff.formatSummary(changes.summary), file = out)
+        return
+
+    out.write('{"from": %s, "to": %s, "path": %s, "changes": [' \
+              %(_json.dumps(sid1.sid), _json.dumps(sid2.sid), _json.dumps(path)))
+    sep = '\n'
+    for change in changes:
+        out.write(sep + _json.dumps(change._asdict()))
+        sep = ',\n'
+    out.write('],\n"summary": %s}\n' % _json.dumps(changes.summary))
+
+def export(cfg, snapshot_id, paths, target, stdout = None):
+    """
+    Export `paths` from snapshot `snapshot_id` into the tar archive `target`.
+    All messages are printed to stderr as the archive might be written
+    to `stdout` (default ``sys.stdout``) if `target` is ``-``.
+
+    Returns:
+        bool:   ``True`` if successful
+    """
+    paths = [tools.prepare_path(os.path.abspath(os.path.expanduser(p))) for p in paths]
+    snapshots_list = snapshots.listSnapshots(cfg)
+    sid = selectSnapshot(snapshots_list, snapshot_id, 'SnapshotID to export',
+                         out = sys.stderr if target == '-' else None)
+    def callback(msg):
+        print(msg, file = sys.stderr)
+    return _export.export(snapshots.Snapshots(cfg), sid, paths, target, callback, stdout)
+
+def search(cfg, pattern, ignoreCase = False, out = sys.stdout):
+    """
+    Print all files matching `pattern` and the snapshots they exist in.
+
+    Returns:
+        bool:   ``True`` if at least one file was found
+    """
+    snapshots_list = snapshots.listSnapshots(cfg)
+    try:
+        results = snapshots.Snapshots(cfg).search(pattern, ignoreCase)
+    except (OSError, sqlite3.Error) as e:
+        print('Search failed: %s' % str(e), file = sys.stderr)
+        return False
+    for path, ranges in results:
+        print(path, file = out)
+        for first, last in ranges:
+            if first == last:
+                line = '    %s' % first
+            else:
+                line = '    %s - %s' %(first, last)
+            if last in snapshots_list and snapshots_list.index(last) > 0:
+                line += ' (removed in %s)' % snapshots_list[snapshots_list.index(last) - 1]
+            print(line, file = out)
+    return bool(results)
+
+def log(cfg, snapshot_id = None, mode = snapshotlog.ALL, start = 0, count = None, out = sys.stdout):
+    """
+    Print the log of snapshot `snapshot_id` or the last take_snapshot log
+    if `snapshot_id` is ``None``. Only lines matching `mode` are printed,
+    starting with the `start`-th line.
+
+    Returns:
+        bool:   ``True`` if successful
+    """
+    if snapshot_id is None:
+        logFile = cfg.get_take_snapshot_log_file()
+    else:
+        snapshots_list = snapshots.listSnapshots(cfg)
+        sid = selectSnapshot(snapshots_list, snapshot_id, 'SnapshotID')
+        logFile = sid.path(sid.LOG)
+    try:
+        lines = snapshotlog.readLevel(logFile, mode, start, count)
+    except OSError as e:
+        print('Failed to read log %s: %s' %(logFile, str(e)), file = sys.stderr)
+        return False
+    for line in lines:
+        out.write(line)
+    return True
+
+def ls(cfg, snapshot_id, path = '/', out = sys.stdout):
+    """
+    Print the content of folder `path` in snapshot `snapshot_id` like
+    'ls -l' with owner, group and permissions from the snapshot.
+
+    Returns:
+        bool:   ``True`` if successful
+    """
+    path = tools.prepare_path(os.path.abspath(os.path.expanduser(path)))
+    snapshots_list = snapshots.listSnapshots(cfg)
+    sid = selectSnapshot(snapshots_list, snapshot_id, 'SnapshotID to list')
+    view = snapshots.SnapshotView(snapshots.Snapshots(cfg), sid)
+    entry = view.stat(path)
+    if entry is not None and not stat.S_ISDIR(entry.mode):
+        entries = [entry._replace(name = path)]
+    else:
+        try:
+            entries = view.listdir(path)
+        except OSError as e:
+            print('Failed to list %s: %s' %(path, str(e)), file = sys.stderr)
+            return False
+
+    rows = []
+    for entry in entries:
+        name = entry.name
+        if entry.target is not None:
+            name += ' -> ' + entry.target
+        rows.append((stat.filemode(entry.mode), entry.user, entry.group, str(entry.size),
+                     time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.mtime)), name))
+    if rows:
+        width = [max([len(row[i]) for row in rows]) for i in range(4)]
+        for row in rows:
+            print('%s %s %s %s %s %s' %(row[0].ljust(width[0]), row[1].ljust(width[1]),
+                                        row[2].ljust(width[2]), row[3].rjust(width[3]),
+                                        row[4], row[5]),
+                  file = out)
+    return True
+
+def watch(cfg, json = False, out = sys.stdout):
+    """
+    Print events from the status bus of a running backup until it is
+    finished.
+
+    Returns:
+        bool:   ``False`` if the backup failed
+    """
+    client = statusbus.StatusClient(cfg)
+    if not client.connect():
+        print('No backup is running for profile "%s".' % cfg.get_profile_name(), file = out)
+        return True
+    ret = True
+    try:
+        for event in client.events():
+            if json:
+                print(_json.dumps(event), file = out)
+            else:
+                line = formatStatusEvent(event)
+                if line:
+                    print(line, file = out)
+            out.flush()
+            if event['event'] == statusbus.FINISH:
+                ret = not event.get('error')
+                break
+    finally:
+        client.close()
+    return ret
+
+def formatStatusEvent(event):
+    """
+    Text representation of one status bus event.
+
+    Args:
+        event (dict):   event from :py:meth:`statusbus.StatusClient.events`
+
+    Returns:
+        str:            one line
+    """
+    kind = event.get('event')
+    if kind == statusbus.MESSAGE:
+        if event.get('type') == 1:
+            return 'Error: %s' % event.get('message', '')
+        return event.get('message', '')
+    if kind == statusbus.PROGRESS:
+        return '%3s%% | Sent: %s | Speed: %s | ETA: %s' %(event.get('percent', 0),
+                                                          event.get('sent', ''),
+                                                          event.get('speed', ''),
+                                                          event.get('eta', ''))
+    if kind == statusbus.PHASE:
+        return '== %s ==' % event.get('phase', '')
+    if kind == statusbus.FINISH:
+        if event.get('error'):
+            return 'Backup failed'
+        if event.get('snapshot'):
+            return 'New snapshot: %s' % event['snapshot']
+        return 'Done, no new snapshot'
+    return ''
+
+def status(cfg, json = False, out = sys.stdout):
+    """
+    Print the state of the resident scheduler and all its profiles.
+
+    Returns:
+        bool:   ``False`` if the scheduler is not running
+    """
+    state, running = scheduler.readState(cfg)
+    if json:
+        print(_json.dumps(OrderedDict((('running', running), ('state', state)))), file = out)
+        return running
+    if running and state:
+        print('Scheduler is running (PID %s) since %s'
+              %(state.get('pid'), formatTime(state.get('started'))), file = out)
+    else:
+        print('Scheduler is not running', file = out)
+    if not state:
+        return running
+    if not running:
+        print('Last state from %s' % formatTime(state.get('updated')), file = out)
+    for profile_id, job in state.get('profiles', {}).items():
+        print('', file = out)
+        print('Profile %s: %s' %(profile_id, job.get('name', '')), file = out)
+        print('  Schedule:    %s' % cfg.AUTOMATIC_BACKUP_MODES.get(job.get('mode'), job.get('mode')), file = out)
+        if job.get('running'):
+            print('  Running:     since %s (PID %s)' %(formatTime(job.get('started')), job.get('pid')), file = out)
+        print('  Next run:    %s' % formatTime(job.get('next_run')), file = out)
+        lastRun = formatTime(job.get('last_run'))
+        if job.get('last_result'):
+            lastRun += ' (%s)' % job['last_result']
+        print('  Last run:    %s' % lastRun, file = out)
+        if job.get('failures'):
+            print('  Failures:    %s' % job['failures'], file = out)
+    return running
+
+def formatTime(timestamp):
+    if timestamp is None:
+        return '-'
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
 def remove(cfg, snapshot_ids = None, force = None):
     snapshots_list = snapshots.listSnapshots(cfg)
     if not snapshot_ids:
@@ -135,26 +405,24 @@ def checkConfig(cfg, crontab = True):
 
     return True
 
-def selectSnapshot(snapshots_list, snapshot_id = None, msg = 'SnapshotID'):
+def selectSnapshot(snapshot_list, snapshot_id = None, msg = 'SnapshotID', out = None):
     """
     check if given snapshot is valid. If not print a list of all
-    snapshots and ask to choose one
+    snapshots and ask to choose one. The list and the prompt are
+    printed to `out` (default ``sys.stdout``).
     """
+    if out is None:
+        out = sys.stdout
     len_snapshots = len(snapshot_list)
 
     if not snapshot_id is None:
+        if snapshot_id in snapshot_list:
+            return snapshot_list[snapshot_list.index(snapshot_id)]
         try:
-            sid = snapshots.SID(snapshot_id)
-            if sid in snapshot_list:
-                return sid
-            else:
-                print('SnapshotID %s not found.' % snapshot_id)
-        except ValueError:
-            try:
-                index = int(snapshot_id)
-                return snapshot_list[index]
-            except (ValueError, IndexError):
-                print('Invalid SnaphotID index: %s' % snapshot_id)
+            index = int(snapshot_id)
+            return snapshot_list[index]
+        except (ValueError, IndexError):
+            print('SnapshotID %s not found.' % snapshot_id, file = out)
     snapshot_id = None
 
     columns = (terminalSize()[1] - 25) // 26 + 1
@@ -162,7 +430,7 @@ def selectSnapshot(snapshots_list, snapshot_id = None, msg = 'SnapshotID'):
     if len_snapshots % columns > 0:
         rows += 1
 
-    print('SnapshotID\'s:')
+    print('SnapshotID\'s:', file = out)
     for row in range(rows):
         line = []
         for column in range(columns):
@@ -170,14 +438,15 @@ def selectSnapshot(snapshots_list, snapshot_id = None, msg = 'SnapshotID'):
             if index > len_snapshots - 1:
                 continue
             line.append('{i:>4}: {s}'.format(i = index, s = snapshot_list[index]))
-        print(' '.join(line))
-    print('')
+        print(' '.join(line), file = out)
+    print('', file = out)
     while snapshot_id is None:
+        print(msg + ' ( 0 - %d ): ' % (len_snapshots - 1), end = '', file = out, flush = True)
         try:
-            index = int(input(msg + ' ( 0 - %d ): ' % (len_snapshots - 1) ))
+            index = int(input())
             snapshot_id = snapshot_list[index]
         except (ValueError, IndexError):
-            print('Invalid Input')
+            print('Invalid Input', file = out)
             continue
     return snapshot_id
 
@@ -22,6 +22,7 @@ import gettext
 import socket
 import random
 import shlex
+from collections import namedtuple
 try:
     import pwd
 except ImportError:
@@ -44,6 +45,53 @@ gettext.bindtextdomain('backintime', os.path.join(tools.get_share_path(), 'local
 gettext.textdomain( 'backintime' )
 
 
+class ProfileSettings(namedtuple('ProfileSettings',
+                                 ('profile_id', 'mode', 'snapshots_path',
+                                  'host', 'user', 'profile',
+                                  'ssh_host', 'ssh_port', 'ssh_user',
+                                  'ssh_path', 'ssh_cipher', 'ssh_private_key_file',
+                                  'ssh_prefix', 'ssh_nice', 'ssh_ionice',
+                                  'full_rsync', 'include'))):
+    """
+    Parsed and typed options of one profile which are needed in hot paths
+    like :py:meth:`snapshots.SID.path` or
+    :py:meth:`snapshots.Snapshots.cmd_ssh`. Build with
+    :py:meth:`Config.profile_settings` which will take care of rebuilding
+    after options changed.
+
+    `snapshots_path` is only set for modes which don't need to be mounted.
+    `ssh_prefix` is an empty string if the prefix is disabled.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def fromConfig(cls, cfg, profile_id):
+        host, user, profile = cfg.get_host_user_profile(profile_id)
+        mode = cfg.get_snapshots_mode(profile_id)
+        snapshots_path = None
+        if mode in cfg.SNAPSHOT_MODES and cfg.SNAPSHOT_MODES[mode][0] is None:
+            snapshots_path = cfg.get_snapshots_path(profile_id, mode)
+        ssh_prefix = ''
+        if cfg.ssh_prefix_enabled(profile_id):
+            ssh_prefix = cfg.ssh_prefix(profile_id).strip()
+        return cls(profile_id = profile_id,
+                   mode = mode,
+                   snapshots_path = snapshots_path,
+                   host = host,
+                   user = user,
+                   profile = profile,
+                   ssh_host = cfg.get_ssh_host(profile_id),
+                   ssh_port = cfg.get_ssh_port(profile_id),
+                   ssh_user = cfg.get_ssh_user(profile_id),
+                   ssh_path = cfg.get_snapshots_path_ssh(profile_id) or './',
+                   ssh_cipher = cfg.get_ssh_cipher(profile_id),
+                   ssh_private_key_file = cfg.get_ssh_private_key_file(profile_id),
+                   ssh_prefix = ssh_prefix,
+                   ssh_nice = cfg.is_run_nice_on_remote_enabled(profile_id),
+                   ssh_ionice = cfg.is_run_ionice_on_remote_enabled(profile_id),
+                   full_rsync = cfg.full_rsync(profile_id),
+                   include = tuple(cfg.get_include(profile_id)))
+
 class Config( configfile.ConfigFileWithProfiles ):
     APP_NAME = 'Back In Time'
     VERSION = '1.1.13'
@@ -150,6 +198,7 @@ class Config( configfile.ConfigFileWithProfiles ):
     PLUGIN_MANAGER = pluginmanager.PluginManager()
 
     def __init__( self, config_path = None ):
+        self._profile_settings = {}
         configfile.ConfigFileWithProfiles.__init__( self, _('Main profile') )
 
         self._APP_PATH = tools.get_backintime_path()
@@ -171,6 +220,7 @@ class Config( configfile.ConfigFileWithProfiles ):
 
         tools.make_dirs( self._LOCAL_CONFIG_FOLDER )
         tools.make_dirs( self._LOCAL_DATA_FOLDER )
+        tools.TOOL_CAPS.filename = self.get_tool_caps_file()
 
         self._DEFAULT_CONFIG_PATH = os.path.join( self._LOCAL_CONFIG_FOLDER, 'config' )
         if config_path is None:
@@ -226,9 +276,20 @@ class Config( configfile.ConfigFileWithProfiles ):
         self.current_hash_id = 'local'
         self.pw = None
         self.force_use_checksum = False
+        self.profile_run = False
         self.xWindowId = None
         self.inhibitCookie = None
-        self.setupUdev = tools.SetupUdev()
+        self._setupUdev = None
+
+    @property
+    def setupUdev(self):
+        """
+        :py:class:`tools.SetupUdev` connects to system dbus. Don't do this
+        on startup of every command but only if udev rules are needed.
+        """
+        if self._setupUdev is None:
+            self._setupUdev = tools.SetupUdev()
+        return self._setupUdev
 
     def save( self ):
         return super(Config, self).save(self._LOCAL_CONFIG_PATH)
@@ -309,8 +370,11 @@ class Config( configfile.ConfigFileWithProfiles ):
         """
         Returns the full path for the snapshots: .../backintime/machine/user/profile_id/
         """
-        host, user, profile = self.get_host_user_profile( profile_id )
-        return os.path.join( self.get_snapshots_path( profile_id ), 'backintime', host, user, profile )
+        s = self.profile_settings(profile_id)
+        path = s.snapshots_path
+        if path is None:
+            path = self.get_snapshots_path(profile_id, s.mode)
+        return os.path.join( path, 'backintime', s.host, s.user, s.profile )
 
     def set_snapshots_path( self, value, profile_id = None, mode = None ):
         """
@@ -420,11 +484,8 @@ class Config( configfile.ConfigFileWithProfiles ):
         """
         Returns the full path for the snapshots: .../backintime/machine/user/profile_id/
         """
-        path = self.get_snapshots_path_ssh( profile_id )
-        if not path:
-            path = './'
-        host, user, profile = self.get_host_user_profile( profile_id )
-        return os.path.join( path, 'backintime', host, user, profile )
+        s = self.profile_settings(profile_id)
+        return os.path.join( s.ssh_path, 'backintime', s.host, s.user, s.profile )
 
     def set_snapshots_path_ssh( self, value, profile_id = None ):
         self.set_profile_str_value( 'snapshots.ssh.path', value, profile_id )
@@ -463,14 +524,8 @@ class Config( configfile.ConfigFileWithProfiles ):
         self.set_profile_str_value( 'snapshots.ssh.user', value, profile_id )
 
     def get_ssh_host_port_user_path_cipher(self, profile_id = None ):
-        host = self.get_ssh_host(profile_id)
-        port = self.get_ssh_port(profile_id)
-        user = self.get_ssh_user(profile_id)
-        path = self.get_snapshots_path_ssh(profile_id)
-        cipher = self.get_ssh_cipher(profile_id)
-        if not path:
-            path = './'
-        return (host, port, user, path, cipher)
+        s = self.profile_settings(profile_id)
+        return (s.ssh_host, s.ssh_port, s.ssh_user, s.ssh_path, s.ssh_cipher)
 
     def get_ssh_private_key_file(self, profile_id = None):
         ssh = self.get_ssh_private_key_folder()
@@ -493,18 +548,6 @@ class Config( configfile.ConfigFileWithProfiles ):
     def set_ssh_private_key_file( self, value, profile_id = None ):
         self.set_profile_str_value( 'snapshots.ssh.private_key_file', value, profile_id )
 
-    def ssh_max_arg_length(self, profile_id = None):
-        #?Maximum argument length of commands run on remote host. This can be tested
-        #?with 'python3 /usr/share/backintime/common/sshMaxArg.py USER@HOST'.\n
-        #?0 = unlimited;0, >700
-        value = self.get_profile_int_value('snapshots.ssh.max_arg_length', 0, profile_id)
-        if value and value < 700:
-            raise ValueError('SSH max arg length %s is to low to run commands' % value)
-        return value
-
-    def set_ssh_max_arg_length(self, value, profile_id = None):
-        self.set_profile_int_value('snapshots.ssh.max_arg_length', value, profile_id)
-
     #ENCFS
     def get_local_encfs_path( self, profile_id = None ):
         #?Where to save snapshots in mode 'local_encfs'.;absolute path
@@ -1030,14 +1073,15 @@ class Config( configfile.ConfigFileWithProfiles ):
         return self.set_profile_str_value('snapshots.ssh.prefix.value', value, profile_id)
 
     def ssh_prefix_cmd(self, profile_id = None, cmd_type = str):
+        prefix = self.profile_settings(profile_id).ssh_prefix
         if cmd_type == list:
-            if self.ssh_prefix_enabled(profile_id):
-                return shlex.split(self.ssh_prefix(profile_id))
+            if prefix:
+                return shlex.split(prefix)
             else:
                 return []
         if cmd_type == str:
-            if self.ssh_prefix_enabled(profile_id):
-                return self.ssh_prefix(profile_id).strip() + ' '
+            if prefix:
+                return prefix + ' '
             else:
                 return ''
 
@@ -1056,6 +1100,17 @@ class Config( configfile.ConfigFileWithProfiles ):
     def set_use_checksum( self, value, profile_id = None ):
         return self.set_profile_bool_value( 'snapshots.use_checksum', value, profile_id )
 
+    def version_index(self, profile_id = None):
+        #?Keep an index of all versions of every file in the snapshots.
+        #?This makes listing the different versions of a file much faster,
+        #?especially on remote profiles. The index is built on the first
+        #?search and then each new snapshot is added to it. If disabled
+        #?'backintime search' will still build the index when it is used.
+        return self.get_profile_bool_value('snapshots.version_index.enabled', False, profile_id)
+
+    def set_version_index(self, value, profile_id = None):
+        return self.set_profile_bool_value('snapshots.version_index.enabled', value, profile_id)
+
     def log_level( self, profile_id = None ):
         #?Log level used during take_snapshot.\n1 = Error\n2 = Changes\n3 = Info;1-3
         return self.get_profile_int_value( 'snapshots.log_level', 3, profile_id )
@@ -1063,6 +1118,47 @@ class Config( configfile.ConfigFileWithProfiles ):
     def set_log_level( self, value, profile_id = None ):
         return self.set_profile_int_value( 'snapshots.log_level', value, profile_id )
 
+    def log_max_size(self, profile_id = None):
+        #?Rotate the take_snapshot log if it grows bigger than this value
+        #?in MiB. Up to 5 rotated parts will be kept. 0 = disabled;0-99999
+        return self.get_profile_int_value('snapshots.log_max_size', 0, profile_id)
+
+    def set_log_max_size(self, value, profile_id = None):
+        return self.set_profile_int_value('snapshots.log_max_size', value, profile_id)
+
+    def log_compress(self, profile_id = None):
+        #?Compress the take_snapshot log with gzip while it is written.
+        return self.get_profile_bool_value('snapshots.log_compress', False, profile_id)
+
+    def set_log_compress(self, value, profile_id = None):
+        return self.set_profile_bool_value('snapshots.log_compress', value, profile_id)
+
+    def metrics_enabled(self, profile_id = None):
+        #?Write metrics of each backup run as OpenMetrics textfile for
+        #?node_exporter's textfile collector.
+        return self.get_profile_bool_value('snapshots.metrics.enabled', False, profile_id)
+
+    def set_metrics_enabled(self, value, profile_id = None):
+        return self.set_profile_bool_value('snapshots.metrics.enabled', value, profile_id)
+
+    def metrics_path(self, profile_id = None):
+        #?Folder for the metrics textfile. Point this to the folder set in
+        #?node_exporter's --collector.textfile.directory.;absolute path;~/.local/share/backintime
+        return self.get_profile_str_value('snapshots.metrics.path', self._LOCAL_DATA_FOLDER, profile_id)
+
+    def set_metrics_path(self, value, profile_id = None):
+        return self.set_profile_str_value('snapshots.metrics.path', value, profile_id)
+
+    def metrics_file(self, profile_id = None):
+        """
+        Metrics textfile for profile `profile_id`. User name and profile
+        are part of the name so multiple users can share one folder.
+        """
+        if profile_id is None:
+            profile_id = self.get_current_profile()
+        return os.path.join(self.metrics_path(profile_id),
+                            'backintime_%s_%s.prom' %(self.get_user(), profile_id))
+
     def full_rsync( self, profile_id = None ):
         #?Full rsync mode. May be faster but snapshots are not read-only
         #?anymore and destination file-system must support all linux
@@ -1150,6 +1246,31 @@ class Config( configfile.ConfigFileWithProfiles ):
     def set_use_global_flock(self, value):
         self.set_bool_value('global.use_flock', value)
 
+    def is_scheduler_enabled(self):
+        #?Run automatic backups from the resident scheduler ('backintime scheduler')
+        #?instead of crontab entries and udev rules. The scheduler must be started
+        #?on login, e.g. from desktop autostart or a systemd user unit.
+        return self.get_bool_value('global.scheduler.enabled', False)
+
+    def set_scheduler_enabled(self, value):
+        self.set_bool_value('global.scheduler.enabled', value)
+
+    def get_scheduler_max_runs_per_destination(self):
+        #?How many profiles the scheduler may back up to the same drive or
+        #?remote host at the same time.;1-99
+        return self.get_int_value('global.scheduler.max_runs_per_destination', 1)
+
+    def set_scheduler_max_runs_per_destination(self, value):
+        self.set_int_value('global.scheduler.max_runs_per_destination', value)
+
+    def get_scheduler_retries(self):
+        #?How often the scheduler retries a failed backup before waiting for
+        #?the next regular run. Retries wait 5 minutes, doubled each time.;0-99
+        return self.get_int_value('global.scheduler.retries', 3)
+
+    def set_scheduler_retries(self, value):
+        self.set_int_value('global.scheduler.retries', value)
+
     def get_app_path( self ):
         return self._APP_PATH
 
@@ -1169,12 +1290,42 @@ class Config( configfile.ConfigFileWithProfiles ):
     def get_take_snapshot_log_file( self, profile_id = None ):
         return os.path.join( self._LOCAL_DATA_FOLDER, "takesnapshot_%s.log" % self.__get_file_id__( profile_id ) )
 
+    def profile_settings(self, profile_id = None):
+        """
+        Parsed options of profile `profile_id` which are used in hot paths.
+        The result is cached and rebuilt automatically as soon as any
+        option was changed (set_*, remove, load).
+
+        Args:
+            profile_id (str, int):  profile ID. Default is the current profile
+
+        Returns:
+            ProfileSettings:        typed options
+        """
+        if profile_id is None:
+            profile_id = self.current_profile_id
+        else:
+            profile_id = str(profile_id)
+        version = getattr(self.dict, 'version', None)
+        cached = self._profile_settings.get(profile_id)
+        if version is not None and cached is not None and cached[0] == version:
+            return cached[1]
+        settings = ProfileSettings.fromConfig(self, profile_id)
+        self._profile_settings[profile_id] = (version, settings)
+        return settings
+
+    def get_take_snapshot_run_profile_file(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "takesnapshot_%s.profile.txt" % self.__get_file_id__(profile_id))
+
     def get_take_snapshot_message_file( self, profile_id = None ):
         return os.path.join( self._LOCAL_DATA_FOLDER, "worker%s.message" % self.__get_file_id__( profile_id ) )
 
     def get_take_snapshot_progress_file( self, profile_id = None ):
         return os.path.join( self._LOCAL_DATA_FOLDER, "worker%s.progress" % self.__get_file_id__( profile_id ) )
 
+    def get_take_snapshot_socket_file(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "worker%s.sock" % self.__get_file_id__(profile_id))
+
     def get_take_snapshot_instance_file( self, profile_id = None ):
         return os.path.join( self._LOCAL_DATA_FOLDER, "worker%s.lock" % self.__get_file_id__( profile_id ) )
 
@@ -1229,9 +1380,27 @@ class Config( configfile.ConfigFileWithProfiles ):
     def get_restore_log_file( self, profile_id = None ):
         return os.path.join( self._LOCAL_DATA_FOLDER, "restore_%s.log" % self.__get_file_id__( profile_id ) )
 
+    def get_restore_history_file( self, profile_id = None ):
+        return os.path.join( self._LOCAL_DATA_FOLDER, "restore_%s.history" % self.__get_file_id__( profile_id ) )
+
+    def get_scheduler_instance_file(self):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'scheduler.lock')
+
+    def get_scheduler_state_file(self):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'scheduler.json')
+
     def get_restore_instance_file( self, profile_id = None ):
         return os.path.join( self._LOCAL_DATA_FOLDER, "restore%s.lock" % self.__get_file_id__( profile_id ) )
 
+    def get_tool_caps_file(self):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'toolcaps.json')
+
+    def get_hash_cache_file(self, profile_id = None):
+        return os.path.join(self.get_snapshots_full_path(profile_id), 'hash.cache')
+
+    def get_version_index_file(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, 'version_%s.index' % self.__get_file_id__(profile_id))
+
     def get_last_snapshot_symlink(self, profile_id = None):
         return os.path.join(self.get_snapshots_full_path(profile_id), 'last_snapshot')
 
@@ -1419,6 +1588,10 @@ class Config( configfile.ConfigFileWithProfiles ):
         if self.NONE == backup_mode:
             return cron_line
 
+        if self.is_scheduler_enabled():
+            logger.debug('Automatic backups are run by the scheduler', self)
+            return cron_line
+
         hour = self.get_automatic_backup_time(profile_id) // 100
         minute = self.get_automatic_backup_time(profile_id) % 100
         day = self.get_automatic_backup_day(profile_id)
@@ -1495,15 +1668,30 @@ class Config( configfile.ConfigFileWithProfiles ):
 
         return cron_line
 
-    def cron_cmd(self, profile_id):
-        cmd = tools.which('backintime') + ' '
+    def backup_job_cmd(self, profile_id):
+        """
+        Command which runs 'backup-job' for profile `profile_id`.
+
+        Returns:
+            list:   command and arguments
+        """
+        cmd = []
+        if self.is_run_nice_from_cron_enabled( profile_id ) and tools.check_command('nice'):
+            cmd.extend((tools.which('nice'), '-n', '19'))
+        if self.is_run_ionice_from_cron_enabled(profile_id) and tools.check_command('ionice'):
+            cmd.extend((tools.which('ionice'), '-c2', '-n7'))
+        cmd.append(tools.which('backintime'))
         if profile_id != '1':
-            cmd += '--profile-id %s ' % profile_id
+            cmd.extend(('--profile-id', profile_id))
         if not self._LOCAL_CONFIG_PATH is self._DEFAULT_CONFIG_PATH:
-            cmd += '--config %s ' % self._LOCAL_CONFIG_PATH
+            cmd.extend(('--config', self._LOCAL_CONFIG_PATH))
         if logger.DEBUG:
-            cmd += '--debug '
-        cmd += 'backup-job'
+            cmd.append('--debug')
+        cmd.append('backup-job')
+        return cmd
+
+    def cron_cmd(self, profile_id):
+        cmd = ' '.join(self.backup_job_cmd(profile_id))
         if self.redirect_stdout_in_cron(profile_id):
             cmd += ' >/dev/null'
         if self.redirect_stderr_in_cron(profile_id):
@@ -1511,10 +1699,6 @@ class Config( configfile.ConfigFileWithProfiles ):
                 cmd += ' 2>&1'
             else:
                 cmd += ' 2>/dev/null'
-        if self.is_run_ionice_from_cron_enabled(profile_id) and tools.check_command('ionice'):
-            cmd = tools.which('ionice') + ' -c2 -n7 ' + cmd
-        if self.is_run_nice_from_cron_enabled( profile_id ) and tools.check_command('nice'):
-            cmd = tools.which('nice') + ' -n 19 ' + cmd
         return cmd
 
 if __name__ == '__main__':
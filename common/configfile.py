@@ -16,18 +16,65 @@
 #    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import os
+import itertools
 
 import gettext
 import logger
 
 _=gettext.gettext
 
+_versions = itertools.count(1)
+
+class ConfigDict(dict):
+    """
+    dict which gets a new :py:attr:`version` on every change. Caches built
+    from the options can compare the version instead of watching every
+    setter.
+    """
+    def __init__(self, *args, **kwargs):
+        super(ConfigDict, self).__init__(*args, **kwargs)
+        self.version = next(_versions)
+
+    def _changed(self):
+        self.version = next(_versions)
+
+    def __setitem__(self, key, value):
+        super(ConfigDict, self).__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super(ConfigDict, self).__delitem__(key)
+        self._changed()
+
+    def clear(self):
+        super(ConfigDict, self).clear()
+        self._changed()
+
+    def pop(self, *args):
+        ret = super(ConfigDict, self).pop(*args)
+        self._changed()
+        return ret
+
+    def popitem(self):
+        ret = super(ConfigDict, self).popitem()
+        self._changed()
+        return ret
+
+    def setdefault(self, key, default = None):
+        ret = super(ConfigDict, self).setdefault(key, default)
+        self._changed()
+        return ret
+
+    def update(self, *args, **kwargs):
+        super(ConfigDict, self).update(*args, **kwargs)
+        self._changed()
+
 class ConfigFile(object):
     """
     Store options in a plain text file in form of: key=value
     """
     def __init__( self ):
-        self.dict = {}
+        self.dict = ConfigDict()
         self.error_handler = None
         self.question_handler = None
 
@@ -105,7 +152,7 @@ class ConfigFile(object):
         Args:
             filename (str): full path
         """
-        self.dict = {}
+        self.dict = ConfigDict()
         self.append( filename, **kwargs )
 
     def append( self, filename, maxsplit = 1 ):
@@ -21,8 +21,10 @@ import subprocess
 import re
 import shutil
 import tempfile
+import threading
+import queue
+from collections import OrderedDict
 from datetime import datetime
-from distutils.version import StrictVersion
 
 import config
 import mount
@@ -200,7 +202,7 @@ class EncFS_mount(mount.MountControl):
         check if encfs is installed and user is part of group fuse
         """
         logger.debug('Check fuse', self)
-        if not tools.check_command('encfs'):
+        if not tools.TOOL_CAPS.available('encfs'):
             logger.debug('sshfs is missing', self)
             raise MountException( _('encfs not found. Please install e.g. \'apt-get install encfs\'') )
         if self.CHECK_FUSE_GROUP:
@@ -222,11 +224,8 @@ class EncFS_mount(mount.MountControl):
         """
         logger.debug('Check version', self)
         if self.reverse:
-            proc = subprocess.Popen(['encfs', '--version'],
-                                    stdout = subprocess.PIPE,
-                                    stderr = subprocess.STDOUT,
-                                    universal_newlines = True)
-            output = proc.communicate()[0]
+            from distutils.version import StrictVersion
+            output = tools.TOOL_CAPS.output('encfs') or ''
             m = re.search(r'(\d\.\d\.\d)', output)
             if m and StrictVersion(m.group(1)) <= StrictVersion('1.7.2'):
                 logger.debug('Wrong encfs version %s' %m.group(1), self)
@@ -395,6 +394,181 @@ class EncFS_SSH(EncFS_mount):
                 d['hash_id'] = d['hash_id_1']
             return d
 
+class PathCache(object):
+    """
+    LRU cache for paths encoded or decoded by encfsctl.
+
+    EncFS chains the IV of a filename with the IV of its parent folder.
+    So the same name will be encoded differently in different folders.
+    Paths are split into their components and each component is stored
+    with its (plain) parent path as context. Encoding ``foo/bar/baz`` will
+    also make ``foo`` and ``foo/bar`` available from cache.
+
+    Works with both ``str`` and ``bytes`` paths.
+
+    Args:
+        maxsize (int):  maximum number of components kept in cache
+    """
+    def __init__(self, maxsize = 100000):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _split(self, path):
+        if isinstance(path, bytes):
+            return path.split(b'/'), b'/'
+        return path.split('/'), '/'
+
+    def get(self, path):
+        """
+        Get the cached result for `path`.
+
+        Args:
+            path (str, bytes):  path that should be en- or decoded
+
+        Returns:
+            str, bytes:         cached result or ``None`` if at least one
+                                component of `path` is not in cache
+        """
+        components, sep = self._split(path)
+        parent = sep[:0]
+        ret = []
+        with self.lock:
+            for component in components:
+                key = (parent, component)
+                try:
+                    value = self.cache[key]
+                except KeyError:
+                    self.misses += 1
+                    return None
+                self.cache.move_to_end(key)
+                ret.append(value)
+                parent += sep + component
+            self.hits += 1
+        return sep.join(ret)
+
+    def add(self, path, result):
+        """
+        Add `result` for `path` to the cache. Nothing will be cached if
+        `path` and `result` doesn't have the same number of components.
+
+        Args:
+            path (str, bytes):      plain input path
+            result (str, bytes):    en- or decoded result from encfsctl
+        """
+        components, sep = self._split(path)
+        results = self._split(result)[0]
+        if len(components) != len(results):
+            return
+        parent = sep[:0]
+        with self.lock:
+            for component, value in zip(components, results):
+                key = (parent, component)
+                self.cache[key] = value
+                self.cache.move_to_end(key)
+                parent += sep + component
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last = False)
+
+    def clear(self):
+        """
+        Remove all entries and reset statistics.
+        """
+        with self.lock:
+            self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hitRate(self):
+        """
+        Percentage of lookups which could be answered from cache.
+
+        Returns:
+            float:  hit rate in percent
+        """
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits * 100.0 / total
+
+    def __str__(self):
+        return '%s hits, %s misses (%.1f%%), %s components cached' \
+               %(self.hits, self.misses, self.hitRate(), len(self.cache))
+
+def pipeline(procs, paths, newline, cache, window = 128):
+    """
+    Send `paths` to running encfsctl processes in pipe mode and yield their
+    answers in the same order.
+
+    A writer thread keeps up to `window` requests in flight while the caller
+    reads the answers. So we don't have to wait for one round trip per path.
+    Requests are spread round-robin over all `procs`. Paths which are
+    already in `cache` will not be sent to encfsctl at all.
+
+    Args:
+        procs (list):               running ``subprocess.Popen`` instances of
+                                    encfsctl
+        paths (iterable):           paths to en- or decode
+        newline (str, bytes):       line separator used by `procs`
+        cache (PathCache):          cache for results
+        window (int):               maximum number of requests in flight
+
+    Yields:
+        tuple:                      ``(path, result)``. `result` is empty
+                                    if encfsctl failed
+    """
+    inflight = queue.Queue(maxsize = window)
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        try:
+            i = 0
+            for path in paths:
+                if stop.is_set():
+                    break
+                ret = cache.get(path)
+                if ret is None:
+                    proc = procs[i % len(procs)]
+                    i += 1
+                    proc.stdin.write(path + newline)
+                    inflight.put((path, proc))
+                else:
+                    inflight.put((path, ret))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            inflight.put(None)
+
+    thread = threading.Thread(target = writer, daemon = True)
+    thread.start()
+    try:
+        while True:
+            item = inflight.get()
+            if item is None:
+                break
+            path, proc = item
+            if isinstance(proc, subprocess.Popen):
+                ret = proc.stdout.readline().strip(newline)
+                if ret:
+                    cache.add(path, ret)
+            else:
+                ret = proc
+            yield (path, ret)
+    finally:
+        #read all pending answers. Otherwise the next request would get
+        #a wrong answer if the caller didn't consume all results.
+        stop.set()
+        while item is not None:
+            item = inflight.get()
+            if item is not None and isinstance(item[1], subprocess.Popen):
+                item[1].stdout.readline()
+        thread.join()
+    if errors:
+        raise errors[0]
+
 class Encode(object):
     """
     encode path with encfsctl.
@@ -414,12 +588,17 @@ class Encode(object):
         self.re_asterisk = re.compile(r'\*')
         self.re_separate_asterisk = re.compile(r'(.*?)(\*+)(.*)')
 
+        self.cache = PathCache()
+
     def __del__(self):
         self.close()
 
     def start_process(self):
         """
         start 'encfsctl encode' process in pipe mode.
+
+        Returns:
+            subprocess.Popen:   new encfsctl process
         """
         thread = password_ipc.TempPasswordThread(self.password)
         env = self.encfs.get_env()
@@ -431,30 +610,72 @@ class Encode(object):
         logger.debug('Call command: %s'
                      %' '.join(encfsctl),
                      self)
-        self.p = subprocess.Popen(encfsctl, env = env, bufsize = 0,
+        proc = subprocess.Popen(encfsctl, env = env, bufsize = 0,
                                 stdin=subprocess.PIPE,
                                 stdout=subprocess.PIPE,
                                 universal_newlines = True)
         thread.stop()
+        return proc
 
-    def path(self, path):
+    def check_process(self):
         """
-        write plain path to encfsctl stdin and read encrypted path from stdout
+        start 'encfsctl encode' process if it is not running yet.
         """
         if not 'p' in vars(self):
-            self.start_process()
+            self.p = self.start_process()
         if not self.p.returncode is None:
             logger.warning('\'encfsctl encode\' process terminated. Restarting.', self)
             del self.p
-            self.start_process()
+            self.p = self.start_process()
+
+    def path(self, path):
+        """
+        write plain path to encfsctl stdin and read encrypted path from stdout
+        """
+        ret = self.cache.get(path)
+        if not ret is None:
+            return ret
+        self.check_process()
         self.p.stdin.write(path + '\n')
         ret = self.p.stdout.readline().strip('\n')
         if not len(ret) and len(path):
             logger.debug('Failed to encode %s. Got empty string'
                          %path, self)
             raise EncodeValueError()
+        self.cache.add(path, ret)
         return ret
 
+    def encode_many(self, paths, processes = 1, window = 128):
+        """
+        encode a lot of plain paths without waiting for a full round trip
+        on each path.
+
+        Args:
+            paths (iterable):   plain paths
+            processes (int):    number of encfsctl processes to spread the
+                                work on
+            window (int):       maximum number of requests in flight
+
+        Yields:
+            str:                encrypted paths in the same order as `paths`
+
+        Raises:
+            exceptions.EncodeValueError:    if encfsctl returned an empty
+                                            string
+        """
+        self.check_process()
+        procs = [self.p] + [self.start_process() for i in range(processes - 1)]
+        try:
+            for path, ret in pipeline(procs, paths, '\n', self.cache, window):
+                if not len(ret) and len(path):
+                    logger.debug('Failed to encode %s. Got empty string'
+                                 %path, self)
+                    raise EncodeValueError()
+                yield ret
+        finally:
+            for proc in procs[1:]:
+                proc.communicate()
+
     def exclude(self, path):
         """
         encrypt paths for snapshots.take_snapshot exclude list.
@@ -498,6 +719,26 @@ class Encode(object):
             return os.path.join(os.sep, enc)
         return enc
 
+    def exclude_many(self, paths):
+        """
+        encrypt a list of paths for snapshots.take_snapshot exclude list.
+        All paths without wildcards are encoded in one batch before.
+
+        Args:
+            paths (list):   plain exclude paths
+
+        Returns:
+            list:           encrypted paths or ``None`` for paths which
+                            can't be encrypted
+        """
+        paths = list(paths)
+        plain = [path for path in paths
+                 if self.re_asterisk.search(path) is None
+                 and not tools.patternHasNotEncryptableWildcard(path)]
+        for ret in self.encode_many(plain):
+            pass
+        return [self.exclude(path) for path in paths]
+
     def include(self, path):
         """
         encrypt paths for snapshots.take_snapshot include list.
@@ -518,6 +759,7 @@ class Encode(object):
         if 'p' in vars(self) and self.p.returncode is None:
             logger.debug('stop \'encfsctl encode\' process', self)
             self.p.communicate()
+            logger.debug('encode cache: %s' %self.cache, self)
 
 class Bounce(object):
     """
@@ -533,12 +775,18 @@ class Bounce(object):
     def exclude(self, path):
         return path
 
+    def exclude_many(self, paths):
+        return list(paths)
+
     def include(self, path):
         return path
 
     def remote(self, path):
         return path
 
+    def remote_many(self, paths):
+        return iter(paths)
+
     def close(self):
         pass
 
@@ -626,6 +874,10 @@ class Decode(object):
         pattern.append(r'rsync warning: some files vanished before they could be transferred')
         self.re_skip = re.compile(r'^\[I\] %s \(rsync: (%s)' % (_take_snapshot, '|'.join(pattern)) )
 
+        self.cache = PathCache()
+        #if not None, path() will only collect paths instead of decoding them
+        self.collect = None
+
         self.string = string
         if string:
             self.newline = '\n'
@@ -638,6 +890,9 @@ class Decode(object):
     def start_process(self):
         """
         start 'encfsctl decode' process in pipe mode.
+
+        Returns:
+            subprocess.Popen:   new encfsctl process
         """
         thread = password_ipc.TempPasswordThread(self.password)
         env = os.environ.copy()
@@ -649,12 +904,24 @@ class Decode(object):
         logger.debug('Call command: %s'
                      %' '.join(encfsctl),
                      self)
-        self.p = subprocess.Popen(encfsctl, env = env,
-                                  stdin=subprocess.PIPE,
-                                  stdout=subprocess.PIPE,
-                                  universal_newlines = self.string,   #return string (if True) or bytes
-                                  bufsize = 0)
+        proc = subprocess.Popen(encfsctl, env = env,
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                universal_newlines = self.string,   #return string (if True) or bytes
+                                bufsize = 0)
         thread.stop()
+        return proc
+
+    def check_process(self):
+        """
+        start 'encfsctl decode' process if it is not running yet.
+        """
+        if not 'p' in vars(self):
+            self.p = self.start_process()
+        if not self.p.returncode is None:
+            logger.warning('\'encfsctl decode\' process terminated. Restarting.', self)
+            del self.p
+            self.p = self.start_process()
 
     def path(self, path):
         """
@@ -665,27 +932,54 @@ class Decode(object):
             assert isinstance(path, str), 'path is not str type: %s' % path
         else:
             assert isinstance(path, bytes), 'path is not bytes type: %s' % path
-        if not 'p' in vars(self):
-            self.start_process()
-        if not self.p.returncode is None:
-            logger.warning('\'encfsctl decode\' process terminated. Restarting.', self)
-            del self.p
-            self.start_process()
+        if not self.collect is None:
+            self.collect.append(path)
+            return path
+        ret = self.cache.get(path)
+        if not ret is None:
+            return ret
+        self.check_process()
         self.p.stdin.write(path + self.newline)
         ret = self.p.stdout.readline()
         ret = ret.strip(self.newline)
         if ret:
+            self.cache.add(path, ret)
             return ret
         return path
 
+    def decode_many(self, paths, processes = 1, window = 128):
+        """
+        decode a lot of crypted paths without waiting for a full round trip
+        on each path.
+
+        Args:
+            paths (iterable):   crypted paths
+            processes (int):    number of encfsctl processes to spread the
+                                work on
+            window (int):       maximum number of requests in flight
+
+        Yields:
+            str:                plain paths in the same order as `paths`.
+                                If a path couldn't be decoded the crypted
+                                path is returned
+        """
+        self.check_process()
+        procs = [self.p] + [self.start_process() for i in range(processes - 1)]
+        try:
+            for path, ret in pipeline(procs, paths, self.newline, self.cache, window):
+                if ret:
+                    yield ret
+                else:
+                    yield path
+        finally:
+            for proc in procs[1:]:
+                proc.communicate()
+
     def list(self, list_):
         """
         decode a list of paths
         """
-        output = []
-        for path in list_:
-            output.append(self.path(path))
-        return output
+        return list(self.decode_many(list_))
 
     def log(self, line):
         """
@@ -718,6 +1012,30 @@ class Decode(object):
             return m.group(1) + self.path(m.group(2)) + m.group(3) + self.path(m.group(4)) + m.group(5)
         return line
 
+    def log_many(self, lines):
+        """
+        decode paths in a batch of takesnapshot.log lines. All paths are
+        collected first and decoded in one pipelined run of
+        :py:func:`decode_many`.
+
+        Args:
+            lines (iterable):   log lines
+
+        Returns:
+            list:               decoded log lines
+        """
+        lines = list(lines)
+        self.collect = []
+        try:
+            for line in lines:
+                self.log(line)
+            paths = self.collect
+        finally:
+            self.collect = None
+        for ret in self.decode_many(paths):
+            pass
+        return [self.log(line) for line in lines]
+
     def replace(self, m):
         """
         return decoded string for re.sub
@@ -753,6 +1071,26 @@ class Decode(object):
         dec_path = self.path( path[len(remote_path):] )
         return os.path.join(remote_path, dec_path)
 
+    def remote_many(self, paths, processes = 1, window = 128):
+        """
+        decode a lot of paths on remote host starting from
+        backintime/host/user/...
+
+        Args:
+            paths (iterable):   crypted paths (bytes)
+            processes (int):    number of encfsctl processes to spread the
+                                work on
+            window (int):       maximum number of requests in flight
+
+        Yields:
+            bytes:              plain paths in the same order as `paths`
+        """
+        remote_path = self.remote_path.encode()
+        head = len(remote_path)
+        crypted = (path[head:] for path in paths)
+        for dec_path in self.decode_many(crypted, processes, window):
+            yield os.path.join(remote_path, dec_path)
+
     def close(self):
         """
         stop encfsctl process
@@ -760,3 +1098,4 @@ class Decode(object):
         if 'p' in vars(self) and self.p.returncode is None:
             logger.debug('stop \'encfsctl decode\' process', self)
             self.p.communicate()
+            logger.debug('decode cache: %s' %self.cache, self)
@@ -0,0 +1,454 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Export parts of a snapshot into a tar archive.
+
+The archive is written as a stream (see :py:func:`tarfile.open` with
+``'w|'`` modes). Files are read from the snapshot one by one and written
+directly into the archive, so nothing is restored locally first.
+Owner, group and mode of every member are taken from the snapshots
+fileinfo instead of the read-only files in the snapshot.
+
+On ssh profiles the tar stream is generated with ``tar`` on the remote
+host and only the headers are rewritten locally.
+
+Only fileinfo entries below the exported paths are loaded and they are
+dropped again as soon as the walk through the snapshot has passed them
+(see :py:class:`FileInfoReader`).
+"""
+
+import os
+import bz2
+import collections
+import pwd
+import grp
+import sys
+import stat
+import shlex
+import tarfile
+import subprocess
+
+import logger
+
+#suffix: tarfile stream mode
+COMPRESSION = (('.tar.gz',  'w|gz'),
+               ('.tgz',     'w|gz'),
+               ('.tar.xz',  'w|xz'),
+               ('.txz',     'w|xz'),
+               ('.tar.bz2', 'w|bz2'),
+               ('.tbz2',    'w|bz2'),
+               ('.tar',     'w|'))
+
+def streamMode(target):
+    """
+    Get the :py:mod:`tarfile` stream mode depending on the suffix of
+    `target`. Unknown suffixes and stdout (``-``) result in an
+    uncompressed tar.
+
+    Args:
+        target (str):   archive file name
+
+    Returns:
+        str:            mode for :py:func:`tarfile.open`
+    """
+    for suffix, mode in COMPRESSION:
+        if target.endswith(suffix):
+            return mode
+    return 'w|'
+
+def readFileInfo(infoFile):
+    """
+    Read fileinfo.bz2 line by line.
+
+    Args:
+        infoFile (str): full path to fileinfo.bz2
+
+    Yields:
+        tuple:          (path, (mode, user, group)) with path as ``bytes``
+    """
+    try:
+        with bz2.BZ2File(infoFile, 'rb') as fileinfo:
+            for line in fileinfo:
+                line = line.strip(b'\n')
+                index = line.find(b'/')
+                if index < 0:
+                    continue
+                info = line[:index].strip().split(b' ')
+                if len(info) == 3:
+                    yield (line[index:], (int(info[0]), info[1], info[2]))
+    except Exception as e:
+        logger.debug('Failed to read %s: %s' %(infoFile, str(e)))
+
+def sortKey(path):
+    """
+    Sort key for paths which matches a depth-first walk with the
+    content of each folder sorted by name. Every folder is directly
+    followed by its content ('/a', '/a/b', '/a-b'), which plain byte
+    order would not do.
+
+    Args:
+        path (bytes):   absolute path
+
+    Returns:
+        list:           path components
+    """
+    return path.split(b'/')
+
+def loadFileInfo(sid, paths):
+    """
+    Load only those fileinfo entries from `sid` which belong to `paths`.
+    Unlike :py:attr:`snapshots.SID.fileInfo` this doesn't keep the whole
+    snapshot in memory if only a small part gets exported. But memory
+    still grows with the number of files below `paths`.
+
+    Args:
+        sid (snapshots.SID):    snapshot
+        paths (list):           exported paths as ``bytes``
+
+    Returns:
+        dict:                   ``{path: (mode, user, group)}``
+    """
+    prefixes = tuple(os.path.join(p, b'') for p in paths)
+    d = {}
+    infoFile = sid.path(sid.FILEINFO)
+    if not os.path.isfile(infoFile):
+        return d
+    for path, info in readFileInfo(infoFile):
+        if path in paths or path.startswith(prefixes):
+            d[path] = info
+    return d
+
+class FileInfoReader(object):
+    """
+    Look up fileinfo entries of `sid` while walking through the exported
+    paths. fileinfo is read in one pass and only entries below `paths`
+    are kept. They are sorted by :py:func:`sortKey` like the walk, so
+    every entry is dropped again once the walk has passed it. Memory is
+    bound by the number of files below `paths`, not by the snapshot.
+
+    If paths are looked up out of order (e.g. remote tar without
+    '--sort=name' or nested export paths) the remaining lookups use
+    :py:func:`loadFileInfo`.
+
+    Args:
+        sid (snapshots.SID):    snapshot
+        paths (list):           exported paths as ``bytes``
+    """
+    def __init__(self, sid, paths):
+        self.sid = sid
+        self.paths = paths
+        self.lastKey = None
+        self.dict = None
+        self.entries = collections.deque(sorted(((sortKey(p), info)
+                                                 for p, info in loadFileInfo(sid, paths).items()),
+                                                key = lambda x: x[0]))
+
+    def fallback(self, reason):
+        logger.debug('Load fileinfo of %s into memory: %s' %(self.sid, reason), self)
+        self.close()
+        self.dict = loadFileInfo(self.sid, self.paths)
+
+    def get(self, path):
+        """
+        Args:
+            path (bytes):   absolute path inside the snapshot
+
+        Returns:
+            tuple:          (mode, user, group) or ``None``
+        """
+        if self.dict is not None:
+            return self.dict.get(path)
+        key = sortKey(path)
+        if self.lastKey is not None and key < self.lastKey:
+            self.fallback('paths are not sorted')
+            return self.dict.get(path)
+        self.lastKey = key
+        while self.entries and self.entries[0][0] < key:
+            self.entries.popleft()
+        if self.entries and self.entries[0][0] == key:
+            return self.entries[0][1]
+        return None
+
+    def close(self):
+        self.entries.clear()
+
+class _Entry(object):
+    """
+    Minimal :py:class:`os.DirEntry` replacement for the exported paths
+    itself.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def stat(self, follow_symlinks = True):
+        if follow_symlinks:
+            return os.stat(self.path)
+        return os.lstat(self.path)
+
+    def is_dir(self, follow_symlinks = True):
+        return stat.S_ISDIR(self.stat(follow_symlinks).st_mode)
+
+class Export(object):
+    """
+    Write `paths` from snapshot `sid` into a tar archive.
+
+    Args:
+        snapshots (snapshots.Snapshots):    current snapshots instance
+        sid (snapshots.SID):                snapshot to export from
+        paths (list):                       absolute paths (``str``) to export
+        callback (method):                  callable which will handle
+                                            messages
+    """
+    BUFSIZE = 1024 * 1024
+
+    def __init__(self, snapshots, sid, paths, callback = None):
+        self.snapshots = snapshots
+        self.config = snapshots.config
+        self.sid = sid
+        self.paths = sorted((os.path.normpath(p).encode() for p in paths),
+                            key = sortKey)
+        self.callback = callback
+        self.fileInfo = None
+        self.uidCache = {}
+        self.gidCache = {}
+        self.count = 0
+        self.errors = 0
+
+    def report(self, msg, error = False):
+        if error:
+            self.errors += 1
+            logger.warning(msg, self)
+        else:
+            logger.debug(msg, self)
+        if self.callback:
+            self.callback(msg)
+
+    def uid(self, name, default):
+        if not name in self.uidCache:
+            try:
+                self.uidCache[name] = pwd.getpwnam(name).pw_uid
+            except KeyError:
+                self.uidCache[name] = None
+        uid = self.uidCache[name]
+        return default if uid is None else uid
+
+    def gid(self, name, default):
+        if not name in self.gidCache:
+            try:
+                self.gidCache[name] = grp.getgrnam(name).gr_gid
+            except KeyError:
+                self.gidCache[name] = None
+        gid = self.gidCache[name]
+        return default if gid is None else gid
+
+    def applyFileInfo(self, tarinfo, path):
+        """
+        Replace mode, user and group of `tarinfo` with those from fileinfo.
+        The numeric UID/GID is taken from this machine if the user/group
+        exists here, otherwise the one from the snapshot is kept.
+
+        Args:
+            tarinfo (tarfile.TarInfo): member
+            path (bytes):               absolute path of the member
+        """
+        info = self.fileInfo.get(path)
+        if info is None:
+            return
+        tarinfo.mode = stat.S_IMODE(info[0])
+        tarinfo.uname = info[1].decode(errors = 'surrogateescape')
+        tarinfo.gname = info[2].decode(errors = 'surrogateescape')
+        tarinfo.uid = self.uid(tarinfo.uname, tarinfo.uid)
+        tarinfo.gid = self.gid(tarinfo.gname, tarinfo.gid)
+
+    def run(self, fileobj, mode = 'w|'):
+        """
+        Write the archive into `fileobj`.
+
+        Args:
+            fileobj (io.BufferedIOBase):    opened binary file or stdout
+            mode (str):                     stream mode for
+                                            :py:func:`tarfile.open`
+
+        Returns:
+            bool:                           ``True`` if all members were
+                                            exported without errors
+        """
+        self.fileInfo = FileInfoReader(self.sid, self.paths)
+        try:
+            with tarfile.open(fileobj = fileobj, mode = mode,
+                              format = tarfile.PAX_FORMAT,
+                              bufsize = self.BUFSIZE) as tar:
+                if self.config.get_snapshots_mode() == 'ssh':
+                    self.remote(tar)
+                else:
+                    self.local(tar)
+        finally:
+            self.fileInfo.close()
+        logger.info('Exported %s items from snapshot %s with %s errors'
+                    %(self.count, self.sid, self.errors), self)
+        return not self.errors
+
+    def _tarInfo(self, entry, head):
+        """
+        Create a :py:class:`tarfile.TarInfo` for a :py:func:`os.scandir`
+        entry. Hardlinks are stored as regular files.
+        """
+        st = entry.stat(follow_symlinks = False)
+        tarinfo = tarfile.TarInfo(entry.path[head:].lstrip(b'/').decode(errors = 'surrogateescape'))
+        tarinfo.mtime = st.st_mtime
+        tarinfo.mode = stat.S_IMODE(st.st_mode)
+        tarinfo.uid = st.st_uid
+        tarinfo.gid = st.st_gid
+        if stat.S_ISREG(st.st_mode):
+            tarinfo.type = tarfile.REGTYPE
+            tarinfo.size = st.st_size
+        elif stat.S_ISDIR(st.st_mode):
+            tarinfo.type = tarfile.DIRTYPE
+        elif stat.S_ISLNK(st.st_mode):
+            tarinfo.type = tarfile.SYMTYPE
+            tarinfo.linkname = os.readlink(entry.path).decode(errors = 'surrogateescape')
+        else:
+            return None
+        self.applyFileInfo(tarinfo, entry.path[head:])
+        return tarinfo
+
+    def _add(self, tar, entry, head):
+        try:
+            tarinfo = self._tarInfo(entry, head)
+            if tarinfo is None:
+                self.report('Skip special file %s' % entry.path.decode(errors = 'ignore'))
+                return
+            if tarinfo.isreg():
+                with open(entry.path, 'rb') as f:
+                    tar.addfile(tarinfo, f)
+            else:
+                tar.addfile(tarinfo)
+            #TarFile keeps every member even in stream mode
+            tar.members = []
+            self.count += 1
+        except OSError as e:
+            self.report('Failed to export %s: %s' %(entry.path.decode(errors = 'ignore'), str(e)), True)
+
+    def local(self, tar):
+        """
+        Walk through the (mounted) snapshot and add all items to `tar`.
+        Only the sorted listing of one folder per level is kept, so memory
+        depends on the depth of the tree and the size of its folders but not
+        on the number of files.
+        """
+        root = self.sid.pathBackup().rstrip('/').encode()
+        head = len(root)
+        for path in self.paths:
+            full = root + path
+            if not os.path.lexists(full):
+                self.report('%s is not in snapshot %s' %(path.decode(errors = 'ignore'), self.sid), True)
+                continue
+            self._add(tar, _Entry(full), head)
+            if not os.path.isdir(full) or os.path.islink(full):
+                continue
+            stack = [self._listdir(full)]
+            while stack:
+                entry = next(stack[-1], None)
+                if entry is None:
+                    stack.pop()
+                    continue
+                self._add(tar, entry, head)
+                if entry.is_dir(follow_symlinks = False):
+                    try:
+                        stack.append(self._listdir(entry.path))
+                    except OSError as e:
+                        self.report('Failed to scan %s: %s' %(entry.path.decode(errors = 'ignore'), str(e)), True)
+
+    @staticmethod
+    def _listdir(path):
+        """
+        Content of folder `path` sorted by name like fileinfo.
+        """
+        with os.scandir(path) as it:
+            return iter(sorted(it, key = lambda entry: entry.name))
+
+    def remote(self, tar):
+        """
+        Run 'tar' on the remote host and copy its members into `tar`.
+        Only the headers are changed to match fileinfo. File contents are
+        copied straight through.
+
+        Remote tar stores hardlinks as regular files, otherwise it would
+        remember every file of the hardlinked snapshot. If it supports
+        '--sort=name' fileinfo can be streamed, too.
+        """
+        root = self.sid.pathBackup(use_mode = ['ssh']).rstrip('/')
+        script = 'SORT=\n'
+        script += 'tar --sort=name -cf /dev/null -T /dev/null 2>/dev/null && SORT=--sort=name\n'
+        script += 'cd %s && exec tar -cf - --hard-dereference $SORT --' % shlex.quote(root)
+        for path in self.paths:
+            script += ' %s' % shlex.quote(path.decode(errors = 'surrogateescape').lstrip('/') or '.')
+        cmd = self.snapshots.cmd_ssh(['sh', '-s'], use_modes = ['ssh'])
+        logger.debug("Call script with \"%s\":\n%s" %(' '.join(cmd), script), self)
+        proc = subprocess.Popen(cmd,
+                                stdin = subprocess.PIPE,
+                                stdout = subprocess.PIPE)
+        proc.stdin.write(script.encode(errors = 'surrogateescape') + b'\n')
+        proc.stdin.close()
+        try:
+            with tarfile.open(fileobj = proc.stdout, mode = 'r|',
+                              bufsize = self.BUFSIZE) as src:
+                for tarinfo in src:
+                    path = os.path.normpath('/' + tarinfo.name).encode(errors = 'surrogateescape')
+                    self.applyFileInfo(tarinfo, path)
+                    if tarinfo.isreg():
+                        tar.addfile(tarinfo, src.extractfile(tarinfo))
+                    else:
+                        tar.addfile(tarinfo)
+                    tar.members = []
+                    src.members = []
+                    self.count += 1
+        except tarfile.TarError as e:
+            self.report('Failed to read remote tar stream: %s' % str(e), True)
+        finally:
+            proc.stdout.close()
+        if proc.wait():
+            self.report('Remote tar returned %s' % proc.returncode, True)
+
+def export(snapshots, sid, paths, target, callback = None, stdout = None):
+    """
+    Export `paths` from `sid` into archive `target`.
+
+    Args:
+        snapshots (snapshots.Snapshots):    current snapshots instance
+        sid (snapshots.SID):                snapshot to export from
+        paths (list):                       absolute paths to export
+        target (str):                       archive file name or ``-``
+                                            for stdout
+        callback (method):                  callable which will handle
+                                            messages
+        stdout (io.TextIOWrapper):          stdout used for ``-``.
+                                            Default is ``sys.stdout``
+
+    Returns:
+        bool:                               ``True`` if successful
+    """
+    e = Export(snapshots, sid, paths, callback)
+    mode = streamMode(target)
+    if target == '-':
+        if stdout is None:
+            stdout = sys.stdout
+        ret = e.run(stdout.buffer, mode)
+        stdout.flush()
+        return ret
+    with open(target, 'wb') as f:
+        return e.run(f, mode)
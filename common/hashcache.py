@@ -0,0 +1,212 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Persistent cache for file content hashes.
+
+Unchanged files are hard-linked between snapshots, so comparing a file in
+many snapshots would hash the very same inode over and over again. Hashes
+are cached by ``(st_dev, st_ino, size, mtime_ns)`` in memory. The SQLite
+database is stored next to the snapshots and only keeps hashes of files
+on the same filesystem by ``(st_ino, size, mtime_ns)`` because device
+numbers change between mounts. Filesystems which make up inode numbers
+(like sshfs) are never written to the database. Files are read with a
+large buffer and missing hashes can be calculated in parallel with
+:py:meth:`HashCache.hashMany`.
+"""
+
+import os
+import sqlite3
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import logger
+import tools
+
+#blake2b is faster than md5 on 64bit systems but only available since
+#Python 3.6
+if hasattr(hashlib, 'blake2b'):
+    ALGORITHM = 'blake2b'
+else:
+    ALGORITHM = 'md5'
+
+BUFSIZE = 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hashes (ino INTEGER,
+                                   size INTEGER,
+                                   mtime INTEGER,
+                                   algorithm TEXT,
+                                   hash TEXT,
+                                   UNIQUE (ino, size, mtime, algorithm));
+'''
+
+def fileHash(path, algorithm = ALGORITHM):
+    """
+    Calculate the hash of the content of `path`.
+
+    Args:
+        path (str, bytes):  full path to file
+        algorithm (str):    name of a :py:mod:`hashlib` algorithm
+
+    Returns:
+        str:                hex digest
+    """
+    h = hashlib.new(algorithm)
+    buf = bytearray(BUFSIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering = 0) as f:
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            h.update(view[:size])
+    return h.hexdigest()
+
+def _key(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, ALGORITHM)
+
+class HashCache(object):
+    """
+    Content hashes of files cached by inode.
+
+    Args:
+        fileName (str):     path to the database inside the repository.
+                            Only hashes of files on the same filesystem
+                            are stored in there. If ``None`` or if the
+                            filesystem has no stable inode numbers
+                            hashes are only cached in memory
+        threads (int):      number of parallel workers in
+                            :py:meth:`hashMany`
+        maxItems (int):     number of hashes to keep in the database
+    """
+    def __init__(self, fileName = None, threads = 4, maxItems = 100000):
+        self.fileName = fileName
+        self.threads = threads
+        self.maxItems = maxItems
+        self.cache = {}
+        self.new = {}
+        self.conn = None
+        self.dev = None
+        if fileName:
+            root = os.path.dirname(fileName)
+            if not tools.stable_inodes(root):
+                logger.debug('%s has no stable inode numbers. Don\'t store hashes in %s'
+                             %(root, fileName), self)
+                return
+            try:
+                self.dev = os.stat(root).st_dev
+                self.conn = sqlite3.connect(fileName, timeout = 30)
+                self.conn.executescript(SCHEMA)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning('Failed to open hash cache %s: %s' %(fileName, str(e)), self)
+                self.conn = None
+
+    def _lookup(self, key):
+        if key in self.cache:
+            return self.cache[key]
+        if self.conn is not None and key[0] == self.dev:
+            row = self.conn.execute('SELECT hash FROM hashes WHERE ino = ? '
+                                    'AND size = ? AND mtime = ? AND algorithm = ?',
+                                    key[1:]).fetchone()
+            if row:
+                self.cache[key] = row[0]
+                return row[0]
+        return None
+
+    def _store(self, key, value):
+        self.cache[key] = value
+        if key[0] == self.dev:
+            self.new[key] = value
+
+    def hash(self, path, st = None):
+        """
+        Get the hash of `path` from cache or calculate it.
+
+        Args:
+            path (str, bytes):  full path to file
+            st (os.stat_result):    result of :py:func:`os.stat` for
+                                    `path` if already known
+
+        Returns:
+            str:                hex digest
+        """
+        if st is None:
+            st = os.stat(path)
+        key = _key(st)
+        value = self._lookup(key)
+        if value is None:
+            value = fileHash(path)
+            self._store(key, value)
+        return value
+
+    def hashMany(self, paths):
+        """
+        Make sure hashes for all `paths` are cached. Missing hashes are
+        calculated in a thread pool. Hard-links are only hashed once.
+
+        Args:
+            paths (list):   full paths to files
+        """
+        todo = {}
+        for path in paths:
+            try:
+                key = _key(os.stat(path))
+            except OSError:
+                continue
+            if not key in todo and self._lookup(key) is None:
+                todo[key] = path
+        if not todo:
+            return
+        logger.debug('Hash %s files with %s' %(len(todo), ALGORITHM), self)
+        keys = list(todo.keys())
+        with ThreadPoolExecutor(max_workers = self.threads) as pool:
+            for key, value in zip(keys, pool.map(self._fileHash, [todo[k] for k in keys])):
+                if value is not None:
+                    self._store(key, value)
+
+    def _fileHash(self, path):
+        try:
+            return fileHash(path)
+        except OSError as e:
+            logger.debug('Failed to hash %s: %s' %(path, str(e)), self)
+            return None
+
+    def save(self):
+        """
+        Write new hashes into the database and drop the oldest ones if
+        there are more than `maxItems`.
+        """
+        if self.conn is None or not self.new:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)',
+                                      [key[1:] + (value,) for key, value in self.new.items()])
+                self.conn.execute('DELETE FROM hashes WHERE rowid <= '
+                                  '(SELECT MAX(rowid) FROM hashes) - ?', (self.maxItems,))
+            self.new = {}
+        except sqlite3.Error as e:
+            logger.warning('Failed to save hash cache %s: %s' %(self.fileName, str(e)), self)
+
+    def close(self):
+        """
+        Save new hashes and close the database.
+        """
+        self.save()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,235 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Collect metrics of one take_snapshot run and export them as OpenMetrics
+textfile which can be picked up by node_exporter's textfile collector.
+"""
+
+import os
+import time
+import tempfile
+from collections import OrderedDict
+
+import logger
+import restoreplan
+
+PREFIX = 'backintime_'
+
+class Metrics(object):
+    """
+    Metrics of one take_snapshot run.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Default is the current profile
+    """
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        if profile_id is None:
+            profile_id = cfg.get_current_profile()
+        self.profile_id = profile_id
+        self.start = time.time()
+        self.end = None
+        self.success = False
+        self.phases = OrderedDict()
+        self.currentPhase = None
+        self.phaseStart = None
+        self.transferred = 0
+        self.filesChanged = 0
+        self.filesDeleted = 0
+        self.errors = 0
+        self.freeBytes = None
+        self.freeInodes = None
+        self.snapshots = None
+        self.lastSnapshot = None
+
+    def phase(self, name):
+        """
+        Start phase `name` and stop the current one.
+        """
+        now = time.time()
+        self._stopPhase(now)
+        self.currentPhase = name
+        self.phaseStart = now
+
+    def _stopPhase(self, now):
+        if self.currentPhase is None:
+            return
+        duration = now - self.phaseStart
+        self.phases[self.currentPhase] = self.phases.get(self.currentPhase, 0.0) + duration
+        self.currentPhase = None
+
+    def finish(self, success):
+        """
+        Stop the current phase and the whole run.
+        """
+        self.end = time.time()
+        self._stopPhase(self.end)
+        self.success = success
+
+    def rsyncLine(self, line):
+        """
+        Count transferred bytes from rsync's summary line and changed or
+        deleted files from itemized lines ('BACKINTIME: %i %n%L').
+
+        Args:
+            line (str): rsync output line
+        """
+        if line.startswith('BACKINTIME: '):
+            item = line[12:]
+            if item.startswith('*deleting'):
+                if not item.endswith('/'):
+                    self.filesDeleted += 1
+            elif len(item) > 2 and item[0] != '.' and item[1] != 'd':
+                self.filesChanged += 1
+            return
+        size = restoreplan.History.parseRsyncStats(line)
+        if not size is None:
+            self.transferred += size
+
+    def statFilesystem(self, path):
+        """
+        Free space and inodes of the filesystem which holds `path`.
+        """
+        try:
+            info = os.statvfs(path)
+        except OSError as e:
+            logger.debug('Failed to stat %s: %s' %(path, str(e)), self)
+            return
+        self.freeBytes = info.f_bavail * info.f_frsize
+        self.freeInodes = info.f_favail
+
+    def statSnapshots(self, snapshots):
+        """
+        Number of snapshots and newest snapshot which didn't fail.
+
+        Args:
+            snapshots (list):   :py:class:`snapshots.SID` instances
+        """
+        self.snapshots = len(snapshots)
+        good = [sid for sid in snapshots if not sid.failed]
+        if good:
+            self.lastSnapshot = max(good)
+
+    def samples(self):
+        """
+        All metrics of this run.
+
+        Yields:
+            tuple:  (name, help, labels, value) where labels is a dict
+                    of additional labels
+        """
+        yield ('last_run_timestamp_seconds', 'Time when the last run finished.',
+               {}, self.end or time.time())
+        yield ('last_run_success', '1 if the last run finished without errors.',
+               {}, int(self.success))
+        yield ('last_run_duration_seconds', 'Duration of the last run.',
+               {}, (self.end or time.time()) - self.start)
+        for phase, duration in self.phases.items():
+            yield ('phase_duration_seconds', 'Duration of each phase of the last run.',
+                   {'phase': phase}, duration)
+        yield ('transferred_bytes', 'Bytes sent and received by rsync in the last run.',
+               {}, self.transferred)
+        yield ('files_changed', 'Files added or changed in the last run.',
+               {}, self.filesChanged)
+        yield ('files_deleted', 'Files deleted in the last run.',
+               {}, self.filesDeleted)
+        yield ('errors', 'Errors in the last run.',
+               {}, self.errors)
+        if not self.freeBytes is None:
+            yield ('free_bytes', 'Free space on the snapshot filesystem after removing old snapshots.',
+                   {}, self.freeBytes)
+            yield ('free_inodes', 'Free inodes on the snapshot filesystem after removing old snapshots.',
+                   {}, self.freeInodes)
+        if not self.snapshots is None:
+            yield ('snapshots', 'Number of snapshots.',
+                   {}, self.snapshots)
+        if not self.lastSnapshot is None:
+            timestamp = time.mktime(self.lastSnapshot.date.timetuple())
+            yield ('last_snapshot_timestamp_seconds', 'Time of the newest snapshot which did not fail.',
+                   {}, timestamp)
+            yield ('last_snapshot_age_seconds', 'Age of the newest snapshot which did not fail.',
+                   {}, (self.end or time.time()) - timestamp)
+
+    def format(self):
+        """
+        Metrics in OpenMetrics text format.
+
+        Returns:
+            str:    metrics including the final '# EOF'
+        """
+        labels = OrderedDict((('profile', self.profile_id),
+                              ('profile_name', self.config.get_profile_name(self.profile_id))))
+        lines = []
+        last = None
+        for name, helpText, extra, value in self.samples():
+            name = PREFIX + name
+            if name != last:
+                lines.append('# HELP %s %s' %(name, helpText))
+                lines.append('# TYPE %s gauge' % name)
+                last = name
+            d = labels.copy()
+            d.update(extra)
+            lines.append('%s{%s} %s' %(name, formatLabels(d), formatValue(value)))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename = None):
+        """
+        Replace `filename` atomically so the collector never reads a half
+        written file.
+
+        Args:
+            filename (str): Default is :py:meth:`config.Config.metrics_file`
+
+        Returns:
+            bool:           ``True`` if successful
+        """
+        if filename is None:
+            filename = self.config.metrics_file(self.profile_id)
+        folder = os.path.dirname(filename)
+        try:
+            os.makedirs(folder, exist_ok = True)
+            with tempfile.NamedTemporaryFile('wt', dir = folder, prefix = '.backintime_',
+                                             suffix = '.tmp', delete = False) as f:
+                tmp = f.name
+                f.write(self.format())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, filename)
+        except OSError as e:
+            logger.error('Failed to write metrics to %s: %s' %(filename, str(e)), self)
+            try:
+                os.remove(tmp)
+            except (NameError, OSError):
+                pass
+            return False
+        return True
+
+def formatLabels(labels):
+    """
+    Format and escape labels like ``a="1",b="x"``.
+    """
+    items = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        items.append('%s="%s"' %(key, value))
+    return ','.join(items)
+
+def formatValue(value):
+    if isinstance(value, float):
+        return repr(round(value, 3))
+    return str(value)
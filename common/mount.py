@@ -42,7 +42,9 @@ class Mount(object):
         self.tmp_mount = tmp_mount
         self.parent = parent
 
-        if self.config.get_password_use_cache(self.profile_id):
+        #local profiles don't need a password, so don't start pw-cache for them
+        mode = self.config.get_snapshots_mode(self.profile_id)
+        if self.config.mode_need_password(mode) and self.config.get_password_use_cache(self.profile_id):
             pw_cache = password.Password_Cache(self.config)
             action = None
             running = pw_cache.status()
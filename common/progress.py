@@ -15,8 +15,12 @@
 #    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import os
+import mmap
+import time
+import struct
 
 import configfile
+import logger
 
 class ProgressFile(configfile.ConfigFile):
 
@@ -37,3 +41,211 @@ class ProgressFile(configfile.ConfigFile):
 
     def isFileReadable(self):
         return os.access(self.filename, os.R_OK)
+
+class ProgressSegment(object):
+    """
+    Memory-mapped progress of the current take_snapshot or restore run.
+
+    Instead of writing and parsing :py:class:`ProgressFile` for every
+    progress line, the writer updates a small file with a fixed layout
+    in place and readers map it once and read it without parsing. A
+    sequence counter which is odd while the writer is busy makes sure
+    readers never see half written values.
+
+    :py:class:`ProgressFile` is still used as fallback if the segment
+    can't be mapped (writer) or isn't active (reader, e.g. the progress
+    was written by an older version).
+
+    Args:
+        cfg (config.Config):    current config
+        maxRate (int):          update the segment at most this many
+                                times per second
+    """
+    MAGIC = b'BITP'
+    VERSION = 1
+    #magic, version, reserved, sequence
+    HEADER = struct.Struct('<4sHHI')
+    #status, percent, sent, speed, eta
+    DATA = struct.Struct('<ii16s16s16s')
+    SIZE = HEADER.size + DATA.size
+    KEYS = ('status', 'percent', 'sent', 'speed', 'eta')
+    INACTIVE = 0
+
+    def __init__(self, cfg, maxRate = 4):
+        self.config = cfg
+        self.maxRate = maxRate
+        self.filename = None
+        self.inode = None
+        self.mm = None
+        self.writeable = False
+        self.seq = 0
+        self.lastUpdate = 0.0
+
+    def _filename(self):
+        return self.config.get_take_snapshot_progress_file() + '.mmap'
+
+    def _map(self, writeable):
+        """
+        Map the segment of the current profile. Remap if the profile has
+        changed or the file was replaced.
+
+        Returns:
+            bool:   ``True`` if the segment is mapped
+        """
+        filename = self._filename()
+        try:
+            st = os.stat(filename)
+        except OSError:
+            st = None
+        if self.mm is not None and filename == self.filename \
+           and st is not None and (st.st_dev, st.st_ino) == self.inode \
+           and writeable <= self.writeable:
+            return True
+        self.close()
+        if st is None and not writeable:
+            return False
+        try:
+            if writeable:
+                fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o600)
+            else:
+                fd = os.open(filename, os.O_RDONLY)
+            try:
+                st = os.fstat(fd)
+                if st.st_size < self.SIZE:
+                    if not writeable:
+                        return False
+                    os.ftruncate(fd, self.SIZE)
+                access = mmap.ACCESS_WRITE if writeable else mmap.ACCESS_READ
+                self.mm = mmap.mmap(fd, self.SIZE, access = access)
+            finally:
+                os.close(fd)
+        except (OSError, ValueError) as e:
+            logger.debug('Failed to map progress segment %s: %s' %(filename, str(e)), self)
+            self.mm = None
+            return False
+        self.filename = filename
+        self.inode = (st.st_dev, st.st_ino)
+        self.writeable = writeable
+        if writeable:
+            magic, version, reserved, self.seq = self.HEADER.unpack_from(self.mm)
+            if magic != self.MAGIC or version != self.VERSION:
+                self.seq = 0
+                self.mm[:self.SIZE] = bytes(self.SIZE)
+                self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.VERSION, 0, 0)
+            #an interrupted writer might have left an odd counter
+            self.seq += self.seq % 2
+        return True
+
+    def close(self):
+        """
+        Unmap the segment.
+        """
+        if self.mm is not None:
+            self.mm.close()
+        self.mm = None
+        self.filename = None
+        self.inode = None
+        self.writeable = False
+
+    def _write(self, status, percent, sent, speed, eta):
+        self.seq += 1
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.VERSION, 0, self.seq)
+        self.DATA.pack_into(self.mm, self.HEADER.size, status, percent,
+                            sent.encode()[:16], speed.encode()[:16], eta.encode()[:16])
+        self.seq += 1
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.VERSION, 0, self.seq)
+
+    def update(self, status, percent, sent = '', speed = '', eta = ''):
+        """
+        Write new progress. Updates which come faster than
+        :py:attr:`maxRate` are dropped.
+
+        Args:
+            status (int):   e.g. :py:data:`ProgressFile.RSYNC`
+            percent (int):  percent done
+            sent (str):     data sent so far
+            speed (str):    current speed
+            eta (str):      estimated time of arrival
+
+        Returns:
+            bool:           ``False`` if the update was dropped
+        """
+        now = time.time()
+        if self.maxRate and now - self.lastUpdate < 1.0 / self.maxRate:
+            return False
+        self.lastUpdate = now
+        if self._map(True):
+            self._write(status, percent, sent, speed, eta)
+            return True
+        pg = ProgressFile(self.config)
+        pg.set_int_value('status', status)
+        pg.set_str_value('sent', sent)
+        pg.set_int_value('percent', percent)
+        pg.set_str_value('speed', speed)
+        pg.set_str_value('eta', eta)
+        pg.save()
+        return True
+
+    def clear(self):
+        """
+        Mark progress as done and remove the fallback file. The segment
+        itself stays so readers don't have to map it again.
+        """
+        self.lastUpdate = 0.0
+        if os.path.exists(self._filename()) and self._map(True):
+            self._write(self.INACTIVE, 0, '', '', '')
+        filename = self.config.get_take_snapshot_progress_file()
+        try:
+            if os.path.exists(filename):
+                os.remove(filename)
+        except Exception as e:
+            logger.debug('Failed to remove snapshot progress file %s: %s'
+                         %(filename, str(e)),
+                         self)
+
+    def values(self, retries = 100):
+        """
+        Read the current progress from the segment.
+
+        Returns:
+            dict:   status, percent, sent, speed and eta or ``None`` if
+                    there is no active progress
+        """
+        if not self._map(False):
+            return None
+        for i in range(retries):
+            magic, version, reserved, seq = self.HEADER.unpack_from(self.mm)
+            if magic != self.MAGIC or version != self.VERSION:
+                return None
+            if seq % 2:
+                continue
+            data = self.DATA.unpack_from(self.mm, self.HEADER.size)
+            if self.HEADER.unpack_from(self.mm)[3] == seq:
+                break
+        else:
+            return None
+        if data[0] == self.INACTIVE:
+            return None
+        return dict(zip(self.KEYS, data[:2] + tuple(v.rstrip(b'\0').decode(errors = 'replace')
+                                                    for v in data[2:])))
+
+    def read(self):
+        """
+        Current progress from the segment or from :py:class:`ProgressFile`
+        as fallback.
+
+        Returns:
+            ProgressFile:   progress or ``None`` if there is no progress
+        """
+        values = self.values()
+        pg = ProgressFile(self.config)
+        if values is not None:
+            for key in ('status', 'percent'):
+                pg.set_int_value(key, values[key])
+            for key in ('sent', 'speed', 'eta'):
+                pg.set_str_value(key, values[key])
+            return pg
+        if pg.isFileReadable():
+            pg.load()
+            return pg
+        return None
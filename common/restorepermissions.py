@@ -0,0 +1,237 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Restore owner, group and mode of restored files.
+
+The work is split into phases:
+
+    scan:       walk the snapshot with :py:func:`os.scandir` and collect
+                files and folders (folders in an ordered set)
+    compare:    look up the backup permissions of all collected items in
+                fileinfo and resolve user and group names
+    files:      stat, chown and chmod all files in a thread pool
+    folders:    same for folders, deepest folders first, so changing the
+                mode of a parent can't lock out its children
+
+Timings for each phase are logged and available in
+:py:attr:`RestorePermissions.timings`.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import logger
+import tools
+
+def applyPathInfo(path, uid, gid, mode):
+    """
+    Restore permissions (owner, group and mode) of `path`. If permissions are
+    already identical with the new ones just skip. Otherwise try to
+    'chown' to new owner and new group. If that fails (most probably because
+    we are not running as root and normal user has no rights to change
+    ownership of files) try to at least 'chgrp' to the new group. Finally
+    'chmod' the new mode.
+
+    Args:
+        path (bytes):   current path of file that should be changed
+        uid (int):      new UID or -1
+        gid (int):      new GID or -1
+        mode (int):     new mode
+
+    Returns:
+        list:           ``(ok, msg)`` tuples for every action that was
+                        necessary
+    """
+    ret = []
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ret
+    name = path.decode(errors = 'ignore')
+
+    if uid != -1 or gid != -1:
+        ok = False
+        if uid != st.st_uid:
+            try:
+                os.chown(path, uid, gid)
+                ok = True
+            except OSError:
+                pass
+            ret.append((ok, 'chown %s %s : %s' %(name, uid, gid)))
+
+        #if restore uid/gid failed try to restore at least gid
+        if not ok and gid != st.st_gid:
+            try:
+                os.chown(path, -1, gid)
+                ok = True
+            except OSError:
+                pass
+            ret.append((ok, 'chgrp %s %s' %(name, gid)))
+
+    #restore perms
+    if mode != st.st_mode:
+        ok = False
+        try:
+            os.chmod(path, mode)
+            ok = True
+        except OSError:
+            pass
+        ret.append((ok, 'chmod %s %04o' %(name, mode)))
+    return ret
+
+def _applyChunk(chunk):
+    ret = []
+    for item in chunk:
+        ret.extend(applyPathInfo(*item))
+    return ret
+
+class RestorePermissions(object):
+    """
+    Restore permissions of all files and folders restored from one snapshot.
+
+    Args:
+        snapshots (snapshots.Snapshots):    used for resolving user and
+                                            group names and for reporting
+        fileInfoDict (snapshots.FileInfoDict):  permissions during backup
+        callback (method):                  callable which will handle
+                                            messages
+        threads (int):                      number of worker threads
+        chunkSize (int):                    number of items one worker
+                                            handles at once
+    """
+    def __init__(self, snapshots, fileInfoDict, callback = None,
+                 threads = 8, chunkSize = 1000):
+        self.snapshots = snapshots
+        self.fileInfoDict = fileInfoDict
+        self.callback = callback
+        self.threads = threads
+        self.chunkSize = chunkSize
+
+        #(key_path, real_path)
+        self.files = []
+        self.dirs = tools.OrderedSet()
+        self.timings = OrderedDict((phase, 0.0) for phase in ('scan', 'compare', 'files', 'folders'))
+
+    def add(self, sid, path, restore_to = b'', src_delta = 0):
+        """
+        Collect all files and folders which were restored from `path`.
+        This is the 'scan' phase.
+
+        Args:
+            sid (snapshots.SID):    snapshot which `path` was restored from
+            path (str, bytes):      restored path
+            restore_to (bytes):     alternative destination or empty
+            src_delta (int):        number of leading characters which
+                                    need to be cut from `path` if
+                                    `restore_to` is used
+        """
+        start = time.time()
+        snapshot_path_to = sid.pathBackup(path).rstrip('/')
+        root_snapshot_path_to = sid.pathBackup().rstrip('/')
+        if isinstance(path, str):
+            path = path.encode()
+        if isinstance(restore_to, str):
+            restore_to = restore_to.encode()
+
+        #parent folders
+        if not restore_to:
+            curr_path = b'/'
+            for path_item in path.strip(b'/').split(b'/'):
+                curr_path = os.path.join(curr_path, path_item)
+                self.dirs.add((curr_path, curr_path))
+        else:
+            self.dirs.add((path, restore_to + path[src_delta:]))
+
+        if os.path.isdir(snapshot_path_to) and not os.path.islink(snapshot_path_to):
+            head = len(root_snapshot_path_to.encode())
+            stack = [snapshot_path_to.encode()]
+            while stack:
+                try:
+                    it = os.scandir(stack.pop())
+                except OSError as e:
+                    logger.debug('Failed to scan %s: %s' %(e.filename, str(e)), self)
+                    continue
+                with it:
+                    for entry in it:
+                        item_path = entry.path[head:]
+                        real_path = restore_to + item_path[src_delta:]
+                        if entry.is_dir(follow_symlinks = False):
+                            self.dirs.add((item_path, real_path))
+                            stack.append(entry.path)
+                        else:
+                            self.files.append((item_path, real_path))
+        self.timings['scan'] += time.time() - start
+
+    def _compare(self, items):
+        """
+        Look up backup permissions for `items` and resolve names to UID/GID.
+
+        Yields:
+            tuple:  ``(real_path, uid, gid, mode)`` for all items which are
+                    in fileinfo
+        """
+        fileInfoDict = self.fileInfoDict
+        get_uid = self.snapshots.get_uid
+        get_gid = self.snapshots.get_gid
+        for key_path, real_path in items:
+            info = fileInfoDict.get(key_path)
+            if info is None:
+                continue
+            yield (real_path,
+                   get_uid(info[1], self.callback),
+                   get_gid(info[2], self.callback),
+                   info[0])
+
+    def _apply(self, pool, items):
+        """
+        Apply `items` in chunks in `pool` and report all actions to
+        callback in order.
+        """
+        chunks = [items[i:i + self.chunkSize] for i in range(0, len(items), self.chunkSize)]
+        for ret in pool.map(_applyChunk, chunks):
+            for ok, msg in ret:
+                self.snapshots.restore_callback(self.callback, ok, msg)
+
+    def run(self):
+        """
+        Compare collected items with fileinfo and restore permissions of
+        files first and folders last.
+        """
+        start = time.time()
+        files = list(self._compare(self.files))
+        #group folders by depth so children are always done before parents
+        levels = {}
+        for item in self._compare(reversed(self.dirs)):
+            levels.setdefault(item[0].count(b'/'), []).append(item)
+        self.timings['compare'] += time.time() - start
+
+        with ThreadPoolExecutor(max_workers = self.threads) as pool:
+            start = time.time()
+            self._apply(pool, files)
+            self.timings['files'] += time.time() - start
+
+            start = time.time()
+            for depth in sorted(levels, reverse = True):
+                self._apply(pool, levels[depth])
+            self.timings['folders'] += time.time() - start
+
+        logger.info('Restore permissions of %s files and %s folders: %s'
+                    %(len(self.files), len(self.dirs),
+                      ', '.join(['%s %.2fs' %(phase, t) for phase, t in self.timings.items()])),
+                    self)
@@ -0,0 +1,293 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Estimate how much data a restore will move and how long it will take.
+
+Sizes and file counts are summed up from the snapshot metadata only
+(file contents are never read). If the snapshot folder is not reachable
+the number of items is taken from fileinfo instead. The duration is
+estimated from the throughput of previous restores which is stored in
+:py:class:`History`.
+"""
+
+import os
+import re
+import json
+import time
+import gettext
+import threading
+
+import logger
+
+_=gettext.gettext
+
+def formatSize(size):
+    """
+    Human readable size.
+
+    Args:
+        size (int): size in bytes
+
+    Returns:
+        str:        size like '1.5 GiB'
+    """
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if size < 1024 or unit == 'TiB':
+            break
+        size /= 1024
+    if unit == 'B':
+        return '%d %s' %(size, unit)
+    return '%.1f %s' %(size, unit)
+
+def formatDuration(seconds):
+    """
+    Human readable duration.
+
+    Args:
+        seconds (float):    duration in seconds
+
+    Returns:
+        str:                duration like '2:05:30' or '< 1 minute'
+    """
+    if seconds < 60:
+        return _('< 1 minute')
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' %(hours, minutes, seconds)
+
+class History(object):
+    """
+    Throughput of the last restores of one profile.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID
+        maxItems (int):         number of restores to remember
+    """
+    #rsync -h summary: 'sent 1.23M bytes  received 35 bytes  2.46M bytes/sec'
+    RE_RSYNC_STATS = re.compile(r'^sent ([\d.,]+)([KMGTP]?) bytes\s+received ([\d.,]+)([KMGTP]?) bytes')
+    UNITS = {'': 1, 'K': 1000, 'M': 1000**2, 'G': 1000**3, 'T': 1000**4, 'P': 1000**5}
+
+    def __init__(self, cfg, profile_id = None, maxItems = 20):
+        self.fileName = cfg.get_restore_history_file(profile_id)
+        self.maxItems = maxItems
+
+    def load(self):
+        """
+        Returns:
+            list:   ``[bytes, seconds]`` of previous restores
+        """
+        try:
+            with open(self.fileName, 'rt') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def add(self, size, seconds):
+        """
+        Remember throughput of a restore.
+
+        Args:
+            size (int):         transferred bytes
+            seconds (float):    duration of the transfer
+        """
+        if size <= 0 or seconds <= 0:
+            return
+        items = self.load()[-(self.maxItems - 1):] + [[size, seconds]]
+        try:
+            with open(self.fileName, 'wt') as f:
+                json.dump(items, f)
+        except OSError as e:
+            logger.debug('Failed to write restore history %s: %s'
+                         %(self.fileName, str(e)), self)
+
+    def throughput(self):
+        """
+        Returns:
+            float:  average bytes per second or ``None`` if there is no
+                    history yet
+        """
+        items = self.load()
+        size = sum([i[0] for i in items])
+        seconds = sum([i[1] for i in items])
+        if not size or not seconds:
+            return None
+        return size / seconds
+
+    @classmethod
+    def parseRsyncStats(cls, line):
+        """
+        Parse the summary line of 'rsync -h'.
+
+        Args:
+            line (str): rsync output line
+
+        Returns:
+            int:        sent and received bytes or ``None`` if `line` is
+                        not the summary line
+        """
+        m = cls.RE_RSYNC_STATS.match(line)
+        if not m:
+            return None
+        sent = float(m.group(1).replace(',', '')) * cls.UNITS[m.group(2)]
+        received = float(m.group(3).replace(',', '')) * cls.UNITS[m.group(4)]
+        return int(sent + received)
+
+class RestorePlan(object):
+    """
+    Result of :py:func:`plan`. Counters are updated while planning is
+    still running.
+    """
+    def __init__(self):
+        self.files = 0
+        self.dirs = 0
+        self.size = 0
+        #False if counted from fileinfo which doesn't know sizes
+        self.sizeKnown = True
+        self.missing = []
+        self.throughput = None
+        self.canceled = False
+        self.done = False
+
+    @property
+    def seconds(self):
+        """
+        Estimated duration in seconds or ``None`` if unknown.
+        """
+        if not self.sizeKnown or not self.throughput:
+            return None
+        return self.size / self.throughput
+
+    def __str__(self):
+        msg = _('%(files)s files and %(dirs)s folders') \
+              % {'files': self.files, 'dirs': self.dirs}
+        if self.sizeKnown:
+            msg += ', ' + formatSize(self.size)
+        if not self.throughput:
+            msg += '\n' + _('Duration: unknown (no previous restore to compare with)')
+        elif self.seconds is None:
+            msg += '\n' + _('Duration: unknown')
+        else:
+            msg += '\n' + _('Estimated duration: up to %s') % formatDuration(self.seconds)
+        if self.missing:
+            msg += '\n' + _('Not in snapshot: %s') % ', '.join(self.missing)
+        return msg
+
+def _countFileInfo(fileInfoDict, path, result):
+    path = path.encode()
+    prefix = os.path.join(path, b'')
+    for key, info in fileInfoDict.items():
+        if key == path or key.startswith(prefix):
+            if info[0] & 0o170000 == 0o040000:
+                result.dirs += 1
+            else:
+                result.files += 1
+
+def plan(sid, paths, cancel = None, result = None):
+    """
+    Sum up sizes and numbers of files and folders which would be restored
+    from `sid`.
+
+    Args:
+        sid (snapshots.SID):        snapshot to restore from
+        paths (list):               paths to restore
+        cancel (threading.Event):   stop planning as soon as this is set
+        result (RestorePlan):       instance which will be updated. A new
+                                    one will be created if ``None``
+
+    Returns:
+        RestorePlan:                plan
+    """
+    if result is None:
+        result = RestorePlan()
+    result.throughput = History(sid.config, sid.profileID).throughput()
+
+    fileInfoDict = None
+    for path in paths:
+        snapshotPath = sid.pathBackup(path)
+        if not os.path.lexists(snapshotPath):
+            if not os.path.isdir(sid.pathBackup()):
+                #snapshot is not reachable. Count from fileinfo instead
+                if fileInfoDict is None:
+                    fileInfoDict = sid.fileInfo
+                result.sizeKnown = False
+                _countFileInfo(fileInfoDict, path, result)
+            else:
+                result.missing.append(path)
+            continue
+
+        if not os.path.isdir(snapshotPath) or os.path.islink(snapshotPath):
+            result.files += 1
+            result.size += os.lstat(snapshotPath).st_size
+            continue
+        result.dirs += 1
+        stack = [snapshotPath]
+        while stack:
+            if cancel is not None and cancel.is_set():
+                result.canceled = True
+                return result
+            try:
+                it = os.scandir(stack.pop())
+            except OSError as e:
+                logger.debug('Failed to scan %s: %s' %(e.filename, str(e)))
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks = False):
+                        result.dirs += 1
+                        stack.append(entry.path)
+                    else:
+                        result.files += 1
+                        try:
+                            result.size += entry.stat(follow_symlinks = False).st_size
+                        except OSError:
+                            pass
+    result.done = True
+    return result
+
+class PlannerThread(threading.Thread):
+    """
+    Run :py:func:`plan` in a background thread.
+
+    Args:
+        sid (snapshots.SID):    snapshot to restore from
+        paths (list):           paths to restore
+        callback (method):      will be called with the :py:class:`RestorePlan`
+                                when planning is done (not if it got
+                                canceled)
+    """
+    def __init__(self, sid, paths, callback = None):
+        super(PlannerThread, self).__init__(daemon = True)
+        self.sid = sid
+        self.paths = paths
+        self.callback = callback
+        self.plan = RestorePlan()
+        self.cancelEvent = threading.Event()
+
+    def run(self):
+        start = time.time()
+        plan(self.sid, self.paths, self.cancelEvent, self.plan)
+        logger.debug('Restore plan took %.2fs: %s'
+                     %(time.time() - start, str(self.plan).replace('\n', '; ')), self)
+        if self.plan.done and self.callback:
+            self.callback(self.plan)
+
+    def cancel(self):
+        """
+        Stop planning.
+        """
+        self.cancelEvent.set()
@@ -0,0 +1,205 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Profile a backup run ('backintime backup --profile-run'). Python code is
+profiled with cProfile, commands started by Back In Time are timed
+separately so it is easy to see if the time was spent in Python or in
+rsync, ssh, find and co.
+"""
+
+import io
+import os
+import time
+from collections import namedtuple, OrderedDict
+
+import logger
+
+Command = namedtuple('Command', ('cmd', 'wall', 'cpu'))
+
+class _NoTimer(object):
+    """
+    Do-nothing context manager returned by :py:func:`command` while
+    profiling is disabled.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NO_TIMER = _NoTimer()
+
+def command(profiler, cmd):
+    """
+    Time `cmd` with `profiler` if profiling is enabled.
+
+    Args:
+        profiler (RunProfile):  profiler or ``None`` if disabled
+        cmd:                    command as str or list
+
+    Returns:
+        context manager
+    """
+    if profiler is None:
+        return NO_TIMER
+    return profiler.command(cmd)
+
+class _CommandTimer(object):
+    def __init__(self, profiler, cmd):
+        self.profiler = profiler
+        if isinstance(cmd, (list, tuple)):
+            cmd = ' '.join(cmd)
+        self.cmd = cmd
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.cpu = _childrenCpu()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.commands.append(Command(self.cmd,
+                                              time.time() - self.wall,
+                                              _childrenCpu() - self.cpu))
+        return False
+
+def _childrenCpu():
+    t = os.times()
+    return t.children_user + t.children_system
+
+class RunProfile(object):
+    """
+    cProfile for the Python part of a run and wall/CPU time of each child
+    command. CPU time of children is only counted after they were waited
+    for, which all callers of :py:meth:`command` do.
+    """
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.commands = []
+        self.wall = None
+        self.cpu = None
+
+    def start(self):
+        self._wall = time.time()
+        self._cpu = time.process_time()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.wall = time.time() - self._wall
+        self.cpu = time.process_time() - self._cpu
+
+    def command(self, cmd):
+        """
+        Context manager which times child command `cmd`.
+        """
+        return _CommandTimer(self, cmd)
+
+    def commandsSummary(self):
+        """
+        Commands grouped by executable, sorted by wall time.
+
+        Returns:
+            list:   (name, count, wall, cpu)
+        """
+        groups = OrderedDict()
+        for c in self.commands:
+            name = _commandName(c.cmd)
+            count, wall, cpu = groups.get(name, (0, 0.0, 0.0))
+            groups[name] = (count + 1, wall + c.wall, cpu + c.cpu)
+        ret = [(name,) + values for name, values in groups.items()]
+        ret.sort(key = lambda x: x[2], reverse = True)
+        return ret
+
+    def hotspots(self, top = 10):
+        """
+        Short summary for the end of a run.
+
+        Args:
+            top (int):  number of Python functions and commands
+
+        Returns:
+            list:       lines
+        """
+        childWall = sum(c.wall for c in self.commands)
+        lines = ['Run: %.2fs wall, %.2fs CPU in Python, %.2fs in %d commands'
+                 %(self.wall, self.cpu, childWall, len(self.commands))]
+        lines.append('Top commands (calls, wall, CPU):')
+        for name, count, wall, cpu in self.commandsSummary()[:top]:
+            lines.append('  %-20s %6d %9.2fs %9.2fs' %(name, count, wall, cpu))
+        lines.append('Top Python functions (calls, own time, cumulative):')
+        import pstats
+        stats = pstats.Stats(self.profile)
+        items = sorted(stats.stats.items(), key = lambda x: x[1][2], reverse = True)
+        for (filename, lineno, func), (cc, nc, tt, ct, callers) in items[:top]:
+            lines.append('  %-40s %8d %8.2fs %8.2fs' %('%s:%d(%s)' %(os.path.basename(filename), lineno, func),
+                                                        nc, tt, ct))
+        return lines
+
+    def report(self, top = 50):
+        """
+        Full report with all commands and pstats output.
+
+        Returns:
+            str:    report
+        """
+        out = io.StringIO()
+        out.write('\n'.join(self.hotspots(top)))
+        out.write('\n\nCommands (wall, CPU, command):\n')
+        for c in sorted(self.commands, key = lambda c: c.wall, reverse = True):
+            out.write('%9.2fs %9.2fs %s\n' %(c.wall, c.cpu, c.cmd))
+        out.write('\n')
+        import pstats
+        stats = pstats.Stats(self.profile, stream = out)
+        stats.sort_stats('cumulative').print_stats(top)
+        return out.getvalue()
+
+    def write(self, filename):
+        """
+        Write :py:meth:`report` to `filename` and raw cProfile data to
+        `filename` with extension '.pstats' for tools like snakeviz.
+
+        Returns:
+            bool:   ``True`` if successful
+        """
+        try:
+            with open(filename, 'wt') as f:
+                f.write(self.report())
+            self.profile.dump_stats(os.path.splitext(filename)[0] + '.pstats')
+        except OSError as e:
+            logger.error('Failed to write run profile %s: %s' %(filename, str(e)), self)
+            return False
+        return True
+
+def _commandName(cmd):
+    """
+    Name of the first real executable in shell command `cmd`, skipping
+    wrappers like nice, ionice, nocache and environment assignments.
+    """
+    skip = ('nice', 'ionice', 'nocache', 'env')
+    words = cmd.split()
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word == '-n' and i + 1 < len(words):
+            i += 2
+            continue
+        if os.path.basename(word) in skip or word.startswith('-') or '=' in word:
+            i += 1
+            continue
+        return os.path.basename(word)
+    return cmd[:20]
@@ -0,0 +1,554 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Resident scheduler ('backintime scheduler') as alternative to crontab
+entries and udev rules.
+
+All profiles are loaded once and their next due times are kept in a heap.
+Only when a profile is due a 'backup-job' process is started, so there is
+no Python cold start every few minutes just to find out that nothing needs
+to be done. The scheduler reloads the config if it changed, starts profiles
+with schedule 'When drive get connected' when their drive shows up, limits
+how many profiles run on the same destination, retries failed runs with
+backoff and writes its state for 'backintime status'.
+"""
+
+import os
+import json
+import time
+import heapq
+import signal
+import datetime
+import itertools
+import subprocess
+import tempfile
+from collections import OrderedDict
+
+import config
+import logger
+import tools
+from applicationinstance import ApplicationInstance
+
+#seconds between checks for finished runs, config changes and new drives
+POLL = 10
+#first retry after a failed run, doubled with every failure
+RETRY_BASE = 5 * 60
+RETRY_MAX = 2 * 60 * 60
+#wait this long if a run was deferred because we are on battery
+BATTERY_DELAY = 15 * 60
+
+SUCCESS  = 'success'
+FAILED   = 'failed'
+DEFERRED = 'deferred'
+
+def cronFields(cfg, profile_id):
+    """
+    Minutes, hours, days of month and weekdays on which profile
+    `profile_id` is due. This is the same schedule
+    :py:meth:`config.Config.cronLine` would write into crontab.
+
+    Returns:
+        tuple:  (minutes, hours, days, weekdays) where each is a set or
+                ``None`` for any value. ``None`` if the schedule has no
+                fixed times
+    """
+    mode = cfg.get_automatic_backup_mode(profile_id)
+    hour = cfg.get_automatic_backup_time(profile_id) // 100
+    minute = cfg.get_automatic_backup_time(profile_id) % 100
+    every = lambda step, end: set(range(0, end, step))
+
+    if mode == cfg._5_MIN:
+        return (every(5, 60), None, None, None)
+    elif mode == cfg._10_MIN:
+        return (every(10, 60), None, None, None)
+    elif mode == cfg._30_MIN:
+        return (every(30, 60), None, None, None)
+    elif mode == cfg._1_HOUR:
+        return ({0}, None, None, None)
+    elif mode == cfg._2_HOURS:
+        return ({0}, every(2, 24), None, None)
+    elif mode == cfg._4_HOURS:
+        return ({0}, every(4, 24), None, None)
+    elif mode == cfg._6_HOURS:
+        return ({0}, every(6, 24), None, None)
+    elif mode == cfg._12_HOURS:
+        return ({0}, every(12, 24), None, None)
+    elif mode == cfg.CUSTOM_HOUR:
+        hours = customHours(cfg.get_custom_backup_time(profile_id))
+        if not hours:
+            logger.warning('Invalid custom hours for profile %s: %s'
+                           %(profile_id, cfg.get_custom_backup_time(profile_id)))
+            return None
+        return ({0}, hours, None, None)
+    elif mode == cfg.DAY:
+        return ({minute}, {hour}, None, None)
+    elif mode == cfg.REPEATEDLY:
+        #check as often as the crontab entry would
+        if cfg.get_automatic_backup_anacron_unit(profile_id) <= cfg.DAY:
+            return (every(15, 60), None, None, None)
+        return ({0}, None, None, None)
+    elif mode == cfg.WEEK:
+        return ({minute}, {hour}, None, {cfg.get_automatic_backup_weekday(profile_id)})
+    elif mode == cfg.MONTH:
+        return ({minute}, {hour}, {cfg.get_automatic_backup_day(profile_id)}, None)
+    return None
+
+def customHours(value):
+    """
+    Parse custom hours like '8,12,18,23' or '*/3'.
+
+    Returns:
+        set:    hours or ``None`` if `value` is invalid
+    """
+    value = value.strip()
+    try:
+        if value.startswith('*/'):
+            step = int(value[2:])
+            if step < 1:
+                return None
+            return set(range(0, 24, step))
+        hours = set(int(i) for i in value.split(','))
+    except ValueError:
+        return None
+    if not hours or min(hours) < 0 or max(hours) > 23:
+        return None
+    return hours
+
+def nextCronTime(now, minutes, hours = None, days = None, weekdays = None):
+    """
+    First full minute after `now` which matches all fields like cron does.
+    Weekdays count from 1 = monday to 7 = sunday.
+
+    Returns:
+        datetime.datetime:  next match or ``None`` if there is none
+                            within the next year
+    """
+    t = now.replace(second = 0, microsecond = 0) + datetime.timedelta(minutes = 1)
+    end = t + datetime.timedelta(days = 366)
+    while t < end:
+        if (days and t.day not in days) or (weekdays and t.isoweekday() not in weekdays):
+            t = t.replace(hour = 0, minute = 0) + datetime.timedelta(days = 1)
+        elif hours and t.hour not in hours:
+            t = t.replace(minute = 0) + datetime.timedelta(hours = 1)
+        elif t.minute not in minutes:
+            t += datetime.timedelta(minutes = 1)
+        else:
+            return t
+    return None
+
+def nextRun(cfg, profile_id, now):
+    """
+    Next time profile `profile_id` is due after `now`.
+
+    Returns:
+        datetime.datetime:  due time or ``None`` if the profile has no
+                            fixed schedule (disabled, at boot or udev)
+    """
+    fields = cronFields(cfg, profile_id)
+    if fields is None:
+        return None
+    return nextCronTime(now, *fields)
+
+def bootTime():
+    """
+    Time when the system was booted.
+
+    Returns:
+        float:  timestamp or 0 if unknown
+    """
+    try:
+        with open('/proc/stat', 'rt') as f:
+            for line in f:
+                if line.startswith('btime '):
+                    return float(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def destination(cfg, profile_id):
+    """
+    Name of the drive or remote host profile `profile_id` writes to. The
+    number of parallel runs on each destination is limited.
+    """
+    mode = cfg.get_snapshots_mode(profile_id)
+    if mode in ('ssh', 'ssh_encfs'):
+        host, port, user, path, cipher = cfg.get_ssh_host_port_user_path_cipher(profile_id)
+        return 'ssh://%s@%s:%s' %(user, host, port)
+    if mode == 'local_encfs':
+        path = cfg.get_local_encfs_path(profile_id)
+    else:
+        path = cfg.get_snapshots_path(profile_id)
+    if path and os.path.exists(path):
+        return tools.get_mountpoint(path)
+    return path
+
+def driveUuid(cfg, profile_id):
+    """
+    UUID of the drive for profiles with schedule 'When drive get connected'.
+    """
+    mode = cfg.get_snapshots_mode(profile_id)
+    if mode == 'local':
+        path = cfg.get_snapshots_full_path(profile_id)
+    elif mode == 'local_encfs':
+        path = cfg.get_local_encfs_path(profile_id)
+    else:
+        return None
+    uuid = tools.get_uuid_from_path(path)
+    if uuid is None:
+        uuid = cfg.get_profile_str_value('snapshots.path.uuid', '', profile_id) or None
+    return uuid
+
+class Job(object):
+    """
+    State of one profile in the :py:class:`Scheduler`.
+    """
+    def __init__(self, profile_id):
+        self.profile_id = profile_id
+        self.name = ''
+        self.mode = config.Config.NONE
+        self.destination = None
+        self.uuid = None
+        self.drivePresent = False
+        self.due = None
+        self.generation = 0
+        self.proc = None
+        self.started = None
+        self.lastRun = None
+        self.lastResult = None
+        self.failures = 0
+
+    def state(self):
+        return OrderedDict((('name', self.name),
+                            ('mode', self.mode),
+                            ('destination', self.destination),
+                            ('next_run', self.due),
+                            ('running', self.proc is not None),
+                            ('pid', self.proc.pid if self.proc is not None else None),
+                            ('started', self.started),
+                            ('last_run', self.lastRun),
+                            ('last_result', self.lastResult),
+                            ('failures', self.failures)))
+
+class Scheduler(object):
+    """
+    Start 'backup-job' for all profiles when they are due.
+
+    Args:
+        cfg (config.Config):    current config
+    """
+    def __init__(self, cfg):
+        self.config = cfg
+        self.configFile = cfg._LOCAL_CONFIG_PATH
+        self.configMtime = self._configMtime()
+        self.jobs = OrderedDict()
+        self.heap = []
+        self.counter = itertools.count()
+        self.stopped = False
+        self.reloadRequested = False
+        self.stateChanged = True
+        self.started = time.time()
+
+    def _configMtime(self):
+        try:
+            return os.stat(self.configFile).st_mtime
+        except OSError:
+            return None
+
+    def load(self, now = None):
+        """
+        (Re)build jobs for all profiles and schedule them. State of
+        profiles which still exist is kept.
+        """
+        if now is None:
+            now = time.time()
+        jobs = OrderedDict()
+        for profile_id in self.config.get_profiles():
+            job = self.jobs.get(profile_id, Job(profile_id))
+            job.name = self.config.get_profile_name(profile_id)
+            job.mode = self.config.get_automatic_backup_mode(profile_id)
+            job.destination = destination(self.config, profile_id)
+            job.uuid = None
+            if job.mode == self.config.UDEV:
+                job.uuid = driveUuid(self.config, profile_id)
+            jobs[profile_id] = job
+            if job.proc is None:
+                self.scheduleNext(job, now)
+        for profile_id, job in self.jobs.items():
+            if not profile_id in jobs and job.proc is not None:
+                logger.info('Profile %s was removed while it is running' % profile_id, self)
+        self.jobs = jobs
+        self.stateChanged = True
+
+    def reload(self, now = None):
+        """
+        Read the config again.
+        """
+        logger.info('Reload config %s' % self.configFile, self)
+        self.reloadRequested = False
+        self.configMtime = self._configMtime()
+        self.config = config.Config(self.configFile)
+        self.load(now)
+
+    def schedule(self, job, due):
+        """
+        Set next due time of `job`. Older heap entries of `job` become
+        invalid.
+
+        Args:
+            job (Job):      job
+            due (float):    timestamp or ``None`` to unschedule
+        """
+        job.generation += 1
+        job.due = due
+        if not due is None:
+            heapq.heappush(self.heap, (due, next(self.counter), job.profile_id, job.generation))
+        self.stateChanged = True
+
+    def scheduleNext(self, job, now):
+        """
+        Schedule `job` for its next regular run after `now`.
+        """
+        if job.mode == self.config.AT_EVERY_BOOT:
+            #the timestamp inside the spool file has only day resolution
+            try:
+                lastRun = os.stat(self.config.get_anacron_spool_file(job.profile_id)).st_mtime
+            except OSError:
+                lastRun = 0
+            if job.lastRun is None and lastRun < bootTime():
+                self.schedule(job, now)
+            else:
+                self.schedule(job, None)
+            return
+        due = nextRun(self.config, job.profile_id, datetime.datetime.fromtimestamp(now))
+        self.schedule(job, None if due is None else _timestamp(due))
+
+    def running(self, dest):
+        """
+        Number of runs on destination `dest`.
+        """
+        return len([job for job in self.jobs.values() if job.proc is not None and job.destination == dest])
+
+    def tick(self, now = None):
+        """
+        Do one round of checks and start all due jobs.
+
+        Returns:
+            float:  seconds until the next round
+        """
+        if now is None:
+            now = time.time()
+        if self.reloadRequested or self._configMtime() != self.configMtime:
+            self.reload(now)
+        self.checkRunning(now)
+        self.checkDrives(now)
+        self.runDue(now)
+        if self.stateChanged:
+            self.writeState()
+        if self.heap:
+            return max(0, min(self.heap[0][0] - now, POLL))
+        return POLL
+
+    def checkRunning(self, now):
+        for job in self.jobs.values():
+            if job.proc is None:
+                continue
+            returncode = job.proc.poll()
+            if returncode is None:
+                continue
+            self.finished(job, returncode, now)
+
+    def checkDrives(self, now):
+        """
+        Start profiles with schedule 'When drive get connected' if their
+        drive was plugged in.
+        """
+        for job in self.jobs.values():
+            if job.mode != self.config.UDEV or not job.uuid:
+                continue
+            present = os.path.exists(os.path.join(tools.DISK_BY_UUID, job.uuid))
+            if present and not job.drivePresent:
+                logger.info('Drive %s for profile %s connected' %(job.uuid, job.profile_id), self)
+                self.schedule(job, now)
+            job.drivePresent = present
+
+    def runDue(self, now):
+        while self.heap and self.heap[0][0] <= now:
+            due, count, profile_id, generation = heapq.heappop(self.heap)
+            job = self.jobs.get(profile_id)
+            if job is None or job.generation != generation:
+                #outdated entry
+                continue
+            self.runJob(job, now)
+
+    def runJob(self, job, now):
+        """
+        Start `job` if nothing prevents it.
+        """
+        if job.proc is not None:
+            #still running from last time. backup-job would refuse anyway
+            self.scheduleNext(job, now)
+            return
+        limit = self.config.get_scheduler_max_runs_per_destination()
+        if self.running(job.destination) >= limit:
+            logger.debug('Profile %s waits for %s' %(job.profile_id, job.destination), self)
+            self.schedule(job, now + POLL)
+            return
+        if not self.config.is_backup_scheduled(job.profile_id):
+            self.scheduleNext(job, now)
+            return
+        if self.config.is_no_on_battery_enabled(job.profile_id) and tools.on_battery():
+            logger.info('Deferring profile %s while on battery' % job.profile_id, self)
+            job.lastResult = DEFERRED
+            self.schedule(job, now + BATTERY_DELAY)
+            return
+        self.start(job, now)
+
+    def start(self, job, now):
+        cmd = self.config.backup_job_cmd(job.profile_id)
+        logger.info('Start profile %s: %s' %(job.profile_id, ' '.join(cmd)), self)
+        job.started = now
+        try:
+            #new session so backups are not killed together with the scheduler
+            job.proc = subprocess.Popen(cmd,
+                                        stdin = subprocess.DEVNULL,
+                                        stdout = subprocess.DEVNULL,
+                                        stderr = subprocess.DEVNULL,
+                                        start_new_session = True)
+        except (OSError, TypeError) as e:
+            logger.error('Failed to start profile %s: %s' %(job.profile_id, str(e)), self)
+            self.finished(job, None, now)
+            return
+        self.schedule(job, None)
+
+    def finished(self, job, returncode, now):
+        """
+        Handle end of a run. backup-job returns 1 also if there was nothing
+        to do, so a run is successful if it wrote the anacron timestamp.
+        """
+        success = returncode == 0 or (returncode is not None and self._timestampWritten(job))
+        job.proc = None
+        job.lastRun = job.started
+        if success:
+            job.lastResult = SUCCESS
+            job.failures = 0
+            self.scheduleNext(job, now)
+            return
+        job.lastResult = FAILED
+        job.failures += 1
+        if job.failures <= self.config.get_scheduler_retries():
+            delay = min(RETRY_BASE * 2 ** (job.failures - 1), RETRY_MAX)
+            logger.warning('Profile %s failed. Retry in %d minutes'
+                           %(job.profile_id, delay // 60), self)
+            self.schedule(job, now + delay)
+        else:
+            logger.warning('Profile %s failed %d times. Wait for next regular run'
+                           %(job.profile_id, job.failures), self)
+            job.failures = 0
+            self.scheduleNext(job, now)
+
+    def _timestampWritten(self, job):
+        try:
+            mtime = os.stat(self.config.get_anacron_spool_file(job.profile_id)).st_mtime
+        except OSError:
+            return False
+        return mtime >= job.started - 1
+
+    def state(self):
+        return OrderedDict((('pid', os.getpid()),
+                            ('started', self.started),
+                            ('updated', time.time()),
+                            ('config', self.configFile),
+                            ('profiles', OrderedDict((pid, job.state()) for pid, job in self.jobs.items()))))
+
+    def writeState(self, filename = None):
+        """
+        Replace the state file for 'backintime status' atomically.
+        """
+        if filename is None:
+            filename = self.config.get_scheduler_state_file()
+        folder = os.path.dirname(filename)
+        try:
+            os.makedirs(folder, exist_ok = True)
+            with tempfile.NamedTemporaryFile('wt', dir = folder, prefix = '.scheduler_',
+                                             suffix = '.tmp', delete = False) as f:
+                tmp = f.name
+                json.dump(self.state(), f, indent = 1)
+            os.replace(tmp, filename)
+        except OSError as e:
+            logger.error('Failed to write scheduler state %s: %s' %(filename, str(e)), self)
+            try:
+                os.remove(tmp)
+            except (NameError, OSError):
+                pass
+            return
+        self.stateChanged = False
+
+    def stop(self, *args):
+        self.stopped = True
+
+    def requestReload(self, *args):
+        self.reloadRequested = True
+
+    def run(self):
+        """
+        Run until SIGTERM or SIGINT. SIGHUP reloads the config.
+
+        Returns:
+            bool:   ``False`` if an other scheduler is already running
+        """
+        instance = ApplicationInstance(self.config.get_scheduler_instance_file(), False, flock = True)
+        if not instance.check():
+            logger.error('The scheduler is already running', self)
+            return False
+        instance.start_application()
+        if not self.config.is_scheduler_enabled():
+            logger.warning("'global.scheduler.enabled' is not set. Crontab entries "
+                           "will start backups, too.", self)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.requestReload)
+        logger.info('Scheduler started', self)
+        self.load()
+        try:
+            while not self.stopped:
+                timeout = self.tick()
+                if not self.stopped:
+                    time.sleep(timeout)
+        finally:
+            self.writeState()
+            instance.exit_application()
+            logger.info('Scheduler stopped', self)
+        return True
+
+def readState(cfg):
+    """
+    Read the state written by a running scheduler.
+
+    Returns:
+        tuple:  (state, running) where state is a dict or ``None`` if
+                there is no state file
+    """
+    running = not ApplicationInstance(cfg.get_scheduler_instance_file(), False).check()
+    try:
+        with open(cfg.get_scheduler_state_file(), 'rt') as f:
+            return (json.load(f, object_pairs_hook = OrderedDict), running)
+    except (OSError, ValueError) as e:
+        logger.debug('Failed to read scheduler state: %s' % str(e))
+        return (None, running)
+
+def _timestamp(dt):
+    return time.mktime(dt.timetuple())
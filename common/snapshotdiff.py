@@ -0,0 +1,306 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Compare two snapshots.
+
+Both snapshot trees are walked side by side. Files which share the same
+inode (hard-linked because they didn't change) are identical without
+reading their content. Files with different inodes are compared by size
+and modification time, the same way rsync decides whether a file has
+changed. So the costs depend on the number of changes, not on the size
+of the snapshots.
+
+Owner, group and permissions are taken from fileinfo if available.
+"""
+
+import os
+import stat
+from collections import namedtuple, OrderedDict
+
+import logger
+import export
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+METADATA = 'metadata'
+
+#symbols used in text output
+SYMBOLS = OrderedDict(((ADDED, '+'),
+                       (REMOVED, '-'),
+                       (MODIFIED, 'M'),
+                       (METADATA, 'm')))
+
+Change = namedtuple('Change', ('type', 'path', 'isDir', 'before', 'after'))
+Change.__doc__ = """
+One changed item.
+
+Attributes:
+    type (str):     :py:data:`ADDED`, :py:data:`REMOVED`,
+                    :py:data:`MODIFIED` or :py:data:`METADATA`
+    path (str):     absolute path of the item
+    isDir (bool):   ``True`` if item is a folder
+    before (dict):  attributes in first snapshot or ``None``
+    after (dict):   attributes in second snapshot or ``None``
+"""
+
+def _kind(mode):
+    if stat.S_ISDIR(mode):
+        return 'dir'
+    if stat.S_ISLNK(mode):
+        return 'link'
+    if stat.S_ISREG(mode):
+        return 'file'
+    return 'other'
+
+class _Side(object):
+    """
+    One of the two compared snapshots.
+    """
+    def __init__(self, sid, path):
+        self.sid = sid
+        self.root = sid.pathBackup().rstrip('/').encode()
+        self.fileInfo = export.loadFileInfo(sid, [path])
+
+    def stat(self, path):
+        try:
+            return os.lstat(self.root + path)
+        except OSError:
+            return None
+
+    def listdir(self, path):
+        """
+        Returns:
+            dict:   ``{name: os.stat_result}`` of all items in folder
+                    `path`
+        """
+        ret = {}
+        try:
+            with os.scandir(self.root + path) as it:
+                for entry in it:
+                    try:
+                        ret[entry.name] = entry.stat(follow_symlinks = False)
+                    except OSError as e:
+                        logger.debug('Failed to stat %s: %s' %(entry.path, str(e)), self)
+        except OSError as e:
+            logger.debug('Failed to scan %s: %s' %(e.filename, str(e)), self)
+        return ret
+
+    def meta(self, path, st):
+        """
+        Owner, group and permissions of `path` from fileinfo or from `st`
+        if `path` is not in fileinfo.
+        """
+        info = self.fileInfo.get(path)
+        if info is None:
+            return (stat.S_IMODE(st.st_mode), str(st.st_uid), str(st.st_gid))
+        return (stat.S_IMODE(info[0]),
+                info[1].decode(errors = 'replace'),
+                info[2].decode(errors = 'replace'))
+
+    def attributes(self, path, st):
+        """
+        Attributes of `path` for :py:class:`Change`.
+        """
+        mode, user, group = self.meta(path, st)
+        ret = OrderedDict((('kind', _kind(st.st_mode)),
+                           ('size', st.st_size),
+                           ('mtime', int(st.st_mtime)),
+                           ('mode', '%04o' % mode),
+                           ('user', user),
+                           ('group', group)))
+        if stat.S_ISLNK(st.st_mode):
+            try:
+                ret['target'] = os.readlink(self.root + path).decode(errors = 'surrogateescape')
+            except OSError:
+                pass
+        return ret
+
+class SnapshotDiff(object):
+    """
+    Iterate over all differences between two snapshots.
+
+    Args:
+        sid1 (snapshots.SID):       older snapshot
+        sid2 (snapshots.SID):       newer snapshot
+        path (str):                 only compare this file or folder
+        cancel (threading.Event):   stop as soon as this is set
+
+    Yields:
+        Change:                     changed items
+
+    Attributes:
+        summary (collections.OrderedDict):  number of changes for each
+                                            type. Complete when the
+                                            iteration is done
+    """
+    def __init__(self, sid1, sid2, path = '/', cancel = None):
+        self.sid1 = sid1
+        self.sid2 = sid2
+        self.path = os.path.normpath(os.path.join(os.sep, path)).encode()
+        self.cancel = cancel
+        self.summary = OrderedDict((t, 0) for t in SYMBOLS)
+        self.canceled = False
+
+    def __iter__(self):
+        self.summary = OrderedDict((t, 0) for t in SYMBOLS)
+        a = _Side(self.sid1, self.path)
+        b = _Side(self.sid2, self.path)
+        if self.path == b'/':
+            yield from self._walk(a, b, b'/')
+            return
+        change = self._compare(a, b, self.path, a.stat(self.path), b.stat(self.path))
+        if change is not None:
+            yield change
+        if change is None or change.type in (MODIFIED, METADATA):
+            sta, stb = a.stat(self.path), b.stat(self.path)
+            if sta and stb and stat.S_ISDIR(sta.st_mode) and stat.S_ISDIR(stb.st_mode):
+                yield from self._walk(a, b, self.path)
+        elif change.isDir:
+            yield from self._subtree(a if change.type == REMOVED else b,
+                                     change.type, self.path)
+
+    def _change(self, type_, path, isDir, before, after):
+        self.summary[type_] += 1
+        return Change(type_, path.decode(errors = 'surrogateescape'), isDir, before, after)
+
+    def _isCanceled(self):
+        if self.cancel is not None and self.cancel.is_set():
+            self.canceled = True
+        return self.canceled
+
+    def _compare(self, a, b, path, sta, stb):
+        """
+        Compare one item which might be missing in one or both snapshots.
+
+        Returns:
+            Change:     change or ``None`` if both are identical
+        """
+        if sta is None and stb is None:
+            return None
+        if stb is None:
+            return self._change(REMOVED, path, stat.S_ISDIR(sta.st_mode),
+                                a.attributes(path, sta), None)
+        if sta is None:
+            return self._change(ADDED, path, stat.S_ISDIR(stb.st_mode),
+                                None, b.attributes(path, stb))
+
+        kind = _kind(sta.st_mode)
+        isDir = kind == 'dir'
+        if kind != _kind(stb.st_mode):
+            type_ = MODIFIED
+            isDir = False
+        elif isDir:
+            type_ = None
+        elif (sta.st_dev, sta.st_ino) == (stb.st_dev, stb.st_ino):
+            #hard-linked, so content is identical
+            type_ = None
+        elif kind == 'link':
+            if os.readlink(a.root + path) != os.readlink(b.root + path):
+                type_ = MODIFIED
+            else:
+                type_ = None
+        elif sta.st_size != stb.st_size or sta.st_mtime_ns != stb.st_mtime_ns:
+            type_ = MODIFIED
+        else:
+            type_ = None
+
+        if type_ is None and a.meta(path, sta) != b.meta(path, stb):
+            type_ = METADATA
+        if type_ is None:
+            return None
+        return self._change(type_, path, isDir,
+                            a.attributes(path, sta), b.attributes(path, stb))
+
+    def _walk(self, a, b, path):
+        """
+        Walk through folder `path` in both snapshots side by side.
+        """
+        stack = [path]
+        while stack:
+            if self._isCanceled():
+                return
+            folder = stack.pop()
+            itemsA = a.listdir(folder)
+            itemsB = b.listdir(folder)
+            subfolders = []
+            for name in sorted(set(itemsA) | set(itemsB)):
+                item = os.path.join(folder, name)
+                sta, stb = itemsA.get(name), itemsB.get(name)
+                change = self._compare(a, b, item, sta, stb)
+                if change is not None:
+                    yield change
+                    if change.type in (ADDED, REMOVED):
+                        if change.isDir:
+                            yield from self._subtree(a if change.type == REMOVED else b,
+                                                     change.type, item)
+                        continue
+                if sta and stb and stat.S_ISDIR(sta.st_mode) and stat.S_ISDIR(stb.st_mode):
+                    subfolders.append(item)
+            stack.extend(reversed(subfolders))
+
+    def _subtree(self, side, type_, path):
+        """
+        Report everything inside folder `path` as added or removed.
+        """
+        stack = [path]
+        while stack:
+            if self._isCanceled():
+                return
+            folder = stack.pop()
+            items = side.listdir(folder)
+            subfolders = []
+            for name in sorted(items):
+                item = os.path.join(folder, name)
+                st = items[name]
+                isDir = stat.S_ISDIR(st.st_mode)
+                attr = side.attributes(item, st)
+                if type_ == ADDED:
+                    yield self._change(type_, item, isDir, None, attr)
+                else:
+                    yield self._change(type_, item, isDir, attr, None)
+                if isDir:
+                    subfolders.append(item)
+            stack.extend(reversed(subfolders))
+
+def formatChange(change):
+    """
+    Text representation of `change` like ``'M /foo/bar'``. Folders end
+    with a slash.
+
+    Args:
+        change (Change):    change
+
+    Returns:
+        str:                one line
+    """
+    path = change.path
+    if change.isDir:
+        path = os.path.join(path, '')
+    return '%s %s' %(SYMBOLS[change.type], path)
+
+def formatSummary(summary):
+    """
+    Text representation of :py:attr:`SnapshotDiff.summary`.
+
+    Args:
+        summary (collections.OrderedDict):  number of changes per type
+
+    Returns:
+        str:                                one line
+    """
+    return ', '.join(['%s: %s' %(t.capitalize(), n) for t, n in summary.items()])
@@ -0,0 +1,602 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Streaming pipeline for take_snapshot logs.
+
+Logs are processed line by line through generator stages::
+
+    lines -> filterLines -> decodeLines -> renderLines
+
+So even huge logs can be shown progressively without loading them into
+memory at once.
+
+New lines are written through :py:class:`LogWriter` which buffers them
+and writes them in background. Logs might be rotated and compressed with
+gzip. :py:func:`readLog` reads all parts transparently. With the sidecar
+index :py:func:`readLevel` reads only blocks which contain lines of the
+requested level.
+"""
+
+import os
+import bz2
+import gzip
+import atexit
+import gettext
+import threading
+import weakref
+
+import logger
+
+_=gettext.gettext
+
+ALL            = 0
+ERRORS         = 1
+CHANGES        = 2
+INFORMATION    = 3
+ERRORS_CHANGES = 4
+
+#values for 'backintime log --filter'
+FILTERS = {'all':            ALL,
+           'errors':         ERRORS,
+           'changes':        CHANGES,
+           'info':           INFORMATION,
+           'errors-changes': ERRORS_CHANGES}
+
+#level chars (the 'E' in '[E] ...') which will pass the filter in each mode
+MODE_LEVELS = {ERRORS:         ('E',),
+               CHANGES:        ('C',),
+               INFORMATION:    ('I',),
+               ERRORS_CHANGES: ('E', 'C')}
+
+def decodeHeader(config):
+    """
+    Header which will be added on top of decoded logs.
+
+    Args:
+        config (config.Config): current config
+
+    Returns:
+        str:                    header message
+    """
+    msg = _('### This log has been decoded with automatic search pattern\n'\
+            '### If some paths are not decoded you can manually decode '   \
+            'them with:\n')
+    msg += '### \'backintime --quiet'
+    profile_id = config.get_current_profile()
+    if int(profile_id) > 1:
+        msg += ' --profile %s' % config.get_profile_name(profile_id)
+    msg += ' --decode <path>\'\n\n'
+    return msg
+
+def readLines(lines):
+    """
+    Strip trailing newlines from `lines`.
+
+    Args:
+        lines (iterable):   raw lines e.g. an open file object
+
+    Yields:
+        str:                lines without newline
+    """
+    for line in lines:
+        yield line.rstrip('\n')
+
+def filterLines(lines, mode = ALL):
+    """
+    Only pass lines which match `mode`. Lines which doesn't start with a
+    level like '[E]' (e.g. the header) will always pass.
+
+    Args:
+        lines (iterable):   log lines
+        mode (int):         one of ``ALL``, ``ERRORS``, ``CHANGES``,
+                            ``INFORMATION`` or ``ERRORS_CHANGES``
+
+    Yields:
+        str:                filtered lines
+    """
+    if not mode in MODE_LEVELS:
+        yield from lines
+        return
+    levels = MODE_LEVELS[mode]
+    for line in lines:
+        if line.startswith('[') and len(line) > 1 and line[1] not in levels:
+            continue
+        yield line
+
+def decodeLines(lines, decode = None, batchSize = 256):
+    """
+    Decode paths in `lines` with `decode`. Lines are collected in batches
+    of `batchSize` so all paths of one batch can be decoded in a single
+    pipelined run of encfsctl.
+
+    Args:
+        lines (iterable):               log lines
+        decode (encfstools.Decode):     decode instance or ``None`` to skip
+                                        decoding
+        batchSize (int):                number of lines decoded at once
+
+    Yields:
+        str:                            decoded lines
+    """
+    if decode is None:
+        yield from lines
+        return
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batchSize:
+            yield from decode.log_many(batch)
+            batch = []
+    if batch:
+        yield from decode.log_many(batch)
+
+def renderLines(lines, header = ''):
+    """
+    Add newlines to `lines` and prepend `header`.
+
+    Args:
+        lines (iterable):   log lines
+        header (str):       text which will be yield first
+
+    Yields:
+        str:                lines including newline
+    """
+    if header:
+        yield header
+    for line in lines:
+        yield line + '\n'
+
+def pipeline(lines, mode = ALL, decode = None, header = ''):
+    """
+    Put all stages together.
+
+    Args:
+        lines (iterable):               raw log lines (e.g. an open file)
+        mode (int):                     filter mode. See :py:func:`filterLines`
+        decode (encfstools.Decode):     decode instance or ``None``
+        header (str):                   text which will be yield first
+
+    Yields:
+        str:                            rendered lines including newline
+    """
+    lines = readLines(lines)
+    lines = filterLines(lines, mode)
+    lines = decodeLines(lines, decode)
+    yield from renderLines(lines, header)
+
+GZIP_MAGIC = b'\x1f\x8b'
+BZ2_MAGIC = b'BZh'
+
+#Logs are written in blocks. Each block is compressed separately (one
+#gzip member or bz2 stream) so single blocks can be read without
+#decompressing the whole file. The sidecar index "<log>.idx" has one line
+#per block:
+#    <offset> <length> <[E] lines> <[C] lines> <[I] lines> <other levels> <no level>
+INDEX_SUFFIX = '.idx'
+INDEX_LEVELS = ('E', 'C', 'I')
+BLOCK_SIZE = 256 * 1024
+
+def isCompressed(filename):
+    """
+    Check if `filename` was written with gzip.
+
+    Args:
+        filename (str): full path
+
+    Returns:
+        bool:           ``True`` if `filename` starts with gzip magic bytes
+    """
+    return _magic(filename) == GZIP_MAGIC
+
+def _magic(filename):
+    try:
+        with open(filename, 'rb') as f:
+            head = f.read(3)
+    except OSError:
+        return None
+    for magic in (GZIP_MAGIC, BZ2_MAGIC):
+        if head.startswith(magic):
+            return magic
+    return None
+
+def _decompressor(filename):
+    return {GZIP_MAGIC: gzip.decompress,
+            BZ2_MAGIC:  bz2.decompress}.get(_magic(filename))
+
+def indexFile(filename):
+    """
+    Full path of the sidecar index for log `filename`.
+    """
+    return filename + INDEX_SUFFIX
+
+def logFiles(filename, backups = None):
+    """
+    All existing parts of log `filename` with the oldest rotated part
+    first and the live log last.
+
+    Args:
+        filename (str): full path of the live log
+        backups (int):  number of rotated parts to look for. Default is
+                        :py:attr:`LogWriter.BACKUPS`
+
+    Returns:
+        list:           full paths
+    """
+    if backups is None:
+        backups = LogWriter.BACKUPS
+    parts = ['%s.%s' %(filename, i) for i in range(backups, 0, -1)]
+    parts.append(filename)
+    return [part for part in parts if os.path.exists(part)]
+
+def countLevels(data):
+    """
+    Count lines in `data` for each column of the index.
+
+    Args:
+        data (bytes):   log lines
+
+    Returns:
+        list:           number of lines with level ``E``, ``C``, ``I``,
+                        any other level and without level
+    """
+    counts = [0] * (len(INDEX_LEVELS) + 2)
+    lines = data.split(b'\n')
+    if not lines[-1]:
+        lines.pop()
+    for line in lines:
+        if line[:1] == b'[' and len(line) > 1:
+            level = chr(line[1])
+            if level in INDEX_LEVELS:
+                counts[INDEX_LEVELS.index(level)] += 1
+            else:
+                counts[-2] += 1
+        else:
+            counts[-1] += 1
+    return counts
+
+def splitBlocks(data, blockSize = None):
+    """
+    Split `data` into blocks of about `blockSize` bytes at line endings.
+
+    Args:
+        data (bytes):       log lines
+        blockSize (int):    minimum size of one block. Default is
+                            :py:data:`BLOCK_SIZE`
+
+    Yields:
+        bytes:              blocks
+    """
+    if blockSize is None:
+        blockSize = BLOCK_SIZE
+    start = 0
+    while start < len(data):
+        end = data.find(b'\n', start + blockSize - 1)
+        if end < 0:
+            end = len(data)
+        else:
+            end += 1
+        yield data[start:end]
+        start = end
+
+def appendBlocks(filename, data, compress = None):
+    """
+    Append `data` to log `filename` block by block and add them to the
+    sidecar index.
+
+    Args:
+        filename (str):     full path of the log
+        data (bytes):       log lines
+        compress (method):  compress each block with this (e.g.
+                            ``bz2.compress``) or ``None``
+    """
+    with open(filename, 'ab') as f, open(indexFile(filename), 'at') as index:
+        offset = f.seek(0, os.SEEK_END)
+        for block in splitBlocks(data):
+            raw = block if compress is None else compress(block)
+            f.write(raw)
+            index.write(' '.join(str(i) for i in [offset, len(raw)] + countLevels(block)) + '\n')
+            offset += len(raw)
+
+def writeBlocks(filename, data, compress = None):
+    """
+    Same as :py:func:`appendBlocks` but replace existing logs.
+    """
+    for path in (filename, indexFile(filename)):
+        if os.path.exists(path):
+            os.remove(path)
+    appendBlocks(filename, data, compress)
+
+def loadIndex(filename):
+    """
+    Load the sidecar index of `filename`.
+
+    Args:
+        filename (str): full path of the log
+
+    Returns:
+        list:           ``(offset, length, counts)`` for every block or
+                        ``None`` if there is no index or it doesn't match
+                        the log (e.g. it was written by an older version)
+    """
+    ret = []
+    offset = 0
+    try:
+        with open(indexFile(filename), 'rt') as f:
+            for line in f:
+                values = [int(i) for i in line.split()]
+                if len(values) != len(INDEX_LEVELS) + 4 or values[0] != offset:
+                    return None
+                ret.append((values[0], values[1], values[2:]))
+                offset += values[1]
+        if offset != os.path.getsize(filename):
+            return None
+    except (OSError, ValueError):
+        return None
+    return ret
+
+def _passing(counts, mode):
+    """
+    Number of lines out of one block which pass :py:func:`filterLines`.
+    """
+    if not mode in MODE_LEVELS:
+        return sum(counts)
+    return sum(counts[INDEX_LEVELS.index(level)] for level in MODE_LEVELS[mode]) + counts[-1]
+
+def readLog(filename):
+    """
+    Read log `filename` including rotated parts and uncompress them if
+    necessary.
+
+    Args:
+        filename (str):     full path of the live log
+
+    Returns:
+        generator:          lines including newline
+
+    Raises:
+        FileNotFoundError:  if there is no part of the log
+    """
+    parts = logFiles(filename)
+    if not parts:
+        raise FileNotFoundError(2, 'No such file or directory', filename)
+    return _readParts(parts)
+
+def readLevel(filename, mode = ALL, start = 0, count = None):
+    """
+    Read only lines which pass `mode` from log `filename` including
+    rotated parts. If there is a sidecar index, blocks without matching
+    lines or before `start` won't be read at all.
+
+    Args:
+        filename (str):     full path of the live log
+        mode (int):         filter mode. See :py:func:`filterLines`
+        start (int):        skip this number of matching lines
+        count (int):        return at most this number of lines or
+                            ``None`` for all
+
+    Returns:
+        generator:          lines including newline
+
+    Raises:
+        FileNotFoundError:  if there is no part of the log
+    """
+    parts = logFiles(filename)
+    if not parts:
+        raise FileNotFoundError(2, 'No such file or directory', filename)
+    return _readLevel(parts, mode, start, count)
+
+def _readLevel(parts, mode, start, count):
+    for part in parts:
+        for matching, load in _blocks(part, mode):
+            if matching is not None and matching <= start:
+                start -= matching
+                continue
+            for line in filterLines(load(), mode):
+                if start:
+                    start -= 1
+                    continue
+                if count is not None:
+                    if count <= 0:
+                        return
+                    count -= 1
+                yield line
+
+def _blocks(part, mode):
+    """
+    Blocks of `part` which contain lines matching `mode`.
+
+    Yields:
+        tuple:  number of matching lines (``None`` if `part` has no
+                index) and a method which returns the lines of the block
+    """
+    index = loadIndex(part)
+    if index is None:
+        yield (None, lambda: _readParts([part]))
+        return
+    decompress = _decompressor(part)
+    for offset, length, counts in index:
+        matching = _passing(counts, mode)
+        if matching:
+            yield (matching, lambda offset = offset, length = length: _readBlock(part, offset, length, decompress))
+
+def _readBlock(filename, offset, length, decompress = None):
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    if decompress is not None:
+        data = decompress(data)
+    lines = data.decode('utf-8', 'replace').split('\n')
+    last = lines.pop()
+    ret = [line + '\n' for line in lines]
+    if last:
+        ret.append(last)
+    return ret
+
+def _readParts(parts):
+    for part in parts:
+        magic = _magic(part)
+        try:
+            if magic == GZIP_MAGIC:
+                f = gzip.open(part, 'rt', encoding = 'utf-8', errors = 'replace')
+            elif magic == BZ2_MAGIC:
+                f = bz2.open(part, 'rt', encoding = 'utf-8', errors = 'replace')
+            else:
+                f = open(part, 'rt', encoding = 'utf-8', errors = 'replace')
+        except OSError as e:
+            logger.debug('Failed to read log %s: %s' %(part, str(e)))
+            continue
+        with f:
+            yield from f
+
+_writers = weakref.WeakSet()
+
+@atexit.register
+def _closeAll():
+    for writer in list(_writers):
+        writer.close()
+
+class LogWriter(object):
+    """
+    Buffered writer for take_snapshot logs. Instead of opening the log for
+    every single line, lines are collected and written if the buffer
+    exceeds `bufferSize` bytes or at latest after `flushInterval`
+    seconds from a background thread. Errors and exit of the process
+    always flush.
+
+    Args:
+        filename (str):         full path of the live log
+        maxSize (int):          rotate the log if it is bigger than this
+                                number of bytes. ``0`` disables rotation
+        compress (bool):        write the live log with gzip
+        bufferSize (int):       flush if there are more bytes buffered
+        flushInterval (float):  flush at least after this number of
+                                seconds
+    """
+    BACKUPS = 5
+
+    def __init__(self, filename, maxSize = 0, compress = False,
+                 bufferSize = 64 * 1024, flushInterval = 1.0):
+        self.filename = filename
+        self.maxSize = maxSize
+        self.compress = compress
+        self.bufferSize = bufferSize
+        self.flushInterval = flushInterval
+        self.buffer = []
+        self.bufferBytes = 0
+        self.lock = threading.RLock()
+        self.thread = None
+        self.stopEvent = threading.Event()
+        _writers.add(self)
+
+    def write(self, line, flush = False):
+        """
+        Add one line to the buffer.
+
+        Args:
+            line (str):     log line without newline
+            flush (bool):   write buffer immediately (e.g. for errors)
+        """
+        with self.lock:
+            self.buffer.append(line + '\n')
+            self.bufferBytes += len(line) + 1
+            if flush or self.bufferBytes >= self.bufferSize:
+                self._flush()
+            if self.thread is None:
+                self.stopEvent.clear()
+                self.thread = threading.Thread(target = self._run,
+                                               name = 'LogWriter',
+                                               daemon = True)
+                self.thread.start()
+
+    def _run(self):
+        while not self.stopEvent.wait(self.flushInterval):
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered lines into the log.
+        """
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        data = ''.join(self.buffer).encode('utf-8', 'replace')
+        self.buffer = []
+        self.bufferBytes = 0
+        try:
+            self._rotate(len(data))
+            appendBlocks(self.filename, data, gzip.compress if self.compress else None)
+        except Exception as e:
+            logger.debug('Failed to write take_snapshot log %s: %s'
+                         %(self.filename, str(e)),
+                         self)
+
+    def _rotate(self, size):
+        """
+        Rotate the live log if it would grow beyond :py:attr:`maxSize` or
+        if it was written in a different format than :py:attr:`compress`.
+        """
+        try:
+            current = os.path.getsize(self.filename)
+        except OSError:
+            return
+        if not current:
+            return
+        if not (self.maxSize and current + size > self.maxSize) \
+           and isCompressed(self.filename) == self.compress:
+            return
+        for i in range(self.BACKUPS - 1, -1, -1):
+            src = '%s.%s' %(self.filename, i) if i else self.filename
+            dst = '%s.%s' %(self.filename, i + 1)
+            if not os.path.exists(src):
+                continue
+            os.replace(src, dst)
+            if os.path.exists(indexFile(src)):
+                os.replace(indexFile(src), indexFile(dst))
+            elif os.path.exists(indexFile(dst)):
+                #don't keep a stale index for the moved part
+                os.remove(indexFile(dst))
+
+    def close(self):
+        """
+        Stop the background thread and flush the buffer.
+        """
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+            self.stopEvent.set()
+            self._flush()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def clear(self):
+        """
+        Drop the buffer and remove the log including all rotated parts.
+        """
+        with self.lock:
+            self.buffer = []
+            self.bufferBytes = 0
+            for part in logFiles(self.filename):
+                for path in (part, indexFile(part)):
+                    if not os.path.exists(path):
+                        continue
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        logger.debug('Failed to remove %s: %s' %(path, str(e)), self)
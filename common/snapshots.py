@@ -29,6 +29,10 @@ import shutil
 import time
 import re
 import fcntl
+import shlex
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
 
 import config
 import configfile
@@ -39,6 +43,14 @@ import encfstools
 import mount
 import progress
 import bcolors
+import restoreplan
+import restorepermissions
+import snapshotlog
+import versionindex
+import hashcache
+import statusbus
+import metrics
+import runprofile
 from exceptions import MountException
 
 _=gettext.gettext
@@ -61,6 +73,11 @@ class Snapshots:
 
         self.clear_uid_gid_cache()
         self.clear_uid_gid_names_cache()
+        self._take_snapshot_log_writer = None
+        self.progress = progress.ProgressSegment(self.config)
+        self.status_bus = None
+        self.metrics = None
+        self.run_profile = None
 
         #rsync --info=progress2 output
         #search for:     517.38K  26%   14.46MB/s    0:02:36
@@ -80,11 +97,10 @@ class Snapshots:
 
     #TODO: make own class for takeSnapshotMessage
     def clear_take_snapshot_message( self ):
-        files = (self.config.get_take_snapshot_message_file(), \
-                 self.config.get_take_snapshot_progress_file() )
-        for f in files:
-            if os.path.exists(f):
-                os.remove(f)
+        f = self.config.get_take_snapshot_message_file()
+        if os.path.exists(f):
+            os.remove(f)
+        self.progress.clear()
 
     #TODO: make own class for takeSnapshotMessage
     def get_take_snapshot_message( self ):
@@ -126,6 +142,9 @@ class Snapshots:
     #TODO: make own class for takeSnapshotMessage
     def set_take_snapshot_message( self, type_id, message, timeout = -1 ):
         data = str(type_id) + '\n' + message
+        if type_id == 1 and not self.metrics is None:
+            self.metrics.errors += 1
+        self.publish_status(statusbus.MESSAGE, type = type_id, message = message, timeout = timeout)
 
         try:
             with open( self.config.get_take_snapshot_message_file(), 'wt' ) as f:
@@ -151,54 +170,45 @@ class Snapshots:
                          self)
             pass
 
-    #TODO: make own class for takeSnapshotLog
-    def _filter_take_snapshot_log( self, log, mode , decode = None):
-        decode_msg = _('### This log has been decoded with automatic search pattern\n'\
-                       '### If some paths are not decoded you can manually decode '   \
-                       'them with:\n')
-        decode_msg += '### \'backintime --quiet'
-        profile_id = self.config.get_current_profile()
-        if int(profile_id) > 1:
-            decode_msg += ' --profile %s' % self.config.get_profile_name(profile_id)
-        decode_msg += ' --decode <path>\'\n\n'
-        if 0 == mode:
-            if not decode is None:
-                ret = decode_msg
-                for line in log.split('\n'):
-                    line = decode.log(line)
-                    ret += line + '\n'
-                return ret
-            return log
-
-        lines = log.split( '\n' )
-        log = ''
-        if not decode is None:
-            log = decode_msg
-
-        for line in lines:
-            if line.startswith( '[' ):
-                if mode == 1 and line[1] != 'E':
-                    continue
-                elif mode == 2 and line[1] != 'C':
-                    continue
-                elif mode == 3 and line[1] != 'I':
-                    continue
-                elif mode == 4 and line[1] not in ('E', 'C'):
-                    continue
-
-            if not decode is None:
-                line = decode.log(line)
-            log = log + line + '\n'
+    def iter_take_snapshot_log(self, mode = 0, profile_id = None, decode = None, start = 0, count = None):
+        """
+        Read the current take_snapshot log line by line and stream it
+        through :py:func:`snapshotlog.pipeline`.
 
-        return log
+        Args:
+            mode (int):                     filter mode. See
+                                            :py:func:`snapshotlog.filterLines`
+            profile_id (str):               profile ID
+            decode (encfstools.Decode):     decode paths with this instance
+            start (int):                    skip this number of lines
+                                            matching `mode`
+            count (int):                    return at most this number
+                                            of lines or ``None`` for all
+
+        Yields:
+            str:                            log lines including newline
+        """
+        logFile = self.config.get_take_snapshot_log_file(profile_id)
+        header = ''
+        if not decode is None:
+            header = snapshotlog.decodeHeader(self.config)
+        writer = self._take_snapshot_log_writer
+        if not writer is None and writer.filename == logFile:
+            writer.flush()
+        try:
+            lines = snapshotlog.readLevel(logFile, mode, start, count)
+        except Exception as e:
+            msg = ('Failed to get take_snapshot log from %s:' %logFile, str(e))
+            logger.debug(' '.join(msg), self)
+            yield '\n'.join(msg)
+            return
+        yield from snapshotlog.pipeline(lines, mode, decode, header)
 
     #TODO: make own class for takeSnapshotLog
     def get_take_snapshot_log( self, mode = 0, profile_id = None, **kwargs ):
         logFile = self.config.get_take_snapshot_log_file(profile_id)
         try:
-            with open(logFile, 'rt') as f:
-                data = f.read()
-            return self._filter_take_snapshot_log( data, mode, **kwargs )
+            return ''.join(self.iter_take_snapshot_log(mode, profile_id, **kwargs))
         except Exception as e:
             msg = ('Failed to get take_snapshot log from %s:' %logFile, str(e))
             logger.debug(' '.join(msg), self)
@@ -209,23 +219,120 @@ class Snapshots:
         if NewSnapshot(self.config).saveToContinue:
             msg = "Last snapshot didn't finish but can be continued.\n\n======== continue snapshot (profile %s): %s ========\n"
         else:
-            os.system( "rm \"%s\"" % self.config.get_take_snapshot_log_file() )
+            self.take_snapshot_log_writer().clear()
             msg = "========== Take snapshot (profile %s): %s ==========\n"
         self.append_to_take_snapshot_log(msg %(self.config.get_current_profile(), date.strftime('%c')), 1)
 
+    def take_snapshot_log_writer(self):
+        """
+        Buffered writer for the take_snapshot log of the current profile.
+
+        Returns:
+            snapshotlog.LogWriter:  log writer
+        """
+        logFile = self.config.get_take_snapshot_log_file()
+        writer = self._take_snapshot_log_writer
+        if writer is None or writer.filename != logFile:
+            if not writer is None:
+                writer.close()
+            writer = snapshotlog.LogWriter(logFile,
+                                           maxSize = self.config.log_max_size() * 1024 * 1024,
+                                           compress = self.config.log_compress())
+            self._take_snapshot_log_writer = writer
+        return writer
+
+    def close_take_snapshot_log(self):
+        """
+        Write all buffered lines and stop the background writer.
+        """
+        if not self._take_snapshot_log_writer is None:
+            self._take_snapshot_log_writer.close()
+
     #TODO: make own class for takeSnapshotLog
     def append_to_take_snapshot_log( self, message, level ):
         if level > self.config.log_level():
             return
 
+        #errors are written immediately
+        self.take_snapshot_log_writer().write(message, flush = level == 1)
+
+    def start_status_bus(self):
+        """
+        Start :py:class:`statusbus.StatusBus` so GUI, systray and
+        'backintime watch' get events pushed instead of polling files.
+        """
+        self.status_bus = statusbus.StatusBus(self.config)
+        if not self.status_bus.start():
+            self.status_bus = None
+
+    def publish_status(self, event, **data):
+        """
+        Send an event to all subscribers of the status bus if it is
+        running.
+        """
+        if not self.status_bus is None:
+            self.status_bus.publish(event, **data)
+
+    def set_take_snapshot_phase(self, phase):
+        """
+        Start a new phase of take_snapshot. This is published on the status
+        bus and measured for :py:meth:`write_metrics`.
+
+        Args:
+            phase (str):    one of the ``statusbus.PHASE_*`` values
+        """
+        if not self.metrics is None:
+            self.metrics.phase(phase)
+        self.publish_status(statusbus.PHASE, phase = phase)
+
+    def write_metrics(self, success):
+        """
+        Finish collecting metrics of the current take_snapshot run and
+        write them to :py:meth:`config.Config.metrics_file` if enabled.
+        """
+        if self.metrics is None:
+            return
+        if self.config.metrics_enabled():
+            try:
+                self.metrics.statSnapshots(listSnapshots(self.config))
+            except OSError as e:
+                logger.debug('Failed to list snapshots for metrics: %s' % str(e), self)
+            self.metrics.finish(success)
+            self.metrics.write()
+        self.metrics = None
+
+    def write_run_profile(self, sid = None):
+        """
+        Stop profiling the current run ('backup --profile-run') and write
+        the report into snapshot `sid`. If there is no new snapshot the
+        report goes to the local data folder.
+
+        Args:
+            sid (SID):  new snapshot
+        """
+        if self.run_profile is None or not self.run_profile.wall is None:
+            return
+        self.run_profile.stop()
+        if sid is None or not sid.exists():
+            self.run_profile.write(self.config.get_take_snapshot_run_profile_file())
+            return
+        path = sid.path()
+        mode = os.stat(path).st_mode
         try:
-            with open( self.config.get_take_snapshot_log_file(), 'at' ) as f:
-                f.write( message + '\n' )
-        except Exception as e:
-            logger.debug('Failed to add message to take_snapshot log %s: %s'
-                         %(self.config.get_take_snapshot_log_file(), str(e)),
-                         self)
-            pass
+            sid.makeWriteable()
+            self.run_profile.write(sid.path(SID.RUN_PROFILE))
+        finally:
+            os.chmod(path, mode)
+
+    def stop_status_bus(self, **data):
+        """
+        Send :py:data:`statusbus.FINISH` with `data` and stop the status
+        bus.
+        """
+        if not self.status_bus is None:
+            self.status_bus.publish(statusbus.FINISH, **data)
+            self.status_bus.stop()
+            self.status_bus = None
 
     def is_busy( self ):
         instance = applicationinstance.ApplicationInstance( self.config.get_take_snapshot_instance_file(), False )
@@ -410,7 +517,7 @@ class Snapshots:
         assert isinstance(key_path, bytes), 'key_path is not bytes type: %s' % key_path
         assert isinstance(path, bytes), 'path is not bytes type: %s' % path
         assert isinstance(fileInfoDict, FileInfoDict), 'fileInfoDict is not FileInfoDict type: %s' % fileInfoDict
-        if key_path not in fileInfoDict or not os.path.exists(path):
+        if key_path not in fileInfoDict:
             return
         info = fileInfoDict[key_path]
 
@@ -418,47 +525,8 @@ class Snapshots:
         uid = self.get_uid(info[1], callback)
         gid = self.get_gid(info[2], callback)
 
-        #current file stats
-        st = os.stat(path)
-
-        # logger.debug('%(path)s: uid %(target_uid)s/%(cur_uid)s, gid %(target_gid)s/%(cur_gid)s, mod %(target_mod)s/%(cur_mod)s'
-        #              %{'path': path.decode(),
-        #                'target_uid': uid,
-        #                'cur_uid': st.st_uid,
-        #                'target_gid': gid,
-        #                'cur_gid': st.st_gid,
-        #                'target_mod': info[0],
-        #                'cur_mod': st.st_mode
-        #                })
-
-        if uid != -1 or gid != -1:
-            ok = False
-            if uid != st.st_uid:
-                try:
-                    os.chown( path, uid, gid )
-                    ok = True
-                except:
-                    pass
-                self.restore_callback( callback, ok, "chown %s %s : %s" % ( path.decode(errors = 'ignore'), uid, gid ) )
-
-            #if restore uid/gid failed try to restore at least gid
-            if not ok and gid != st.st_gid:
-                try:
-                    os.chown( path, -1, gid )
-                    ok = True
-                except:
-                    pass
-                self.restore_callback( callback, ok, "chgrp %s %s" % ( path.decode(errors = 'ignore'), gid ) )
-
-        #restore perms
-        ok = False
-        if info[0] != st.st_mode:
-            try:
-                os.chmod( path, info[0] )
-                ok = True
-            except:
-                pass
-            self.restore_callback( callback, ok, "chmod %s %04o" % ( path.decode(errors = 'ignore'), info[0] ) )
+        for ok, msg in restorepermissions.applyPathInfo(path, uid, gid, info[0]):
+            self.restore_callback(callback, ok, msg)
 
     def restore( self, sid, paths, callback = None, restore_to = '', delete = False, backup = False, no_backup = False):
         instance = applicationinstance.ApplicationInstance( self.config.get_restore_instance_file(), False, flock = True)
@@ -497,38 +565,50 @@ class Snapshots:
             cmd_suffix += '--filter="protect %s" ' % self.config._LOCAL_DATA_FOLDER
             cmd_suffix += '--filter="protect %s" ' % self.config._MOUNT_ROOT
 
-        restored_paths = []
+        #group paths with the same source base and src_delta so each group
+        #can be restored with one single rsync call using --files-from
+        groups = OrderedDict()
         for path in paths:
             tools.make_dirs(os.path.dirname(path))
             src_path = path
             src_delta = 0
-            src_base = sid.pathBackup(use_mode = ['ssh'])
-            cmd = cmd_suffix
+            src_base = os.path.join(sid.pathBackup(use_mode = ['ssh']), '')
             if restore_to:
                 items = os.path.split(src_path)
                 aux = items[0].lstrip(os.sep)
                 #bugfix: restore system root ended in <src_base>//.<src_path>
                 if aux:
                     src_base = os.path.join(src_base, aux) + '/'
-                src_path = '/' + items[1]
+                src_path = items[1]
                 if items[0] == '/':
                     src_delta = 0
                 else:
                     src_delta = len(items[0])
+            src_path = src_path.lstrip(os.sep) or '.'
+            groups.setdefault((src_base, src_delta), []).append((path, src_path))
 
-            cmd += self.rsync_remote_path('%s.%s' %(src_base, src_path), use_modes = ['ssh'])
-            cmd += ' "%s/"' % restore_to
-            self.restore_callback( callback, True, cmd )
-            self._execute( cmd, callback, filters = (self._filter_rsync_progress, ))
-            self.restore_callback(callback, True, ' ')
-            restored_paths.append((path, src_delta))
-        try:
-            os.remove(self.config.get_take_snapshot_progress_file())
-        except Exception as e:
-            logger.debug('Failed to remove snapshot progress file %s: %s'
-                         %(self.config.get_take_snapshot_progress_file(), str(e)),
-                         self)
-            pass
+        restored_paths = []
+        self.restore_transferred = 0
+        start = time.time()
+        for (src_base, src_delta), items in groups.items():
+            with tempfile.NamedTemporaryFile(prefix = 'bit_restore_') as files_from:
+                #NUL separated, so newlines in filenames don't break the list
+                for path, src_path in items:
+                    files_from.write(src_path.encode() + b'\0')
+                files_from.flush()
+
+                cmd = cmd_suffix
+                cmd += '--from0 --files-from="%s" ' % files_from.name
+                cmd += self.rsync_remote_path('%s.' % src_base, use_modes = ['ssh'])
+                cmd += ' "%s/"' % restore_to
+                self.restore_callback( callback, True, cmd )
+                self._execute( cmd, callback, filters = (self._filter_rsync_progress,
+                                                         self._filter_rsync_stats))
+                self.restore_callback(callback, True, ' ')
+            restored_paths.extend([(path, src_delta) for path, src_path in items])
+        #remember throughput for estimating the duration of future restores
+        restoreplan.History(self.config).add(self.restore_transferred, time.time() - start)
+        self.progress.clear()
 
         if full_rsync and not self.config.get_snapshots_mode() in ['ssh', 'ssh_encfs']:
             instance.exit_application()
@@ -548,45 +628,12 @@ class Snapshots:
             self.get_gid(name.encode(), callback = callback, backup = gid)
 
         if fileInfoDict:
-            all_dirs = [] #restore dir permissions after all files are done
+            if isinstance(restore_to, str):
+                restore_to = restore_to.encode()
+            engine = restorepermissions.RestorePermissions(self, fileInfoDict, callback)
             for path, src_delta in restored_paths:
-                #explore items
-                snapshot_path_to = sid.pathBackup(path).rstrip( '/' )
-                root_snapshot_path_to = sid.pathBackup().rstrip( '/' )
-                #use bytes instead of string from here
-                if isinstance(path, str):
-                    path = path.encode()
-                if isinstance(restore_to, str):
-                    restore_to = restore_to.encode()
-
-                if not restore_to:
-                    path_items = path.strip(b'/').split(b'/')
-                    curr_path = b'/'
-                    for path_item in path_items:
-                        curr_path = os.path.join( curr_path, path_item )
-                        if curr_path not in all_dirs:
-                            all_dirs.append( curr_path )
-                else:
-                    if path not in all_dirs:
-                        all_dirs.append(path)
-
-                if os.path.isdir( snapshot_path_to ) and not os.path.islink( snapshot_path_to ):
-                    head = len(root_snapshot_path_to.encode())
-                    for explore_path, dirs, files in os.walk( snapshot_path_to.encode() ):
-                        for item in dirs:
-                            item_path = os.path.join( explore_path, item )[head:]
-                            if item_path not in all_dirs:
-                                all_dirs.append( item_path )
-
-                        for item in files:
-                            item_path = os.path.join( explore_path, item )[head:]
-                            real_path = restore_to + item_path[src_delta:]
-                            self._restore_path_info( item_path, real_path, fileInfoDict, callback )
-
-            all_dirs.reverse()
-            for item_path in all_dirs:
-                real_path = restore_to + item_path[src_delta:]
-                self._restore_path_info( item_path, real_path, fileInfoDict, callback )
+                engine.add(sid, path, restore_to, src_delta)
+            engine.run()
 
             self.restore_callback( callback, True, '')
             if self.restore_permission_failed:
@@ -601,6 +648,21 @@ class Snapshots:
         return '.backup.' + datetime.date.today().strftime( '%Y%m%d' )
 
     def remove_snapshot( self, sid, execute = True, quote = '\"'):
+        """
+        Remove snapshot `sid`. First make all folders writeable and then
+        delete the snapshot folder. Both commands run in one shell script
+        which is streamed through a single ssh session on remote profiles.
+
+        Args:
+            sid (SID):          snapshot to remove
+            execute (bool):     run the commands. If ``False`` just return
+                                them
+            quote (str):        character used to quote paths
+
+        Returns:
+            tuple:              ``(find, rm)`` commands if `execute` is
+                                ``False``
+        """
         if len( sid.sid ) <= 1:
             return
         path = sid.path( use_mode = ['ssh', 'ssh_encfs'])
@@ -608,8 +670,7 @@ class Snapshots:
                % {'path': path, 'quote': quote, 'suffix': self.config.find_suffix()}
         rm = 'rm -rf %(quote)s%(path)s%(quote)s' % {'path': path, 'quote': quote}
         if execute:
-            self._execute(self.cmd_ssh(find, quote = True))
-            self._execute(self.cmd_ssh(rm))
+            self._execute_script('%s\n%s\n' %(find, rm))
         else:
             return((find, rm))
 
@@ -617,6 +678,10 @@ class Snapshots:
         ret_val, ret_error = False, True
         sleep = True
 
+        if self.config.profile_run:
+            self.run_profile = runprofile.RunProfile()
+            self.run_profile.start()
+
         self.config.PLUGIN_MANAGER.load_plugins( self )
 
         if not self.config.is_configured():
@@ -644,6 +709,9 @@ class Snapshots:
                 instance.start_application()
                 self.flockExclusive()
                 logger.info('Lock', self)
+                self.start_status_bus()
+                self.metrics = metrics.Metrics(self.config)
+                self.set_take_snapshot_phase(statusbus.PHASE_PREPARE)
 
                 now = datetime.datetime.today()
 
@@ -655,6 +723,10 @@ class Snapshots:
                     hash_id = mount.Mount(cfg = self.config).mount()
                 except MountException as ex:
                     logger.error(str(ex), self)
+                    self.metrics.errors += 1
+                    self.write_metrics(False)
+                    self.write_run_profile()
+                    self.stop_status_bus(success = False, error = True)
                     instance.exit_application()
                     logger.info('Unlock', self)
                     time.sleep(2)
@@ -715,7 +787,11 @@ class Snapshots:
                             ret_error = False
 
                         if not ret_error:
+                            self.set_take_snapshot_phase(statusbus.PHASE_REMOVE_OLD)
                             self._free_space( now )
+                            self.metrics.statFilesystem(self.config.get_snapshots_full_path())
+                            self.append_version_index(sid)
+                            self.set_take_snapshot_phase(statusbus.PHASE_FINALIZE)
                             self.set_take_snapshot_message( 0, _('Finalizing') )
 
                     time.sleep(2)
@@ -733,12 +809,17 @@ class Snapshots:
                 if not ret_error:
                     self.clear_take_snapshot_message()
 
+                self.write_metrics(not ret_error)
+                self.write_run_profile(sid if ret_val else None)
+
                 #unmount
                 try:
                     mount.Mount(cfg = self.config).umount(self.config.current_hash_id)
                 except MountException as ex:
                     logger.error(str(ex), self)
 
+                self.stop_status_bus(success = bool(ret_val), error = bool(ret_error),
+                                     snapshot = sid.sid if ret_val else None)
                 instance.exit_application()
                 self.flockRelease()
                 logger.info('Unlock', self)
@@ -753,6 +834,8 @@ class Snapshots:
         if self.config.inhibitCookie:
             self.config.inhibitCookie = tools.unInhibitSuspend(*self.config.inhibitCookie)
 
+        self.close_take_snapshot_log()
+        self.write_run_profile()
         return ret_val
 
     def _filter_rsync_progress(self, line):
@@ -760,21 +843,36 @@ class Snapshots:
         if m:
             if m.group(5).strip():
                 return
-            pg = progress.ProgressFile(self.config)
-            pg.set_int_value('status', pg.RSYNC)
-            pg.set_str_value('sent', m.group(1) )
-            pg.set_int_value('percent', int(m.group(2)) )
-            pg.set_str_value('speed', m.group(3) )
-            pg.set_str_value('eta', m.group(4) )
-            pg.save()
-            del(pg)
+            if self.progress.update(progress.ProgressFile.RSYNC,
+                                    int(m.group(2)),
+                                    sent = m.group(1),
+                                    speed = m.group(3),
+                                    eta = m.group(4)):
+                self.publish_status(statusbus.PROGRESS,
+                                    percent = int(m.group(2)),
+                                    sent = m.group(1),
+                                    speed = m.group(3),
+                                    eta = m.group(4))
             return
         return line
 
+    def _filter_rsync_stats(self, line):
+        """
+        Sum up transferred bytes from rsync's summary line in
+        ``self.restore_transferred``.
+        """
+        if line:
+            size = restoreplan.History.parseRsyncStats(line)
+            if not size is None:
+                self.restore_transferred += size
+        return line
+
     def _exec_rsync_callback( self, line, params ):
         if not line:
             return
 
+        if not self.metrics is None:
+            self.metrics.rsyncLine(line)
         self.set_take_snapshot_message( 0, _('Take snapshot') + " (rsync: %s)" % line )
 
         if line.endswith( ')' ):
@@ -790,6 +888,8 @@ class Snapshots:
                     self.append_to_take_snapshot_log( '[C] ' + line[ 12 : ], 2 )
 
     def _exec_rsync_compare_callback( self, line, params ):
+        if not self.metrics is None:
+            self.metrics.rsyncLine(line)
         if len(line) >= 13:
             if line.startswith( 'BACKINTIME: ' ):
                 if line[12] != '.':
@@ -837,11 +937,10 @@ class Snapshots:
             logger.info("Remove leftover '%s' folder from last run" %new_snapshot.displayID)
             self.set_take_snapshot_message(0, _("Remove leftover '%s' folder from last run") %new_snapshot.displayID)
             #first do the heavy lifting over ssh
-            self._execute(self.cmd_ssh("find \"%s\" -type d -exec chmod u+wx \"{}\" %s"
-                                       %(new_snapshot.path(use_mode = ['ssh', 'ssh_encfs']), find_suffix),
-                                       quote = True)) #Debian patch
-            self._execute(self.cmd_ssh("rm -rf \"%s\""
-                                       %new_snapshot.pathBackup(use_mode = ['ssh', 'ssh_encfs']) ))
+            script  = 'find "%s" -type d -exec chmod u+wx "{}" %s\n' \
+                      %(new_snapshot.path(use_mode = ['ssh', 'ssh_encfs']), find_suffix) #Debian patch
+            script += 'rm -rf "%s"\n' %new_snapshot.pathBackup(use_mode = ['ssh', 'ssh_encfs'])
+            self._execute_script(script)
             #then delete the new_snapshot folder through sshfs
             #this will make sure os.path.exists will recognize the path is gone
             self._execute("rm -rf \"%s\"" %new_snapshot.path())
@@ -933,6 +1032,7 @@ class Snapshots:
         cmd += self.rsync_remote_path( new_snapshot.pathBackup(use_mode = ['ssh', 'ssh_encfs']) )
 
         self.set_take_snapshot_message( 0, _('Take snapshot') )
+        self.set_take_snapshot_phase(statusbus.PHASE_TRANSFER)
 
         if full_rsync:
             if prev_sid:
@@ -946,13 +1046,7 @@ class Snapshots:
         params = [False, False]
         self.append_to_take_snapshot_log( '[I] ' + cmd, 3 )
         self._execute( cmd + ' 2>&1', self._exec_rsync_callback, params, filters = (self._filter_rsync_progress, ))
-        try:
-            os.remove(self.config.get_take_snapshot_progress_file())
-        except Exception as e:
-            logger.debug('Failed to remove snapshot progress file %s: %s'
-                         %(self.config.get_take_snapshot_progress_file(), str(e)),
-                         self)
-            pass
+        self.progress.clear()
 
         has_errors = False
         if params[0]:
@@ -997,6 +1091,7 @@ class Snapshots:
             #save permissions for sync folders
             logger.info('Save permissions', self)
             self.set_take_snapshot_message( 0, _('Save permission ...') )
+            self.set_take_snapshot_phase(statusbus.PHASE_SAVE_INFO)
 
             permission_done = False
             fileInfoDict = FileInfoDict()
@@ -1011,20 +1106,21 @@ class Snapshots:
                     decode = encfstools.Bounce()
                 head = len( path_to_explore_ssh )
 
-                find = subprocess.Popen(cmd, stdout = subprocess.PIPE,
-                                        stderr = subprocess.PIPE)
+                with runprofile.command(self.run_profile, cmd):
+                    find = subprocess.Popen(cmd, stdout = subprocess.PIPE,
+                                            stderr = subprocess.PIPE)
 
-                for line in find.stdout:
-                    if line:
-                        self._save_path_info(fileInfoDict, decode.remote(line.rstrip(b'\n'))[head:])
+                    paths = (line.rstrip(b'\n') for line in find.stdout if line)
+                    for path in decode.remote_many(paths):
+                        self._save_path_info(fileInfoDict, path[head:])
 
-                output = find.communicate()[0]
+                    output = find.communicate()[0]
                 if find.returncode:
                     self.set_take_snapshot_message(1, _('Save permission over ssh failed. Retry normal method'))
                 else:
-                    for line in output.split(b'\n'):
-                        if line:
-                            self._save_path_info(fileInfoDict, decode.remote(line)[head:])
+                    paths = [line for line in output.split(b'\n') if line]
+                    for path in decode.remote_many(paths):
+                        self._save_path_info(fileInfoDict, path[head:])
                     permission_done = True
 
             if not permission_done:
@@ -1056,8 +1152,8 @@ class Snapshots:
 
         #copy take snapshot log
         try:
-            with open( self.config.get_take_snapshot_log_file(), 'rb') as logfile:
-                new_snapshot.setLog(logfile.read())
+            self.take_snapshot_log_writer().flush()
+            new_snapshot.setLog(''.join(snapshotlog.readLog(self.config.get_take_snapshot_log_file())))
         except Exception as e:
             logger.debug('Failed to write take_snapshot log %s into compressed file %s: %s'
                          %(self.config.get_take_snapshot_log_file(), new_snapshot.path(SID.LOG), str(e)),
@@ -1198,50 +1294,41 @@ class Snapshots:
                         %del_snapshots, self)
             lckFile = os.path.normpath(os.path.join(del_snapshots[0].path(use_mode = ['ssh', 'ssh_encfs']), os.pardir, 'smartremove.lck'))
 
-            maxLength = self.config.ssh_max_arg_length()
-            if not maxLength:
-                import sshMaxArg
-                user_host = '%s@%s' %(self.config.get_ssh_user(), self.config.get_ssh_host())
-                maxLength = sshMaxArg.test_ssh_max_arg(user_host)
-                self.config.set_ssh_max_arg_length(maxLength)
-                self.config.save()
-                sshMaxArg.reportResult(user_host, maxLength)
+            #write the worker script to the remote host and run it detached
+            #in screen. Everything is streamed through stdin of one ssh
+            #session so there is no limit on the number of snapshots.
+            worker = os.path.join(os.path.dirname(lckFile),
+                                  'smartremove_%s_%s.sh' %(os.getpid(), int(time.time())))
+            log = 'logger -t "backintime smart-remove [$BASHPID]"'
 
-            additionalChars = len(self.config.ssh_prefix_cmd(cmd_type = str))
-
-            head = 'screen -d -m bash -c "('
+            body = '(\n'
             if logger.DEBUG:
-                head += 'logger -t \\\"backintime smart-remove [$BASHPID]\\\" \\\"start\\\"; '
-            head += 'flock -x 9; '
+                body += '%s "start"\n' %log
+            body += 'flock -x 9\n'
             if logger.DEBUG:
-                head += 'logger -t \\\"backintime smart-remove [$BASHPID]\\\" \\\"got exclusive flock\\\"; '
-
-            tail = ') 9>\\\"%s\\\""' %lckFile
+                body += '%s "got exclusive flock"\n' %log
 
-            cmds = []
             for sid in del_snapshots:
-                find, rm = self.remove_snapshot(sid, execute = False, quote = '\\\"')
-                s = 'test -e \\\"%s\\\" && (' %sid.path(use_mode = ['ssh', 'ssh_encfs'])
+                find, rm = self.remove_snapshot(sid, execute = False)
+                body += 'test -e "%s" && (\n' %sid.path(use_mode = ['ssh', 'ssh_encfs'])
                 if logger.DEBUG:
-                    s += 'logger -t \\\"backintime smart-remove [$BASHPID]\\\" '
-                    s += '\\\"snapshot %s still exist\\\"; ' %sid
-                    s += 'sleep 1; ' #add one second delay because otherwise you might not see serialized process with small snapshots
-                s += '%s; ' %find
+                    body += '%s "snapshot %s still exist"\n' %(log, sid)
+                    body += 'sleep 1\n' #add one second delay because otherwise you might not see serialized process with small snapshots
+                body += '%s\n' %find
                 if logger.DEBUG:
-                    s += 'logger -t \\\"backintime smart-remove [$BASHPID]\\\" '
-                    s += '\\\"snapshot %s change permission done\\\"; ' %sid
-                s += '%s; ' %rm
+                    body += '%s "snapshot %s change permission done"\n' %(log, sid)
+                body += '%s\n' %rm
                 if logger.DEBUG:
-                    s += 'logger -t \\\"backintime smart-remove [$BASHPID]\\\" '
-                    s += '\\\"snapshot %s remove done\\\"' %sid
-                s += '); '
-                cmds.append(s)
-
-            for cmd in tools.splitCommands(cmds,
-                                           head = head,
-                                           tail = tail,
-                                           maxLength = maxLength - additionalChars):
-                self._execute(self.cmd_ssh(cmd, quote = True))
+                    body += '%s "snapshot %s remove done"\n' %(log, sid)
+                body += ')\n'
+            body += ') 9>"%s"\n' %lckFile
+            body += 'rm -f "$0"\n'
+
+            script  = 'cat > "%s" <<\'BIT_SMART_REMOVE\'\n' %worker
+            script += body
+            script += 'BIT_SMART_REMOVE\n'
+            script += 'screen -d -m bash "%s"\n' %worker
+            self._execute_script(script)
         else:
             logger.info("[smart remove] remove snapshots: %s"
                         %del_snapshots, self)
@@ -1378,8 +1465,9 @@ class Snapshots:
             snapshots_path_ssh = './'
         cmd = self.cmd_ssh(['df', snapshots_path_ssh])
 
-        df = subprocess.Popen(cmd, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
-        output = df.communicate()[0]
+        with runprofile.command(self.run_profile, cmd):
+            df = subprocess.Popen(cmd, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+            output = df.communicate()[0]
         #Filesystem     1K-blocks      Used Available Use% Mounted on
         #/tmp           127266564 115596412   5182296  96% /
         #                                     ^^^^^^^
@@ -1393,25 +1481,26 @@ class Snapshots:
         logger.debug("Call command \"%s\"" %cmd, self, 1)
         ret_val = 0
 
-        if callback is None:
-            ret_val = os.system( cmd )
-        else:
-            pipe = os.popen( cmd, 'r' )
+        with runprofile.command(self.run_profile, cmd):
+            if callback is None:
+                ret_val = os.system( cmd )
+            else:
+                pipe = os.popen( cmd, 'r' )
 
-            while True:
-                line = tools.temp_failure_retry( pipe.readline )
-                if not line:
-                    break
-                line = line.strip()
-                for f in filters:
-                    line = f(line)
-                if not line:
-                    continue
-                callback(line , user_data )
+                while True:
+                    line = tools.temp_failure_retry( pipe.readline )
+                    if not line:
+                        break
+                    line = line.strip()
+                    for f in filters:
+                        line = f(line)
+                    if not line:
+                        continue
+                    callback(line , user_data )
 
-            ret_val = pipe.close()
-            if ret_val is None:
-                ret_val = 0
+                ret_val = pipe.close()
+                if ret_val is None:
+                    ret_val = 0
 
         if ret_val != 0:
             logger.warning("Command \"%s\" returns %s%s%s"
@@ -1424,13 +1513,72 @@ class Snapshots:
 
         return ret_val
 
+    def _execute_script(self, script, use_modes = ['ssh', 'ssh_encfs']):
+        """
+        Run a shell `script`. On remote profiles the script is streamed
+        through stdin of one single ssh session instead of passing it as
+        command line argument. So there is no limit on the length of the
+        script, no extra layer of quoting and only one round trip.
+
+        Args:
+            script (str):       shell script
+            use_modes (list):   list of modes in which the script should
+                                run on the remote host
+
+        Returns:
+            int:                returncode of the shell
+        """
+        cmd = self.cmd_ssh(['sh', '-s'], use_modes = use_modes)
+        logger.debug("Call script with \"%s\":\n%s" %(' '.join(cmd), script), self, 1)
+        with runprofile.command(self.run_profile, cmd):
+            proc = subprocess.Popen(cmd,
+                                    stdin = subprocess.PIPE,
+                                    universal_newlines = True)
+            proc.communicate(script)
+        ret_val = proc.returncode
+
+        if ret_val != 0:
+            logger.warning("Script \"%s\" returns %s%s%s"
+                           %(' '.join(cmd), bcolors.WARNING, ret_val, bcolors.ENDC),
+                           self, 1)
+        else:
+            logger.debug("Script \"%s\" returns %s"
+                         %(' '.join(cmd), ret_val),
+                         self, 1)
+
+        return ret_val
+
     def filter_for(self, base_sid, base_path, snapshots_list, list_diff_only  = False, flag_deep_check = False, list_equal_to = False):
         "return a list of available snapshots (including 'now'), eventually filtered for uniqueness"
-        snapshots_filtered = []
+        return list(self.iter_filter_for(base_sid, base_path, snapshots_list,
+                                         list_diff_only, flag_deep_check,
+                                         list_equal_to))
 
+    def iter_filter_for(self, base_sid, base_path, snapshots_list, list_diff_only  = False, flag_deep_check = False, list_equal_to = False, cancel = None):
+        """
+        Same as :py:meth:`filter_for` but yield snapshots as soon as they
+        are found. With deep check hashes are calculated in small chunks
+        so the first results don't have to wait for all files being
+        hashed. Stop iterating (or call ``close()`` on the generator) or
+        set `cancel` to cancel. `cancel` is also checked between hash
+        chunks so a canceled deep check stops before the next result.
+
+        Args:
+            base_sid (SID):         snapshot of the selected item
+            base_path (str):        path of the selected item
+            snapshots_list (list):  snapshots to check
+            list_diff_only (bool):  skip snapshots with identical items
+            flag_deep_check (bool): compare content of files
+            list_equal_to (str):    only snapshots with items equal to
+                                    this full path
+            cancel (threading.Event):   stop as soon as this is set
+
+        Yields:
+            SID:                    matching snapshots (including 'now')
+        """
         base_full_path = base_sid.pathBackup(base_path)
         if not os.path.lexists( base_full_path ):
-            return []
+            return
 
         all_snapshots_list = [RootSnapshot(self.config)]
         all_snapshots_list.extend( snapshots_list )
@@ -1448,9 +1596,8 @@ class Snapshots:
                         if target in targets:
                             continue
                         targets.append( target )
-                    snapshots_filtered.append(sid)
-
-            return snapshots_filtered
+                    yield sid
+            return
 
         #directories
         if os.path.isdir( base_full_path ):
@@ -1458,9 +1605,8 @@ class Snapshots:
                 path = sid.pathBackup(base_path)
 
                 if os.path.exists( path ) and not os.path.islink( path ) and os.path.isdir( path ):
-                    snapshots_filtered.append(sid)
-
-            return snapshots_filtered
+                    yield sid
+            return
 
         #files
         if not list_diff_only and not list_equal_to:
@@ -1468,24 +1614,163 @@ class Snapshots:
                 path = sid.pathBackup(base_path)
 
                 if os.path.exists( path ) and not os.path.islink( path ) and os.path.isfile( path ):
-                    snapshots_filtered.append(sid)
+                    yield sid
+            return
 
-            return snapshots_filtered
+        if list_diff_only and not flag_deep_check and not list_equal_to:
+            versions = self._filter_for_version_index(base_path, snapshots_list)
+            if versions is not None:
+                yield from versions
+                return
 
         # check for duplicates
-        uniqueness = tools.UniquenessSet(flag_deep_check, follow_symlink = False, list_equal_to = list_equal_to)
-        for sid in all_snapshots_list:
-            path = sid.pathBackup(base_path)
-            if os.path.exists( path ) and not os.path.islink( path ) and os.path.isfile( path ) and uniqueness.check_for(path):
-                snapshots_filtered.append(sid)
+        hashCache = None
+        if flag_deep_check:
+            hashCache = hashcache.HashCache(self.config.get_hash_cache_file())
+        try:
+            uniqueness = tools.UniquenessSet(flag_deep_check, follow_symlink = False,
+                                             list_equal_to = list_equal_to,
+                                             hashCache = hashCache)
+            candidates = []
+            for sid in all_snapshots_list:
+                path = sid.pathBackup(base_path)
+                if os.path.exists( path ) and not os.path.islink( path ) and os.path.isfile( path ):
+                    candidates.append((sid, path))
+            if hashCache is None:
+                for sid, path in candidates:
+                    if uniqueness.check_for(path):
+                        yield sid
+                return
+
+            #hash only as many files as there are workers before checking them
+            needed = set(uniqueness.neededHashes([path for sid, path in candidates]))
+            chunkSize = max(1, hashCache.threads)
+            for i in range(0, len(candidates), chunkSize):
+                if cancel is not None and cancel.is_set():
+                    logger.debug('Filter for %s canceled' % base_path, self)
+                    return
+                chunk = candidates[i:i + chunkSize]
+                hashCache.hashMany([path for sid, path in chunk if path in needed])
+                for sid, path in chunk:
+                    if uniqueness.check_for(path):
+                        yield sid
+        finally:
+            if hashCache is not None:
+                hashCache.close()
+
+    def _filter_for_version_index(self, base_path, snapshots_list):
+        """
+        Same as :py:meth:`filter_for` with `list_diff_only` but take all
+        versions of `base_path` from :py:class:`versionindex.VersionIndex`
+        instead of checking the file in every snapshot. Like
+        :py:class:`tools.UniquenessSet` versions are compared by size and
+        modification time.
+
+        Args:
+            base_path (str):        path of a regular file
+            snapshots_list (list):  snapshots to check
+
+        Returns:
+            list:                   snapshots with different versions of
+                                    `base_path` (including 'now') or
+                                    ``None`` if the index is not usable
+        """
+        if not self.config.version_index():
+            return None
+        index = versionindex.VersionIndex(self.config)
+        try:
+            versions = index.versions(base_path, snapshots_list)
+        except Exception as e:
+            logger.debug('Failed to query version index: %s' % str(e), self)
+            return None
+        finally:
+            index.close()
+        if versions is None:
+            return None
 
+        snapshots_filtered = []
+        keys = set()
+        root = RootSnapshot(self.config)
+        path = root.pathBackup(base_path)
+        if os.path.exists( path ) and not os.path.islink( path ) and os.path.isfile( path ):
+            st = os.stat(path)
+            keys.add((st.st_size, int(st.st_mtime)))
+            snapshots_filtered.append(root)
+        for sid, key in versions:
+            if not key in keys:
+                keys.add(key)
+                snapshots_filtered.append(sid)
         return snapshots_filtered
 
+    def update_version_index(self):
+        """
+        Add all missing snapshots to :py:class:`versionindex.VersionIndex`.
+        On an existing repository this scans every snapshot, so it must not
+        run during take_snapshot.
+        """
+        if not self.config.version_index():
+            return
+        logger.info('Update version index', self)
+        index = versionindex.VersionIndex(self.config)
+        try:
+            index.update(self, listSnapshots(self.config))
+        except Exception as e:
+            logger.error('Failed to update version index: %s' % str(e), self)
+        finally:
+            index.close()
+
+    def append_version_index(self, sid):
+        """
+        Add the new snapshot `sid` to :py:class:`versionindex.VersionIndex`
+        if the index is complete otherwise. Building the index for older
+        snapshots is left to the next search.
+        """
+        if not self.config.version_index():
+            return
+        logger.info('Update version index', self)
+        self.set_take_snapshot_message(0, _('Update version index'))
+        index = versionindex.VersionIndex(self.config)
+        try:
+            index.append(self, sid, listSnapshots(self.config),
+                         timeout = versionindex.APPEND_TIMEOUT)
+        except Exception as e:
+            logger.error('Failed to update version index: %s' % str(e), self)
+        finally:
+            index.close()
+
+    def search(self, pattern, ignoreCase = False, cancel = None):
+        """
+        Search for files in all snapshots with
+        :py:meth:`versionindex.VersionIndex.search`. Snapshots which are
+        not in the index yet will be added first.
+
+        Args:
+            pattern (str):              shell-style wildcard
+            ignoreCase (bool):          match case-insensitive
+            cancel (threading.Event):   stop as soon as this is set
+
+        Returns:
+            list:                       ``(path, ranges)`` with
+                                        ``(first, last)`` snapshots in
+                                        `ranges`
+
+        Raises:
+            versionindex.Canceled:      if `cancel` was set
+        """
+        snapshots_list = listSnapshots(self.config)
+        index = versionindex.VersionIndex(self.config)
+        try:
+            index.update(self, snapshots_list, cancel)
+            return index.search(pattern, snapshots_list, ignoreCase, cancel)
+        finally:
+            index.close()
+
     def cmd_ssh(self, cmd, quote = False, use_modes = ['ssh', 'ssh_encfs'] ):
-        mode = self.config.get_snapshots_mode()
+        settings = self.config.profile_settings()
+        mode = settings.mode
         if mode in ['ssh', 'ssh_encfs'] and mode in use_modes:
-            (ssh_host, ssh_port, ssh_user, ssh_path, ssh_cipher) = self.config.get_ssh_host_port_user_path_cipher()
-            ssh_private_key = self.config.get_ssh_private_key_file()
+            ssh_host, ssh_port, ssh_user, ssh_cipher = settings.ssh_host, settings.ssh_port, settings.ssh_user, settings.ssh_cipher
+            ssh_private_key = settings.ssh_private_key_file
 
             if isinstance(cmd, str):
                 if ssh_cipher == 'default':
@@ -1494,10 +1779,10 @@ class Snapshots:
                     ssh_cipher_suffix = '-c %s' % ssh_cipher
                 ssh_private_key = "-o IdentityFile=%s" % ssh_private_key
 
-                if self.config.is_run_ionice_on_remote_enabled():
+                if settings.ssh_ionice:
                     cmd = 'ionice -c2 -n7 ' + cmd
 
-                if self.config.is_run_nice_on_remote_enabled():
+                if settings.ssh_nice:
                     cmd = 'nice -n 19 ' + cmd
 
                 cmd = self.config.ssh_prefix_cmd(cmd_type = str) + cmd
@@ -1520,10 +1805,10 @@ class Snapshots:
                 suffix += ['-o', 'IdentityFile=%s' % ssh_private_key]
                 suffix += ['%s@%s' % (ssh_user, ssh_host)]
 
-                if self.config.is_run_ionice_on_remote_enabled():
+                if settings.ssh_ionice:
                     cmd = ['ionice', '-c2', '-n7'] + cmd
 
-                if self.config.is_run_nice_on_remote_enabled():
+                if settings.ssh_nice:
                     cmd = ['nice', '-n 19'] + cmd
 
                 cmd = self.config.ssh_prefix_cmd(cmd_type = list) + cmd
@@ -1552,11 +1837,9 @@ class Snapshots:
                                 current mode is in `use_modes` a combination
                                 of user, host and `path` like ''user@host:"/foo"''
         """
-        mode = self.config.get_snapshots_mode()
-        if mode in ['ssh', 'ssh_encfs'] and mode in use_modes:
-            user = self.config.get_ssh_user()
-            host = self.config.get_ssh_host()
-            return '\'%s@%s:"%s"\'' % (user, host, path)
+        settings = self.config.profile_settings()
+        if settings.mode in ['ssh', 'ssh_encfs'] and settings.mode in use_modes:
+            return '\'%s@%s:"%s"\'' % (settings.ssh_user, settings.ssh_host, path)
         else:
             return '"%s"' % path
 
@@ -1696,8 +1979,7 @@ class Snapshots:
         if excludeFolders is None:
             excludeFolders = self.config.get_exclude()
 
-        for exclude in excludeFolders:
-            exclude = encode.exclude(exclude)
+        for exclude in encode.exclude_many(excludeFolders):
             if exclude is None:
                 continue
             items.add('--exclude="{}"'.format(exclude))
@@ -1784,6 +2066,7 @@ class SID(object):
     FAILED   = 'failed'
     FILEINFO = 'fileinfo.bz2'
     LOG      = 'takesnapshot.log.bz2'
+    RUN_PROFILE = 'profile-run.txt'
 
     def __init__(self, date, cfg):
         self.config = cfg
@@ -1947,7 +2230,7 @@ class SID(object):
             str:                full snapshot path
         """
         path = [i.strip(os.sep) for i in path]
-        current_mode = self.config.get_snapshots_mode(self.profileID)
+        current_mode = self.config.profile_settings(self.profileID).mode
         if 'ssh' in use_mode and current_mode == 'ssh':
             return os.path.join(self.config.get_snapshots_full_path_ssh(self.profileID),
                                 self.sid, *path)
@@ -2188,24 +2471,60 @@ class SID(object):
         Load log from "takesnapshot.log.bz2"
 
         Args:
-            mode (str):     NotImplemented
-            decode (bool):  NotImplemented
+            mode (int):                     filter mode. See
+                                            :py:func:`snapshotlog.filterLines`
+            decode (encfstools.Decode):     decode paths with this instance
 
         Returns:
-            str:            log
+            str:                            log
         """
         logfile = self.path(self.LOG)
         try:
-            with bz2.BZ2File(logfile, 'rb' ) as f:
-                return f.read().decode('utf-8')
+            if not mode and decode is None:
+                with bz2.BZ2File(logfile, 'rb' ) as f:
+                    return f.read().decode('utf-8')
+            return ''.join(self.iterLog(mode, decode))
         except Exception as e:
             msg = ('Failed to get snapshot log from {}:'.format(logfile), str(e))
             logger.debug(' '.join(msg), self)
             return '\n'.join(msg)
 
+    def iterLog(self, mode = None, decode = None, start = 0, count = None):
+        """
+        Stream log from "takesnapshot.log.bz2" line by line through
+        :py:func:`snapshotlog.pipeline`. Blocks without lines matching
+        `mode` are skipped if the log has a sidecar index.
+
+        Args:
+            mode (int):                     filter mode. See
+                                            :py:func:`snapshotlog.filterLines`
+            decode (encfstools.Decode):     decode paths with this instance
+            start (int):                    skip this number of lines
+                                            matching `mode`
+            count (int):                    return at most this number
+                                            of lines or ``None`` for all
+
+        Yields:
+            str:                            log lines including newline
+        """
+        logfile = self.path(self.LOG)
+        header = ''
+        if not decode is None:
+            header = snapshotlog.decodeHeader(self.config)
+        try:
+            lines = snapshotlog.readLevel(logfile, mode, start, count)
+        except Exception as e:
+            msg = ('Failed to get snapshot log from {}:'.format(logfile), str(e))
+            logger.debug(' '.join(msg), self)
+            yield '\n'.join(msg)
+            return
+        yield from snapshotlog.pipeline(lines, mode, decode, header)
+
     def setLog(self, log):
         """
-        Write log to "takesnapshot.log.bz2"
+        Write log to "takesnapshot.log.bz2". The log is compressed in
+        blocks with a sidecar index so single levels can be read without
+        decompressing the whole log.
 
         Args:
             log: full snapshot log
@@ -2214,8 +2533,7 @@ class SID(object):
             log = log.encode('utf-8', 'replace')
         logfile = self.path(self.LOG)
         try:
-            with bz2.BZ2File(logfile, 'wb') as f:
-                f.write(log)
+            snapshotlog.writeBlocks(logfile, log, bz2.compress)
         except Exception as e:
             logger.error('Failed to write log into compressed file {}: {}'.format(
                          logfile, str(e)),
@@ -2359,7 +2677,7 @@ class RootSnapshot(GenericNonSnapshot):
         Returns:
             str:                full snapshot path
         """
-        current_mode = self.config.get_snapshots_mode(self.profileID)
+        current_mode = self.config.profile_settings(self.profileID).mode
         if 'ssh_encfs' in use_mode and current_mode == 'ssh_encfs':
             if path:
                 path = self.config.ENCODE.remote(os.path.join(*path))
@@ -2367,6 +2685,193 @@ class RootSnapshot(GenericNonSnapshot):
         else:
             return os.path.join(os.sep, *path)
 
+ViewEntry = namedtuple('ViewEntry', ('name', 'mode', 'user', 'group', 'size', 'mtime', 'target'))
+ViewEntry.__doc__ = """
+One item in a folder listed by :py:class:`SnapshotView`.
+
+Attributes:
+    name (str):     file name
+    mode (int):     file type and permissions as in ``st_mode``
+    user (str):     owner
+    group (str):    group
+    size (int):     size in bytes
+    mtime (float):  modification time
+    target (str):   target of symlinks or ``None``
+"""
+
+#file types from 'find -printf %y'
+FIND_TYPES = {'d': stat.S_IFDIR, 'f': stat.S_IFREG, 'l': stat.S_IFLNK,
+              'b': stat.S_IFBLK, 'c': stat.S_IFCHR, 'p': stat.S_IFIFO,
+              's': stat.S_IFSOCK}
+
+class SnapshotView(object):
+    """
+    Read-only view into a snapshot for browsing without a FUSE mount.
+
+    Folder listings are cached per (snapshot, folder). Owner, group and
+    permissions are taken from fileinfo instead of the read-only files
+    in the snapshot. On ssh profiles listings are read with one remote
+    'find' which also lists all sub-folders, so opening one of them
+    doesn't need another round trip.
+
+    Args:
+        snapshots (Snapshots):  current snapshots instance
+        sid (SID):              snapshot to view
+    """
+    CACHE_SIZE = 512
+    _cache = OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, snapshots, sid):
+        self.snapshots = snapshots
+        self.config = snapshots.config
+        self.sid = sid
+        self.remote = not sid.isRoot and self.config.get_snapshots_mode(sid.profileID) == 'ssh'
+        self._fileInfo = None
+
+    @property
+    def fileInfo(self):
+        if self._fileInfo is None:
+            if self.sid.isRoot:
+                self._fileInfo = FileInfoDict()
+            else:
+                self._fileInfo = self.sid.fileInfo
+        return self._fileInfo
+
+    @classmethod
+    def clearCache(cls):
+        """
+        Drop all cached folder listings.
+        """
+        with cls._lock:
+            cls._cache.clear()
+
+    def listdir(self, path):
+        """
+        List folder `path`.
+
+        Args:
+            path (str):     absolute path inside the snapshot
+
+        Returns:
+            list:           :py:class:`ViewEntry` sorted by name
+
+        Raises:
+            OSError:        if `path` couldn't be listed
+        """
+        path = os.path.normpath(os.path.join(os.sep, path))
+        key = (self.sid.profileID, self.sid.sid, path)
+        if not self.sid.isRoot:
+            #the current filesystem ('Now') is never cached
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    return self._cache[key]
+
+        if self.remote:
+            listings = self._listRemote(path)
+        else:
+            listings = {path: self._listLocal(path)}
+
+        if not self.sid.isRoot:
+            with self._lock:
+                for folder, entries in listings.items():
+                    self._cache[(self.sid.profileID, self.sid.sid, folder)] = entries
+                    self._cache.move_to_end((self.sid.profileID, self.sid.sid, folder))
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last = False)
+        return listings[path]
+
+    def stat(self, path):
+        """
+        Get a single item from the listing of its parent folder.
+
+        Args:
+            path (str):     absolute path inside the snapshot
+
+        Returns:
+            ViewEntry:      item or ``None`` if it doesn't exist
+        """
+        path = os.path.normpath(os.path.join(os.sep, path))
+        folder, name = os.path.split(path)
+        if not name:
+            return None
+        try:
+            entries = self.listdir(folder)
+        except OSError:
+            return None
+        for entry in entries:
+            if entry.name == name:
+                return entry
+        return None
+
+    def _meta(self, path, mode, user, group):
+        """
+        Take permissions, owner and group from fileinfo if available.
+        """
+        info = self.fileInfo.get(os.fsencode(path))
+        if info is None:
+            return (mode, user, group)
+        return (stat.S_IFMT(mode) | stat.S_IMODE(info[0]),
+                info[1].decode(errors = 'replace'),
+                info[2].decode(errors = 'replace'))
+
+    def _listLocal(self, path):
+        entries = []
+        with os.scandir(self.sid.pathBackup(path)) as it:
+            for item in it:
+                try:
+                    st = item.stat(follow_symlinks = False)
+                    target = os.readlink(item.path) if stat.S_ISLNK(st.st_mode) else None
+                except OSError as e:
+                    logger.debug('Failed to stat %s: %s' %(item.path, str(e)), self)
+                    continue
+                mode, user, group = self._meta(os.path.join(path, item.name),
+                                               st.st_mode,
+                                               self.snapshots.get_user_name(st.st_uid),
+                                               self.snapshots.get_group_name(st.st_gid))
+                entries.append(ViewEntry(item.name, mode, user, group,
+                                         st.st_size, st.st_mtime, target))
+        entries.sort()
+        return entries
+
+    def _listRemote(self, path):
+        """
+        List `path` and all its sub-folders with one remote 'find'.
+
+        Returns:
+            dict:   ``{folder: [ViewEntry, ...]}``
+        """
+        root = self.sid.pathBackup(path, use_mode = ['ssh'])
+        script = 'cd %s && exec find . -mindepth 1 -maxdepth 2 -printf %s\n' \
+                 %(shlex.quote(root), shlex.quote('%y %s %T@ %m %u %g %P\\0%l\\0'))
+        cmd = self.snapshots.cmd_ssh(['sh', '-s'], use_modes = ['ssh'])
+        proc = subprocess.Popen(cmd,
+                                stdin = subprocess.PIPE,
+                                stdout = subprocess.PIPE,
+                                stderr = subprocess.PIPE)
+        out, err = proc.communicate(script.encode())
+        if proc.returncode and not out:
+            raise OSError('Failed to list %s: %s' %(root, err.decode(errors = 'replace').strip()))
+
+        listings = {path: []}
+        items = out.split(b'\0')
+        for header, target in zip(items[0::2], items[1::2]):
+            ftype, size, mtime, perms, user, group, relpath = header.decode(errors = 'surrogateescape').split(' ', 6)
+            folder, name = os.path.split(os.path.join(path, relpath))
+            mode = FIND_TYPES.get(ftype, 0) | int(perms, 8)
+            mode, user, group = self._meta(os.path.join(folder, name), mode, user, group)
+            target = target.decode(errors = 'surrogateescape') if ftype == 'l' else None
+            listings.setdefault(folder, []).append(ViewEntry(name, mode, user, group,
+                                                             int(size), float(mtime), target))
+            if ftype == 'd' and folder == path:
+                #sub-folders are listed completely
+                listings.setdefault(os.path.join(folder, name), [])
+        for entries in listings.values():
+            entries.sort()
+        return listings
+
 def iterSnapshots(cfg, includeNewSnapshot = False):
     """
     Iterate over snapshots in current snapshot path. Use this in a 'for' loop
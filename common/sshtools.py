@@ -262,7 +262,7 @@ class SSH(mount.MountControl):
         check if sshfs is installed and user is part of group fuse
         """
         logger.debug('Check fuse', self)
-        if not tools.check_command('sshfs'):
+        if not tools.TOOL_CAPS.available('sshfs'):
             logger.debug('sshfs is missing', self)
             raise MountException( _('sshfs not found. Please install e.g. \'apt-get install sshfs\'') )
         if self.CHECK_FUSE_GROUP:
@@ -415,7 +415,7 @@ class SSH(mount.MountControl):
             logger.debug('Failed pinging host %s' %self.host, self)
             raise MountException( _('Ping %s failed. Host is down or wrong address.') % self.host)
 
-    def check_remote_commands(self, retry = False):
+    def check_remote_commands(self):
         """
         try all relevant commands for take_snapshot on remote host.
         specialy embedded Linux devices using 'BusyBox' sometimes doesn't
@@ -423,18 +423,6 @@ class SSH(mount.MountControl):
         also check for hardlink-support on remote host.
         """
         logger.debug('Check remote commands', self)
-        def maxArg():
-            if retry:
-                raise MountException("Checking commands on remote host didn't return any output. "
-                                     "We already checked the maximum argument lenght but it seem like "
-                                     "there is an other problem")
-            logger.warning('Looks like the command was to long for remote SSHd. We will test max arg length now and retry.',
-                           self)
-            import sshMaxArg
-            mid = sshMaxArg.test_ssh_max_arg(self.user_host)
-            sshMaxArg.reportResult(self.host, mid)
-            self.config.set_ssh_max_arg_length(mid, self.profile_id)
-            return self.check_remote_commands(retry = True)
 
         #check rsync
         tmp_file = tempfile.mkstemp()[1]
@@ -454,107 +442,74 @@ class SSH(mount.MountControl):
 
         #check cp chmod find and rm
         remote_tmp_dir = os.path.join(self.path, 'tmp_%s' % self.random_id())
-        head  = 'tmp=%s ; ' % remote_tmp_dir
+        script  = 'tmp="%s"\n' % remote_tmp_dir
         #first define a function to clean up and exit
-        head += 'cleanup(){ '
-        head += 'test -e $tmp/a && rm $tmp/a >/dev/null 2>&1; '
-        head += 'test -e $tmp/b && rm $tmp/b >/dev/null 2>&1; '
-        head += 'test -e smr.lock && rm smr.lock >/dev/null 2>&1; '
-        head += 'test -e $tmp && rmdir $tmp >/dev/null 2>&1; '
-        head += 'exit $1; }; '
-        tail = []
+        script += 'cleanup(){\n'
+        script += '    test -e "$tmp/a" && rm "$tmp/a" >/dev/null 2>&1\n'
+        script += '    test -e "$tmp/b" && rm "$tmp/b" >/dev/null 2>&1\n'
+        script += '    test -e smr.lock && rm smr.lock >/dev/null 2>&1\n'
+        script += '    test -e "$tmp" && rmdir "$tmp" >/dev/null 2>&1\n'
+        script += '    exit $1\n'
+        script += '}\n'
         #create tmp_RANDOM dir and file a
-        cmd  = 'test -e $tmp || mkdir $tmp; touch $tmp/a; '
-        tail.append(cmd)
-
+        script += 'test -e "$tmp" || mkdir "$tmp"; touch "$tmp/a"\n'
         #try to create hardlink b from a
-        cmd  = 'echo \"cp -aRl SOURCE DEST\"; cp -aRl $tmp/a $tmp/b >/dev/null; err_cp=$?; '
-        cmd += 'test $err_cp -ne 0 && cleanup $err_cp; '
-        tail.append(cmd)
+        script += 'echo "cp -aRl SOURCE DEST"; cp -aRl "$tmp/a" "$tmp/b" >/dev/null; err_cp=$?\n'
+        script += 'test $err_cp -ne 0 && cleanup $err_cp\n'
         #list inodes of a and b
-        cmd  = 'ls -i $tmp/a; ls -i $tmp/b; '
-        tail.append(cmd)
+        script += 'ls -i "$tmp/a"; ls -i "$tmp/b"\n'
         #try to chmod
-        cmd  = 'echo \"chmod u+rw FILE\"; chmod u+rw $tmp/a >/dev/null; err_chmod=$?; '
-        cmd += 'test $err_chmod -ne 0 && cleanup $err_chmod; '
-        tail.append(cmd)
+        script += 'echo "chmod u+rw FILE"; chmod u+rw "$tmp/a" >/dev/null; err_chmod=$?\n'
+        script += 'test $err_chmod -ne 0 && cleanup $err_chmod\n'
         #try to find and chmod
-        cmd  = 'echo \"find PATH -type f -exec chmod u-wx \"{}\" \\;\"; '
-        cmd += 'find $tmp -type f -exec chmod u-wx \"{}\" \\; >/dev/null; err_find=$?; '
-        cmd += 'test $err_find -ne 0 && cleanup $err_find; '
-        tail.append(cmd)
+        script += 'echo "find PATH -type f -exec chmod u-wx \\"{}\\" \\;"\n'
+        script += 'find "$tmp" -type f -exec chmod u-wx "{}" \\; >/dev/null; err_find=$?\n'
+        script += 'test $err_find -ne 0 && cleanup $err_find\n'
         #try find suffix '+'
-        cmd  = 'find $tmp -type f -exec chmod u-wx \"{}\" + >/dev/null; err_gnu_find=$?; '
-        cmd += 'test $err_gnu_find -ne 0 && echo \"gnu_find not supported\"; '
-        tail.append(cmd)
+        script += 'find "$tmp" -type f -exec chmod u-wx "{}" + >/dev/null; err_gnu_find=$?\n'
+        script += 'test $err_gnu_find -ne 0 && echo "gnu_find not supported"\n'
         #try to rm -rf
-        cmd  = 'echo \"rm -rf PATH\"; rm -rf $tmp >/dev/null; err_rm=$?; '
-        cmd += 'test $err_rm -ne 0 && cleanup $err_rm; '
-        tail.append(cmd)
+        script += 'echo "rm -rf PATH"; rm -rf "$tmp" >/dev/null; err_rm=$?\n'
+        script += 'test $err_rm -ne 0 && cleanup $err_rm\n'
         #try nice -n 19
         if self.nice:
-            cmd  = 'echo \"nice -n 19\"; nice -n 19 true >/dev/null; err_nice=$?; '
-            cmd += 'test $err_nice -ne 0 && cleanup $err_nice; '
-            tail.append(cmd)
+            script += 'echo "nice -n 19"; nice -n 19 true >/dev/null; err_nice=$?\n'
+            script += 'test $err_nice -ne 0 && cleanup $err_nice\n'
         #try ionice -c2 -n7
         if self.ionice:
-            cmd  = 'echo \"ionice -c2 -n7\"; ionice -c2 -n7 true >/dev/null; err_nice=$?; '
-            cmd += 'test $err_nice -ne 0 && cleanup $err_nice; '
-            tail.append(cmd)
+            script += 'echo "ionice -c2 -n7"; ionice -c2 -n7 true >/dev/null; err_nice=$?\n'
+            script += 'test $err_nice -ne 0 && cleanup $err_nice\n'
         #try nocache
         if self.nocache:
-            cmd  = 'echo \"nocache\"; nocache true >/dev/null; err_nocache=$?; '
-            cmd += 'test $err_nocache -ne 0 && cleanup $err_nocache; '
-            tail.append(cmd)
+            script += 'echo "nocache"; nocache true >/dev/null; err_nocache=$?\n'
+            script += 'test $err_nocache -ne 0 && cleanup $err_nocache\n'
         #try screen, bash and flock used by smart-remove running in background
         if self.config.get_smart_remove_run_remote_in_background(self.profile_id):
-            cmd  = 'echo \"screen -d -m bash -c ...\"; screen -d -m bash -c \"true\" >/dev/null; err_screen=$?; '
-            cmd += 'test $err_screen -ne 0 && cleanup $err_screen; '
-            cmd += 'echo \"(flock -x 9) 9>smr.lock\"; bash -c \"(flock -x 9) 9>smr.lock\" >/dev/null; err_flock=$?; '
-            cmd += 'test $err_flock -ne 0 && cleanup $err_flock; '
-            tail.append(cmd)
+            script += 'echo "screen -d -m bash ..."; screen -d -m bash -c "true" >/dev/null; err_screen=$?\n'
+            script += 'test $err_screen -ne 0 && cleanup $err_screen\n'
+            script += 'echo "(flock -x 9) 9>smr.lock"; bash -c "(flock -x 9) 9>smr.lock" >/dev/null; err_flock=$?\n'
+            script += 'test $err_flock -ne 0 && cleanup $err_flock\n'
         #if we end up here, everything should be fine
-        cmd = 'echo \"done\"'
-        tail.append(cmd)
-
-        maxLength = self.config.ssh_max_arg_length(self.profile_id)
-        additionalChars = len('echo ""') + len(self.config.ssh_prefix_cmd(self.profile_id, cmd_type = str))
+        script += 'echo "done"\n'
 
+        #stream the script through stdin of one ssh session. This way
+        #there is no limit on the scripts length and no extra layer of quoting.
         ssh = ['ssh']
         ssh.extend(self.ssh_options + [self.user_host])
         ssh.extend(self.config.ssh_prefix_cmd(self.profile_id, cmd_type = list))
-        output = ''
-        err = ''
-        returncode = 0
-        for cmd in tools.splitCommands(tail,
-                                       head = head,
-                                       maxLength = maxLength - additionalChars):
-            if cmd.endswith('; '):
-                cmd += 'echo ""'
-            c = ssh[:]
-            c.extend([cmd])
-            try:
-                logger.debug('Call command: %s' %' '.join(c), self)
-                proc = subprocess.Popen(c,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE,
-                                        universal_newlines = True)
-                ret = proc.communicate()
-            except OSError as e:
-                #Argument list too long
-                if e.errno == 7:
-                    logger.debug('Argument list too log (Python exception)', self)
-                    return maxArg()
-                else:
-                    raise
-            logger.debug('Command stdout: %s' %ret[0], self)
-            logger.debug('Command stderr: %s' %ret[1], self)
-            logger.debug('Command returncode: %s' %proc.returncode, self)
-            output += ret[0].strip('\n') + '\n'
-            err    += ret[1].strip('\n') + '\n'
-            returncode += proc.returncode
-            if proc.returncode:
-                break
+        ssh.extend(['sh', '-s'])
+        logger.debug('Call command: %s' %' '.join(ssh), self)
+        logger.debug('Command script:\n%s' %script, self)
+        proc = subprocess.Popen(ssh,
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines = True)
+        output, err = proc.communicate(script)
+        returncode = proc.returncode
+        logger.debug('Command stdout: %s' %output, self)
+        logger.debug('Command stderr: %s' %err, self)
+        logger.debug('Command returncode: %s' %returncode, self)
 
         output_split = output.strip('\n').split('\n')
 
@@ -565,7 +520,9 @@ class SSH(mount.MountControl):
                 break
 
         if not output_split:
-            return maxArg()
+            raise MountException( _('Checking commands on remote host %(host)s didn\'t return any output:\n'
+                                    '%(err)s\nLook at \'man backintime\' for further instructions')
+                                    % {'host' : self.host, 'err' : err})
 
         gnu_find_suffix_support = True
         for line in output_split:
@@ -0,0 +1,160 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Trace startup time of a command ('backintime --startup-trace ...'). Every
+import done after :py:func:`start` is timed and printed together with
+some marks of the startup phases on stderr when the process exits.
+
+This module must not import anything from Back In Time because it is
+started before everything else.
+"""
+
+import os
+import sys
+import time
+import atexit
+
+TRACER = None
+
+class ImportTracer(object):
+    """
+    Meta path finder which times how long each module takes to import.
+    Modules are still found and loaded by the regular finders, only their
+    loaders get wrapped while the module is executed.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stack = []
+        self.imports = []
+        self.marks = []
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target = None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if hasattr(spec.loader, 'exec_module'):
+                spec.loader = _TimedLoader(self, spec.loader)
+            return spec
+        return None
+
+    def enter(self, name):
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def leave(self):
+        name, start, children = self.stack.pop()
+        duration = time.perf_counter() - start
+        if self.stack:
+            self.stack[-1][2] += duration
+        self.imports.append((name, duration, duration - children, len(self.stack)))
+
+    def mark(self, label):
+        """
+        Remember time since start for phase `label`.
+        """
+        self.marks.append((label, time.perf_counter() - self.start))
+
+    def report(self, top = 25):
+        """
+        Summary of all phases and the slowest imports.
+
+        Returns:
+            list:   lines
+        """
+        total = sum(i[1] for i in self.imports if i[3] == 0)
+        lines = ['Startup trace (pid %s):' % os.getpid()]
+        for label, t in self.marks:
+            lines.append('  %8.1f ms  %s' %(t * 1000, label))
+        lines.append('Imported %d modules in %.1f ms. Slowest (cumulative, self):'
+                     %(len(self.imports), total * 1000))
+        for name, duration, own, depth in sorted(self.imports, key = lambda x: x[1], reverse = True)[:top]:
+            lines.append('  %8.1f ms %8.1f ms  %s' %(duration * 1000, own * 1000, name))
+        return lines
+
+    def printReport(self, out = None):
+        if out is None:
+            out = sys.stderr
+        self.mark('exit')
+        try:
+            print('\n'.join(self.report()), file = out)
+        except (OSError, ValueError):
+            pass
+
+class _TimedLoader(object):
+    def __init__(self, tracer, loader):
+        self.tracer = tracer
+        self.loader = loader
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        #put the real loader back so nobody else sees the wrapper
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        self.tracer.enter(module.__name__)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.tracer.leave()
+
+def start():
+    """
+    Start tracing imports and print the report on exit.
+    """
+    global TRACER
+    if TRACER is not None:
+        return
+    TRACER = ImportTracer()
+    TRACER.install()
+    atexit.register(TRACER.printReport)
+
+def mark(label):
+    """
+    Mark the end of startup phase `label`. Does nothing if tracing is not
+    enabled.
+    """
+    if TRACER is not None:
+        TRACER.mark(label)
+
+def enabled(argv = None):
+    """
+    Check if '--startup-trace' is in `argv`. This has to be done before
+    the arguments are parsed to catch all imports.
+
+    Args:
+        argv (list):    commandline arguments. Default is sys.argv
+
+    Returns:
+        bool:           ``True`` if tracing was requested
+    """
+    if argv is None:
+        argv = sys.argv
+    return '--startup-trace' in argv
@@ -0,0 +1,257 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Publish/subscribe status bus for a running take_snapshot process.
+
+The backup process listens on a Unix socket per profile and pushes every
+event as one line of JSON to all subscribers (GUI, systray,
+``backintime watch``). New subscribers first get the latest event of each
+type so they don't have to wait for the next update. Sockets are
+non-blocking and subscribers which don't read their events fast enough
+are dropped, so a stalled subscriber can never stall the backup.
+
+If no backup is running there is no socket and :py:meth:`StatusClient.connect`
+returns ``False``. Clients should fall back to the message and progress
+files in that case.
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+from collections import OrderedDict
+
+import logger
+
+MESSAGE  = 'message'
+PROGRESS = 'progress'
+PHASE    = 'phase'
+FINISH   = 'finish'
+
+#values for PHASE events
+PHASE_PREPARE    = 'prepare'
+PHASE_TRANSFER   = 'transfer'
+PHASE_SAVE_INFO  = 'save-info'
+PHASE_REMOVE_OLD = 'remove-old'
+PHASE_FINALIZE   = 'finalize'
+
+class StatusBus(object):
+    """
+    Server side of the status bus owned by the take_snapshot process.
+
+    Args:
+        cfg (config.Config):    current config
+    """
+    def __init__(self, cfg):
+        self.config = cfg
+        self.filename = cfg.get_take_snapshot_socket_file()
+        self.sock = None
+        self.clients = []
+        self.state = OrderedDict()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopEvent = threading.Event()
+
+    def start(self):
+        """
+        Listen for subscribers.
+
+        Returns:
+            bool:   ``True`` if the bus is listening
+        """
+        if os.path.exists(self.filename):
+            client = StatusClient(self.config)
+            if client.connect(self.filename):
+                client.close()
+                logger.warning('Status bus %s is already in use' % self.filename, self)
+                return False
+            #left over from a crashed process
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.filename)
+            os.chmod(self.filename, 0o600)
+            sock.listen(8)
+        except OSError as e:
+            logger.debug('Failed to start status bus %s: %s' %(self.filename, str(e)), self)
+            sock.close()
+            return False
+        sock.settimeout(0.5)
+        self.sock = sock
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target = self._accept,
+                                       name = 'StatusBus',
+                                       daemon = True)
+        self.thread.start()
+        return True
+
+    def _accept(self):
+        while not self.stopEvent.is_set():
+            try:
+                conn, addr = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            conn.setblocking(False)
+            with self.lock:
+                if all(self._send(conn, self._encode(event)) for event in self.state.values()):
+                    self.clients.append(conn)
+                else:
+                    conn.close()
+
+    @staticmethod
+    def _encode(event):
+        return (json.dumps(event) + '\n').encode()
+
+    @staticmethod
+    def _send(conn, line):
+        """
+        Send `line` without blocking.
+
+        Returns:
+            bool:   ``False`` if the subscriber is gone or its send buffer
+                    is full. A partly sent line would break the stream
+                    so the subscriber has to be dropped in both cases.
+        """
+        try:
+            return conn.send(line) == len(line)
+        except OSError:
+            return False
+
+    def publish(self, event, **data):
+        """
+        Send an event to all subscribers.
+
+        Args:
+            event (str):    :py:data:`MESSAGE`, :py:data:`PROGRESS`,
+                            :py:data:`PHASE` or :py:data:`FINISH`
+            **data:         values of the event
+        """
+        item = OrderedDict((('event', event), ('time', time.time())))
+        item.update(data)
+        line = self._encode(item)
+        with self.lock:
+            self.state[event] = item
+            for conn in self.clients[:]:
+                if not self._send(conn, line):
+                    logger.debug('Drop status bus subscriber which is gone or too slow', self)
+                    conn.close()
+                    self.clients.remove(conn)
+
+    @property
+    def subscribers(self):
+        with self.lock:
+            return len(self.clients)
+
+    def stop(self):
+        """
+        Close all connections and remove the socket.
+        """
+        if self.sock is None:
+            return
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.sock.close()
+        self.sock = None
+        with self.lock:
+            for conn in self.clients:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                conn.close()
+            self.clients = []
+            self.state.clear()
+        try:
+            os.remove(self.filename)
+        except OSError as e:
+            logger.debug('Failed to remove status bus %s: %s' %(self.filename, str(e)), self)
+
+class StatusClient(object):
+    """
+    Subscriber of :py:class:`StatusBus`.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Default is the current profile
+    """
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        self.profile_id = profile_id
+        self.sock = None
+
+    def connect(self, filename = None):
+        """
+        Connect to the status bus of a running backup.
+
+        Args:
+            filename (str): socket. Default is the socket of the profile
+
+        Returns:
+            bool:           ``False`` if no backup is running
+        """
+        if filename is None:
+            filename = self.config.get_take_snapshot_socket_file(self.profile_id)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(filename)
+        except OSError:
+            sock.close()
+            return False
+        self.sock = sock
+        return True
+
+    def events(self):
+        """
+        Wait for events until the backup process closes the bus or
+        :py:meth:`close` is called.
+
+        Yields:
+            dict:   event with keys 'event', 'time' and the event's values
+        """
+        if self.sock is None:
+            return
+        try:
+            with self.sock.makefile('r') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        logger.debug('Invalid status event %s: %s' %(line, str(e)), self)
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Disconnect. This will also stop :py:meth:`events` waiting in an
+        other thread.
+        """
+        if self.sock is None:
+            return
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.sock = None
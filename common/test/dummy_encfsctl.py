@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#this is a test dummy to simulate 'encfsctl encode|decode' in pipe mode.
+#Every path component is xor'ed with a keystream derived from its plain
+#parent path (like EncFS' IV chaining) and printed as hex. Every request
+#is counted in the file given by environ BIT_DUMMY_ENCFSCTL_COUNT.
+import os
+import sys
+import hashlib
+
+def keystream(parent, size):
+    key = b''
+    while len(key) < size:
+        key += hashlib.md5(parent + key).digest()
+    return key[:size]
+
+def encode(path):
+    parent = b''
+    ret = []
+    for component in path.split(b'/'):
+        key = keystream(parent, len(component))
+        ret.append(bytes(a ^ b for a, b in zip(component, key)).hex().encode())
+        parent += b'/' + component
+    return b'/'.join(ret)
+
+def decode(path):
+    parent = b''
+    ret = []
+    for component in path.split(b'/'):
+        try:
+            component = bytes.fromhex(component.decode())
+        except ValueError:
+            return b''
+        key = keystream(parent, len(component))
+        component = bytes(a ^ b for a, b in zip(component, key))
+        ret.append(component)
+        parent += b'/' + component
+    return b'/'.join(ret)
+
+if __name__ == '__main__':
+    func = {'encode': encode, 'decode': decode}[sys.argv[1]]
+    count = 0
+    for line in sys.stdin.buffer:
+        sys.stdout.buffer.write(func(line.rstrip(b'\n')) + b'\n')
+        sys.stdout.buffer.flush()
+        count += 1
+    if 'BIT_DUMMY_ENCFSCTL_COUNT' in os.environ:
+        with open(os.environ['BIT_DUMMY_ENCFSCTL_COUNT'], 'wt') as f:
+            f.write(str(count))
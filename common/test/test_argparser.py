@@ -69,6 +69,18 @@ class TestArgParser(generic.TestCase):
         self.assertIn('debug', args)
         self.assertTrue(args.debug)
 
+    def test_startup_trace(self):
+        args = backintime.arg_parse(['--startup-trace', 'last-snapshot'])
+        self.assertTrue(args.startup_trace)
+        self.assertEqual(args.command, 'last-snapshot')
+        args = backintime.arg_parse(['last-snapshot'])
+        self.assertFalse(args.startup_trace)
+
+    def test_startup_trace_not_abbreviated(self):
+        args = backintime.arg_parse(['log', '--start', '10'])
+        self.assertFalse(args.startup_trace)
+        self.assertEqual(args.start, 10)
+
     def test_config_no_path(self):
         with self.assertRaises(SystemExit):
             backintime.arg_parse(['--config'])
@@ -139,6 +151,97 @@ class TestArgParser(generic.TestCase):
                 self.assertIn('config', args, msg)
                 self.assertEqual(args.config, 'bar', msg)
 
+    def test_cmd_backup_profile_run(self):
+        args = backintime.arg_parse(['backup'])
+        self.assertFalse(args.profile_run)
+        for command in ('backup', 'backup-job'):
+            with self.subTest(command = command):
+                args = backintime.arg_parse([command, '--profile-run'])
+                self.assertTrue(args.profile_run)
+
+    ############################################################################
+    ###                                Diff                                  ###
+    ############################################################################
+    def test_cmd_diff(self):
+        args = backintime.arg_parse(['diff', '1', '0'])
+        self.assertEqual(args.command, 'diff')
+        self.assertIs(args.func, backintime.diff)
+        self.assertEqual(args.SNAPSHOT_ID1, '1')
+        self.assertEqual(args.SNAPSHOT_ID2, '0')
+        self.assertEqual(args.PATH, '/')
+        self.assertFalse(args.json)
+
+    def test_cmd_diff_path_json(self):
+        args = backintime.arg_parse(['diff', '1', '0', '/home', '--json'])
+        self.assertEqual(args.PATH, '/home')
+        self.assertTrue(args.json)
+
+    ############################################################################
+    ###                               Export                                 ###
+    ############################################################################
+    def test_cmd_export(self):
+        args = backintime.arg_parse(['export', '0', '/home', '/etc', '--to', 'foo.tar.gz'])
+        self.assertEqual(args.command, 'export')
+        self.assertIs(args.func, backintime.export)
+        self.assertEqual(args.SNAPSHOT_ID, '0')
+        self.assertListEqual(args.PATH, ['/home', '/etc'])
+        self.assertEqual(args.to, 'foo.tar.gz')
+
+    def test_cmd_export_missing_to(self):
+        with self.assertRaises(SystemExit):
+            backintime.arg_parse(['export', '0', '/home'])
+
+    ############################################################################
+    ###                               Search                                 ###
+    ############################################################################
+    def test_cmd_search(self):
+        args = backintime.arg_parse(['search', '*.ods'])
+        self.assertEqual(args.command, 'search')
+        self.assertIs(args.func, backintime.search)
+        self.assertEqual(args.PATTERN, '*.ods')
+        self.assertFalse(args.ignore_case)
+
+    def test_cmd_search_ignore_case(self):
+        args = backintime.arg_parse(['search', '-i', 'report'])
+        self.assertTrue(args.ignore_case)
+
+    ############################################################################
+    ###                                 Log                                  ###
+    ############################################################################
+    def test_cmd_log(self):
+        args = backintime.arg_parse(['log'])
+        self.assertEqual(args.command, 'log')
+        self.assertIs(args.func, backintime.log)
+        self.assertIsNone(args.SNAPSHOT_ID)
+        self.assertEqual(args.filter, 'all')
+        self.assertEqual(args.start, 0)
+        self.assertIsNone(args.count)
+
+    def test_cmd_log_page(self):
+        args = backintime.arg_parse(['log', '0', '--filter', 'errors', '--start', '100', '--count', '50'])
+        self.assertEqual(args.SNAPSHOT_ID, '0')
+        self.assertEqual(args.filter, 'errors')
+        self.assertEqual(args.start, 100)
+        self.assertEqual(args.count, 50)
+
+    def test_cmd_log_invalid_filter(self):
+        with self.assertRaises(SystemExit):
+            backintime.arg_parse(['log', '--filter', 'foo'])
+
+    ############################################################################
+    ###                                 Ls                                   ###
+    ############################################################################
+    def test_cmd_ls(self):
+        args = backintime.arg_parse(['ls', '0'])
+        self.assertEqual(args.command, 'ls')
+        self.assertIs(args.func, backintime.ls)
+        self.assertEqual(args.SNAPSHOT_ID, '0')
+        self.assertEqual(args.PATH, '/')
+
+    def test_cmd_ls_path(self):
+        args = backintime.arg_parse(['ls', '20151130-230501-984', '/home'])
+        self.assertEqual(args.PATH, '/home')
+
     ############################################################################
     ###                               Restore                                ###
     ############################################################################
@@ -160,6 +263,16 @@ class TestArgParser(generic.TestCase):
         self.assertIn('SNAPSHOT_ID', args)
         self.assertEqual(args.SNAPSHOT_ID, '20151130-230501-984')
 
+    def test_cmd_restore_dry_run(self):
+        args = backintime.arg_parse(['restore', '--dry-run', '/home', '', '0'])
+        self.assertEqual(args.command, 'restore')
+        self.assertIn('dry_run', args)
+        self.assertTrue(args.dry_run)
+        self.assertEqual(args.WHAT, '/home')
+
+        args = backintime.arg_parse(['restore', '/home'])
+        self.assertFalse(args.dry_run)
+
     def test_cmd_restore_what_where_snapshot_id_multi_args(self):
         for argv in shuffleArgs('--quiet', ('restore', '/home', '/tmp', '20151130-230501-984'),
                                 '--checksum', ('--profile-id', '2'), '--local-backup',
@@ -236,5 +349,39 @@ class TestArgParser(generic.TestCase):
         with self.assertRaises(SystemExit):
             backintime.arg_parse(('restore', '--local-backup', '--no-local-backup'))
 
+    ############################################################################
+    ###                                Watch                                 ###
+    ############################################################################
+    def test_cmd_watch(self):
+        args = backintime.arg_parse(['watch'])
+        self.assertEqual(args.command, 'watch')
+        self.assertIs(args.func, backintime.watch)
+        self.assertFalse(args.json)
+
+    def test_cmd_watch_json(self):
+        args = backintime.arg_parse(['watch', '--json'])
+        self.assertTrue(args.json)
+
+    ############################################################################
+    ###                              Scheduler                               ###
+    ############################################################################
+    def test_cmd_scheduler(self):
+        args = backintime.arg_parse(['scheduler'])
+        self.assertEqual(args.command, 'scheduler')
+        self.assertIs(args.func, backintime.scheduler)
+
+    ############################################################################
+    ###                                Status                                ###
+    ############################################################################
+    def test_cmd_status(self):
+        args = backintime.arg_parse(['status'])
+        self.assertEqual(args.command, 'status')
+        self.assertIs(args.func, backintime.status)
+        self.assertFalse(args.json)
+
+    def test_cmd_status_json(self):
+        args = backintime.arg_parse(['status', '--json'])
+        self.assertTrue(args.json)
+
 if __name__ == '__main__':
     unittest.main()
@@ -50,3 +50,44 @@ class TestConfig(generic.TestCase):
             # set directory to read only
             os.chmod(dirpath, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
             self.assertFalse(self.config.set_snapshots_path(dirpath))
+
+    def test_profile_settings(self):
+        self.config.set_snapshots_mode('ssh')
+        self.config.set_ssh_host('foo')
+        self.config.set_ssh_port(2222)
+        settings = self.config.profile_settings()
+        self.assertEqual(settings.mode, 'ssh')
+        self.assertEqual(settings.ssh_host, 'foo')
+        self.assertEqual(settings.ssh_port, 2222)
+        self.assertEqual(settings.ssh_path, './')
+        self.assertIsNone(settings.snapshots_path)
+        #cached until something changed
+        self.assertIs(self.config.profile_settings(), settings)
+        self.assertIs(self.config.profile_settings(1), settings)
+        with self.assertRaises(AttributeError):
+            settings.ssh_host = 'bar'
+
+    def test_profile_settings_invalidate(self):
+        settings = self.config.profile_settings()
+        self.config.set_ssh_host('bar')
+        self.assertIsNot(self.config.profile_settings(), settings)
+        self.assertEqual(self.config.profile_settings().ssh_host, 'bar')
+        self.assertEqual(self.config.get_ssh_host_port_user_path_cipher()[0], 'bar')
+        #also catch options changed directly in dict
+        self.config.dict['profile1.snapshots.ssh.prefix.enabled'] = 'true'
+        self.config.dict['profile1.snapshots.ssh.prefix.value'] = 'FOO=bar'
+        self.assertEqual(self.config.ssh_prefix_cmd(cmd_type = list), ['FOO=bar'])
+        self.config.remove_profile_key('snapshots.ssh.prefix.enabled')
+        self.assertEqual(self.config.ssh_prefix_cmd(cmd_type = str), '')
+
+    def test_profile_settings_paths(self):
+        with tempdir() as dirpath:
+            self.config.dict['profile1.snapshots.path'] = dirpath
+            host, user, profile = self.config.get_host_user_profile()
+            self.assertEqual(self.config.get_snapshots_full_path(),
+                             os.path.join(dirpath, 'backintime', host, user, profile))
+            self.config.set_host_user_profile('host', 'user', '2')
+            self.assertEqual(self.config.get_snapshots_full_path(),
+                             os.path.join(dirpath, 'backintime', 'host', 'user', '2'))
+            self.assertEqual(self.config.get_snapshots_full_path_ssh(),
+                             os.path.join('./', 'backintime', 'host', 'user', '2'))
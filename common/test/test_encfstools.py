@@ -0,0 +1,253 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import subprocess
+import unittest
+from tempfile import NamedTemporaryFile
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import encfstools
+
+DUMMY_ENCFSCTL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'dummy_encfsctl.py')
+
+class DummyEncFS(object):
+    """
+    minimal stand-in for encfstools.EncFS_SSH which is needed to create
+    encfstools.Encode
+    """
+    class Mountpoint(object):
+        mountpoint = '/tmp/mnt'
+        path = '/remote/backintime'
+
+    password = 'foo'
+    rev_root = Mountpoint()
+    ssh = Mountpoint()
+
+class TestPathCache(generic.TestCase):
+    def test_empty(self):
+        cache = encfstools.PathCache()
+        self.assertIsNone(cache.get('foo'))
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 0)
+
+    def test_parents(self):
+        cache = encfstools.PathCache()
+        cache.add('foo/bar/baz', 'A/B/C')
+        self.assertEqual(cache.get('foo/bar/baz'), 'A/B/C')
+        self.assertEqual(cache.get('foo/bar'), 'A/B')
+        self.assertEqual(cache.get('foo'), 'A')
+        self.assertIsNone(cache.get('foo/bar/baz/qux'))
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hitRate(), 75.0)
+
+    def test_parent_context(self):
+        cache = encfstools.PathCache()
+        cache.add('foo/baz', 'A/B')
+        cache.add('bar/baz', 'C/D')
+        self.assertEqual(cache.get('foo/baz'), 'A/B')
+        self.assertEqual(cache.get('bar/baz'), 'C/D')
+
+    def test_absolute(self):
+        cache = encfstools.PathCache()
+        cache.add('/foo/bar', '/A/B')
+        self.assertEqual(cache.get('/foo/bar'), '/A/B')
+        self.assertIsNone(cache.get('foo/bar'))
+
+    def test_bytes(self):
+        cache = encfstools.PathCache()
+        cache.add(b'foo/bar', b'A/B')
+        self.assertEqual(cache.get(b'foo/bar'), b'A/B')
+        self.assertEqual(cache.get(b'foo'), b'A')
+
+    def test_different_length(self):
+        cache = encfstools.PathCache()
+        cache.add('foo/bar', 'A')
+        self.assertIsNone(cache.get('foo'))
+        self.assertEqual(len(cache.cache), 0)
+
+    def test_lru(self):
+        cache = encfstools.PathCache(maxsize = 2)
+        cache.add('foo', 'A')
+        cache.add('bar', 'B')
+        #touch foo so bar is the least recently used entry
+        cache.get('foo')
+        cache.add('baz', 'C')
+        self.assertEqual(cache.get('foo'), 'A')
+        self.assertIsNone(cache.get('bar'))
+        self.assertEqual(cache.get('baz'), 'C')
+
+class TestPipeline(generic.TestCase):
+    def test_decode_bytes(self):
+        proc = subprocess.Popen([DUMMY_ENCFSCTL, 'encode'],
+                                stdin = subprocess.PIPE,
+                                stdout = subprocess.PIPE,
+                                bufsize = 0)
+        paths = [b'foo/bar', b'foo', b'baz/qux']
+        cache = encfstools.PathCache()
+        crypted = [ret for path, ret in encfstools.pipeline([proc], paths, b'\n', cache)]
+        proc.communicate()
+
+        proc = subprocess.Popen([DUMMY_ENCFSCTL, 'decode'],
+                                stdin = subprocess.PIPE,
+                                stdout = subprocess.PIPE,
+                                bufsize = 0)
+        cache = encfstools.PathCache()
+        ret = list(encfstools.pipeline([proc], crypted + [b'not_hex'], b'\n', cache))
+        proc.communicate()
+        self.assertListEqual([r for p, r in ret], paths + [b''])
+
+class TestEncode(generic.TestCase):
+    def setUp(self):
+        super(TestEncode, self).setUp()
+        self.countFile = NamedTemporaryFile()
+        self.env = os.environ.copy()
+        self.env['BIT_DUMMY_ENCFSCTL_COUNT'] = self.countFile.name
+
+    def tearDown(self):
+        super(TestEncode, self).tearDown()
+        self.countFile.close()
+
+    def encode(self, cache = True):
+        enc = encfstools.Encode(DummyEncFS())
+        if not cache:
+            enc.cache = encfstools.PathCache(maxsize = 0)
+        enc.p = subprocess.Popen([DUMMY_ENCFSCTL, 'encode'],
+                                 env = self.env,
+                                 bufsize = 0,
+                                 stdin = subprocess.PIPE,
+                                 stdout = subprocess.PIPE,
+                                 universal_newlines = True)
+        return enc
+
+    def requests(self):
+        with open(self.countFile.name, 'rt') as f:
+            return int(f.read())
+
+    def paths(self):
+        for i in range(20):
+            for j in range(20):
+                yield 'home/user/folder%s/file%s' % (i, j)
+                yield 'home/user/folder%s' % i
+
+    def test_path(self):
+        enc = self.encode()
+        ret = enc.path('foo/bar')
+        self.assertNotEqual(ret, 'foo/bar')
+        self.assertEqual(enc.path('foo/bar'), ret)
+        self.assertEqual(enc.path('foo'), ret.split('/')[0])
+        enc.close()
+        self.assertEqual(self.requests(), 1)
+
+    def test_same_result_as_uncached(self):
+        enc = self.encode()
+        result = [enc.path(p) for p in self.paths()]
+        enc.close()
+
+        enc = self.encode(cache = False)
+        resultUncached = [enc.path(p) for p in self.paths()]
+        enc.close()
+
+        self.assertListEqual(result, resultUncached)
+
+    def test_encode_many(self):
+        paths = list(self.paths())
+        enc = self.encode(cache = False)
+        result = [enc.path(p) for p in paths]
+        enc.close()
+
+        enc = self.encode(cache = False)
+        self.assertListEqual(list(enc.encode_many(paths, window = 8)), result)
+        enc.close()
+        self.assertEqual(self.requests(), len(paths))
+
+    def test_encode_many_processes(self):
+        paths = list(self.paths())
+        enc = self.encode(cache = False)
+        result = [enc.path(p) for p in paths]
+        enc.close()
+
+        enc = self.encode(cache = False)
+        enc.start_process = lambda: subprocess.Popen([DUMMY_ENCFSCTL, 'encode'],
+                                                     bufsize = 0,
+                                                     stdin = subprocess.PIPE,
+                                                     stdout = subprocess.PIPE,
+                                                     universal_newlines = True)
+        self.assertListEqual(list(enc.encode_many(paths, processes = 3)), result)
+        enc.close()
+        #first process got every third request
+        self.assertEqual(self.requests(), len(paths) // 3 + 1)
+
+    def test_encode_many_abort(self):
+        enc = self.encode(cache = False)
+        paths = ['foo/%s' % i for i in range(100)]
+        for i, ret in enumerate(enc.encode_many(paths, window = 16)):
+            if i == 5:
+                break
+        #pending answers must not mess up the next request
+        self.assertEqual(enc.path('bar'), self.encode().path('bar'))
+
+    def test_exclude_many(self):
+        paths = ['/foo/bar', 'baz', 'foo/*/bar', 'foo*']
+        enc = self.encode(cache = False)
+        result = [enc.exclude(p) for p in paths]
+        enc.close()
+
+        enc = self.encode()
+        self.assertListEqual(enc.exclude_many(paths), result)
+        self.assertIsNone(result[3])
+
+    def test_benchmark(self):
+        """
+        compare cached and uncached encoding of the same set of paths.
+        Run with '-v' to see the timings.
+        """
+        paths = list(self.paths())
+
+        enc = self.encode(cache = False)
+        start = time.time()
+        for path in paths:
+            enc.path(path)
+        enc.close()
+        uncached = time.time() - start
+        uncachedRequests = self.requests()
+
+        enc = self.encode()
+        start = time.time()
+        for path in paths:
+            enc.path(path)
+        enc.close()
+        cached = time.time() - start
+        cachedRequests = self.requests()
+
+        if '-v' in sys.argv:
+            print('\nuncached: %s requests in %.3fs\n'
+                  'cached:   %s requests in %.3fs (%s)'
+                  %(uncachedRequests, uncached, cachedRequests, cached, enc.cache))
+        self.assertEqual(uncachedRequests, len(paths))
+        #every folder is a parent of its files and gets cached with them
+        self.assertEqual(cachedRequests, 400)
+        self.assertEqual(enc.cache.hitRate(), 50.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import io
+import os
+import bz2
+import sys
+import stat
+import tarfile
+import unittest
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import snapshots
+import tools
+import export
+import cli
+
+class TestStreamMode(generic.TestCase):
+    def test_streamMode(self):
+        self.assertEqual(export.streamMode('foo.tar'), 'w|')
+        self.assertEqual(export.streamMode('foo.tar.gz'), 'w|gz')
+        self.assertEqual(export.streamMode('foo.tgz'), 'w|gz')
+        self.assertEqual(export.streamMode('foo.tar.xz'), 'w|xz')
+        self.assertEqual(export.streamMode('foo.tar.bz2'), 'w|bz2')
+        self.assertEqual(export.streamMode('-'), 'w|')
+
+class TestExport(generic.TestCase):
+    def setUp(self):
+        super(TestExport, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.cfg.dict['profile1.snapshots.path'] = self.tmpDir.name
+        self.cfg._LOCAL_DATA_FOLDER = self.tmpDir.name
+        self.sn = snapshots.Snapshots(self.cfg)
+        self.sid = snapshots.SID('20151219-010324-123', self.cfg)
+        for item in ('foo/bar/file1', 'foo/bar/file2', 'foo/baz/file3', 'other/file4'):
+            path = self.sid.pathBackup(item)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            with open(path, 'wt') as f:
+                f.write(item)
+            os.chmod(path, 0o400)
+        os.symlink('bar/file1', self.sid.pathBackup('foo/link'))
+
+        d = snapshots.FileInfoDict()
+        d[b'/foo'] = (stat.S_IFDIR | 0o750, b'root', b'root')
+        d[b'/foo/bar/file1'] = (stat.S_IFREG | 0o644, b'root', b'root')
+        d[b'/foo/bar/file2'] = (stat.S_IFREG | 0o600, b'nobodyBIT', b'nogroupBIT')
+        d[b'/other/file4'] = (stat.S_IFREG | 0o777, b'root', b'root')
+        self.sid.fileInfo = d
+        self.target = os.path.join(self.tmpDir.name, 'export.tar')
+
+    def tearDown(self):
+        super(TestExport, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def members(self, target = None):
+        with tarfile.open(target or self.target) as tar:
+            return {m.name: (m, tar.extractfile(m).read() if m.isreg() else None)
+                    for m in tar.getmembers()}
+
+    def test_local(self):
+        self.assertTrue(export.export(self.sn, self.sid, ['/foo'], self.target))
+        members = self.members()
+        self.assertSetEqual(set(members), {'foo', 'foo/bar', 'foo/bar/file1',
+                                           'foo/bar/file2', 'foo/baz',
+                                           'foo/baz/file3', 'foo/link'})
+        self.assertEqual(members['foo/bar/file1'][1], b'foo/bar/file1')
+        self.assertTrue(members['foo/link'][0].issym())
+        self.assertEqual(members['foo/link'][0].linkname, 'bar/file1')
+
+    def test_fileinfo(self):
+        export.export(self.sn, self.sid, ['/foo'], self.target)
+        members = self.members()
+        self.assertTrue(members['foo'][0].isdir())
+        self.assertEqual(members['foo'][0].mode, 0o750)
+        self.assertEqual(members['foo/bar/file1'][0].mode, 0o644)
+        self.assertEqual(members['foo/bar/file1'][0].uname, 'root')
+        self.assertEqual(members['foo/bar/file1'][0].uid, 0)
+        #unknown user and group keep the IDs from snapshot
+        file2 = members['foo/bar/file2'][0]
+        self.assertEqual(file2.mode, 0o600)
+        self.assertEqual(file2.uname, 'nobodyBIT')
+        self.assertEqual(file2.uid, os.lstat(self.sid.pathBackup('foo/bar/file2')).st_uid)
+        #no fileinfo
+        self.assertEqual(members['foo/baz/file3'][0].mode, 0o400)
+
+    def test_loadFileInfo(self):
+        d = export.loadFileInfo(self.sid, [b'/foo/bar'])
+        self.assertSetEqual(set(d), {b'/foo/bar/file1', b'/foo/bar/file2'})
+
+    def test_fileInfoReader(self):
+        reader = export.FileInfoReader(self.sid, [b'/foo', b'/other'])
+        self.assertIsNone(reader.dict)
+        self.assertEqual(len(reader.entries), 4)
+        self.assertEqual(reader.get(b'/foo'), (stat.S_IFDIR | 0o750, b'root', b'root'))
+        self.assertIsNone(reader.get(b'/foo/bar'))
+        self.assertEqual(reader.get(b'/foo/bar/file2')[1], b'nobodyBIT')
+        #passed entries are dropped
+        self.assertEqual(len(reader.entries), 2)
+        self.assertEqual(reader.get(b'/other/file4')[0], stat.S_IFREG | 0o777)
+        self.assertIsNone(reader.dict)
+        #out of order
+        self.assertEqual(reader.get(b'/foo/bar/file1')[0], stat.S_IFREG | 0o644)
+        self.assertIsNotNone(reader.dict)
+        reader.close()
+
+    def test_fileInfoReader_unsorted(self):
+        #fileinfo is not sorted on disk
+        with bz2.BZ2File(self.sid.path(self.sid.FILEINFO), 'wb') as f:
+            f.write(b'33188 root root /a-b\n')
+            f.write(b'33188 root root /a/b\n')
+            f.write(b'16872 root root /a\n')
+            f.write(b'16872 root root /other\n')
+        reader = export.FileInfoReader(self.sid, [b'/a', b'/a-b'])
+        self.assertEqual([export.sortKey(p) for p in (b'/a', b'/a/b', b'/a-b')],
+                         [key for key, info in reader.entries])
+        self.assertEqual(reader.get(b'/a')[0], 16872)
+        self.assertEqual(reader.get(b'/a/b')[0], 33188)
+        self.assertEqual(reader.get(b'/a-b')[0], 33188)
+        self.assertIsNone(reader.dict)
+
+    def test_no_members_kept(self):
+        tars = []
+        tarOpen = tarfile.open
+        def capture(*args, **kwargs):
+            tars.append(tarOpen(*args, **kwargs))
+            return tars[-1]
+        with patch('tarfile.open', side_effect = capture):
+            self.assertTrue(export.export(self.sn, self.sid, ['/foo'], self.target))
+        self.assertEqual(tars[0].members, [])
+        self.assertEqual(len(self.members()), 7)
+
+    def test_multiple_paths(self):
+        export.export(self.sn, self.sid, ['/foo/bar/file2', '/other/'], self.target)
+        members = self.members()
+        self.assertSetEqual(set(members), {'foo/bar/file2', 'other', 'other/file4'})
+        self.assertEqual(members['other/file4'][0].mode, 0o777)
+
+    def test_missing(self):
+        msg = []
+        self.assertFalse(export.export(self.sn, self.sid, ['/nothing', '/other'],
+                                       self.target, msg.append))
+        self.assertIn('other/file4', self.members())
+        self.assertRegex(msg[0], r'^/nothing is not in snapshot')
+
+    def test_cli_stdout(self):
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with patch('sys.stdout', new_callable = io.StringIO) as quiet, \
+             patch('sys.stderr', new_callable = io.StringIO) as stderr, \
+             patch('builtins.input', return_value = '0'):
+            self.assertTrue(cli.export(self.cfg, None, ['/foo'], '-', stdout))
+        #neither the archive nor the snapshot selection go to the replaced stdout
+        self.assertNotIn('SnapshotID', quiet.getvalue())
+        self.assertNotIn('foo/bar/file1', quiet.getvalue())
+        self.assertIn('SnapshotID to export', stderr.getvalue())
+        stdout.buffer.seek(0)
+        with tarfile.open(fileobj = stdout.buffer) as tar:
+            self.assertIn('foo/bar/file1', tar.getnames())
+
+    def test_compression(self):
+        for suffix, magic in (('.tar.gz', b'\x1f\x8b'),
+                              ('.tar.xz', b'\xfd7zXZ'),
+                              ('.tar.bz2', b'BZh')):
+            with self.subTest(suffix = suffix):
+                target = os.path.join(self.tmpDir.name, 'export' + suffix)
+                export.export(self.sn, self.sid, ['/foo'], target)
+                with open(target, 'rb') as f:
+                    self.assertEqual(f.read(len(magic)), magic)
+                self.assertEqual(len(self.members(target)), 7)
+
+    @unittest.skipUnless(tools.check_command('tar'), 'tar is not installed')
+    def test_remote(self):
+        #run the 'remote' tar locally
+        path = self.cfg.get_snapshots_full_path()
+        with patch.object(self.cfg, 'get_snapshots_mode', return_value = 'ssh'), \
+             patch.object(self.cfg, 'get_snapshots_full_path', return_value = path), \
+             patch.object(self.cfg, 'get_snapshots_full_path_ssh', return_value = path), \
+             patch.object(self.sn, 'cmd_ssh', return_value = ['sh', '-s']):
+            self.assertTrue(export.export(self.sn, self.sid, ['/foo', '/other/file4'], self.target))
+        members = self.members()
+        self.assertSetEqual(set(members), {'foo', 'foo/bar', 'foo/bar/file1',
+                                           'foo/bar/file2', 'foo/baz',
+                                           'foo/baz/file3', 'foo/link',
+                                           'other/file4'})
+        self.assertEqual(members['foo'][0].mode, 0o750)
+        self.assertEqual(members['foo/bar/file2'][0].uname, 'nobodyBIT')
+        self.assertEqual(members['foo/bar/file2'][1], b'foo/bar/file2')
+        self.assertEqual(members['other/file4'][0].mode, 0o777)
+
+    @unittest.skipUnless(tools.check_command('tar'), 'tar is not installed')
+    def test_remote_hardlinks(self):
+        os.link(self.sid.pathBackup('foo/bar/file1'), self.sid.pathBackup('foo/baz/hardlink'))
+        path = self.cfg.get_snapshots_full_path()
+        with patch.object(self.cfg, 'get_snapshots_mode', return_value = 'ssh'), \
+             patch.object(self.cfg, 'get_snapshots_full_path', return_value = path), \
+             patch.object(self.cfg, 'get_snapshots_full_path_ssh', return_value = path), \
+             patch.object(self.sn, 'cmd_ssh', return_value = ['sh', '-s']):
+            self.assertTrue(export.export(self.sn, self.sid, ['/foo'], self.target))
+        members = self.members()
+        for name in ('foo/bar/file1', 'foo/baz/hardlink'):
+            self.assertTrue(members[name][0].isreg())
+            self.assertEqual(members[name][1], b'foo/bar/file1')
+
+if __name__ == '__main__':
+    unittest.main()
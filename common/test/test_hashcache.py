@@ -0,0 +1,159 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import hashlib
+import unittest
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import tools
+import hashcache
+
+class TestHashCache(generic.TestCase):
+    def setUp(self):
+        super(TestHashCache, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.dbFile = os.path.join(self.tmpDir.name, 'hash.cache')
+
+    def tearDown(self):
+        super(TestHashCache, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def createFile(self, name, content, mtime = 1000):
+        path = os.path.join(self.tmpDir.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_fileHash(self):
+        data = os.urandom(hashcache.BUFSIZE * 2 + 123)
+        path = self.createFile('foo', data)
+        self.assertEqual(hashcache.fileHash(path, 'md5'), hashlib.md5(data).hexdigest())
+        self.assertEqual(hashcache.fileHash(path),
+                         hashlib.new(hashcache.ALGORITHM, data).hexdigest())
+
+    def test_cached(self):
+        path = self.createFile('foo', b'foo')
+        cache = hashcache.HashCache(self.dbFile)
+        value = cache.hash(path)
+        with patch('hashcache.fileHash') as fileHash:
+            self.assertEqual(cache.hash(path), value)
+            fileHash.assert_not_called()
+        cache.close()
+
+        #persistent
+        cache = hashcache.HashCache(self.dbFile)
+        with patch('hashcache.fileHash') as fileHash:
+            self.assertEqual(cache.hash(path), value)
+            fileHash.assert_not_called()
+        cache.close()
+
+    def test_changed_mtime(self):
+        path = self.createFile('foo', b'foo')
+        cache = hashcache.HashCache()
+        cache.hash(path)
+        os.utime(path, (2000, 2000))
+        with patch('hashcache.fileHash', return_value = 'bar') as fileHash:
+            self.assertEqual(cache.hash(path), 'bar')
+            fileHash.assert_called_once_with(path)
+
+    def test_hashMany(self):
+        foo = self.createFile('foo', b'foo')
+        bar = self.createFile('bar', b'bar')
+        link = os.path.join(self.tmpDir.name, 'link')
+        os.link(foo, link)
+        cache = hashcache.HashCache(threads = 2)
+        with patch('hashcache.fileHash', side_effect = hashcache.fileHash) as fileHash:
+            cache.hashMany([foo, bar, link, '/nonexistent_bit_test'])
+            #hard-link is only hashed once
+            self.assertEqual(fileHash.call_count, 2)
+            self.assertEqual(cache.hash(link), hashcache.fileHash(foo))
+            self.assertEqual(fileHash.call_count, 3)
+
+    def test_maxItems(self):
+        cache = hashcache.HashCache(self.dbFile, maxItems = 3)
+        for i in range(5):
+            cache.hash(self.createFile('foo%s' % i, b'foo%d' % i))
+        cache.close()
+        cache = hashcache.HashCache(self.dbFile)
+        self.assertEqual(cache.conn.execute('SELECT COUNT(*) FROM hashes').fetchone()[0], 3)
+        cache.close()
+
+    def test_other_filesystem_not_stored(self):
+        path = self.createFile('foo', b'foo')
+        cache = hashcache.HashCache(self.dbFile)
+        #file on another device than the repository
+        cache.dev += 1
+        value = cache.hash(path)
+        cache.close()
+        cache = hashcache.HashCache(self.dbFile)
+        self.assertEqual(cache.conn.execute('SELECT COUNT(*) FROM hashes').fetchone()[0], 0)
+        cache.close()
+        self.assertEqual(value, hashcache.fileHash(path))
+
+    def test_unstable_inodes(self):
+        path = self.createFile('foo', b'foo')
+        with patch('tools.get_filesystem', return_value = 'fuse.sshfs'):
+            cache = hashcache.HashCache(self.dbFile)
+        self.assertIsNone(cache.conn)
+        cache.hash(path)
+        with patch('hashcache.fileHash') as fileHash:
+            cache.hash(path)
+            fileHash.assert_not_called()
+        cache.close()
+        self.assertFalse(os.path.exists(self.dbFile))
+
+class TestUniquenessSet(generic.TestCase):
+    def setUp(self):
+        super(TestUniquenessSet, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        #same size and mtime but different content
+        self.paths = []
+        for i, content in enumerate((b'foo', b'bar', b'foo')):
+            path = os.path.join(self.tmpDir.name, str(i))
+            with open(path, 'wb') as f:
+                f.write(content)
+            os.utime(path, (1000, 1000))
+            self.paths.append(path)
+
+    def tearDown(self):
+        super(TestUniquenessSet, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def check(self, uniqueness):
+        uniqueness.prefetch(self.paths)
+        return [uniqueness.check_for(path) for path in self.paths]
+
+    def test_deep_check(self):
+        expected = self.check(tools.UniquenessSet(True))
+        self.assertListEqual(expected, [True, True, False])
+        cache = hashcache.HashCache()
+        self.assertListEqual(self.check(tools.UniquenessSet(True, hashCache = cache)), expected)
+        self.assertEqual(len(cache.cache), 3)
+
+    def test_equal_to(self):
+        cache = hashcache.HashCache()
+        uniqueness = tools.UniquenessSet(True, list_equal_to = self.paths[0], hashCache = cache)
+        self.assertListEqual(self.check(uniqueness), [True, False, True])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import snapshots
+import metrics
+
+class TestMetrics(generic.TestCase):
+    def setUp(self):
+        super(TestMetrics, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.cfg.dict['profile1.snapshots.path'] = self.tmpDir.name
+        self.cfg._LOCAL_DATA_FOLDER = self.tmpDir.name
+        os.makedirs(self.cfg.get_snapshots_full_path())
+        self.metrics = metrics.Metrics(self.cfg)
+
+    def tearDown(self):
+        super(TestMetrics, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def values(self):
+        ret = {}
+        for line in self.metrics.format().splitlines():
+            if line.startswith('#'):
+                continue
+            name, value = line.rsplit(' ', 1)
+            ret[name] = float(value)
+        return ret
+
+    def test_rsync_lines(self):
+        for line in ('BACKINTIME: >f+++++++++ home/user/new',
+                     'BACKINTIME: >f.st...... home/user/changed',
+                     'BACKINTIME: cd+++++++++ home/user/folder/',
+                     'BACKINTIME: *deleting   home/user/old',
+                     'BACKINTIME: *deleting   home/user/oldfolder/',
+                     'sent 1.50K bytes  received 500 bytes  4.00K bytes/sec',
+                     'total size is 10.00M  speedup is 5000.00'):
+            self.metrics.rsyncLine(line)
+        self.assertEqual(self.metrics.filesChanged, 2)
+        self.assertEqual(self.metrics.filesDeleted, 1)
+        self.assertEqual(self.metrics.transferred, 2000)
+
+    def test_phases(self):
+        with patch('time.time', side_effect = [100.0, 102.5, 110.0, 111.0]):
+            self.metrics.phase('transfer')
+            self.metrics.phase('save-info')
+            self.metrics.phase('transfer')
+            self.metrics.finish(True)
+        self.assertDictEqual(dict(self.metrics.phases), {'transfer': 3.5, 'save-info': 7.5})
+
+    def test_format(self):
+        self.metrics.phase('transfer')
+        self.metrics.errors = 2
+        self.metrics.finish(False)
+        text = self.metrics.format()
+        self.assertTrue(text.endswith('# EOF\n'))
+        self.assertIn('# TYPE backintime_errors gauge', text)
+        values = self.values()
+        self.assertEqual(values['backintime_errors{profile="1",profile_name="Main profile"}'], 2)
+        self.assertEqual(values['backintime_last_run_success{profile="1",profile_name="Main profile"}'], 0)
+        self.assertIn('backintime_phase_duration_seconds{profile="1",profile_name="Main profile",phase="transfer"}',
+                      values)
+        #HELP and TYPE only once per metric family
+        self.assertEqual(text.count('# TYPE backintime_phase_duration_seconds'), 1)
+
+    def test_escape_labels(self):
+        self.assertEqual(metrics.formatLabels({'a': 'x"y\\z\n'}), 'a="x\\"y\\\\z\\n"')
+
+    def test_snapshots(self):
+        s1 = snapshots.SID('20151219-010000-123', self.cfg)
+        s1.makeDirs()
+        s2 = snapshots.SID('20151219-020000-123', self.cfg)
+        s2.makeDirs()
+        s2.failed = True
+        self.metrics.statSnapshots(snapshots.listSnapshots(self.cfg))
+        self.metrics.statFilesystem(self.cfg.get_snapshots_full_path())
+        self.assertEqual(self.metrics.snapshots, 2)
+        self.assertEqual(self.metrics.lastSnapshot, s1)
+        self.assertGreater(self.metrics.freeBytes, 0)
+        values = self.values()
+        self.assertIn('backintime_last_snapshot_age_seconds{profile="1",profile_name="Main profile"}', values)
+        self.assertIn('backintime_free_inodes{profile="1",profile_name="Main profile"}', values)
+
+    def test_write(self):
+        self.cfg.set_metrics_path(os.path.join(self.tmpDir.name, 'textfile'))
+        filename = self.cfg.metrics_file()
+        self.assertTrue(filename.endswith('_1.prom'))
+        self.metrics.finish(True)
+        self.assertTrue(self.metrics.write())
+        with open(filename, 'rt') as f:
+            self.assertEqual(f.read(), self.metrics.format())
+        #no temporary files left
+        self.assertListEqual(os.listdir(os.path.dirname(filename)), [os.path.basename(filename)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import snapshots
+import progress
+
+class TestProgressSegment(generic.TestCase):
+    def setUp(self):
+        super(TestProgressSegment, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.cfg._LOCAL_DATA_FOLDER = self.tmpDir.name
+        self.writer = progress.ProgressSegment(self.cfg, maxRate = 0)
+        self.reader = progress.ProgressSegment(self.cfg)
+
+    def tearDown(self):
+        super(TestProgressSegment, self).tearDown()
+        self.writer.close()
+        self.reader.close()
+        self.tmpDir.cleanup()
+
+    def test_update(self):
+        self.assertIsNone(self.reader.read())
+        self.writer.update(progress.ProgressFile.RSYNC, 26, '517.38K', '14.46MB/s', '0:02:36')
+        self.assertDictEqual(self.reader.values(), {'status': progress.ProgressFile.RSYNC,
+                                                    'percent': 26,
+                                                    'sent': '517.38K',
+                                                    'speed': '14.46MB/s',
+                                                    'eta': '0:02:36'})
+        mm = self.reader.mm
+        self.writer.update(progress.ProgressFile.RSYNC, 27, '600K', '-449.39kB/s', '??:??:??')
+        pg = self.reader.read()
+        #mapped only once
+        self.assertIs(self.reader.mm, mm)
+        self.assertEqual(pg.get_int_value('percent'), 27)
+        self.assertEqual(pg.get_str_value('speed'), '-449.39kB/s')
+        self.assertFalse(os.path.exists(self.cfg.get_take_snapshot_progress_file()))
+
+    def test_clear(self):
+        self.writer.update(progress.ProgressFile.RSYNC, 50)
+        self.assertIsNotNone(self.reader.read())
+        self.writer.clear()
+        self.assertIsNone(self.reader.read())
+
+    def test_max_rate(self):
+        writer = progress.ProgressSegment(self.cfg, maxRate = 1)
+        writer.update(progress.ProgressFile.RSYNC, 1)
+        writer.update(progress.ProgressFile.RSYNC, 2)
+        self.assertEqual(self.reader.values()['percent'], 1)
+        writer.close()
+
+    def test_write_in_progress(self):
+        self.writer.update(progress.ProgressFile.RSYNC, 50)
+        #simulate a writer which is in the middle of an update
+        seq = self.writer.seq + 1
+        self.writer.HEADER.pack_into(self.writer.mm, 0, self.writer.MAGIC,
+                                     self.writer.VERSION, 0, seq)
+        self.assertIsNone(self.reader.values(retries = 3))
+
+    def test_fallback_file(self):
+        pg = progress.ProgressFile(self.cfg)
+        pg.set_int_value('status', pg.RSYNC)
+        pg.set_int_value('percent', 42)
+        pg.save()
+        self.assertEqual(self.reader.read().get_int_value('percent'), 42)
+        self.writer.clear()
+        self.assertFalse(os.path.exists(self.cfg.get_take_snapshot_progress_file()))
+
+    def test_filter_rsync_progress(self):
+        sn = snapshots.Snapshots(self.cfg)
+        self.assertIsNone(sn._filter_rsync_progress('     517.38K  26%   14.46MB/s    0:02:36'))
+        values = self.reader.values()
+        self.assertEqual(values['percent'], 26)
+        self.assertEqual(values['eta'], '0:02:36')
+        sn.clear_take_snapshot_message()
+        self.assertIsNone(self.reader.values())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import stat
+import threading
+import unittest
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import snapshots
+import restoreplan
+
+class TestFormat(generic.TestCase):
+    def test_formatSize(self):
+        self.assertEqual(restoreplan.formatSize(0), '0 B')
+        self.assertEqual(restoreplan.formatSize(1023), '1023 B')
+        self.assertEqual(restoreplan.formatSize(1536), '1.5 KiB')
+        self.assertEqual(restoreplan.formatSize(3 * 1024**3), '3.0 GiB')
+        self.assertEqual(restoreplan.formatSize(2048 * 1024**4), '2048.0 TiB')
+
+    def test_formatDuration(self):
+        self.assertEqual(restoreplan.formatDuration(59), '< 1 minute')
+        self.assertEqual(restoreplan.formatDuration(7530), '2:05:30')
+
+class TestRestorePlan(generic.TestCase):
+    def setUp(self):
+        super(TestRestorePlan, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.cfg.dict['profile1.snapshots.path'] = self.tmpDir.name
+        self.cfg._LOCAL_DATA_FOLDER = self.tmpDir.name
+        self.sid = snapshots.SID('20151219-010324-123', self.cfg)
+        for item, size in (('foo/bar/file1', 100),
+                           ('foo/bar/file2', 200),
+                           ('foo/baz/file3', 1000)):
+            path = self.sid.pathBackup(item)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+
+    def tearDown(self):
+        super(TestRestorePlan, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def test_plan(self):
+        plan = restoreplan.plan(self.sid, ['/foo'])
+        self.assertTrue(plan.done)
+        self.assertEqual(plan.files, 3)
+        self.assertEqual(plan.dirs, 3)
+        self.assertEqual(plan.size, 1300)
+        self.assertIsNone(plan.seconds)
+        self.assertRegex(str(plan), r'^3 files and 3 folders, 1.3 KiB\nDuration: unknown')
+
+    def test_plan_file(self):
+        plan = restoreplan.plan(self.sid, ['/foo/bar/file2', '/foo/baz'])
+        self.assertEqual(plan.files, 2)
+        self.assertEqual(plan.dirs, 1)
+        self.assertEqual(plan.size, 1200)
+
+    def test_missing(self):
+        plan = restoreplan.plan(self.sid, ['/foo/bar', '/nothing'])
+        self.assertEqual(plan.files, 2)
+        self.assertListEqual(plan.missing, ['/nothing'])
+        self.assertIn('/nothing', str(plan))
+
+    def test_fileinfo_fallback(self):
+        sid = snapshots.SID('20151219-020000-123', self.cfg)
+        sid.makeDirs()
+        os.rmdir(sid.pathBackup())
+        d = snapshots.FileInfoDict()
+        d[b'/foo'] = (stat.S_IFDIR | 0o755, b'root', b'root')
+        d[b'/foo/bar'] = (stat.S_IFREG | 0o644, b'root', b'root')
+        d[b'/foobar'] = (stat.S_IFREG | 0o644, b'root', b'root')
+        sid.fileInfo = d
+        plan = restoreplan.plan(sid, ['/foo'])
+        self.assertEqual(plan.files, 1)
+        self.assertEqual(plan.dirs, 1)
+        self.assertFalse(plan.sizeKnown)
+
+    def test_estimate(self):
+        history = restoreplan.History(self.cfg)
+        history.add(1000, 1)
+        history.add(3000, 1)
+        self.assertEqual(history.throughput(), 2000)
+        plan = restoreplan.plan(self.sid, ['/foo'])
+        self.assertEqual(plan.seconds, 0.65)
+        self.assertIn('Estimated duration: up to < 1 minute', str(plan))
+
+    def test_history_max_items(self):
+        history = restoreplan.History(self.cfg, maxItems = 3)
+        for i in range(1, 6):
+            history.add(i, 1)
+        self.assertListEqual(history.load(), [[3, 1], [4, 1], [5, 1]])
+        #failed or empty restores are ignored
+        history.add(0, 1)
+        self.assertEqual(len(history.load()), 3)
+
+    def test_parseRsyncStats(self):
+        parse = restoreplan.History.parseRsyncStats
+        self.assertEqual(parse('sent 1.50M bytes  received 35 bytes  2.46M bytes/sec'), 1500035)
+        self.assertEqual(parse('sent 1,234 bytes  received 35 bytes  2,469.00 bytes/sec'), 1269)
+        self.assertIsNone(parse('total size is 1.23M  speedup is 1.00'))
+
+    def test_cancel(self):
+        cancel = threading.Event()
+        cancel.set()
+        plan = restoreplan.plan(self.sid, ['/foo'], cancel)
+        self.assertTrue(plan.canceled)
+        self.assertFalse(plan.done)
+
+    def test_thread(self):
+        result = []
+        thread = restoreplan.PlannerThread(self.sid, ['/foo'], result.append)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].files, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import stat
+import pstats
+import unittest
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import snapshots
+import runprofile
+
+class TestRunProfile(generic.TestCase):
+    def setUp(self):
+        super(TestRunProfile, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.cfg.dict['profile1.snapshots.path'] = self.tmpDir.name
+        self.cfg._LOCAL_DATA_FOLDER = self.tmpDir.name
+        os.makedirs(self.cfg.get_snapshots_full_path())
+        self.sn = snapshots.Snapshots(self.cfg)
+
+    def tearDown(self):
+        super(TestRunProfile, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def test_disabled(self):
+        self.assertIs(runprofile.command(None, 'true'), runprofile.NO_TIMER)
+        self.sn._execute('true')
+        self.assertIsNone(self.sn.run_profile)
+
+    def test_commands(self):
+        self.sn.run_profile = runprofile.RunProfile()
+        self.sn.run_profile.start()
+        self.sn._execute('true')
+        self.sn._execute('nice -n 19 echo foo', lambda line, data: None)
+        self.sn.run_profile.stop()
+        commands = self.sn.run_profile.commands
+        self.assertListEqual([c.cmd for c in commands], ['true', 'nice -n 19 echo foo'])
+        self.assertGreaterEqual(commands[0].wall, 0)
+        summary = self.sn.run_profile.commandsSummary()
+        self.assertSetEqual(set(x[0] for x in summary), {'true', 'echo'})
+        lines = self.sn.run_profile.hotspots()
+        self.assertTrue(lines[0].startswith('Run: '))
+        self.assertIn('in 2 commands', lines[0])
+
+    def test_command_name(self):
+        self.assertEqual(runprofile._commandName('ionice -c2 -n7 nocache rsync -rtDHh --foo=bar /a /b'), 'rsync')
+        self.assertEqual(runprofile._commandName('FOO=bar /usr/bin/ssh -p 22 host'), 'ssh')
+
+    def test_write_snapshot(self):
+        sid = snapshots.SID('20151219-010000-123', self.cfg)
+        sid.makeDirs()
+        os.chmod(sid.path(), 0o555)
+        self.sn.run_profile = runprofile.RunProfile()
+        self.sn.run_profile.start()
+        self.sn.write_run_profile(sid)
+        self.assertTrue(os.path.exists(sid.path(snapshots.SID.RUN_PROFILE)))
+        self.assertIsInstance(pstats.Stats(sid.path('profile-run.pstats')), pstats.Stats)
+        #snapshot stays read-only
+        self.assertEqual(stat.S_IMODE(os.stat(sid.path()).st_mode), 0o555)
+        os.chmod(sid.path(), 0o755)
+
+    def test_write_no_snapshot(self):
+        self.sn.run_profile = runprofile.RunProfile()
+        self.sn.run_profile.start()
+        self.sn.write_run_profile()
+        #only written once
+        self.sn.write_run_profile()
+        with open(self.cfg.get_take_snapshot_run_profile_file(), 'rt') as f:
+            self.assertIn('function calls', f.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import json
+import datetime
+import unittest
+from unittest.mock import patch, MagicMock
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import scheduler
+
+NOW = datetime.datetime(2016, 5, 4, 10, 7, 30)  #wednesday
+
+class TestNextRun(generic.TestCase):
+    def setUp(self):
+        super(TestNextRun, self).setUp()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+
+    def nextRun(self, mode, **kwargs):
+        self.cfg.set_automatic_backup_mode(mode)
+        for key, value in kwargs.items():
+            getattr(self.cfg, 'set_%s' % key)(value)
+        return scheduler.nextRun(self.cfg, '1', NOW)
+
+    def test_minutes(self):
+        self.assertEqual(self.nextRun(self.cfg._5_MIN), datetime.datetime(2016, 5, 4, 10, 10))
+        self.assertEqual(self.nextRun(self.cfg._30_MIN), datetime.datetime(2016, 5, 4, 10, 30))
+
+    def test_hours(self):
+        self.assertEqual(self.nextRun(self.cfg._1_HOUR), datetime.datetime(2016, 5, 4, 11, 0))
+        self.assertEqual(self.nextRun(self.cfg._4_HOURS), datetime.datetime(2016, 5, 4, 12, 0))
+        self.assertEqual(self.nextRun(self.cfg._12_HOURS), datetime.datetime(2016, 5, 4, 12, 0))
+
+    def test_custom_hours(self):
+        self.assertEqual(self.nextRun(self.cfg.CUSTOM_HOUR, custom_backup_time = '8,9'),
+                         datetime.datetime(2016, 5, 5, 8, 0))
+        self.assertEqual(self.nextRun(self.cfg.CUSTOM_HOUR, custom_backup_time = '*/5'),
+                         datetime.datetime(2016, 5, 4, 15, 0))
+        self.assertIsNone(self.nextRun(self.cfg.CUSTOM_HOUR, custom_backup_time = '8,25'))
+
+    def test_day_week_month(self):
+        self.assertEqual(self.nextRun(self.cfg.DAY, automatic_backup_time = 930),
+                         datetime.datetime(2016, 5, 5, 9, 30))
+        self.assertEqual(self.nextRun(self.cfg.WEEK, automatic_backup_time = 1200,
+                                      automatic_backup_weekday = 7),
+                         datetime.datetime(2016, 5, 8, 12, 0))
+        self.assertEqual(self.nextRun(self.cfg.MONTH, automatic_backup_time = 0,
+                                      automatic_backup_day = 1),
+                         datetime.datetime(2016, 6, 1, 0, 0))
+
+    def test_repeatedly(self):
+        self.assertEqual(self.nextRun(self.cfg.REPEATEDLY, automatic_backup_anacron_unit = self.cfg.DAY),
+                         datetime.datetime(2016, 5, 4, 10, 15))
+        self.assertEqual(self.nextRun(self.cfg.REPEATEDLY, automatic_backup_anacron_unit = self.cfg.WEEK),
+                         datetime.datetime(2016, 5, 4, 11, 0))
+
+    def test_no_fixed_time(self):
+        for mode in (self.cfg.NONE, self.cfg.AT_EVERY_BOOT, self.cfg.UDEV):
+            self.assertIsNone(self.nextRun(mode))
+
+    def test_customHours(self):
+        self.assertEqual(scheduler.customHours('*/8'), {0, 8, 16})
+        self.assertEqual(scheduler.customHours(' 1,2 '), {1, 2})
+        self.assertIsNone(scheduler.customHours('*/0'))
+        self.assertIsNone(scheduler.customHours('a'))
+
+class TestScheduler(generic.TestCase):
+    def setUp(self):
+        super(TestScheduler, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.cfg._LOCAL_DATA_FOLDER = self.tmpDir.name
+        self.cfg.dict['profile1.snapshots.path'] = self.tmpDir.name
+        self.cfg.set_automatic_backup_mode(self.cfg._1_HOUR)
+        self.cfg.add_profile('second')
+        self.cfg.set_automatic_backup_mode(self.cfg._1_HOUR, '2')
+        self.cfg.dict['profile2.snapshots.path'] = self.tmpDir.name
+        self.now = scheduler._timestamp(NOW)
+        self.sched = scheduler.Scheduler(self.cfg)
+        self.sched.load(self.now)
+
+        patcher = patch('subprocess.Popen')
+        self.popen = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.procs = []
+        def newProc(*args, **kwargs):
+            proc = MagicMock()
+            proc.pid = 1000 + len(self.procs)
+            proc.poll.return_value = None
+            self.procs.append(proc)
+            return proc
+        self.popen.side_effect = newProc
+
+    def tearDown(self):
+        super(TestScheduler, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def test_load(self):
+        due = self.now + 52.5 * 60
+        self.assertEqual([job.due for job in self.sched.jobs.values()], [due, due])
+        self.assertEqual(self.sched.tick(self.now), scheduler.POLL)
+        self.popen.assert_not_called()
+
+    def test_destination_limit(self):
+        later = self.now + 3600
+        self.sched.tick(later)
+        self.assertEqual(self.popen.call_count, 1)
+        self.assertEqual(self.popen.call_args[0][0][-1], 'backup-job')
+        first, second = self.sched.jobs.values()
+        self.assertIsNotNone(first.proc)
+        self.assertIsNone(second.proc)
+        self.assertEqual(second.due, later + scheduler.POLL)
+
+        #second profile starts after the first has finished
+        self.procs[0].poll.return_value = 0
+        self.sched.tick(later + scheduler.POLL)
+        self.assertEqual(self.popen.call_count, 2)
+        self.assertEqual(first.lastResult, scheduler.SUCCESS)
+        self.assertIsNotNone(second.proc)
+
+    def test_retry_backoff(self):
+        self.cfg.set_scheduler_retries(2)
+        self.cfg.set_scheduler_max_runs_per_destination(2)
+        job = self.sched.jobs['1']
+        t = self.now + 3600
+        self.sched.tick(t)
+        for delay in (scheduler.RETRY_BASE, scheduler.RETRY_BASE * 2):
+            job.proc.poll.return_value = 1
+            self.sched.tick(t)
+            self.assertEqual(job.lastResult, scheduler.FAILED)
+            self.assertEqual(job.due, t + delay)
+            t += delay
+            self.sched.tick(t)
+            self.assertIsNotNone(job.proc)
+
+        #give up and wait for the next regular run
+        job.proc.poll.return_value = 1
+        self.sched.tick(t)
+        self.assertEqual(job.failures, 0)
+        self.assertEqual(job.due, scheduler._timestamp(datetime.datetime(2016, 5, 4, 12, 0)))
+
+    def test_success_by_timestamp(self):
+        self.sched.tick(self.now + 3600)
+        job = self.sched.jobs['1']
+        os.makedirs(os.path.dirname(self.cfg.get_anacron_spool_file('1')))
+        with open(self.cfg.get_anacron_spool_file('1'), 'wt') as f:
+            f.write('20160504')
+        #backup-job returns 1 if there was nothing to do
+        job.proc.poll.return_value = 1
+        self.sched.tick(self.now + 3600)
+        self.assertEqual(job.lastResult, scheduler.SUCCESS)
+        self.assertEqual(job.failures, 0)
+
+    def test_on_battery(self):
+        self.cfg.set_no_on_battery_enabled(True)
+        self.cfg.set_no_on_battery_enabled(True, '2')
+        with patch('tools.on_battery', return_value = True):
+            self.sched.tick(self.now + 3600)
+        self.popen.assert_not_called()
+        job = self.sched.jobs['1']
+        self.assertEqual(job.lastResult, scheduler.DEFERRED)
+        self.assertEqual(job.due, self.now + 3600 + scheduler.BATTERY_DELAY)
+
+    def test_reschedule_drops_old_entries(self):
+        job = self.sched.jobs['1']
+        self.sched.schedule(job, self.now + 60)
+        self.sched.schedule(job, None)
+        self.sched.tick(self.now + 120)
+        self.popen.assert_not_called()
+
+    def test_state(self):
+        self.sched.tick(self.now + 3600)
+        state, running = scheduler.readState(self.cfg)
+        self.assertFalse(running)
+        self.assertEqual(list(state['profiles'].keys()), ['1', '2'])
+        self.assertTrue(state['profiles']['1']['running'])
+        self.assertEqual(state['profiles']['1']['pid'], 1000)
+        self.assertEqual(state['profiles']['2']['name'], 'second')
+        self.assertFalse(state['profiles']['2']['running'])
+        with open(self.cfg.get_scheduler_state_file(), 'rt') as f:
+            self.assertEqual(json.load(f)['pid'], os.getpid())
+
+    def test_cron_disabled(self):
+        self.assertNotEqual(self.cfg.cronLine('1'), '')
+        self.cfg.set_scheduler_enabled(True)
+        self.assertEqual(self.cfg.cronLine('1'), '')
+
+if __name__ == '__main__':
+    unittest.main()
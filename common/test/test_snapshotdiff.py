@@ -0,0 +1,139 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import stat
+import json
+import shutil
+import threading
+import unittest
+from io import StringIO
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import snapshots
+import snapshotdiff
+import cli
+
+class TestSnapshotDiff(generic.TestCase):
+    def setUp(self):
+        super(TestSnapshotDiff, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.cfg.dict['profile1.snapshots.path'] = self.tmpDir.name
+        self.cfg._LOCAL_DATA_FOLDER = self.tmpDir.name
+        os.makedirs(self.cfg.get_snapshots_full_path())
+
+        self.s1 = snapshots.SID('20151219-010000-123', self.cfg)
+        self.s1.makeDirs()
+        for item, content in (('a/same', 'x'), ('a/mod', '1'), ('a/touched', 't'),
+                              ('a/meta', 'm'), ('gone/sub/file', 'g')):
+            self.createFile(self.s1, item, content)
+        os.symlink('a/same', self.s1.pathBackup('link'))
+
+        self.s2 = snapshots.SID('20151219-020000-123', self.cfg)
+        self.s2.makeDirs()
+        for item in ('a/same', 'a/meta'):
+            os.makedirs(os.path.dirname(self.s2.pathBackup(item)), exist_ok = True)
+            os.link(self.s1.pathBackup(item), self.s2.pathBackup(item))
+        self.createFile(self.s2, 'a/mod', '22', 2000)
+        #new inode but same size and mtime
+        shutil.copy2(self.s1.pathBackup('a/touched'), self.s2.pathBackup('a/touched'))
+        self.createFile(self.s2, 'new/file', 'n')
+        os.symlink('a/mod', self.s2.pathBackup('link'))
+
+        d = snapshots.FileInfoDict()
+        d[b'/a/meta'] = (stat.S_IFREG | 0o644, b'root', b'root')
+        self.s1.fileInfo = d
+        d = snapshots.FileInfoDict()
+        d[b'/a/meta'] = (stat.S_IFREG | 0o600, b'root', b'root')
+        self.s2.fileInfo = d
+
+    def tearDown(self):
+        super(TestSnapshotDiff, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def createFile(self, sid, item, content, mtime = 1000):
+        path = sid.pathBackup(item)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, 'wt') as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def changes(self, path = '/', **kwargs):
+        return [(c.type, c.path) for c in snapshotdiff.SnapshotDiff(self.s1, self.s2, path, **kwargs)]
+
+    def test_diff(self):
+        diff = snapshotdiff.SnapshotDiff(self.s1, self.s2)
+        self.assertListEqual([(c.type, c.path) for c in diff],
+                             [('removed', '/gone'),
+                              ('removed', '/gone/sub'),
+                              ('removed', '/gone/sub/file'),
+                              ('modified', '/link'),
+                              ('added', '/new'),
+                              ('added', '/new/file'),
+                              ('metadata', '/a/meta'),
+                              ('modified', '/a/mod')])
+        self.assertDictEqual(dict(diff.summary), {'added': 2, 'removed': 3,
+                                                  'modified': 2, 'metadata': 1})
+
+    def test_attributes(self):
+        changes = {c.path: c for c in snapshotdiff.SnapshotDiff(self.s1, self.s2)}
+        self.assertEqual(changes['/a/meta'].before['mode'], '0644')
+        self.assertEqual(changes['/a/meta'].after['mode'], '0600')
+        self.assertEqual(changes['/a/mod'].before['size'], 1)
+        self.assertEqual(changes['/a/mod'].after['mtime'], 2000)
+        self.assertEqual(changes['/link'].after['target'], 'a/mod')
+        self.assertIsNone(changes['/new'].before)
+        self.assertTrue(changes['/new'].isDir)
+
+    def test_path(self):
+        self.assertListEqual(self.changes('/a'), [('metadata', '/a/meta'),
+                                                  ('modified', '/a/mod')])
+        self.assertListEqual(self.changes('/a/same'), [])
+        self.assertListEqual(self.changes('/gone/'), [('removed', '/gone'),
+                                                      ('removed', '/gone/sub'),
+                                                      ('removed', '/gone/sub/file')])
+        self.assertListEqual(self.changes('/nonexistent'), [])
+
+    def test_cancel(self):
+        cancel = threading.Event()
+        cancel.set()
+        self.assertListEqual(self.changes(cancel = cancel), [])
+
+    def test_format(self):
+        diff = snapshotdiff.SnapshotDiff(self.s1, self.s2, '/new')
+        self.assertListEqual([snapshotdiff.formatChange(c) for c in diff],
+                             ['+ /new/', '+ /new/file'])
+        self.assertEqual(snapshotdiff.formatSummary(diff.summary),
+                         'Added: 2, Removed: 0, Modified: 0, Metadata: 0')
+
+    def test_cli_json(self):
+        out = StringIO()
+        cli.diff(self.cfg, self.s1.sid, '0', '/a', json = True, out = out)
+        data = json.loads(out.getvalue())
+        self.assertEqual(data['from'], self.s1.sid)
+        self.assertEqual(data['to'], self.s2.sid)
+        self.assertListEqual([(c['type'], c['path']) for c in data['changes']],
+                             [('metadata', '/a/meta'), ('modified', '/a/mod')])
+        self.assertEqual(data['summary']['modified'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
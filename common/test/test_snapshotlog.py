@@ -0,0 +1,301 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import bz2
+import gzip
+import time
+import unittest
+from unittest.mock import patch
+from io import StringIO
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import snapshots
+import snapshotlog
+import cli
+
+LOG = ['========== Take snapshot (profile 1): Sat 19 Dec 2015 ==========',
+       '[I] ...',
+       '[C] cf...p..... foo',
+       '[E] Error: rsync: failed',
+       '[I] Take snapshot (rsync: bar)',
+       '[C] >f+++++++++ bar']
+
+class DummyDecode(object):
+    """
+    replace 'foo' and 'bar' with upper case and count calls
+    """
+    def __init__(self):
+        self.batches = []
+
+    def log_many(self, lines):
+        self.batches.append(len(lines))
+        return [line.replace('foo', 'FOO').replace('bar', 'BAR') for line in lines]
+
+class TestSnapshotLog(generic.TestCase):
+    def test_filterLines(self):
+        self.assertListEqual(list(snapshotlog.filterLines(LOG, snapshotlog.ALL)), LOG)
+        self.assertListEqual(list(snapshotlog.filterLines(LOG, snapshotlog.ERRORS)),
+                             [LOG[0], LOG[3]])
+        self.assertListEqual(list(snapshotlog.filterLines(LOG, snapshotlog.CHANGES)),
+                             [LOG[0], LOG[2], LOG[5]])
+        self.assertListEqual(list(snapshotlog.filterLines(LOG, snapshotlog.INFORMATION)),
+                             [LOG[0], LOG[1], LOG[4]])
+        self.assertListEqual(list(snapshotlog.filterLines(LOG, snapshotlog.ERRORS_CHANGES)),
+                             [LOG[0], LOG[2], LOG[3], LOG[5]])
+
+    def test_decodeLines_batches(self):
+        decode = DummyDecode()
+        ret = list(snapshotlog.decodeLines(LOG, decode, batchSize = 4))
+        self.assertListEqual(decode.batches, [4, 2])
+        self.assertEqual(ret[2], '[C] cf...p..... FOO')
+        self.assertEqual(ret[5], '[C] >f+++++++++ BAR')
+
+    def test_pipeline(self):
+        lines = [line + '\n' for line in LOG]
+        self.assertEqual(''.join(snapshotlog.pipeline(lines)), ''.join(lines))
+
+        ret = ''.join(snapshotlog.pipeline(lines,
+                                           snapshotlog.CHANGES,
+                                           DummyDecode(),
+                                           header = 'HEADER\n'))
+        self.assertEqual(ret, 'HEADER\n' + LOG[0] + '\n'
+                              '[C] cf...p..... FOO\n'
+                              '[C] >f+++++++++ BAR\n')
+
+    def test_pipeline_is_lazy(self):
+        def lines():
+            yield '[E] foo\n'
+            raise AssertionError('read too far')
+        gen = snapshotlog.pipeline(lines(), snapshotlog.ERRORS)
+        self.assertEqual(next(gen), '[E] foo\n')
+        gen.close()
+
+class TestTakeSnapshotLog(generic.TestCase):
+    def setUp(self):
+        super(TestTakeSnapshotLog, self).setUp()
+        self.cfgFile = os.path.abspath(os.path.join(__file__, os.pardir, 'config'))
+        self.cfg = config.Config(self.cfgFile)
+        self.sn = snapshots.Snapshots(self.cfg)
+        self.logFile = self.cfg.get_take_snapshot_log_file()
+        with open(self.logFile, 'wt') as f:
+            f.write('\n'.join(LOG) + '\n')
+
+    def tearDown(self):
+        super(TestTakeSnapshotLog, self).tearDown()
+        os.remove(self.logFile)
+
+    def test_get_take_snapshot_log(self):
+        self.assertEqual(self.sn.get_take_snapshot_log(), '\n'.join(LOG) + '\n')
+        self.assertEqual(self.sn.get_take_snapshot_log(snapshotlog.ERRORS),
+                         '\n'.join((LOG[0], LOG[3])) + '\n')
+
+    def test_iter_take_snapshot_log(self):
+        ret = list(self.sn.iter_take_snapshot_log(snapshotlog.ERRORS_CHANGES))
+        self.assertListEqual(ret, [LOG[i] + '\n' for i in (0, 2, 3, 5)])
+
+    def test_iter_take_snapshot_log_missing(self):
+        os.remove(self.logFile)
+        ret = list(self.sn.iter_take_snapshot_log())
+        self.assertEqual(len(ret), 1)
+        self.assertRegex(ret[0], r'^Failed to get take_snapshot log from')
+        #recreate for tearDown
+        open(self.logFile, 'wt').close()
+
+    def test_append_to_take_snapshot_log(self):
+        self.sn.append_to_take_snapshot_log('[C] >f+++++++++ baz', 2)
+        #buffered but read transparently
+        self.assertEqual(self.sn.get_take_snapshot_log(snapshotlog.CHANGES),
+                         '\n'.join((LOG[0], LOG[2], LOG[5], '[C] >f+++++++++ baz')) + '\n')
+        self.sn.close_take_snapshot_log()
+
+    def test_cli_log(self):
+        out = StringIO()
+        self.assertTrue(cli.log(self.cfg, mode = snapshotlog.CHANGES, start = 1, out = out))
+        self.assertEqual(out.getvalue(), '\n'.join((LOG[2], LOG[5])) + '\n')
+
+class TestLogWriter(generic.TestCase):
+    def setUp(self):
+        super(TestLogWriter, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.logFile = os.path.join(self.tmpDir.name, 'takesnapshot_.log')
+
+    def tearDown(self):
+        super(TestLogWriter, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def read(self):
+        return ''.join(snapshotlog.readLog(self.logFile))
+
+    def test_buffer(self):
+        writer = snapshotlog.LogWriter(self.logFile, flushInterval = 60)
+        writer.write(LOG[1])
+        self.assertFalse(os.path.exists(self.logFile))
+        writer.write(LOG[3], flush = True)
+        self.assertEqual(self.read(), LOG[1] + '\n' + LOG[3] + '\n')
+        writer.write(LOG[5])
+        writer.close()
+        self.assertEqual(self.read(), '\n'.join((LOG[1], LOG[3], LOG[5])) + '\n')
+
+    def test_buffer_size(self):
+        writer = snapshotlog.LogWriter(self.logFile, bufferSize = 20, flushInterval = 60)
+        writer.write(LOG[1])
+        self.assertFalse(os.path.exists(self.logFile))
+        writer.write(LOG[2])
+        self.assertTrue(os.path.exists(self.logFile))
+        writer.close()
+
+    def test_flush_interval(self):
+        writer = snapshotlog.LogWriter(self.logFile, flushInterval = 0.05)
+        writer.write(LOG[1])
+        for i in range(100):
+            if os.path.exists(self.logFile):
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.read(), LOG[1] + '\n')
+        writer.close()
+
+    def test_rotate(self):
+        writer = snapshotlog.LogWriter(self.logFile, maxSize = 50)
+        for line in LOG:
+            writer.write(line, flush = True)
+        writer.close()
+        self.assertTrue(os.path.exists(self.logFile + '.1'))
+        self.assertLessEqual(os.path.getsize(self.logFile), 50)
+        self.assertEqual(self.read(), '\n'.join(LOG) + '\n')
+
+    def test_compress(self):
+        writer = snapshotlog.LogWriter(self.logFile, compress = True)
+        for line in LOG:
+            writer.write(line)
+        writer.close()
+        self.assertTrue(snapshotlog.isCompressed(self.logFile))
+        with gzip.open(self.logFile, 'rt') as f:
+            self.assertEqual(f.read(), '\n'.join(LOG) + '\n')
+        self.assertEqual(self.read(), '\n'.join(LOG) + '\n')
+
+    def test_compress_changed(self):
+        with open(self.logFile, 'wt') as f:
+            f.write(LOG[0] + '\n')
+        writer = snapshotlog.LogWriter(self.logFile, compress = True)
+        writer.write(LOG[1])
+        writer.close()
+        self.assertFalse(snapshotlog.isCompressed(self.logFile + '.1'))
+        self.assertTrue(snapshotlog.isCompressed(self.logFile))
+        self.assertEqual(self.read(), LOG[0] + '\n' + LOG[1] + '\n')
+
+    def test_clear(self):
+        writer = snapshotlog.LogWriter(self.logFile, maxSize = 50)
+        for line in LOG:
+            writer.write(line, flush = True)
+        writer.write('foo')
+        writer.clear()
+        writer.close()
+        self.assertListEqual(snapshotlog.logFiles(self.logFile), [])
+        with self.assertRaises(FileNotFoundError):
+            snapshotlog.readLog(self.logFile)
+
+class TestLogIndex(generic.TestCase):
+    def setUp(self):
+        super(TestLogIndex, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.logFile = os.path.join(self.tmpDir.name, 'takesnapshot.log.bz2')
+        #one block with errors, one with changes only
+        self.data = ('\n'.join(LOG) + '\n' + '[C] >f+++++++++ baz\n' * 100).encode()
+
+    def tearDown(self):
+        super(TestLogIndex, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def test_countLevels(self):
+        self.assertListEqual(snapshotlog.countLevels(('\n'.join(LOG) + '\n[X] foo\n[').encode()),
+                             [1, 2, 2, 1, 2])
+
+    def test_splitBlocks(self):
+        data = b'aaa\nbbb\nccc'
+        self.assertListEqual(list(snapshotlog.splitBlocks(data, 2)), [b'aaa\n', b'bbb\n', b'ccc'])
+        self.assertListEqual(list(snapshotlog.splitBlocks(data, 5)), [b'aaa\nbbb\n', b'ccc'])
+        self.assertEqual(b''.join(snapshotlog.splitBlocks(self.data, 64)), self.data)
+
+    def writeBlocks(self):
+        with patch.object(snapshotlog, 'BLOCK_SIZE', 200):
+            snapshotlog.writeBlocks(self.logFile, self.data, bz2.compress)
+
+    def test_writeBlocks(self):
+        self.writeBlocks()
+        index = snapshotlog.loadIndex(self.logFile)
+        self.assertGreater(len(index), 2)
+        self.assertEqual(sum(length for offset, length, counts in index), os.path.getsize(self.logFile))
+        #still one valid bz2 file
+        with bz2.open(self.logFile, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_readLevel(self):
+        self.writeBlocks()
+        for mode in (snapshotlog.ALL, snapshotlog.ERRORS, snapshotlog.CHANGES,
+                     snapshotlog.INFORMATION, snapshotlog.ERRORS_CHANGES):
+            with self.subTest(mode = mode):
+                expected = list(snapshotlog.filterLines(self.data.decode().splitlines(True), mode))
+                self.assertListEqual(list(snapshotlog.readLevel(self.logFile, mode)), expected)
+                self.assertListEqual(list(snapshotlog.readLevel(self.logFile, mode, 3, 4)), expected[3:7])
+
+    def test_readLevel_skip_blocks(self):
+        self.writeBlocks()
+        with patch.object(snapshotlog, '_readBlock', wraps = snapshotlog._readBlock) as readBlock:
+            self.assertListEqual(list(snapshotlog.readLevel(self.logFile, snapshotlog.ERRORS)),
+                                 [LOG[0] + '\n', LOG[3] + '\n'])
+            self.assertEqual(readBlock.call_count, 1)
+            readBlock.reset_mock()
+            self.assertListEqual(list(snapshotlog.readLevel(self.logFile, snapshotlog.CHANGES, 100, 2)),
+                                 ['[C] >f+++++++++ baz\n'] * 2)
+            self.assertEqual(readBlock.call_count, 1)
+
+    def test_readLevel_without_index(self):
+        self.writeBlocks()
+        os.remove(snapshotlog.indexFile(self.logFile))
+        self.assertIsNone(snapshotlog.loadIndex(self.logFile))
+        self.assertListEqual(list(snapshotlog.readLevel(self.logFile, snapshotlog.ERRORS)),
+                             [LOG[0] + '\n', LOG[3] + '\n'])
+
+    def test_stale_index(self):
+        self.writeBlocks()
+        with open(self.logFile, 'ab') as f:
+            f.write(bz2.compress(b'[E] new\n'))
+        self.assertIsNone(snapshotlog.loadIndex(self.logFile))
+        self.assertListEqual(list(snapshotlog.readLevel(self.logFile, snapshotlog.ERRORS)),
+                             [LOG[0] + '\n', LOG[3] + '\n', '[E] new\n'])
+
+    def test_writer_index(self):
+        logFile = os.path.join(self.tmpDir.name, 'takesnapshot_.log')
+        for compress in (False, True):
+            with self.subTest(compress = compress):
+                writer = snapshotlog.LogWriter(logFile, maxSize = 200, compress = compress)
+                writer.clear()
+                for line in LOG:
+                    writer.write(line, flush = True)
+                writer.close()
+                for part in snapshotlog.logFiles(logFile):
+                    self.assertIsNotNone(snapshotlog.loadIndex(part))
+                self.assertListEqual(list(snapshotlog.readLevel(logFile, snapshotlog.ERRORS)),
+                                     [LOG[0] + '\n', LOG[3] + '\n'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,9 +16,11 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import os
+import re
 import sys
 import tempfile
 import unittest
+from unittest.mock import patch
 import shutil
 import stat
 import pwd
@@ -32,6 +34,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import config
 import configfile
 import snapshots
+import tools
+import snapshotlog
 
 CURRENTUID = os.geteuid()
 CURRENTUSER = pwd.getpwuid(CURRENTUID).pw_name
@@ -257,6 +261,29 @@ class TestSnapshots(GenericSnapshotsTestCase):
                                  r'--include="/baz/1/2" '   +
                                  r'--exclude="\*" / $')
 
+    ############################################################################
+    ###                         _execute_script                              ###
+    ############################################################################
+    def test_execute_script(self):
+        target = os.path.join(self.tmpDir.name, 'foo bar')
+        script  = 'mkdir "%s"\n' % target
+        script += 'touch "%s/baz"\n' % target
+        self.assertEqual(self.sn._execute_script(script), 0)
+        self.assertTrue(os.path.isfile(os.path.join(target, 'baz')))
+
+    def test_execute_script_returncode(self):
+        self.assertEqual(self.sn._execute_script('true\nexit 3\n'), 3)
+
+    def test_remove_snapshot(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        sid.makeDirs('foo')
+        with open(sid.pathBackup('foo', 'bar'), 'wt') as f:
+            f.write('bar')
+        os.chmod(sid.pathBackup('foo'), stat.S_IRUSR | stat.S_IXUSR)
+        self.assertTrue(sid.exists())
+        self.sn.remove_snapshot(sid)
+        self.assertFalse(os.path.exists(sid.path()))
+
 class TestRestore(GenericSnapshotsTestCase):
     def setUp(self):
         super(TestRestore, self).setUp()
@@ -414,6 +441,128 @@ class TestRestorePathInfo(GenericSnapshotsTestCase):
         self.assertEqual(s.st_uid, CURRENTUID)
         self.assertEqual(s.st_gid, CURRENTGID)
 
+class TestRestore(GenericSnapshotsTestCase):
+    def setUp(self):
+        super(TestRestore, self).setUp()
+        self.sn = snapshots.Snapshots(self.cfg)
+        self.sid = snapshots.SID('20151219-010324-123', self.cfg)
+        self.dest = TemporaryDirectory()
+        self.backup = os.path.join(self.tmpDir.name, 'foo')
+        for item in ('bar/file1', 'bar/file 2', 'baz/file3'):
+            path = self.sid.pathBackup(self.backup, item)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            with open(path, 'wt') as f:
+                f.write(item)
+
+    def tearDown(self):
+        super(TestRestore, self).tearDown()
+        self.dest.cleanup()
+
+    def execute(self, cmd, callback = None, *args, **kwargs):
+        m = re.search(r'--files-from="(.*?)"', cmd)
+        with open(m.group(1), 'rb') as f:
+            self.filesFrom.append(f.read().split(b'\0')[:-1])
+        self.cmds.append(cmd)
+
+    def test_one_rsync_per_group(self):
+        self.cmds, self.filesFrom = [], []
+        self.sn._execute = self.execute
+        paths = [os.path.join(self.backup, 'bar/file1'),
+                 os.path.join(self.backup, 'bar/file 2'),
+                 os.path.join(self.backup, 'baz/file3')]
+        self.sn.restore(self.sid, paths, lambda x: None, self.dest.name)
+        self.assertEqual(len(self.cmds), 2)
+        self.assertListEqual(self.filesFrom, [[b'file1', b'file 2'], [b'file3']])
+        self.assertIn('%s/." "%s/"' %(self.sid.pathBackup(self.backup, 'bar'), self.dest.name),
+                      self.cmds[0])
+
+    def test_one_rsync_without_restore_to(self):
+        self.cmds, self.filesFrom = [], []
+        self.sn._execute = self.execute
+        paths = [os.path.join(self.backup, 'bar'),
+                 os.path.join(self.backup, 'baz/file3')]
+        self.sn.restore(self.sid, paths, lambda x: None)
+        self.assertEqual(len(self.cmds), 1)
+        self.assertListEqual(self.filesFrom, [[p.lstrip('/').encode() for p in paths]])
+        self.assertIn('%s/." "/"' % self.sid.pathBackup(), self.cmds[0])
+
+    @unittest.skipUnless(tools.check_command('rsync'), 'rsync is not installed')
+    def test_restore(self):
+        paths = [os.path.join(self.backup, 'bar'),
+                 os.path.join(self.backup, 'baz/file3')]
+        self.sn.restore(self.sid, paths, lambda x: None, self.dest.name)
+        for item in ('bar/file1', 'bar/file 2', 'file3'):
+            self.assertTrue(os.path.isfile(os.path.join(self.dest.name, item)), item)
+
+class TestRestorePermissions(GenericSnapshotsTestCase):
+    def setUp(self):
+        super(TestRestorePermissions, self).setUp()
+        self.sn = snapshots.Snapshots(self.cfg)
+        self.sn.restore_permission_failed = False
+        self.sid = snapshots.SID('20151219-010324-123', self.cfg)
+        self.dest = TemporaryDirectory()
+
+        #backup of /foo/src/... and the same items restored to self.dest
+        self.items = {'src':                 (stat.S_IFDIR | 0o700, True),
+                      'src/sub':             (stat.S_IFDIR | 0o500, True),
+                      'src/sub/deep':        (stat.S_IFDIR | 0o700, True),
+                      'src/sub/deep/file':   (stat.S_IFREG | 0o600, False),
+                      'src/file':            (stat.S_IFREG | 0o640, False)}
+        self.fileInfo = snapshots.FileInfoDict()
+        for item in sorted(self.items):
+            mode, isDir = self.items[item]
+            for path in (self.sid.pathBackup('foo', item), os.path.join(self.dest.name, item)):
+                if isDir:
+                    os.makedirs(path)
+                else:
+                    with open(path, 'wt') as f:
+                        pass
+            self.fileInfo[os.path.join(b'/foo', item.encode())] = \
+                (mode, CURRENTUSER.encode(), CURRENTGROUP.encode())
+
+    def tearDown(self):
+        super(TestRestorePermissions, self).tearDown()
+        for root, dirs, files in os.walk(self.dest.name):
+            for d in dirs:
+                os.chmod(os.path.join(root, d), 0o700)
+        self.dest.cleanup()
+
+    def test_restore(self):
+        msgs = []
+        engine = snapshots.restorepermissions.RestorePermissions(self.sn, self.fileInfo, msgs.append,
+                                                                 threads = 2, chunkSize = 1)
+        engine.add(self.sid, '/foo/src', self.dest.name, len('/foo'))
+        engine.run()
+        self.assertFalse(self.sn.restore_permission_failed)
+
+        for item, (mode, isDir) in self.items.items():
+            path = os.path.join(self.dest.name, item)
+            #'src/sub' is not traversable before its children are done
+            os.chmod(os.path.dirname(path), 0o700)
+            self.assertEqual(os.stat(path).st_mode, mode, item)
+        self.assertEqual(len(engine.files), 2)
+        self.assertEqual(len(engine.dirs), 3)
+        self.assertListEqual(list(engine.timings), ['scan', 'compare', 'files', 'folders'])
+        for msg in msgs:
+            self.assertRegex(msg, r'^chmod ')
+
+    def test_no_changes(self):
+        for item, (mode, isDir) in self.items.items():
+            os.chmod(os.path.join(self.dest.name, item), mode)
+        msgs = []
+        engine = snapshots.restorepermissions.RestorePermissions(self.sn, self.fileInfo, msgs.append)
+        engine.add(self.sid, '/foo/src', self.dest.name, len('/foo'))
+        engine.run()
+        self.assertListEqual(msgs, [])
+
+    def test_missing_in_fileinfo(self):
+        del self.fileInfo[b'/foo/src/file']
+        mode = os.stat(os.path.join(self.dest.name, 'src/file')).st_mode
+        engine = snapshots.restorepermissions.RestorePermissions(self.sn, self.fileInfo)
+        engine.add(self.sid, '/foo/src', self.dest.name, len('/foo'))
+        engine.run()
+        self.assertEqual(os.stat(os.path.join(self.dest.name, 'src/file')).st_mode, mode)
+
 class TestDelete(GenericSnapshotsTestCase):
     def setUp(self):
         super(TestDelete, self).setUp()
@@ -742,6 +891,16 @@ class TestSID(GenericSnapshotsTestCase):
 
         self.assertEqual(sid.log(), 'foo bar\nbaz')
 
+    def test_iterLog_page(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
+        sid.setLog('[I] foo\n[E] bar\n[C] baz\n[E] qux\n')
+        self.assertTrue(os.path.isfile(os.path.join(self.snapshotPath,
+                                                    '20151219-010324-123',
+                                                    'takesnapshot.log.bz2.idx')))
+        self.assertListEqual(list(sid.iterLog(snapshotlog.ERRORS)), ['[E] bar\n', '[E] qux\n'])
+        self.assertListEqual(list(sid.iterLog(snapshotlog.ERRORS, start = 1, count = 1)), ['[E] qux\n'])
+
     def test_makeWriteable(self):
         sid = snapshots.SID('20151219-010324-123', self.cfg)
         os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
@@ -884,5 +1043,73 @@ class TestIterSnapshots(GenericSnapshotsTestCase):
         self.assertEqual(snapshots.lastSnapshot(self.cfg),
                          '20151219-040324-123')
 
+class TestSnapshotView(GenericSnapshotsTestCase):
+    def setUp(self):
+        super(TestSnapshotView, self).setUp()
+        snapshots.SnapshotView.clearCache()
+        self.sn = snapshots.Snapshots(self.cfg)
+        self.sid = snapshots.SID('20151219-010324-123', self.cfg)
+        for item in ('foo/bar/file1', 'foo/file 2', 'foo/baz/sub/file3'):
+            path = self.sid.pathBackup(item)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            with open(path, 'wt') as f:
+                f.write(item)
+            os.chmod(path, 0o400)
+        os.symlink('bar/file1', self.sid.pathBackup('foo/link'))
+
+        d = snapshots.FileInfoDict()
+        d[b'/foo/bar'] = (stat.S_IFDIR | 0o750, b'nobodyBIT', b'nogroupBIT')
+        d[b'/foo/file 2'] = (stat.S_IFREG | 0o644, b'root', b'root')
+        self.sid.fileInfo = d
+
+    def tearDown(self):
+        super(TestSnapshotView, self).tearDown()
+        snapshots.SnapshotView.clearCache()
+
+    def check(self, view):
+        entries = {e.name: e for e in view.listdir('/foo/')}
+        self.assertListEqual(sorted(entries), ['bar', 'baz', 'file 2', 'link'])
+        self.assertEqual(entries['bar'].mode, stat.S_IFDIR | 0o750)
+        self.assertEqual(entries['bar'].user, 'nobodyBIT')
+        self.assertEqual(entries['file 2'].mode, stat.S_IFREG | 0o644)
+        self.assertEqual(entries['file 2'].size, 10)
+        self.assertEqual(entries['link'].target, 'bar/file1')
+        self.assertTrue(stat.S_ISLNK(entries['link'].mode))
+        self.assertEqual(view.stat('/foo/bar/file1').mode, stat.S_IFREG | 0o400)
+        self.assertIsNone(view.stat('/foo/nonexistent'))
+
+    def test_local(self):
+        view = snapshots.SnapshotView(self.sn, self.sid)
+        self.check(view)
+        with self.assertRaises(OSError):
+            view.listdir('/nonexistent')
+
+    def test_cache(self):
+        view = snapshots.SnapshotView(self.sn, self.sid)
+        view.listdir('/foo')
+        with patch('os.scandir', side_effect = OSError):
+            self.assertEqual(len(view.listdir('/foo')), 4)
+            snapshots.SnapshotView.clearCache()
+            with self.assertRaises(OSError):
+                view.listdir('/foo')
+
+    @unittest.skipUnless(tools.check_command('find'), 'find is not installed')
+    def test_remote(self):
+        #run the 'remote' find locally
+        path = self.cfg.get_snapshots_full_path()
+        with patch.object(self.cfg, 'get_snapshots_mode', return_value = 'ssh'), \
+             patch.object(self.cfg, 'get_snapshots_full_path', return_value = path), \
+             patch.object(self.cfg, 'get_snapshots_full_path_ssh', return_value = path), \
+             patch.object(self.sn, 'cmd_ssh', return_value = ['sh', '-s']):
+            view = snapshots.SnapshotView(self.sn, self.sid)
+            self.assertTrue(view.remote)
+            self.check(view)
+            #sub-folders were listed with the parent folder
+            with patch('subprocess.Popen', side_effect = OSError):
+                self.assertListEqual([e.name for e in view.listdir('/foo/baz')], ['sub'])
+            self.assertListEqual([e.name for e in view.listdir('/foo/baz/sub')], ['file3'])
+            with self.assertRaises(OSError):
+                view.listdir('/nonexistent')
+
 if __name__ == '__main__':
     unittest.main()
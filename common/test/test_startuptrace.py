@@ -0,0 +1,151 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import re
+import sys
+import subprocess
+import unittest
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import startuptrace
+
+BACKINTIME = os.path.join(os.path.dirname(__file__), '..', 'backintime.py')
+
+#query commands are fired by cron and scripts very often. They must not
+#pull in modules which are only needed for backups, the GUI or desktop
+#integration.
+STARTUP_BUDGET_MS = 1000
+FORBIDDEN_MODULES = ('dbus', 'keyring', 'cli', 'export', 'snapshotdiff',
+                     'cProfile', 'pstats', 'distutils', 'PyQt4')
+
+#run backintime.py and print all imported modules on stderr afterwards
+RUNNER = '''
+import sys, runpy
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name = '__main__')
+finally:
+    print('MODULES: %s' % ' '.join(sorted(sys.modules)), file = sys.stderr)
+'''
+
+class TestImportTracer(generic.TestCase):
+    def setUp(self):
+        super(TestImportTracer, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        with open(os.path.join(self.tmpDir.name, 'bit_trace_outer.py'), 'wt') as f:
+            f.write('import time\ntime.sleep(0.01)\nimport bit_trace_inner\n')
+        with open(os.path.join(self.tmpDir.name, 'bit_trace_inner.py'), 'wt') as f:
+            f.write('import time\ntime.sleep(0.02)\n')
+        sys.path.insert(0, self.tmpDir.name)
+        self.tracer = startuptrace.ImportTracer()
+        self.tracer.install()
+
+    def tearDown(self):
+        self.tracer.uninstall()
+        sys.path.remove(self.tmpDir.name)
+        for mod in ('bit_trace_outer', 'bit_trace_inner'):
+            sys.modules.pop(mod, None)
+        self.tmpDir.cleanup()
+
+    def test_imports(self):
+        import bit_trace_outer
+        imports = {name: (duration, own, depth) for name, duration, own, depth in self.tracer.imports}
+        self.assertIn('bit_trace_outer', imports)
+        self.assertIn('bit_trace_inner', imports)
+
+        outer, inner = imports['bit_trace_outer'], imports['bit_trace_inner']
+        self.assertEqual(outer[2], 0)
+        self.assertEqual(inner[2], 1)
+        self.assertGreaterEqual(inner[0], 0.02)
+        self.assertGreaterEqual(outer[0], inner[0] + 0.01)
+        self.assertLess(outer[1], outer[0] - inner[0] + 0.005)
+
+        #loader is not wrapped after the import
+        self.assertNotIsInstance(bit_trace_outer.__loader__, startuptrace._TimedLoader)
+        self.assertNotIsInstance(bit_trace_outer.__spec__.loader, startuptrace._TimedLoader)
+
+    def test_report(self):
+        import bit_trace_outer
+        self.tracer.mark('foo')
+        report = '\n'.join(self.tracer.report())
+        self.assertIn('foo', report)
+        self.assertIn('bit_trace_outer', report)
+        self.assertRegex(report, r'Imported \d+ modules')
+
+    def test_enabled(self):
+        self.assertTrue(startuptrace.enabled(['backintime', '--startup-trace', 'last-snapshot']))
+        self.assertFalse(startuptrace.enabled(['backintime', 'last-snapshot']))
+
+class TestStartupBudget(generic.TestCase):
+    def setUp(self):
+        super(TestStartupBudget, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfgFile = os.path.join(self.tmpDir.name, 'config')
+        snapshotsPath = os.path.join(self.tmpDir.name, 'snapshots')
+        os.makedirs(os.path.join(snapshotsPath, 'backintime', 'test-host', 'test-user', '1'))
+        with open(self.cfgFile, 'wt') as f:
+            f.write('config.version=5\n'
+                    'profile1.snapshots.include.1.type=0\n'
+                    'profile1.snapshots.include.1.value=%s\n'
+                    'profile1.snapshots.include.size=1\n'
+                    'profile1.snapshots.path=%s\n'
+                    'profile1.snapshots.path.host=test-host\n'
+                    'profile1.snapshots.path.profile=1\n'
+                    'profile1.snapshots.path.user=test-user\n'
+                    %(self.tmpDir.name, snapshotsPath))
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def run_command(self, *args):
+        cmd = [sys.executable, '-c', RUNNER, BACKINTIME,
+               '--config', self.cfgFile, '--startup-trace', '--quiet'] + list(args)
+        proc = subprocess.Popen(cmd,
+                                stdout = subprocess.PIPE,
+                                stderr = subprocess.PIPE,
+                                universal_newlines = True)
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err)
+        m = re.search(r'^MODULES: (.*)$', err, re.MULTILINE)
+        self.assertTrue(m, err)
+        modules = m.group(1).split()
+        m = re.search(r'Imported \d+ modules in ([\d\.]+) ms', err)
+        self.assertTrue(m, err)
+        return modules, float(m.group(1)), err
+
+    def assertBudget(self, *args):
+        modules, importTime, err = self.run_command(*args)
+        for mod in FORBIDDEN_MODULES:
+            self.assertNotIn(mod, modules, err)
+        self.assertLess(importTime, STARTUP_BUDGET_MS, err)
+        return modules
+
+    def test_last_snapshot(self):
+        self.assertBudget('last-snapshot')
+
+    def test_snapshots_list(self):
+        self.assertBudget('snapshots-list')
+
+    def test_snapshots_path(self):
+        modules = self.assertBudget('snapshots-path')
+        self.assertNotIn('snapshots', modules)
+
+if __name__ == '__main__':
+    unittest.main()
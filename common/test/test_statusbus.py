@@ -0,0 +1,167 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import json
+import time
+import threading
+import unittest
+from io import StringIO
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import statusbus
+import cli
+
+class TestStatusBus(generic.TestCase):
+    def setUp(self):
+        super(TestStatusBus, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.cfg._LOCAL_DATA_FOLDER = self.tmpDir.name
+        self.bus = statusbus.StatusBus(self.cfg)
+
+    def tearDown(self):
+        super(TestStatusBus, self).tearDown()
+        self.bus.stop()
+        self.tmpDir.cleanup()
+
+    def waitForSubscribers(self, count):
+        for i in range(50):
+            if self.bus.subscribers >= count:
+                return
+            time.sleep(0.05)
+        self.fail('subscriber did not connect')
+
+    def test_no_backup_running(self):
+        client = statusbus.StatusClient(self.cfg)
+        self.assertFalse(client.connect())
+        self.assertListEqual(list(client.events()), [])
+
+    def test_publish(self):
+        self.assertTrue(self.bus.start())
+        client = statusbus.StatusClient(self.cfg)
+        self.assertTrue(client.connect())
+        self.waitForSubscribers(1)
+        self.bus.publish(statusbus.PHASE, phase = statusbus.PHASE_TRANSFER)
+        self.bus.publish(statusbus.PROGRESS, percent = 26, sent = '517.38K',
+                         speed = '14.46MB/s', eta = '0:02:36')
+        events = client.events()
+        event = next(events)
+        self.assertEqual(event['event'], statusbus.PHASE)
+        self.assertEqual(event['phase'], statusbus.PHASE_TRANSFER)
+        event = next(events)
+        self.assertEqual(event['event'], statusbus.PROGRESS)
+        self.assertEqual(event['percent'], 26)
+        self.assertEqual(event['eta'], '0:02:36')
+        client.close()
+
+    def test_late_subscriber(self):
+        self.assertTrue(self.bus.start())
+        self.bus.publish(statusbus.MESSAGE, type = 0, message = 'first', timeout = -1)
+        self.bus.publish(statusbus.MESSAGE, type = 0, message = 'second', timeout = -1)
+        self.bus.publish(statusbus.PHASE, phase = statusbus.PHASE_PREPARE)
+        client = statusbus.StatusClient(self.cfg)
+        self.assertTrue(client.connect())
+        events = client.events()
+        #only the latest event of each type
+        self.assertEqual(next(events)['message'], 'second')
+        self.assertEqual(next(events)['phase'], statusbus.PHASE_PREPARE)
+        client.close()
+
+    def test_stalled_subscriber(self):
+        self.assertTrue(self.bus.start())
+        stalled = statusbus.StatusClient(self.cfg)
+        self.assertTrue(stalled.connect())
+        self.waitForSubscribers(1)
+        client = statusbus.StatusClient(self.cfg)
+        self.assertTrue(client.connect())
+        self.waitForSubscribers(2)
+        #sockets are non-blocking
+        self.assertListEqual([conn.gettimeout() for conn in self.bus.clients], [0.0, 0.0])
+        events = client.events()
+        #stalled subscriber never reads so its send buffer runs full
+        start = time.time()
+        for i in range(1000):
+            self.bus.publish(statusbus.MESSAGE, type = 0, message = 'x' * 10000, timeout = -1)
+            self.assertEqual(next(events)['event'], statusbus.MESSAGE)
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(self.bus.subscribers, 1)
+        stalled.close()
+        client.close()
+
+    def test_stop(self):
+        self.assertTrue(self.bus.start())
+        filename = self.cfg.get_take_snapshot_socket_file()
+        self.assertTrue(os.path.exists(filename))
+        client = statusbus.StatusClient(self.cfg)
+        self.assertTrue(client.connect())
+        self.waitForSubscribers(1)
+        self.bus.publish(statusbus.FINISH, success = True, error = False)
+        self.bus.stop()
+        self.assertFalse(os.path.exists(filename))
+        events = [e['event'] for e in client.events()]
+        self.assertListEqual(events, [statusbus.FINISH])
+        client.close()
+
+    def test_stale_socket(self):
+        self.assertTrue(self.bus.start())
+        #second process must not steal the bus
+        self.assertFalse(statusbus.StatusBus(self.cfg).start())
+        self.bus.stop()
+        #left over socket from a crashed process
+        open(self.cfg.get_take_snapshot_socket_file(), 'w').close()
+        self.assertTrue(self.bus.start())
+
+    def test_cli_watch(self):
+        self.assertTrue(self.bus.start())
+        out = StringIO()
+        t = threading.Thread(target = lambda: setattr(self, 'ret', cli.watch(self.cfg, out = out)))
+        t.start()
+        self.waitForSubscribers(1)
+        self.bus.publish(statusbus.PHASE, phase = statusbus.PHASE_TRANSFER)
+        self.bus.publish(statusbus.PROGRESS, percent = 26, sent = '517.38K',
+                         speed = '14.46MB/s', eta = '0:02:36')
+        self.bus.publish(statusbus.FINISH, success = True, error = False,
+                         snapshot = '20151219-010000-123')
+        t.join(10)
+        self.assertFalse(t.is_alive())
+        self.assertTrue(self.ret)
+        self.assertListEqual(out.getvalue().splitlines(),
+                             ['== transfer ==',
+                              ' 26% | Sent: 517.38K | Speed: 14.46MB/s | ETA: 0:02:36',
+                              'New snapshot: 20151219-010000-123'])
+
+    def test_cli_watch_json_error(self):
+        self.assertTrue(self.bus.start())
+        self.bus.publish(statusbus.FINISH, success = False, error = True)
+        out = StringIO()
+        self.assertFalse(cli.watch(self.cfg, json = True, out = out))
+        event = json.loads(out.getvalue())
+        self.assertEqual(event['event'], statusbus.FINISH)
+        self.assertTrue(event['error'])
+
+    def test_cli_watch_not_running(self):
+        out = StringIO()
+        self.assertTrue(cli.watch(self.cfg, out = out))
+        self.assertIn('No backup is running', out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,7 @@ import subprocess
 import random
 import gzip
 import stat
+from unittest.mock import patch
 from copy import deepcopy
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 from datetime import datetime
@@ -438,6 +439,11 @@ class TestTools(generic.TestCase):
         self.assertRegex(tools.get_filesystem('/nonExistingFolder/foo/bar').lower(),
                          r'(:?ext[2-4]|xfs|zfs|jfs|raiserfs|btrfs)')
 
+    def test_stable_inodes(self):
+        self.assertTrue(tools.stable_inodes('/nonExistingFolder/foo/bar'))
+        with patch('tools.get_filesystem', return_value = 'fuse.sshfs'):
+            self.assertFalse(tools.stable_inodes('/foo'))
+
     # tools.get_uuid() get called from tools.get_uuid_from_path.
     # So we skip an extra unittest as it's hard to find a dev on all systems
     @unittest.skipIf(not DISK_BY_UUID_AVAILABLE and not UDEVADM_HAS_UUID,
@@ -565,35 +571,85 @@ class TestTools(generic.TestCase):
         if oldCrontab:
             self.assertListEqual(oldCrontab, tools.readCrontab())
 
-    def test_splitCommands(self):
-        ret = list(tools.splitCommands(['echo foo;'],
-                                       head = 'echo start;',
-                                       tail = 'echo end',
-                                       maxLength = 40))
-        self.assertEqual(len(ret), 1)
-        self.assertEqual(ret[0], 'echo start;echo foo;echo end')
-
-        ret = list(tools.splitCommands(['echo foo;']*3,
-                                       head = 'echo start;',
-                                       tail = 'echo end',
-                                       maxLength = 40))
-        self.assertEqual(len(ret), 2)
-        self.assertEqual(ret[0], 'echo start;echo foo;echo foo;echo end')
-        self.assertEqual(ret[1], 'echo start;echo foo;echo end')
-
-        ret = list(tools.splitCommands(['echo foo;']*3,
-                                       head = 'echo start;',
-                                       tail = 'echo end',
-                                       maxLength = 0))
-        self.assertEqual(len(ret), 1)
-        self.assertEqual(ret[0], 'echo start;echo foo;echo foo;echo foo;echo end')
-
-        ret = list(tools.splitCommands(['echo foo;']*3,
-                                       head = 'echo start;',
-                                       tail = 'echo end',
-                                       maxLength = -10))
-        self.assertEqual(len(ret), 1)
-        self.assertEqual(ret[0], 'echo start;echo foo;echo foo;echo foo;echo end')
+class TestToolCaps(generic.TestCase):
+    def setUp(self):
+        super(TestToolCaps, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.binDir = os.path.join(self.tmpDir.name, 'bin')
+        os.mkdir(self.binDir)
+        self.counter = os.path.join(self.tmpDir.name, 'counter')
+        self.rsync = os.path.join(self.binDir, 'rsync')
+        self.writeRsync('3.1.1')
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.binDir
+        self.cacheFile = os.path.join(self.tmpDir.name, 'toolcaps.json')
+        self.caps = tools.ToolCaps(self.cacheFile)
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        self.tmpDir.cleanup()
+
+    def writeRsync(self, version):
+        with open(self.rsync, 'wt') as f:
+            f.write('#!/bin/sh\n')
+            f.write('echo x >> %s\n' % self.counter)
+            f.write('echo "rsync  version %s  protocol version 31"\n' % version)
+        os.chmod(self.rsync, 0o755)
+
+    def probes(self):
+        if not os.path.exists(self.counter):
+            return 0
+        with open(self.counter, 'rt') as f:
+            return len(f.readlines())
+
+    def test_path(self):
+        self.assertEqual(self.caps.path('rsync'), self.rsync)
+        self.assertTrue(self.caps.available('rsync'))
+        self.assertIsNone(self.caps.path('nocache'))
+        self.assertFalse(self.caps.available('nocache'))
+
+    def test_output_probed_once(self):
+        self.assertIn('3.1.1', self.caps.output('rsync'))
+        self.assertEqual(self.caps.version('rsync'), '3.1.1')
+        self.assertEqual(self.probes(), 1)
+        self.assertTrue(os.path.isfile(self.cacheFile))
+
+        #new instance reads the cache file
+        caps = tools.ToolCaps(self.cacheFile)
+        self.assertEqual(caps.version('rsync'), '3.1.1')
+        self.assertEqual(self.probes(), 1)
+
+    def test_output_invalidated_by_mtime(self):
+        self.assertEqual(self.caps.version('rsync'), '3.1.1')
+        self.writeRsync('3.0.9')
+        st = os.stat(self.rsync)
+        os.utime(self.rsync, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(self.caps.version('rsync'), '3.0.9')
+        self.assertEqual(self.probes(), 2)
+
+    def test_output_not_installed(self):
+        self.assertIsNone(self.caps.output('encfs'))
+        self.assertIsNone(self.caps.version('encfs'))
+        self.assertIsNone(self.caps.output('nocache'))
+
+    def test_failed_probe_not_cached(self):
+        with open(self.rsync, 'at') as f:
+            f.write('exit 1\n')
+        self.assertEqual(self.caps.version('rsync'), '3.1.1')
+        self.assertFalse(os.path.exists(self.cacheFile))
+        #probed again as long as it fails
+        self.assertEqual(tools.ToolCaps(self.cacheFile).version('rsync'), '3.1.1')
+        self.assertEqual(self.probes(), 2)
+
+    def test_config_filename(self):
+        cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.assertEqual(tools.TOOL_CAPS.filename,
+                         os.path.join(cfg._LOCAL_DATA_FOLDER, 'toolcaps.json'))
+
+    def test_broken_cache_file(self):
+        with open(self.cacheFile, 'wt') as f:
+            f.write('foo')
+        self.assertEqual(self.caps.version('rsync'), '3.1.1')
 
 class TestToolsEnviron(generic.TestCase):
     def __init__(self, *args, **kwargs):
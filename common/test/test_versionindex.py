@@ -0,0 +1,305 @@
+# Back In Time
+# Copyright (C) 2016 Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import io
+import os
+import sys
+import shutil
+import sqlite3
+import threading
+import types
+import unittest
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import config
+import tools
+import snapshots
+import versionindex
+import cli
+
+#not existing in filesystem so 'now' is never listed
+PATH = '/bit_test_versionindex/file'
+OTHER = '/bit_test_versionindex/other'
+
+class TestVersionIndex(generic.TestCase):
+    def setUp(self):
+        super(TestVersionIndex, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.cfg = config.Config(os.path.abspath(os.path.join(__file__, os.pardir, 'config')))
+        self.cfg.dict['profile1.snapshots.path'] = self.tmpDir.name
+        self.cfg._LOCAL_DATA_FOLDER = self.tmpDir.name
+        os.makedirs(self.cfg.get_snapshots_full_path())
+        self.cfg.set_version_index(True)
+        self.sn = snapshots.Snapshots(self.cfg)
+        self.prev = None
+
+    def tearDown(self):
+        super(TestVersionIndex, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def snapshot(self, sid, changes = {}):
+        """
+        create a snapshot which hard-links all files from the previous
+        one except those in `changes` ({path: (content, mtime)}).
+        """
+        sid = snapshots.SID(sid, self.cfg)
+        sid.makeDirs()
+        for path in (PATH, OTHER):
+            dst = sid.pathBackup(path)
+            os.makedirs(os.path.dirname(dst), exist_ok = True)
+            if path in changes:
+                if changes[path] is None:
+                    continue
+                content, mtime = changes[path]
+                with open(dst, 'wt') as f:
+                    f.write(content)
+                os.utime(dst, (mtime, mtime))
+            elif self.prev and os.path.exists(self.prev.pathBackup(path)):
+                os.link(self.prev.pathBackup(path), dst)
+        self.prev = sid
+        return sid
+
+    def createSnapshots(self):
+        self.s1 = self.snapshot('20151219-010000-123', {PATH: ('a', 1000), OTHER: ('x', 1000)})
+        self.s2 = self.snapshot('20151219-020000-123', {OTHER: ('y', 2000)})
+        self.s3 = self.snapshot('20151219-030000-123', {PATH: ('bb', 3000)})
+        self.s4 = self.snapshot('20151219-040000-123', {PATH: None})
+        self.s5 = self.snapshot('20151219-050000-123', {PATH: ('bb', 3000)})
+
+    def filter_for(self, path, index = True):
+        self.cfg.set_version_index(index)
+        snapshots_list = snapshots.listSnapshots(self.cfg)
+        #the oldest snapshot always contains both files
+        return self.sn.filter_for(snapshots_list[-1], path,
+                                  snapshots_list, list_diff_only = True)
+
+    def test_versions(self):
+        self.createSnapshots()
+        index = versionindex.VersionIndex(self.cfg)
+        self.assertEqual(index.update(self.sn, snapshots.listSnapshots(self.cfg)), 5)
+        versions = index.versions(PATH, snapshots.listSnapshots(self.cfg))
+        index.close()
+        self.assertListEqual(versions, [(self.s5, (2, 3000)),
+                                        (self.s3, (2, 3000)),
+                                        (self.s2, (1, 1000))])
+
+    def test_filter_for(self):
+        self.createSnapshots()
+        self.sn.update_version_index()
+        for path in (PATH, OTHER):
+            with self.subTest(path = path):
+                self.assertListEqual(self.filter_for(path), self.filter_for(path, False))
+        self.assertListEqual(self.filter_for(PATH), [self.s5, self.s2])
+
+    def test_search(self):
+        self.createSnapshots()
+        self.sn.update_version_index()
+        index = versionindex.VersionIndex(self.cfg)
+        snapshots_list = snapshots.listSnapshots(self.cfg)
+        self.assertListEqual(index.search('fil', snapshots_list),
+                             [(PATH, [(self.s1, self.s3), (self.s5, self.s5)])])
+        self.assertListEqual(index.search('*', snapshots_list),
+                             [(PATH, [(self.s1, self.s3), (self.s5, self.s5)]),
+                              (OTHER, [(self.s1, self.s5)])])
+        self.assertListEqual(index.search('/bit_test_*/oth*', snapshots_list),
+                             [(OTHER, [(self.s1, self.s5)])])
+        self.assertListEqual(index.search('FILE', snapshots_list), [])
+        self.assertListEqual(index.search('FILE', snapshots_list, ignoreCase = True),
+                             [(PATH, [(self.s1, self.s3), (self.s5, self.s5)])])
+        self.assertListEqual(index.search('[!o]ile', snapshots_list),
+                             [(PATH, [(self.s1, self.s3), (self.s5, self.s5)])])
+        index.close()
+
+    def test_search_full_path(self):
+        self.createSnapshots()
+        self.sn.update_version_index()
+        index = versionindex.VersionIndex(self.cfg)
+        snapshots_list = snapshots.listSnapshots(self.cfg)
+        #'*' spans '/' in full path patterns
+        for ignoreCase in (False, True):
+            with self.subTest(ignoreCase = ignoreCase):
+                self.assertListEqual([path for path, ranges in index.search('/bit*/f*', snapshots_list, ignoreCase)],
+                                     [PATH])
+                self.assertListEqual([path for path, ranges in index.search('*/bit_*', snapshots_list, ignoreCase)],
+                                     [PATH, OTHER])
+        index.close()
+
+    def test_search_cancel(self):
+        self.createSnapshots()
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(versionindex.Canceled):
+            self.sn.search('other', cancel = cancel)
+        index = versionindex.VersionIndex(self.cfg)
+        index.open()
+        self.assertListEqual(index.indexed(), [])
+        index.close()
+
+    def test_cli_search_failed(self):
+        self.createSnapshots()
+        out = io.StringIO()
+        with patch('versionindex.VersionIndex.search', side_effect = sqlite3.OperationalError('locked')), \
+             patch('sys.stderr', new_callable = io.StringIO) as err:
+            self.assertFalse(cli.search(self.cfg, 'other', out = out))
+        self.assertIn('locked', err.getvalue())
+
+    def test_search_lazy(self):
+        self.createSnapshots()
+        self.cfg.set_version_index(False)
+        self.assertListEqual(self.sn.search('other'), [(OTHER, [(self.s1, self.s5)])])
+
+    def test_deep_check(self):
+        self.createSnapshots()
+        snapshots_list = snapshots.listSnapshots(self.cfg)
+        sids = self.sn.filter_for(snapshots_list[-1], PATH, snapshots_list,
+                                  list_diff_only = True, flag_deep_check = True)
+        self.assertListEqual(sids, [self.s5, self.s2])
+        self.assertTrue(os.path.exists(self.cfg.get_hash_cache_file()))
+
+    def test_iter_filter_for(self):
+        self.createSnapshots()
+        snapshots_list = snapshots.listSnapshots(self.cfg)
+        it = self.sn.iter_filter_for(snapshots_list[-1], PATH, snapshots_list,
+                                     list_diff_only = True, flag_deep_check = True)
+        self.assertIsInstance(it, types.GeneratorType)
+        self.assertEqual(next(it), self.s5)
+        #canceled before all snapshots were checked
+        it.close()
+        self.assertTrue(os.path.exists(self.cfg.get_hash_cache_file()))
+        self.assertListEqual(list(self.sn.iter_filter_for(snapshots_list[-1], PATH, snapshots_list,
+                                                          list_diff_only = True, flag_deep_check = True)),
+                             [self.s5, self.s2])
+
+    def test_iter_filter_for_cancel(self):
+        self.createSnapshots()
+        snapshots_list = snapshots.listSnapshots(self.cfg)
+        cancel = threading.Event()
+        cancel.set()
+        with patch('hashcache.HashCache.hashMany') as hashMany:
+            self.assertListEqual(list(self.sn.iter_filter_for(snapshots_list[-1], PATH, snapshots_list,
+                                                              list_diff_only = True, flag_deep_check = True,
+                                                              cancel = cancel)),
+                                 [])
+            hashMany.assert_not_called()
+
+    def test_incremental(self):
+        self.s1 = self.snapshot('20151219-010000-123', {PATH: ('a', 1000), OTHER: ('x', 1000)})
+        self.sn.update_version_index()
+        self.s2 = self.snapshot('20151219-020000-123', {PATH: ('b', 2000)})
+        #not indexed yet
+        index = versionindex.VersionIndex(self.cfg)
+        self.assertIsNone(index.versions(PATH, snapshots.listSnapshots(self.cfg)))
+        self.assertEqual(index.update(self.sn, snapshots.listSnapshots(self.cfg)), 1)
+        self.assertListEqual(index.indexed(), [self.s1.sid, self.s2.sid])
+        #unchanged file only extends the existing version
+        rows = list(index.conn.execute('SELECT first, last FROM versions ORDER BY first'))
+        self.assertIn((self.s1.sid, self.s2.sid), rows)
+        index.close()
+        self.assertListEqual(self.filter_for(PATH), [self.s2, self.s1])
+
+    def test_removed_snapshot(self):
+        self.createSnapshots()
+        self.sn.update_version_index()
+        shutil.rmtree(self.s5.path())
+        self.assertListEqual(self.filter_for(PATH), [self.s3, self.s2])
+        self.sn.update_version_index()
+        index = versionindex.VersionIndex(self.cfg)
+        index.open()
+        self.assertNotIn(self.s5.sid, index.indexed())
+        index.close()
+
+    def test_rebuild_missing(self):
+        self.s1 = self.snapshot('20151219-010000-123', {PATH: ('a', 1000), OTHER: ('x', 1000)})
+        self.s3 = self.snapshot('20151219-030000-123', {PATH: ('c', 3000)})
+        self.sn.update_version_index()
+        #older snapshot which isn't in the index
+        self.prev = self.s1
+        self.s2 = self.snapshot('20151219-020000-123', {PATH: ('b', 2000)})
+        index = versionindex.VersionIndex(self.cfg)
+        self.assertIsNone(index.versions(PATH, snapshots.listSnapshots(self.cfg)))
+        self.assertEqual(index.update(self.sn, snapshots.listSnapshots(self.cfg)), 3)
+        index.close()
+        self.assertListEqual(self.filter_for(PATH), [self.s3, self.s2, self.s1])
+
+    def test_other_repository(self):
+        self.createSnapshots()
+        self.sn.update_version_index()
+        index = versionindex.VersionIndex(self.cfg)
+        index.repository = '/foo'
+        index.open()
+        self.assertListEqual(index.indexed(), [])
+        index.close()
+
+    @unittest.skipUnless(tools.check_command('find'), 'find is not installed')
+    def test_scan_remote(self):
+        self.createSnapshots()
+        index = versionindex.VersionIndex(self.cfg)
+        local = sorted(index.scan(self.sn, self.s2))
+        #run the 'remote' find locally
+        path = self.cfg.get_snapshots_full_path()
+        with patch.object(self.cfg, 'get_snapshots_mode', return_value = 'ssh'), \
+             patch.object(self.cfg, 'get_snapshots_full_path', return_value = path), \
+             patch.object(self.cfg, 'get_snapshots_full_path_ssh', return_value = path), \
+             patch.object(self.sn, 'cmd_ssh', return_value = ['sh', '-s']):
+            remote = sorted(index.scan(self.sn, self.s2))
+        self.assertEqual(len(local), 2)
+        self.assertListEqual(remote, local)
+
+    def test_append(self):
+        self.s1 = self.snapshot('20151219-010000-123', {PATH: ('a', 1000), OTHER: ('x', 1000)})
+        self.sn.append_version_index(self.s1)
+        self.s2 = self.snapshot('20151219-020000-123', {PATH: ('b', 2000)})
+        self.sn.append_version_index(self.s2)
+        index = versionindex.VersionIndex(self.cfg)
+        index.open()
+        self.assertListEqual(index.indexed(), [self.s1.sid, self.s2.sid])
+        index.close()
+        self.assertListEqual(self.filter_for(PATH), [self.s2, self.s1])
+
+    def test_append_incomplete(self):
+        #existing repository without index is not scanned during backup
+        self.createSnapshots()
+        index = versionindex.VersionIndex(self.cfg)
+        with patch.object(index, 'scan') as scan:
+            self.assertFalse(index.append(self.sn, self.s5, snapshots.listSnapshots(self.cfg)))
+        scan.assert_not_called()
+        self.assertListEqual(index.indexed(), [])
+        index.close()
+        #but still on search
+        self.assertListEqual(self.sn.search('other'), [(OTHER, [(self.s1, self.s5)])])
+
+    def test_append_timeout(self):
+        self.s1 = self.snapshot('20151219-010000-123', {PATH: ('a', 1000), OTHER: ('x', 1000)})
+        index = versionindex.VersionIndex(self.cfg)
+        with patch('time.time', side_effect = [0, 100, 100]):
+            self.assertFalse(index.append(self.sn, self.s1, snapshots.listSnapshots(self.cfg),
+                                          timeout = 10))
+        self.assertListEqual(index.indexed(), [])
+        self.assertEqual(index.conn.execute('SELECT COUNT(*) FROM versions').fetchone()[0], 0)
+        index.close()
+
+    def test_disabled(self):
+        self.createSnapshots()
+        self.cfg.set_version_index(False)
+        self.sn.update_version_index()
+        self.assertFalse(os.path.exists(self.cfg.get_version_index_file()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,31 +26,71 @@ import gzip
 import tempfile
 import collections
 import hashlib
+import json
+import threading
+import importlib
 from datetime import datetime
-from distutils.version import StrictVersion
-keyring = None
-keyring_warn = False
-try:
-    if os.getenv('BIT_USE_KEYRING', 'true') == 'true' and os.geteuid() != 0:
-        import keyring
-except:
-    keyring = None
+
+class LazyImport(object):
+    """
+    Import module `name` on first use instead of on startup. This keeps slow
+    or optional imports like dbus and keyring out of commands which don't
+    need them. The proxy is ``False`` in boolean context if the import failed
+    and `onError` returned ``None``.
+
+    Args:
+        name (str):         module name
+        onError (method):   called with the exception if import failed.
+                            Its return value is used instead of the module.
+                            Default is to raise the exception
+    """
+    def __init__(self, name, onError = None):
+        self._name = name
+        self._onError = onError
+        self._module = None
+        self._loaded = False
+
+    def _load(self):
+        if not self._loaded:
+            try:
+                self._module = importlib.import_module(self._name)
+            except Exception as e:
+                if self._onError is None:
+                    raise
+                self._module = self._onError(e)
+            self._loaded = True
+        return self._module
+
+    def __getattr__(self, attr):
+        module = self._load()
+        if module is None:
+            raise AttributeError("module '%s' is not available" % self._name)
+        return getattr(module, attr)
+
+    def __bool__(self):
+        return not self._load() is None
+
+def _keyringFailed(e):
     os.putenv('BIT_USE_KEYRING', 'false')
-    keyring_warn = True
+    logger.warning('import keyring failed: %s' % str(e))
+
+if os.getenv('BIT_USE_KEYRING', 'true') == 'true' and os.geteuid() != 0:
+    keyring = LazyImport('keyring', _keyringFailed)
+else:
+    keyring = None
 
 # getting dbus imports to work in Travis CI is a huge pain
 # use conditional dbus import
 ON_TRAVIS = os.environ.get('TRAVIS', 'None').lower() == 'true'
 ON_RTD = os.environ.get('READTHEDOCS', 'None').lower() == 'true'
 
-try:
-    import dbus
-except ImportError:
+def _dbusFailed(e):
     if ON_TRAVIS or ON_RTD:
         #python-dbus doesn't work on Travis yet.
-        dbus = None
-    else:
-        raise
+        return None
+    raise e
+
+dbus = LazyImport('dbus', _dbusFailed)
 
 import configfile
 import logger
@@ -58,6 +98,9 @@ from exceptions import Timeout, InvalidChar, PermissionDeniedByPolicy
 
 DISK_BY_UUID = '/dev/disk/by-uuid'
 
+#filesystems which make up inode numbers for every mount
+UNSTABLE_INODE_FILESYSTEMS = ('fuse.sshfs',)
+
 def get_share_path():
     """
     Get BackInTimes installation base path.
@@ -277,6 +320,171 @@ def which(cmd):
             return fullpath
     return None
 
+class ToolCaps(object):
+    """
+    Registry of external tools Back In Time depends on. Each tool is probed
+    only once (e.g. 'rsync --version'). Results are kept in memory and in a
+    cache file keyed by the binary's full path and mtime, so later runs
+    don't have to spawn the probe again until the tool gets updated.
+
+    :py:class:`config.Config` points :py:data:`TOOL_CAPS` to
+    'toolcaps.json' in its local data folder. Probes which fail are not
+    written to the cache file.
+
+    Args:
+        filename (str): cache file. If ``None`` results are only kept in
+                        memory
+    """
+    PROBES = {'rsync':   ['--version'],
+              'ssh':     ['-V'],
+              'sshfs':   ['--version'],
+              'encfs':   ['--version'],
+              'find':    ['--version'],
+              'nocache': None}
+
+    def __init__(self, filename = None):
+        self.filename = filename
+        self.entries = None
+        self.paths = {}
+        self.lock = threading.RLock()
+
+    def reset(self):
+        """
+        Forget everything in memory. The cache file is still used.
+        """
+        with self.lock:
+            self.entries = None
+            self.paths = {}
+
+    def path(self, tool):
+        """
+        Full path of `tool` like :py:func:`which` but only searched once.
+
+        Args:
+            tool (str): command
+
+        Returns:
+            str:        full path or ``None`` if `tool` is not installed
+        """
+        key = (tool, os.getenv('PATH', ''))
+        with self.lock:
+            if not key in self.paths:
+                self.paths[key] = which(tool)
+            return self.paths[key]
+
+    def available(self, tool):
+        """
+        Returns:
+            bool:   ``True`` if `tool` is installed
+        """
+        return not self.path(tool) is None
+
+    def output(self, tool):
+        """
+        Output of `tool`'s probe command (stdout and stderr).
+
+        Args:
+            tool (str): one of :py:data:`PROBES`
+
+        Returns:
+            str:        probe output or ``None`` if `tool` is not
+                        installed or has no probe
+        """
+        path = self.path(tool)
+        args = self.PROBES.get(tool)
+        if path is None or args is None:
+            return None
+        return self.fileOutput([path] + args, path)
+
+    def version(self, tool):
+        """
+        First version number in `tool`'s probe output.
+
+        Returns:
+            str:    version like '3.1.1' or ``None``
+        """
+        output = self.output(tool)
+        if output:
+            m = re.search(r'(\d+(?:\.\d+)+)', output)
+            if m:
+                return m.group(1)
+
+    def fileOutput(self, cmd, path):
+        """
+        Output of `cmd` which only depends on file `path`. It will be
+        run again only if `path` was modified since.
+
+        Args:
+            cmd (list):     command and args
+            path (str):     binary or input file of `cmd`
+
+        Returns:
+            str:            stdout and stderr of `cmd` or ``None`` if
+                            `path` doesn't exist or `cmd` failed to start.
+                            Output of a failed `cmd` is returned but not
+                            cached
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = ' '.join(cmd)
+        stamp = [st.st_mtime, st.st_size]
+        with self.lock:
+            self._load()
+            entry = self.entries.get(key)
+            if entry and entry.get('stamp') == stamp:
+                return entry['output']
+            try:
+                proc = subprocess.Popen(cmd,
+                                        stdout = subprocess.PIPE,
+                                        stderr = subprocess.STDOUT,
+                                        universal_newlines = True)
+                output = proc.communicate()[0]
+            except OSError as e:
+                logger.debug('Failed to probe %s: %s' %(key, str(e)), self)
+                return None
+            if proc.returncode:
+                logger.debug('Probe %s returned %s' %(key, proc.returncode), self)
+                return output
+            self.entries[key] = {'stamp': stamp, 'output': output}
+            self._save()
+            return output
+
+    def _load(self):
+        if not self.entries is None:
+            return
+        self.entries = {}
+        if self.filename is None:
+            return
+        try:
+            with open(self.filename, 'rt') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self.entries = data
+        except (OSError, ValueError) as e:
+            logger.debug('Failed to read %s: %s' %(self.filename, str(e)), self)
+
+    def _save(self):
+        if self.filename is None:
+            return
+        folder = os.path.dirname(self.filename)
+        try:
+            os.makedirs(folder, exist_ok = True)
+            with tempfile.NamedTemporaryFile('wt', dir = folder, prefix = '.toolcaps_',
+                                             suffix = '.tmp', delete = False) as f:
+                tmp = f.name
+                json.dump(self.entries, f)
+            os.replace(tmp, self.filename)
+        except OSError as e:
+            logger.debug('Failed to write %s: %s' %(self.filename, str(e)), self)
+            try:
+                os.remove(tmp)
+            except (NameError, OSError):
+                pass
+
+TOOL_CAPS = ToolCaps()
+
 def make_dirs( path ):
     """
     Create directories `path` recursive and return success.
@@ -514,12 +722,14 @@ def get_rsync_caps(data = None):
 
     Args:
         data (str): 'rsync --version' output. This is just for unittests.
+                    Default is the cached output from :py:data:`TOOL_CAPS`
 
     Returns:
         list:       str's with rsyncs capabilities
     """
     if not data:
-        data = read_command_output( 'rsync --version' )
+        data = TOOL_CAPS.output('rsync') or ''
+    from distutils.version import StrictVersion
     caps = []
     #rsync >= 3.1 does provide --info=progress2
     m = re.match(r'rsync\s*version\s*(\d\.\d)', data)
@@ -644,7 +854,7 @@ def _get_md5sum_from_path(path):
     md5 = hashlib.md5()
     with open(path, 'rb') as f:
         while True:
-            data = f.read(4096)
+            data = f.read(1024 * 1024)
             if not data:
                 break
             md5.update(data)
@@ -746,7 +956,7 @@ def save_env(f):
     env_file.save(f)
 
 def keyring_supported():
-    if keyring is None:
+    if not keyring:
         logger.debug('No keyring due to import errror.')
         return False
     backends = []
@@ -773,12 +983,12 @@ def keyring_supported():
     return False
 
 def get_password(*args):
-    if not keyring is None:
+    if keyring:
         return keyring.get_password(*args)
     return None
 
 def set_password(*args):
-    if not keyring is None:
+    if keyring:
         return keyring.set_password(*args)
     return False
 
@@ -858,6 +1068,20 @@ def get_filesystem(path):
         return args[2]
     return None
 
+def stable_inodes(path):
+    """
+    Check if the filesystem of `path` keeps inode numbers across mounts.
+    sshfs makes up inode numbers unless it was mounted with 'use_ino'
+    which can't be seen in /etc/mtab and is not used by Back In Time.
+
+    Args:
+        path (str): full path
+
+    Returns:
+        bool:       ``False`` if inode numbers are not stable
+    """
+    return not get_filesystem(path) in UNSTABLE_INODE_FILESYSTEMS
+
 def get_uuid(dev):
     """
     Get the UUID for the block device `dev`.
@@ -1119,12 +1343,12 @@ def getSshKeyFingerprint(path):
     """
     if not os.path.exists(path):
         return
-    cmd = ['ssh-keygen', '-l', '-f', path]
-    proc = subprocess.Popen(cmd, stdout = subprocess.PIPE, stderr = open(os.devnull, 'w'))
-    output = proc.communicate()[0]
-    m = re.match(b'\d+\s+([a-fA-F0-9:]+).*', output)
+    output = TOOL_CAPS.fileOutput(['ssh-keygen', '-l', '-f', path], path)
+    if output is None:
+        return
+    m = re.match(r'\d+\s+([a-fA-F0-9:]+).*', output)
     if m:
-        return m.group(1).decode('UTF-8')
+        return m.group(1)
 
 def readCrontab():
     """
@@ -1188,48 +1412,65 @@ def writeCrontab(lines):
                      %len(lines))
         return True
 
-def splitCommands(cmds, head = '', tail = '', maxLength = 0):
-    """
-    Split a list of commands `cmds` into multiple commands with each length
-    lower than `maxLength`.
-
-    Args:
-        cmds (list):            commands
-        head (str):             command that need to run first on every iteration
-                                of `cmds`
-        tail (str):             command that need to run after every iteration
-                                of `cmds`
-        maxLength (int):        maximum length a command could be.
-                                Don't split if <= 0
-
-    Yields:
-        str:                    new command with length < `maxLength` in form of
-                                'head cmds[0] cmds[n] tail'
-    """
-    while cmds:
-        s = head
-        while cmds and ((len(s + cmds[0] + tail) <= maxLength) or maxLength <= 0):
-            s += cmds.pop(0)
-        s += tail
-        yield s
-
 class UniquenessSet:
     """
     A class to check for uniqueness of snapshots of the same [item]
     """
-    def __init__(self, dc = False, follow_symlink = False, list_equal_to = False):
+    def __init__(self, dc = False, follow_symlink = False, list_equal_to = False, hashCache = None):
         self.deep_check = dc
         self.follow_sym = follow_symlink
         self._uniq_dict = {}      # if not self._uniq_dict[size] -> size already checked with md5sum
         self._size_inode = set()  # if (size,inode) in self._size_inode -> path is a hlink
         self.list_equal_to = list_equal_to
+        self.hashCache = hashCache
         if list_equal_to:
             st = os.stat(list_equal_to)
             if self.deep_check:
-                self.reference = (st.st_size, _get_md5sum_from_path(list_equal_to))
+                self.reference = (st.st_size, self._hash(list_equal_to, st))
             else:
                 self.reference = (st.st_size, int(st.st_mtime))
 
+    def _hash(self, path, st = None):
+        if self.hashCache is None:
+            return _get_md5sum_from_path(path)
+        return self.hashCache.hash(path, st)
+
+    def prefetch(self, paths):
+        """
+        Calculate all hashes which will be needed to check `paths` in
+        parallel. See :py:meth:`neededHashes`. Does nothing without deep
+        check or hashCache.
+
+        Args:
+            paths (list):   full paths which will be checked afterwards
+        """
+        if not self.deep_check or self.hashCache is None:
+            return
+        self.hashCache.hashMany(self.neededHashes(paths))
+
+    def neededHashes(self, paths):
+        """
+        Files out of `paths` which need to be hashed with deep check.
+        Only files which share their size with other files (or with the
+        reference file) need to be hashed.
+
+        Args:
+            paths (list):   full paths which will be checked afterwards
+
+        Returns:
+            list:           full paths, one for each inode
+        """
+        inodes = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            inodes.setdefault(st.st_size, {}).setdefault(st.st_ino, path)
+        if self.list_equal_to:
+            return list(inodes.get(self.reference[0], {}).values())
+        return [path for items in inodes.values() if len(items) > 1 for path in items.values()]
+
     def check_for(self, input_path):
         # follow symlinks ?
         path = input_path
@@ -1262,11 +1503,11 @@ class UniquenessSet:
                 prev = self._uniq_dict[size]
                 if prev:
                     # store md5sum instead of previously stored size
-                    md5sum_prev = _get_md5sum_from_path(prev)
+                    md5sum_prev = self._hash(prev)
                     self._uniq_dict[size] = None
                     self._uniq_dict[md5sum_prev] = prev
                     logger.debug("[deep test] : size duplicate, remove the size, store prev md5sum", self)
-                unique_key = _get_md5sum_from_path(path)
+                unique_key = self._hash(path, dum)
                 logger.debug("[deep test] : store current md5sum ?", self)
         else:
             # store a tuple of (size, modification time)
@@ -1287,7 +1528,7 @@ class UniquenessSet:
         st = os.stat(path)
         if self.deep_check:
             if self.reference[0] == st.st_size:
-                return self.reference[1] == _get_md5sum_from_path(path)
+                return self.reference[1] == self._hash(path, st)
             return False
         else:
             return self.reference == (st.st_size, int(st.st_mtime))
@@ -1504,6 +1745,7 @@ class ShutDown(object):
         """
         if not check_command('unity'):
             return False
+        from distutils.version import StrictVersion
         unity_version = read_command_output('unity --version')
         m = re.match(r'unity ([\d\.]+)', unity_version)
         return m and StrictVersion(m.group(1)) >= StrictVersion('7.0') and process_exists('unity-panel-service')
@@ -1519,7 +1761,7 @@ class SetupUdev(object):
     INTERFACE = 'net.launchpad.backintime.serviceHelper.UdevRules'
     MEMBERS = ('addRule', 'save', 'delete')
     def __init__(self):
-        if dbus is None:
+        if not dbus:
             self.isReady = False
             return
         try:
@@ -1666,14 +1908,3 @@ class OrderedSet(collections.MutableSet):
         if isinstance(other, OrderedSet):
             return len(self) == len(other) and list(self) == list(other)
         return set(self) == set(other)
-
-def __log_keyring_warning():
-    from time import sleep
-    sleep(0.1)
-    logger.warning('import keyring failed')
-
-if keyring is None and keyring_warn:
-    #delay warning to give logger some time to import
-    from threading import Thread
-    thread = Thread(target = __log_keyring_warning, args = ())
-    thread.start()
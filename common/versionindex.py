@@ -0,0 +1,468 @@
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Index of all versions of every file in the snapshots of one profile.
+
+For each path the index stores every identity (inode, size, mtime) the
+file had and the first and last snapshot which contained this identity.
+Because unchanged files are hard-linked between snapshots an identity
+always covers a continuous range of snapshots.
+
+The index is a SQLite database in the local data folder. It is built the
+first time it is needed (e.g. by 'backintime search'). After that each new
+snapshot is added by scanning only the new snapshot (with a single remote
+'find' on ssh profiles). Listing all versions of a file then only needs one
+query instead of checking the file in every snapshot.
+
+Every folder is stored only once and files only keep their name and a
+reference to their folder, no matter in how many snapshots they exist.
+This keeps the index small and allows to search file names across all
+snapshots with :py:meth:`VersionIndex.search`.
+"""
+
+import os
+import re
+import time
+import fnmatch
+import shlex
+import sqlite3
+import bisect
+import subprocess
+
+import logger
+
+#maximum seconds take_snapshot spends on adding the new snapshot
+APPEND_TIMEOUT = 10 * 60
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS snapshots (sid TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS dirs (id INTEGER PRIMARY KEY, path BLOB UNIQUE);
+CREATE TABLE IF NOT EXISTS paths (id INTEGER PRIMARY KEY,
+                                  dir_id INTEGER,
+                                  name BLOB,
+                                  UNIQUE (dir_id, name));
+CREATE TABLE IF NOT EXISTS versions (path_id INTEGER,
+                                     ino INTEGER,
+                                     size INTEGER,
+                                     mtime INTEGER,
+                                     first TEXT,
+                                     last TEXT);
+CREATE INDEX IF NOT EXISTS versions_path ON versions (path_id, last);
+CREATE INDEX IF NOT EXISTS versions_last ON versions (last);
+'''
+
+class Canceled(Exception):
+    """
+    Scanning was canceled or took too long.
+    """
+    pass
+
+def _abortable(items, abort):
+    """
+    Pass through `items` but raise :py:class:`Canceled` as soon as
+    `abort()` returns ``True``.
+    """
+    for i, item in enumerate(items):
+        if not i % 1000 and abort():
+            raise Canceled()
+        yield item
+
+class VersionIndex(object):
+    """
+    Version index for one profile.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID
+    """
+    VERSION = '2'
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        self.profileID = profile_id or cfg.get_current_profile()
+        self.fileName = cfg.get_version_index_file(self.profileID)
+        self.repository = cfg.get_snapshots_full_path(self.profileID)
+        self.conn = None
+
+    def open(self):
+        """
+        Open the database and create tables if necessary. The index will
+        be cleared if it was created for a different snapshots folder.
+        """
+        if self.conn is not None:
+            return
+        self.conn = sqlite3.connect(self.fileName, timeout = 60)
+        self.conn.executescript(SCHEMA)
+        meta = dict(self.conn.execute('SELECT key, value FROM meta'))
+        if meta.get('repository') != self.repository or meta.get('version') != self.VERSION:
+            if meta:
+                logger.info('Version index %s belongs to a different snapshot folder. Start over again.'
+                            % self.fileName, self)
+            self.clear()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def clear(self):
+        """
+        Remove everything from the index.
+        """
+        with self.conn:
+            for table in ('meta', 'snapshots', 'dirs', 'paths', 'versions'):
+                self.conn.execute('DELETE FROM %s' % table)
+            self.conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                                  (('repository', self.repository),
+                                   ('version', self.VERSION)))
+
+    def indexed(self):
+        """
+        Returns:
+            list:   IDs (``str``) of all indexed snapshots sorted from
+                    oldest to newest
+        """
+        return [row[0] for row in self.conn.execute('SELECT sid FROM snapshots ORDER BY sid')]
+
+    def update(self, snapshots, snapshots_list, cancel = None):
+        """
+        Add all snapshots from `snapshots_list` which are newer than the
+        last indexed snapshot. If an older snapshot is missing in the index
+        it will be rebuilt from scratch.
+
+        Args:
+            snapshots (snapshots.Snapshots):    current snapshots instance
+            snapshots_list (list):              all existing snapshots
+            cancel (threading.Event):           stop as soon as this is set.
+                                                Snapshots which were added
+                                                completely stay in the index
+
+        Returns:
+            int:                                number of new indexed
+                                                snapshots
+
+        Raises:
+            Canceled:                           if `cancel` was set
+        """
+        self.open()
+        indexed = self.prune(snapshots_list)
+        todo = sorted([sid for sid in snapshots_list if not sid.sid in indexed])
+        if indexed and todo and todo[0].sid < indexed[-1]:
+            logger.info('Snapshot %s is missing in version index. Rebuild index.' % todo[0], self)
+            self.clear()
+            indexed = []
+            todo = sorted(snapshots_list)
+
+        prev = indexed[-1] if indexed else None
+        for sid in todo:
+            start = time.time()
+            files = self.scan(snapshots, sid)
+            if cancel is not None:
+                if cancel.is_set():
+                    raise Canceled()
+                files = _abortable(files, cancel.is_set)
+            count = self.add(sid, prev, files)
+            logger.debug('Add %s files from snapshot %s to version index in %.2fs'
+                         %(count, sid, time.time() - start), self)
+            prev = sid.sid
+        return len(todo)
+
+    def prune(self, snapshots_list):
+        """
+        Remove snapshots which don't exist anymore from the index.
+
+        Args:
+            snapshots_list (list):  all existing snapshots
+
+        Returns:
+            list:                   IDs of the remaining indexed snapshots
+        """
+        existing = set([sid.sid for sid in snapshots_list])
+        indexed = self.indexed()
+        removed = [sid for sid in indexed if not sid in existing]
+        if removed:
+            with self.conn:
+                self.conn.executemany('DELETE FROM snapshots WHERE sid = ?',
+                                      [(sid,) for sid in removed])
+            indexed = [sid for sid in indexed if sid in existing]
+        return indexed
+
+    def append(self, snapshots, sid, snapshots_list, timeout = None):
+        """
+        Add only the new snapshot `sid` and only if all older snapshots are
+        indexed already. Other than :py:meth:`update` this never scans more
+        than one snapshot, so it is cheap enough to run after each backup.
+        A missing index is built by :py:meth:`update` when it is needed.
+
+        Args:
+            snapshots (snapshots.Snapshots):    current snapshots instance
+            sid (snapshots.SID):                new snapshot
+            snapshots_list (list):              all existing snapshots
+            timeout (float):                    give up after this number
+                                                of seconds
+
+        Returns:
+            bool:                               ``True`` if `sid` is indexed
+        """
+        self.open()
+        if not sid in snapshots_list:
+            return False
+        indexed = self.prune(snapshots_list)
+        if sid.sid in indexed:
+            return True
+        older = sorted([s.sid for s in snapshots_list if s.sid < sid.sid])
+        if indexed != older:
+            logger.info('Version index is not complete. Skip updating it until '
+                        'it is built on the next search.', self)
+            return False
+        files = self.scan(snapshots, sid)
+        if timeout is not None:
+            deadline = time.time() + timeout
+            files = _abortable(files, lambda: time.time() > deadline)
+        start = time.time()
+        try:
+            count = self.add(sid, indexed[-1] if indexed else None, files)
+        except Canceled:
+            logger.warning('Adding snapshot %s to version index took more than %s seconds. '
+                           'It will be added on the next search.' %(sid, timeout), self)
+            return False
+        logger.debug('Add %s files from snapshot %s to version index in %.2fs'
+                     %(count, sid, time.time() - start), self)
+        return True
+
+    def add(self, sid, prev, files):
+        """
+        Add one snapshot. Identities which were in the previous indexed
+        snapshot `prev` get their range extended, all others are added as
+        new versions.
+
+        Args:
+            sid (snapshots.SID):    snapshot
+            prev (str):             ID of the last indexed snapshot or
+                                    ``None``
+            files (iterator):       ``(path, ino, size, mtime)`` for all
+                                    files in `sid`
+
+        Returns:
+            int:                    number of files
+        """
+        with self.conn:
+            c = self.conn
+            c.execute('CREATE TEMP TABLE scan (dir BLOB, name BLOB, ino INTEGER, '
+                      'size INTEGER, mtime INTEGER)')
+            try:
+                c.executemany('INSERT INTO scan VALUES (?, ?, ?, ?, ?)',
+                              (os.path.split(path) + (ino, size, mtime)
+                               for path, ino, size, mtime in files))
+                count = c.execute('SELECT COUNT(*) FROM scan').fetchone()[0]
+                c.execute('INSERT OR IGNORE INTO dirs (path) SELECT DISTINCT dir FROM scan')
+                c.execute('INSERT OR IGNORE INTO paths (dir_id, name) '
+                          'SELECT d.id, s.name FROM scan s JOIN dirs d ON d.path = s.dir')
+                c.execute('CREATE TEMP TABLE scanid AS '
+                          'SELECT p.id AS path_id, s.ino, s.size, s.mtime '
+                          'FROM scan s JOIN dirs d ON d.path = s.dir '
+                          'JOIN paths p ON p.dir_id = d.id AND p.name = s.name')
+                c.execute('CREATE INDEX temp.scanid_idx ON scanid (path_id, ino, size, mtime)')
+                if prev is not None:
+                    c.execute('UPDATE versions SET last = :sid WHERE last = :prev AND EXISTS '
+                              '(SELECT 1 FROM scanid t WHERE t.path_id = versions.path_id '
+                              'AND t.ino = versions.ino AND t.size = versions.size '
+                              'AND t.mtime = versions.mtime)',
+                              {'sid': sid.sid, 'prev': prev})
+                c.execute('INSERT INTO versions SELECT path_id, ino, size, mtime, :sid, :sid '
+                          'FROM scanid t WHERE NOT EXISTS (SELECT 1 FROM versions v '
+                          'WHERE v.path_id = t.path_id AND v.last = :sid AND v.ino = t.ino '
+                          'AND v.size = t.size AND v.mtime = t.mtime)',
+                          {'sid': sid.sid})
+                c.execute('INSERT INTO snapshots VALUES (?)', (sid.sid,))
+            finally:
+                c.execute('DROP TABLE IF EXISTS temp.scan')
+                c.execute('DROP TABLE IF EXISTS temp.scanid')
+        return count
+
+    def scan(self, snapshots, sid):
+        """
+        Iterate over all regular files in `sid`.
+
+        Args:
+            snapshots (snapshots.Snapshots):    current snapshots instance
+            sid (snapshots.SID):                snapshot
+
+        Yields:
+            tuple:                              ``(path, ino, size, mtime)``
+                                                with `path` as ``bytes``
+                                                relative to the backup root
+        """
+        if self.config.get_snapshots_mode(self.profileID) == 'ssh':
+            yield from self.scanRemote(snapshots, sid)
+            return
+        root = sid.pathBackup().rstrip('/').encode()
+        head = len(root)
+        stack = [root]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError as e:
+                logger.debug('Failed to scan %s: %s' %(e.filename, str(e)), self)
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks = False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks = False):
+                        st = entry.stat(follow_symlinks = False)
+                        yield (entry.path[head:], st.st_ino, st.st_size, int(st.st_mtime))
+
+    def scanRemote(self, snapshots, sid):
+        """
+        Same as :py:meth:`scan` but run 'find' on the remote host.
+        """
+        root = sid.pathBackup(use_mode = ['ssh']).rstrip('/')
+        script = 'exec find %s -type f -printf %s\n' \
+                 %(shlex.quote(root), shlex.quote('%i %s %T@ %P\\0'))
+        cmd = snapshots.cmd_ssh(['sh', '-s'], use_modes = ['ssh'])
+        proc = subprocess.Popen(cmd,
+                                stdin = subprocess.PIPE,
+                                stdout = subprocess.PIPE)
+        proc.stdin.write(script.encode())
+        proc.stdin.close()
+        buf = b''
+        while True:
+            data = proc.stdout.read(1024 * 1024)
+            if not data:
+                break
+            items = (buf + data).split(b'\0')
+            buf = items.pop()
+            for item in items:
+                ino, size, mtime, path = item.split(b' ', 3)
+                yield (b'/' + path, int(ino), int(size), int(float(mtime)))
+        proc.stdout.close()
+        if proc.wait():
+            raise OSError('Remote find in %s returned %s' %(root, proc.returncode))
+
+    def versions(self, path, snapshots_list):
+        """
+        Get the newest snapshot out of `snapshots_list` for every version
+        of `path`.
+
+        Args:
+            path (str):             absolute path
+            snapshots_list (list):  existing snapshots
+
+        Returns:
+            list:                   ``(sid, (size, mtime))`` sorted from
+                                    newest to oldest snapshot or ``None``
+                                    if not all snapshots in
+                                    `snapshots_list` are indexed
+        """
+        self.open()
+        indexed = set(self.indexed())
+        if not all([sid.sid in indexed for sid in snapshots_list]):
+            return None
+        sids = sorted(snapshots_list)
+        ids = [sid.sid for sid in sids]
+        row = self.conn.execute('SELECT p.id FROM paths p JOIN dirs d ON d.id = p.dir_id '
+                                'WHERE d.path = ? AND p.name = ?',
+                                os.path.split(os.path.join(os.sep, path.strip(os.sep)).encode())).fetchone()
+        if row is None:
+            return []
+        ret = {}
+        for size, mtime, first, last in self.conn.execute(
+                'SELECT size, mtime, first, last FROM versions WHERE path_id = ?', row):
+            index = bisect.bisect_right(ids, last) - 1
+            if index >= 0 and ids[index] >= first:
+                ret[index] = (size, mtime)
+        return [(sids[index], ret[index]) for index in sorted(ret, reverse = True)]
+
+    def search(self, pattern, snapshots_list, ignoreCase = False, cancel = None):
+        """
+        Search for files in all snapshots.
+
+        `pattern` is a shell-style wildcard which is matched against the
+        file name or against the full path if `pattern` contains a slash.
+        A `pattern` without wildcards matches every name containing it.
+
+        Args:
+            pattern (str):          shell-style wildcard
+            snapshots_list (list):  existing snapshots
+            ignoreCase (bool):      match case-insensitive
+            cancel (threading.Event):
+                                    stop as soon as this is set
+
+        Returns:
+            list:                   ``(path, ranges)`` sorted by path where
+                                    `ranges` is a list of ``(first, last)``
+                                    snapshots (sorted from oldest to newest)
+                                    in which the file existed without a gap.
+                                    ``None`` if not all snapshots in
+                                    `snapshots_list` are indexed
+
+        Raises:
+            Canceled:               if `cancel` was set
+        """
+        self.open()
+        indexed = set(self.indexed())
+        if not all([sid.sid in indexed for sid in snapshots_list]):
+            return None
+        if not set('*?[') & set(pattern):
+            pattern = '*%s*' % pattern
+        fullPath = os.sep in pattern
+        flags = re.IGNORECASE if ignoreCase else 0
+        regex = re.compile(fnmatch.translate(pattern), flags | re.DOTALL)
+
+        #pre-filter names with SQLite's GLOB which is much faster than
+        #matching every name in Python. GLOB is case-sensitive and has a
+        #different syntax for [!...], so only use it for simple patterns.
+        #For full paths fnmatch's * also matches '/', so the last component
+        #of the pattern can't be matched against the name alone.
+        if ignoreCase or fullPath or '[' in pattern:
+            query, args = 'SELECT p.id, d.path, p.name FROM paths p JOIN dirs d ON d.id = p.dir_id', ()
+        else:
+            query = 'SELECT p.id, d.path, p.name FROM paths p JOIN dirs d ON d.id = p.dir_id ' \
+                    'WHERE CAST(p.name AS TEXT) GLOB ?'
+            args = (pattern,)
+
+        sids = sorted(snapshots_list)
+        ids = [sid.sid for sid in sids]
+        ret = []
+        rows = self.conn.execute(query, args).fetchall()
+        if cancel is not None:
+            rows = _abortable(rows, cancel.is_set)
+        for pathID, folder, name in rows:
+            path = os.fsdecode(os.path.join(folder, name))
+            if not regex.match(path if fullPath else os.fsdecode(name)):
+                continue
+            ranges = []
+            for first, last in self.conn.execute('SELECT first, last FROM versions '
+                                                 'WHERE path_id = ?', (pathID,)):
+                start = bisect.bisect_left(ids, first)
+                end = bisect.bisect_right(ids, last) - 1
+                if start <= end:
+                    ranges.append([start, end])
+            if not ranges:
+                continue
+            ranges.sort()
+            merged = [ranges[0]]
+            for start, end in ranges[1:]:
+                if start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(end, merged[-1][1])
+                else:
+                    merged.append([start, end])
+            ret.append((path, [(sids[start], sids[end]) for start, end in merged]))
+        ret.sort()
+        return ret
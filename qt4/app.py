@@ -26,6 +26,7 @@ import datetime
 import gettext
 import re
 import subprocess
+import threading
 
 import qt4tools
 qt4tools.register_backintime_path('common')
@@ -34,6 +35,7 @@ import backintime
 import tools
 import logger
 import snapshots
+import restoreplan
 import guiapplicationinstance
 import mount
 import progress
@@ -45,6 +47,9 @@ from PyQt4.QtCore import *
 import settingsdialog
 import snapshotsdialog
 import logviewdialog
+import snapshotdiffdialog
+import searchdialog
+import snapshotviewmodel
 import restoredialog
 import messagebox
 
@@ -60,6 +65,7 @@ class MainWindow( QMainWindow ):
         self.app_instance = app_instance
         self.qapp = qapp
         self.snapshots = snapshots.Snapshots( config )
+        self.progress_segment = progress.ProgressSegment( config )
         self.last_take_snapshot_message = None
 
         #window icon
@@ -92,6 +98,9 @@ class MainWindow( QMainWindow ):
         self.btn_snapshot_log_view = self.main_toolbar.addAction(icon.VIEW_SNAPSHOT_LOG, _('View Snapshot Log'))
         QObject.connect( self.btn_snapshot_log_view, SIGNAL('triggered()'), self.on_btn_snapshot_log_view_clicked )
 
+        self.btn_snapshot_diff = self.main_toolbar.addAction(icon.COMPARE_SNAPSHOTS, _('Compare Snapshots'))
+        QObject.connect( self.btn_snapshot_diff, SIGNAL('triggered()'), self.on_btn_snapshot_diff_clicked )
+
         self.btn_log_view = self.main_toolbar.addAction(icon.VIEW_LAST_LOG, _('View Last Log'))
         QObject.connect( self.btn_log_view, SIGNAL('triggered()'), self.on_btn_log_view_clicked )
 
@@ -207,6 +216,17 @@ class MainWindow( QMainWindow ):
         self.btn_snapshots = self.files_view_toolbar.addAction(icon.SNAPSHOTS, _('Snapshots'))
         QObject.connect( self.btn_snapshots, SIGNAL('triggered()'), self.on_btn_snapshots_clicked )
 
+        self.files_view_toolbar.addSeparator()
+
+        #search in all snapshots
+        self.edit_search = QLineEdit( self )
+        self.edit_search.setPlaceholderText(_('Search in all snapshots'))
+        self.edit_search.setToolTip(_('Search file names in all snapshots. '
+                                      'Use * and ? as wildcards.'))
+        self.edit_search.setMaximumWidth(250)
+        self.files_view_toolbar.addWidget( self.edit_search )
+        QObject.connect( self.edit_search, SIGNAL('returnPressed()'), self.on_edit_search_return_pressed )
+
         right_layout.addWidget( self.files_view_toolbar )
 
         #menubar
@@ -227,6 +247,7 @@ class MainWindow( QMainWindow ):
         self.menubar_view.addAction(self.btn_show_hidden_files)
         self.menubar_view.addSeparator()
         self.menubar_view.addAction(self.btn_snapshot_log_view)
+        self.menubar_view.addAction(self.btn_snapshot_diff)
         self.menubar_view.addAction(self.btn_log_view)
         self.menubar_view.addSeparator()
         self.menubar_view.addAction(self.btn_snapshots)
@@ -321,6 +342,11 @@ class MainWindow( QMainWindow ):
         self.list_files_view_model.setFilter(QDir.AllDirs | QDir.AllEntries
                                             | QDir.NoDotAndDotDot | QDir.Hidden)
 
+        #snapshots are listed with SnapshotView instead of QFileSystemModel
+        self.snapshot_view_model = snapshotviewmodel.SnapshotViewModel(self)
+        QObject.connect(self.snapshot_view_model, SIGNAL('directoryLoaded()'), self.on_dir_lister_completed)
+        QObject.connect(self.snapshot_view_model, SIGNAL('directoryFailed()'), self.on_dir_lister_failed)
+
         self.list_files_view_proxy_model = QSortFilterProxyModel(self)
         self.list_files_view_proxy_model.setDynamicSortFilter(True)
         self.list_files_view_proxy_model.setSourceModel(self.list_files_view_model)
@@ -340,9 +366,14 @@ class MainWindow( QMainWindow ):
         self.list_files_view_header.setSortIndicator( sort_column, sort_order )
         self.list_files_view_model.sort(self.list_files_view_header.sortIndicatorSection(),
                                         self.list_files_view_header.sortIndicatorOrder() )
+        self.snapshot_view_model.sort(self.list_files_view_header.sortIndicatorSection(),
+                                      self.list_files_view_header.sortIndicatorOrder() )
         QObject.connect(self.list_files_view_header,
                         SIGNAL('sortIndicatorChanged(int,Qt::SortOrder)'),
                         self.list_files_view_model.sort )
+        QObject.connect(self.list_files_view_header,
+                        SIGNAL('sortIndicatorChanged(int,Qt::SortOrder)'),
+                        self.snapshot_view_model.sort )
 
         self.files_view_layout.setCurrentWidget( self.list_files_view )
 
@@ -466,11 +497,19 @@ class MainWindow( QMainWindow ):
         QObject.connect( self.timer_update_take_snapshot, SIGNAL('timeout()'), self.update_take_snapshot )
         self.timer_update_take_snapshot.start()
 
+        #get messages and progress pushed while a backup is running
+        self.status_bus_thread = qt4tools.StatusBusThread(self, self.config)
+        self.status_bus_thread.statusEvent.connect(self.on_status_event)
+        self.status_bus_thread.start()
+
     def closeEvent( self, event ):
         if self.shutdown.ask_before_quit():
             if QMessageBox.Yes != messagebox.warningYesNo(self, _('If you close this window Back In Time will not be able to shutdown your system when the snapshot has finished.\nDo you really want to close?') ):
                 return event.ignore()
 
+        self.status_bus_thread.cancel()
+        self.status_bus_thread.wait()
+
         self.config.set_str_value( 'qt4.last_path', self.path )
         self.config.set_profile_str_value('qt4.last_path', self.path)
 
@@ -552,6 +591,7 @@ class MainWindow( QMainWindow ):
             self.config.PLUGIN_MANAGER.do_unmount()
             self.remount(profile_id, old_profile_id)
             self.config.set_current_profile( profile_id )
+            self.status_bus_thread.reconnect()
             self.config.PLUGIN_MANAGER.load_plugins(cfg = self.config, force = True)
             self.config.PLUGIN_MANAGER.do_mount()
 
@@ -605,7 +645,10 @@ class MainWindow( QMainWindow ):
         fake_busy = busy or self.force_wait_lock_counter > 0
 
         message = _('Working:')
-        take_snapshot_message = self.snapshots.get_take_snapshot_message()
+        if self.status_bus_thread.connected:
+            take_snapshot_message = self.status_bus_thread.takeSnapshotMessage()
+        else:
+            take_snapshot_message = self.snapshots.get_take_snapshot_message()
         if fake_busy:
             if take_snapshot_message is None:
                 take_snapshot_message = ( 0, '...' )
@@ -649,11 +692,13 @@ class MainWindow( QMainWindow ):
 
             self.status.setText(message)
 
-        pg = progress.ProgressFile(self.config)
-        if pg.isFileReadable():
+        if self.status_bus_thread.connected:
+            pg = self.status_bus_thread.progress()
+        else:
+            pg = self.progress_segment.read()
+        if not pg is None:
             self.progressBar.setVisible(True)
             self.status.setVisible(False)
-            pg.load()
             self.progressBar.setValue(pg.get_int_value('percent') )
             self.progressBar.setFormat(' | '.join(self.getProgressBarFormat(pg, self.status.text())) )
         else:
@@ -663,6 +708,18 @@ class MainWindow( QMainWindow ):
         #if not fake_busy:
         #	self.last_take_snapshot_message = None
 
+    def on_status_event(self, event):
+        """
+        Update status bar right away instead of waiting for the next
+        timer tick. While connected to the status bus the timer is only
+        needed as fallback.
+        """
+        if self.status_bus_thread.connected:
+            self.timer_update_take_snapshot.setInterval(qt4tools.StatusBusThread.TIMER_CONNECTED)
+        else:
+            self.timer_update_take_snapshot.setInterval(1000)
+        self.update_take_snapshot()
+
     def getProgressBarFormat(self, pg, message):
         d = (('sent',   _('Sent:')), \
              ('speed',  _('Speed:')),\
@@ -760,6 +817,7 @@ class MainWindow( QMainWindow ):
         self.btn_name_snapshot.setEnabled( enabled )
         self.btn_remove_snapshot.setEnabled( enabled )
         self.btn_snapshot_log_view.setEnabled( enabled )
+        self.btn_snapshot_diff.setEnabled( enabled )
 
     def on_list_time_line_current_item_changed(self):
         item = self.list_time_line.currentItem()
@@ -840,6 +898,19 @@ class MainWindow( QMainWindow ):
             self.list_time_line.setCurrentSnapshotID(dlg.sid)
         self.setMouseButtonNavigation()
 
+    def on_btn_snapshot_diff_clicked(self):
+        item = self.list_time_line.currentItem()
+        if item is None:
+            return
+
+        sid = item.snapshotID()
+        if sid.isRoot:
+            return
+
+        self.removeMouseButtonNavigation()
+        snapshotdiffdialog.SnapshotDiffDialog(self, sid).exec_()
+        self.setMouseButtonNavigation()
+
     def on_btn_remove_snapshot_clicked ( self ):
         items = [item for item in self.list_time_line.selectedItems() if len(item.snapshotID()) > 1]
         if not items:
@@ -936,6 +1007,27 @@ class MainWindow( QMainWindow ):
         cb.setChecked(self.config.is_backup_on_restore_enabled())
         return {'widget': cb, 'retFunc': cb.isChecked, 'id': 'backup'}
 
+    def restore_plan(self, paths):
+        """
+        Label which shows size and estimated duration of the restore. The
+        plan is calculated in a background thread and will be canceled
+        when the dialog is closed.
+        """
+        label = QLabel(_('Calculating restore size...'))
+        thread = RestorePlanThread(self, self.sid, paths)
+        setText = lambda plan: label.setText(str(plan))
+        thread.planReady.connect(setText)
+        thread.start()
+
+        def stop():
+            #drop pending results before the label gets destroyed
+            thread.planReady.disconnect(setText)
+            thread.cancel()
+            thread.finished.connect(thread.deleteLater)
+            if thread.isFinished():
+                thread.deleteLater()
+        return {'widget': label, 'retFunc': stop, 'id': 'plan'}
+
     def confirm_delete_on_restore(self, paths, warn_root = False):
         msg = _('Are you sure you want to remove all newer files in your '
                 'original folder?')
@@ -947,7 +1039,8 @@ class MainWindow( QMainWindow ):
         msg += '\n'
         msg += '\n'.join(paths)
 
-        confirm, opt = messagebox.warningYesNoOptions(self, msg, (self.backup_on_restore(), ) )
+        confirm, opt = messagebox.warningYesNoOptions(self, msg, (self.restore_plan(paths),
+                                                                  self.backup_on_restore()))
         ret = {'backup': False, 'no_backup': False}
         if self.config.is_backup_on_restore_enabled():
             if not opt['backup']:
@@ -961,7 +1054,8 @@ class MainWindow( QMainWindow ):
         msg = _('Do you really want to restore this files(s):')
         msg += '\n'
         msg += '\n'.join(paths)
-        confirm, opt = messagebox.warningYesNoOptions(self, msg, (self.backup_on_restore(), ) )
+        confirm, opt = messagebox.warningYesNoOptions(self, msg, (self.restore_plan(paths),
+                                                                  self.backup_on_restore()))
         ret = {'backup': False, 'no_backup': False}
         if self.config.is_backup_on_restore_enabled():
             if not opt['backup']:
@@ -1044,6 +1138,22 @@ class MainWindow( QMainWindow ):
                 self.list_time_line.setCurrentSnapshotID(dlg.sid)
         self.setMouseButtonNavigation()
 
+    def on_edit_search_return_pressed(self):
+        pattern = self.edit_search.text()
+        if not pattern:
+            return
+
+        self.removeMouseButtonNavigation()
+        dlg = searchdialog.SearchDialog(self, pattern)
+        if QDialog.Accepted == dlg.exec_() and not dlg.path is None:
+            self.path = os.path.dirname(dlg.path)
+            self.path_history.append(self.path)
+            if dlg.sid != self.sid:
+                self.sid = dlg.sid
+                self.list_time_line.setCurrentSnapshotID(dlg.sid)
+            self.update_files_view(2, os.path.basename(dlg.path))
+        self.setMouseButtonNavigation()
+
     def on_btn_folder_up_clicked( self ):
         if len( self.path ) <= 1:
             return
@@ -1162,27 +1272,35 @@ class MainWindow( QMainWindow ):
         #update files view
         full_path = self.sid.pathBackup(self.path)
 
-        if os.path.isdir( full_path ):
+        #snapshots are listed in background and will call
+        #on_dir_lister_failed if self.path is no folder
+        if self.sid.isRoot:
+            is_dir = os.path.isdir( full_path )
+        else:
+            is_dir = True
+
+        if is_dir:
             if self.show_hidden_files:
                 self.list_files_view_proxy_model.setFilterRegExp(r'')
             else:
                 self.list_files_view_proxy_model.setFilterRegExp(r'^[^\.]')
 
-            model_index = self.list_files_view_model.index(full_path)
-            proxy_model_index = self.list_files_view_proxy_model.mapFromSource(model_index)
-            self.list_files_view.setRootIndex(proxy_model_index)
+            if self.sid.isRoot:
+                self.set_files_view_model(self.list_files_view_model)
+                model_index = self.list_files_view_model.index(full_path)
+                proxy_model_index = self.list_files_view_proxy_model.mapFromSource(model_index)
+                self.list_files_view.setRootIndex(proxy_model_index)
+            else:
+                self.set_files_view_model(self.snapshot_view_model)
+                self.list_files_view.setRootIndex(QModelIndex())
+                self.snapshot_view_model.setPath(self.sid, self.path)
 
             self.files_view_toolbar.setEnabled( False )
             self.files_view_layout.setCurrentWidget( self.list_files_view )
             #TODO: find a signal for this
             self.on_dir_lister_completed()
         else:
-            self.btn_restore_menu.setEnabled( False )
-            self.menubar_restore.setEnabled(False)
-            self.btn_restore.setEnabled(False)
-            self.btn_restore_to.setEnabled(False)
-            self.btn_snapshots.setEnabled( False )
-            self.files_view_layout.setCurrentWidget( self.lbl_folder_dont_exists )
+            self.on_dir_lister_failed()
 
         #show current path
         self.edit_current_path.setText( self.path )
@@ -1193,6 +1311,27 @@ class MainWindow( QMainWindow ):
         #update folder_up button state
         self.btn_folder_up.setEnabled( len( self.path ) > 1 )
 
+    def set_files_view_model(self, model):
+        """
+        Switch the files view between QFileSystemModel ('Now') and
+        SnapshotViewModel (snapshots) but keep the column widths.
+        """
+        if self.list_files_view_proxy_model.sourceModel() is model:
+            return
+        widths = [self.list_files_view_header.sectionSize(i) for i in range(3)]
+        self.list_files_view_proxy_model.setSourceModel(model)
+        for i, width in enumerate(widths):
+            self.list_files_view_header.resizeSection(i, width)
+
+    def on_dir_lister_failed(self):
+        self.btn_restore_menu.setEnabled( False )
+        self.menubar_restore.setEnabled(False)
+        self.btn_restore.setEnabled(False)
+        self.btn_restore_to.setEnabled(False)
+        self.btn_snapshots.setEnabled( False )
+        self.files_view_toolbar.setEnabled( True )
+        self.files_view_layout.setCurrentWidget( self.lbl_folder_dont_exists )
+
     def on_dir_lister_completed( self ):
         has_files = (self.list_files_view_proxy_model.rowCount(self.list_files_view.rootIndex() ) > 0 )
 
@@ -1383,6 +1522,25 @@ class RemoveSnapshotThread(QThread):
         if self.config.inhibitCookie:
             self.config.inhibitCookie = tools.unInhibitSuspend(*self.config.inhibitCookie)
 
+class RestorePlanThread(QThread):
+    """
+    calculate size and estimated duration of a restore in background
+    """
+    planReady = pyqtSignal(object)
+    def __init__(self, parent, sid, paths):
+        self.sid = sid
+        self.paths = paths
+        self.cancelEvent = threading.Event()
+        super(RestorePlanThread, self).__init__(parent)
+
+    def run(self):
+        plan = restoreplan.plan(self.sid, self.paths, self.cancelEvent)
+        if plan.done:
+            self.planReady.emit(plan)
+
+    def cancel(self):
+        self.cancelEvent.set()
+
 class FillTimeLineThread(QThread):
     """
     add snapshot IDs to timeline in background
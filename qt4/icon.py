@@ -36,6 +36,8 @@ REMOVE_SNAPSHOT     = QIcon.fromTheme('edit-delete')
 VIEW_SNAPSHOT_LOG   = QIcon.fromTheme('text-plain',
                       QIcon.fromTheme('text-x-generic') )
 VIEW_LAST_LOG       = QIcon.fromTheme('document-new')
+COMPARE_SNAPSHOTS   = QIcon.fromTheme('edit-find-replace',
+                      QIcon.fromTheme('view-split-left-right') )
 SETTINGS            = QIcon.fromTheme('gtk-preferences',
                       QIcon.fromTheme('configure') )
 SHUTDOWN            = QIcon.fromTheme('system-shutdown')
@@ -60,6 +62,8 @@ SHOW_HIDDEN         = QIcon.fromTheme('show-hidden',
                       QIcon.fromTheme('list-add'))
 RESTORE             = QIcon.fromTheme('edit-undo')
 RESTORE_TO          = QIcon.fromTheme('document-revert')
+SEARCH              = QIcon.fromTheme('edit-find',
+                      QIcon.fromTheme('system-search') )
 SNAPSHOTS           = QIcon.fromTheme('file-manager',
                       QIcon.fromTheme('view-list-details',
                       QIcon.fromTheme('system-file-manager') ) )
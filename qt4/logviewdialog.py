@@ -17,6 +17,7 @@
 
 
 import gettext
+import time
 
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
@@ -39,6 +40,7 @@ class LogViewDialog( QDialog ):
         self.sid = sid
         self.enable_update = False
         self.decode = None
+        self.thread = None
 
         w = self.config.get_int_value('qt4.logview.width', 800)
         h = self.config.get_int_value('qt4.logview.height', 500)
@@ -101,10 +103,23 @@ class LogViewDialog( QDialog ):
         #
         self.main_layout.addWidget( QLabel(_('[E] Error, [I] Information, [C] Change')) )
 
+        layout = QHBoxLayout()
+        self.main_layout.addLayout(layout)
+
         #decode path
         self.cb_decode = QCheckBox( _('decode paths'), self )
         QObject.connect( self.cb_decode, SIGNAL('stateChanged(int)'), self.on_cb_decode )
-        self.main_layout.addWidget(self.cb_decode)
+        layout.addWidget(self.cb_decode)
+        layout.addStretch()
+
+        #loading progress
+        self.lbl_loading = QLabel(_('Loading log...'), self)
+        layout.addWidget(self.lbl_loading)
+        self.btn_cancel = QPushButton(_('Cancel'), self)
+        QObject.connect(self.btn_cancel, SIGNAL('clicked()'), self.stop_update_log)
+        layout.addWidget(self.btn_cancel)
+        self.lbl_loading.hide()
+        self.btn_cancel.hide()
 
         #buttons
         button_box = QDialogButtonBox(QDialogButtonBox.Close)
@@ -116,6 +131,7 @@ class LogViewDialog( QDialog ):
         self.update_profiles()
 
     def on_cb_decode(self):
+        self.stop_update_log()
         if self.cb_decode.isChecked():
             self.decode = encfstools.Decode(self.config)
         else:
@@ -180,14 +196,85 @@ class LogViewDialog( QDialog ):
         if not self.enable_update:
             return
 
+        self.stop_update_log()
+        self.txt_log_view.clear()
+
         mode = self.combo_filter.itemData( self.combo_filter.currentIndex() )
 
         if self.sid is None:
-            self.txt_log_view.setPlainText(self.snapshots.get_take_snapshot_log(mode, self.combo_profiles.currentProfileID(), decode = self.decode) )
+            lines = self.snapshots.iter_take_snapshot_log(mode, self.combo_profiles.currentProfileID(), decode = self.decode)
         else:
-            self.txt_log_view.setPlainText(self.sid.log(mode, decode = self.decode))
+            lines = self.sid.iterLog(mode, decode = self.decode)
+
+        self.thread = LoadLogThread(self, lines)
+        self.thread.appendLines.connect(self.txt_log_view.appendPlainText)
+        self.thread.finished.connect(self.update_log_finished)
+        self.lbl_loading.show()
+        self.btn_cancel.show()
+        self.thread.start()
+
+    def update_log_finished(self):
+        if self.thread is None or self.thread.isFinished():
+            self.lbl_loading.hide()
+            self.btn_cancel.hide()
+
+    def stop_update_log(self):
+        """
+        cancel loading the log and wait until the thread is done
+        """
+        if not self.thread is None:
+            self.thread.cancel()
+            self.thread.wait()
+            self.thread = None
+        self.lbl_loading.hide()
+        self.btn_cancel.hide()
 
     def closeEvent(self, event):
+        self.stop_update_log()
         self.config.set_int_value('qt4.logview.width', self.width())
         self.config.set_int_value('qt4.logview.height', self.height())
         event.accept()
+
+class LoadLogThread(QThread):
+    """
+    read, filter and decode log lines in background and add them
+    progressively to the log view.
+    """
+    appendLines = pyqtSignal(str)
+    #emit collected lines at least after this number of lines or seconds
+    CHUNK_LINES = 500
+    CHUNK_TIME = 0.2
+
+    def __init__(self, parent, lines):
+        self.lines = lines
+        self.cancelled = False
+        super(LoadLogThread, self).__init__(parent)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        chunk = []
+        last = time.time()
+        try:
+            for line in self.lines:
+                if self.cancelled:
+                    break
+                chunk.append(line)
+                if len(chunk) >= self.CHUNK_LINES or time.time() - last >= self.CHUNK_TIME:
+                    self.emitChunk(chunk)
+                    chunk = []
+                    last = time.time()
+            else:
+                self.emitChunk(chunk)
+        finally:
+            self.lines.close()
+
+    def emitChunk(self, chunk):
+        if not chunk:
+            return
+        #appendPlainText will add a new paragraph on its own
+        text = ''.join(chunk)
+        if text.endswith('\n'):
+            text = text[:-1]
+        self.appendLines.emit(text)
@@ -42,6 +42,7 @@ class Qt4SysTrayIcon:
     def __init__( self ):
         self.snapshots = snapshots.Snapshots()
         self.config = self.snapshots.config
+        self.progress_segment = progress.ProgressSegment(self.config)
 
         if len( sys.argv ) > 1:
             if not self.config.set_current_profile(sys.argv[1]):
@@ -86,10 +87,15 @@ class Qt4SysTrayIcon:
         self.timer = QTimer()
         QObject.connect( self.timer, SIGNAL('timeout()'), self.update_info )
 
+        self.status_bus_thread = qt4tools.StatusBusThread(None, self.config)
+        self.status_bus_thread.statusEvent.connect(self.on_status_event)
+
         self.ppid = os.getppid()
 
     def prepare_exit( self ):
         self.timer.stop()
+        self.status_bus_thread.cancel()
+        self.status_bus_thread.wait()
 
         if not self.status_icon is None:
             self.status_icon.hide()
@@ -104,6 +110,7 @@ class Qt4SysTrayIcon:
     def run( self ):
         self.status_icon.show()
         self.timer.start( 500 )
+        self.status_bus_thread.start()
 
         logger.info("[qt4systrayicon] begin loop", self)
 
@@ -119,7 +126,10 @@ class Qt4SysTrayIcon:
             self.qapp.exit(0)
             return
 
-        message = self.snapshots.get_take_snapshot_message()
+        if self.status_bus_thread.connected:
+            message = self.status_bus_thread.takeSnapshotMessage()
+        else:
+            message = self.snapshots.get_take_snapshot_message()
         if message is None and self.last_message is None:
             message = ( 0, _('Working...') )
 
@@ -133,9 +143,11 @@ class Qt4SysTrayIcon:
                                                                         ))
                 self.status_icon.setToolTip( self.last_message[1] )
 
-        pg = progress.ProgressFile(self.config)
-        if pg.isFileReadable():
-            pg.load()
+        if self.status_bus_thread.connected:
+            pg = self.status_bus_thread.progress()
+        else:
+            pg = self.progress_segment.read()
+        if not pg is None:
             percent = pg.get_int_value('percent')
             if percent != self.progressBar.value():
                 self.progressBar.setValue(percent)
@@ -149,6 +161,14 @@ class Qt4SysTrayIcon:
             self.menuProgress.setVisible(False)
 
 
+    def on_status_event(self, event):
+        if self.status_bus_thread.connected:
+            self.timer.setInterval(qt4tools.StatusBusThread.TIMER_CONNECTED)
+        else:
+            self.timer.setInterval(500)
+        if not self.status_icon is None:
+            self.update_info()
+
     def getMenuProgress(self, pg):
         d = (('sent',   _('Sent:')), \
              ('speed',  _('Speed:')),\
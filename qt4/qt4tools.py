@@ -18,10 +18,12 @@
 import os
 import sys
 import gettext
+import threading
 from PyQt4.QtGui import QFont, QFileDialog, QListView, QAbstractItemView,      \
                         QTreeView, QDialog, QApplication, QStyleFactory,       \
                         QTreeWidget, QTreeWidgetItem, QColor, QComboBox
-from PyQt4.QtCore import QDir, SIGNAL, Qt, pyqtSlot, pyqtSignal, QModelIndex
+from PyQt4.QtCore import QDir, SIGNAL, Qt, pyqtSlot, pyqtSignal, QModelIndex, \
+                         QThread
 from datetime import datetime, date, timedelta
 from calendar import monthrange
 
@@ -40,6 +42,8 @@ def register_backintime_path(*path):
 
 register_backintime_path('common')
 import snapshots
+import progress
+import statusbus
 
 def get_font_bold( font ):
     font.setWeight( QFont.Bold )
@@ -394,3 +398,81 @@ class ProfileCombo(SortedComboBox):
             if self.itemData(i) == profileID:
                 self.setCurrentIndex(i)
                 break
+
+class StatusBusThread(QThread):
+    """
+    Subscribe to :py:class:`statusbus.StatusBus` of a running backup for
+    the current profile and emit :py:attr:`statusEvent` for every event.
+    As long as :py:attr:`connected` is ``False`` callers need to fall back
+    to poll message and progress files.
+    """
+    statusEvent = pyqtSignal(dict)
+    #seconds between two connection attempts
+    RETRY = 1.0
+    #milliseconds between two updates by timer while events are pushed
+    TIMER_CONNECTED = 5000
+
+    def __init__(self, parent, config):
+        self.config = config
+        self.connected = False
+        self.message = None
+        self.progressValues = None
+        self.client = None
+        self.cancelEvent = threading.Event()
+        super(StatusBusThread, self).__init__(parent)
+
+    def cancel(self):
+        self.cancelEvent.set()
+        self.reconnect()
+
+    def reconnect(self):
+        """
+        Drop the current connection, e.g. after the profile was changed.
+        """
+        client = self.client
+        if not client is None:
+            client.close()
+
+    def takeSnapshotMessage(self):
+        """
+        Latest message like :py:meth:`snapshots.Snapshots.get_take_snapshot_message`.
+        """
+        return self.message
+
+    def progress(self):
+        """
+        Latest progress like :py:meth:`progress.ProgressSegment.read`.
+        """
+        values = self.progressValues
+        if values is None:
+            return None
+        pg = progress.ProgressFile(self.config)
+        pg.set_int_value('status', progress.ProgressFile.RSYNC)
+        pg.set_int_value('percent', values.get('percent', 0))
+        for key in ('sent', 'speed', 'eta'):
+            pg.set_str_value(key, values.get(key, ''))
+        return pg
+
+    def run(self):
+        while not self.cancelEvent.is_set():
+            self.client = statusbus.StatusClient(self.config, self.config.get_current_profile())
+            if not self.client.connect():
+                self.client = None
+                self.cancelEvent.wait(self.RETRY)
+                continue
+            self.connected = True
+            for event in self.client.events():
+                if event['event'] == statusbus.MESSAGE:
+                    self.message = (event['type'], event['message'])
+                elif event['event'] == statusbus.PROGRESS:
+                    self.progressValues = event
+                elif event['event'] in (statusbus.PHASE, statusbus.FINISH) \
+                        and event.get('phase') != statusbus.PHASE_TRANSFER:
+                    self.progressValues = None
+                self.statusEvent.emit(event)
+            self.client.close()
+            self.client = None
+            self.connected = False
+            self.message = None
+            self.progressValues = None
+            self.statusEvent.emit({'event': 'disconnected'})
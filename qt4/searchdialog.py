@@ -0,0 +1,205 @@
+#    Back In Time
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import gettext
+import threading
+
+from PyQt4.QtGui import *
+from PyQt4.QtCore import *
+
+import snapshots
+import versionindex
+import logger
+
+_=gettext.gettext
+
+
+class SearchDialog(QDialog):
+    """
+    Search for files in all snapshots using the version index. The
+    selected file and snapshot will be in `path` and `sid` after the
+    dialog was accepted.
+    """
+    def __init__(self, parent, pattern = ''):
+        super(SearchDialog, self).__init__(parent)
+
+        self.config = parent.config
+        self.thread = None
+        self.path = None
+        self.sid = None
+
+        w = self.config.get_int_value('qt4.search.width', 800)
+        h = self.config.get_int_value('qt4.search.height', 500)
+        self.resize(w, h)
+
+        import icon
+        self.setWindowIcon(icon.SEARCH)
+        self.setWindowTitle(_('Search in all snapshots'))
+
+        self.main_layout = QVBoxLayout(self)
+
+        layout = QHBoxLayout()
+        self.main_layout.addLayout(layout)
+
+        self.edit_pattern = QLineEdit(pattern, self)
+        self.edit_pattern.setToolTip(_('Use * and ? as wildcards. The pattern is matched '
+                                       'against the full path if it contains a slash.'))
+        layout.addWidget(self.edit_pattern, 1)
+        QObject.connect(self.edit_pattern, SIGNAL('returnPressed()'), self.update_search)
+
+        self.cb_ignore_case = QCheckBox(_('Ignore case'), self)
+        self.cb_ignore_case.setChecked(self.config.get_bool_value('qt4.search.ignore_case', True))
+        layout.addWidget(self.cb_ignore_case)
+        QObject.connect(self.cb_ignore_case, SIGNAL('stateChanged(int)'), self.update_search)
+
+        self.btn_search = QPushButton(icon.SEARCH, _('Search'), self)
+        layout.addWidget(self.btn_search)
+        QObject.connect(self.btn_search, SIGNAL('clicked()'), self.update_search)
+
+        #results
+        self.list_results = QTreeWidget(self)
+        self.list_results.setRootIsDecorated(False)
+        self.list_results.setUniformRowHeights(True)
+        self.list_results.setHeaderLabels([_('Path'), _('First snapshot'),
+                                           _('Last snapshot'), _('Removed in')])
+        self.list_results.header().setResizeMode(0, QHeaderView.Stretch)
+        self.list_results.header().setStretchLastSection(False)
+        self.main_layout.addWidget(self.list_results)
+        QObject.connect(self.list_results, SIGNAL('itemActivated(QTreeWidgetItem*,int)'), self.on_item_activated)
+
+        self.lbl_status = QLabel(self)
+        self.main_layout.addWidget(self.lbl_status)
+
+        #buttons
+        button_box = QDialogButtonBox(QDialogButtonBox.Close)
+        self.btn_goto = button_box.addButton(_('Go To'), QDialogButtonBox.AcceptRole)
+        self.btn_goto.setEnabled(False)
+        self.main_layout.addWidget(button_box)
+        QObject.connect(button_box, SIGNAL('accepted()'), self.accept_selected)
+        QObject.connect(button_box, SIGNAL('rejected()'), self.close)
+        QObject.connect(self.list_results, SIGNAL('itemSelectionChanged()'),
+                        lambda: self.btn_goto.setEnabled(bool(self.list_results.selectedItems())))
+
+        if pattern:
+            self.update_search()
+
+    def update_search(self, *args):
+        pattern = self.edit_pattern.text()
+        if not pattern:
+            return
+        self.stop_search()
+        self.list_results.clear()
+        self.lbl_status.setText(_('Searching...'))
+        self.edit_pattern.setEnabled(False)
+        self.btn_search.setEnabled(False)
+
+        self.thread = SearchThread(self, pattern, self.cb_ignore_case.isChecked())
+        self.thread.finished.connect(self.update_search_finished)
+        self.thread.start()
+
+    def stop_search(self):
+        """
+        Cancel the running search without waiting for it. The thread will
+        stop as soon as it checks its cancel flag. It is handed over to
+        the main window so the dialog can be closed in the meantime.
+        """
+        if self.thread is None:
+            return
+        thread = self.thread
+        self.thread = None
+        thread.finished.disconnect(self.update_search_finished)
+        thread.cancel()
+        thread.setParent(self.parent())
+        thread.finished.connect(thread.deleteLater)
+
+    def update_search_finished(self):
+        self.edit_pattern.setEnabled(True)
+        self.btn_search.setEnabled(True)
+        if self.thread is None:
+            return
+        if self.thread.results is None:
+            self.lbl_status.setText(_('Search failed'))
+            return
+
+        snapshots_list = self.thread.snapshots_list
+        items = []
+        for path, ranges in self.thread.results:
+            for first, last in ranges:
+                item = QTreeWidgetItem()
+                item.setText(0, path)
+                item.setText(1, first.displayName)
+                item.setText(2, last.displayName)
+                if last in snapshots_list:
+                    index = snapshots_list.index(last)
+                    if index > 0:
+                        item.setText(3, snapshots_list[index - 1].displayName)
+                item.setData(0, Qt.UserRole, last)
+                items.append(item)
+        self.list_results.addTopLevelItems(items)
+        self.list_results.resizeColumnToContents(1)
+        self.list_results.resizeColumnToContents(2)
+        self.list_results.resizeColumnToContents(3)
+        self.lbl_status.setText(_('Found %(files)s files') % {'files': len(self.thread.results)})
+
+    def on_item_activated(self, item, column):
+        self.accept_item(item)
+
+    def accept_selected(self):
+        items = self.list_results.selectedItems()
+        if items:
+            self.accept_item(items[0])
+
+    def accept_item(self, item):
+        self.path = item.text(0)
+        self.sid = item.data(0, Qt.UserRole)
+        self.accept()
+
+    def done(self, result):
+        self.stop_search()
+        self.config.set_bool_value('qt4.search.ignore_case', self.cb_ignore_case.isChecked())
+        self.config.set_int_value('qt4.search.width', self.width())
+        self.config.set_int_value('qt4.search.height', self.height())
+        super(SearchDialog, self).done(result)
+
+class SearchThread(QThread):
+    """
+    search the version index in background. Snapshots which are not
+    indexed yet will be added first which might take a while. Can be
+    canceled at any time, snapshots which were indexed completely are kept.
+    """
+    def __init__(self, parent, pattern, ignoreCase):
+        self.config = parent.config
+        self.pattern = pattern
+        self.ignoreCase = ignoreCase
+        self.results = None
+        self.snapshots_list = []
+        self.cancelEvent = threading.Event()
+        super(SearchThread, self).__init__(parent)
+
+    def cancel(self):
+        self.cancelEvent.set()
+
+    def run(self):
+        try:
+            self.snapshots_list = snapshots.listSnapshots(self.config)
+            self.results = snapshots.Snapshots(self.config).search(self.pattern, self.ignoreCase,
+                                                                   self.cancelEvent)
+        except versionindex.Canceled:
+            logger.debug('Search canceled', self)
+        except Exception as e:
+            logger.error('Search failed: %s' % str(e), self)
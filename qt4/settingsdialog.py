@@ -702,7 +702,7 @@ class SettingsDialog( QDialog ):
         self.cb_run_ionice_on_remote = QCheckBox(_('on remote host') + self.printDefault(self.config.DEFAULT_RUN_IONICE_ON_REMOTE), self)
         grid.addWidget(self.cb_run_ionice_on_remote, 2, 1)
 
-        self.nocacheAvailable = tools.check_command('nocache')
+        self.nocacheAvailable = tools.TOOL_CAPS.available('nocache')
         label = QLabel(_("Run 'rsync' with 'nocache':"))
         layout.addWidget(label)
         grid = QGridLayout()
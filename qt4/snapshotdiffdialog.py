@@ -0,0 +1,215 @@
+#    Back In Time
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import gettext
+import time
+import threading
+
+from PyQt4.QtGui import *
+from PyQt4.QtCore import *
+
+import qt4tools
+import snapshots
+import snapshotdiff
+
+_=gettext.gettext
+
+
+class SnapshotDiffDialog(QDialog):
+    """
+    Show all changes between two snapshots.
+    """
+    def __init__(self, parent, sid):
+        super(SnapshotDiffDialog, self).__init__(parent)
+
+        self.config = parent.config
+        self.main_window = parent
+        self.thread = None
+        self.enable_update = False
+
+        w = self.config.get_int_value('qt4.snapshotdiff.width', 800)
+        h = self.config.get_int_value('qt4.snapshotdiff.height', 500)
+        self.resize(w, h)
+
+        import icon
+        self.setWindowIcon(icon.COMPARE_SNAPSHOTS)
+        self.setWindowTitle(_('Compare Snapshots'))
+
+        self.main_layout = QVBoxLayout(self)
+
+        layout = QHBoxLayout()
+        self.main_layout.addLayout(layout)
+
+        #snapshots
+        layout.addWidget(QLabel(_('From:'), self))
+        self.combo_from = qt4tools.SnapshotCombo(self)
+        layout.addWidget(self.combo_from, 1)
+        QObject.connect(self.combo_from, SIGNAL('currentIndexChanged(int)'), self.update_diff)
+
+        layout.addWidget(QLabel(_('To:'), self))
+        self.combo_to = qt4tools.SnapshotCombo(self)
+        layout.addWidget(self.combo_to, 1)
+        QObject.connect(self.combo_to, SIGNAL('currentIndexChanged(int)'), self.update_diff)
+
+        #summary
+        self.lbl_summary = QLabel(self)
+        self.main_layout.addWidget(self.lbl_summary)
+
+        #changes
+        self.list_changes = QTreeWidget(self)
+        self.list_changes.setRootIsDecorated(False)
+        self.list_changes.setUniformRowHeights(True)
+        self.list_changes.setHeaderLabels([_('Change'), _('Path')])
+        self.list_changes.header().setResizeMode(0, QHeaderView.ResizeToContents)
+        self.main_layout.addWidget(self.list_changes)
+
+        self.main_layout.addWidget(QLabel(_('[+] Added, [-] Removed, [M] Modified, '
+                                            '[m] Owner, group or permissions changed')))
+
+        layout = QHBoxLayout()
+        self.main_layout.addLayout(layout)
+        layout.addStretch()
+
+        #loading progress
+        self.lbl_loading = QLabel(_('Comparing snapshots...'), self)
+        layout.addWidget(self.lbl_loading)
+        self.btn_cancel = QPushButton(_('Cancel'), self)
+        QObject.connect(self.btn_cancel, SIGNAL('clicked()'), self.stop_update_diff)
+        layout.addWidget(self.btn_cancel)
+        self.lbl_loading.hide()
+        self.btn_cancel.hide()
+
+        #buttons
+        button_box = QDialogButtonBox(QDialogButtonBox.Close)
+        self.main_layout.addWidget(button_box)
+        QObject.connect(button_box, SIGNAL('rejected()'), self.close)
+
+        self.update_snapshots(sid)
+        self.enable_update = True
+        self.update_diff()
+
+    def update_snapshots(self, sid):
+        """
+        Compare `sid` with the snapshot before. If `sid` is the oldest
+        snapshot compare it with the next one.
+        """
+        snapshots_list = snapshots.listSnapshots(self.config)
+        for s in snapshots_list:
+            self.combo_from.addSnapshotID(s)
+            self.combo_to.addSnapshotID(s)
+        sid_from = sid_to = sid
+        if sid in snapshots_list:
+            index = snapshots_list.index(sid)
+            if index + 1 < len(snapshots_list):
+                sid_from = snapshots_list[index + 1]
+            elif index > 0:
+                sid_to = snapshots_list[index - 1]
+        self.combo_from.setCurrentSnapshotID(sid_from)
+        self.combo_to.setCurrentSnapshotID(sid_to)
+
+    def update_diff(self, *args):
+        if not self.enable_update:
+            return
+
+        self.stop_update_diff()
+        self.list_changes.clear()
+        self.lbl_summary.clear()
+
+        sid1 = self.combo_from.currentSnapshotID()
+        sid2 = self.combo_to.currentSnapshotID()
+        if sid1 is None or sid2 is None:
+            return
+
+        self.thread = DiffThread(self, sid1, sid2)
+        self.thread.appendChanges.connect(self.append_changes)
+        self.thread.finished.connect(self.update_diff_finished)
+        self.lbl_loading.show()
+        self.btn_cancel.show()
+        self.thread.start()
+
+    def append_changes(self, changes):
+        items = []
+        for symbol, path in changes:
+            item = QTreeWidgetItem()
+            item.setText(0, symbol)
+            item.setTextAlignment(0, Qt.AlignHCenter)
+            item.setText(1, path)
+            items.append(item)
+        self.list_changes.addTopLevelItems(items)
+
+    def update_diff_finished(self):
+        if self.thread is None or not self.thread.isFinished():
+            return
+        self.lbl_loading.hide()
+        self.btn_cancel.hide()
+        summary = _('Added: %(added)s, Removed: %(removed)s, Modified: %(modified)s, '
+                    'Owner, group or permissions: %(metadata)s') % self.thread.diff.summary
+        if self.thread.diff.canceled:
+            summary += ' (%s)' % _('canceled')
+        self.lbl_summary.setText(summary)
+
+    def stop_update_diff(self):
+        """
+        cancel comparing and wait until the thread is done
+        """
+        if not self.thread is None:
+            self.thread.cancel()
+            self.thread.wait()
+            self.update_diff_finished()
+            self.thread = None
+        self.lbl_loading.hide()
+        self.btn_cancel.hide()
+
+    def closeEvent(self, event):
+        self.stop_update_diff()
+        self.config.set_int_value('qt4.snapshotdiff.width', self.width())
+        self.config.set_int_value('qt4.snapshotdiff.height', self.height())
+        event.accept()
+
+class DiffThread(QThread):
+    """
+    compare two snapshots in background and add changes progressively
+    to the list.
+    """
+    appendChanges = pyqtSignal(list)
+    #emit collected changes at least after this number of changes or seconds
+    CHUNK_ITEMS = 500
+    CHUNK_TIME = 0.2
+
+    def __init__(self, parent, sid1, sid2):
+        self.cancelEvent = threading.Event()
+        self.diff = snapshotdiff.SnapshotDiff(sid1, sid2, cancel = self.cancelEvent)
+        super(DiffThread, self).__init__(parent)
+
+    def cancel(self):
+        self.cancelEvent.set()
+
+    def run(self):
+        chunk = []
+        last = time.time()
+        for change in self.diff:
+            path = change.path
+            if change.isDir:
+                path += '/'
+            chunk.append((snapshotdiff.SYMBOLS[change.type], path))
+            if len(chunk) >= self.CHUNK_ITEMS or time.time() - last >= self.CHUNK_TIME:
+                self.appendChanges.emit(chunk)
+                chunk = []
+                last = time.time()
+        if chunk:
+            self.appendChanges.emit(chunk)
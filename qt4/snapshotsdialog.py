@@ -18,6 +18,7 @@
 
 import os
 import gettext
+import threading
 
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
@@ -91,6 +92,7 @@ class SnapshotsDialog( QDialog ):
 
         self.sid = sid
         self.path = path
+        self.thread = None
 
         self.setWindowIcon(icon.SNAPSHOTS)
         self.setWindowTitle(_('Snapshots'))
@@ -205,6 +207,7 @@ class SnapshotsDialog( QDialog ):
         self.combo_diff.checkSelection()
 
     def update_snapshots( self ):
+        self.stop_update_snapshots()
         self.list_snapshots.clear()
         self.combo_diff.clear()
 
@@ -213,16 +216,47 @@ class SnapshotsDialog( QDialog ):
             equal_to = equal_to_sid.pathBackup(self.path)
         else:
             equal_to = False
-        snapshots_filtered = self.snapshots.filter_for(self.sid, self.path,
-                                self.snapshots_list,
-                                self.cb_only_different_snapshots.isChecked(),
-                                self.cb_only_different_snapshots_deep_check.isChecked(),
-                                equal_to)
-        for sid in snapshots_filtered:
-            self.add_snapshot_(sid)
 
+        #filter in background and add snapshots as soon as they are found
+        self.thread = FilterForThread(self,
+                                      self.cb_only_different_snapshots.isChecked(),
+                                      self.cb_only_different_snapshots_deep_check.isChecked(),
+                                      equal_to)
+        self.thread.addSnapshot.connect(self.on_thread_add_snapshot)
+        self.thread.finished.connect(self.update_snapshots_finished)
+        self.setCursor(Qt.BusyCursor)
+        self.thread.start()
+
+        self.update_toolbar()
+
+    def on_thread_add_snapshot(self, sid):
+        #ignore pending signals from a canceled thread
+        if self.thread is None or self.sender() != self.thread:
+            return
+        self.add_snapshot_(sid)
+
+    def update_snapshots_finished(self):
+        if self.thread is None or not self.thread.isFinished():
+            return
+        self.unsetCursor()
         self.update_toolbar()
 
+    def stop_update_snapshots(self):
+        """
+        Cancel filtering snapshots without waiting for it. The thread will
+        stop as soon as it checks its cancel flag. It is handed over to
+        the main window so the dialog can be closed in the meantime.
+        """
+        if not self.thread is None:
+            thread = self.thread
+            self.thread = None
+            thread.addSnapshot.disconnect(self.on_thread_add_snapshot)
+            thread.finished.disconnect(self.update_snapshots_finished)
+            thread.cancel()
+            thread.setParent(self.parent())
+            thread.finished.connect(thread.deleteLater)
+        self.unsetCursor()
+
     def update_combo_equal_to(self):
         self.combo_equal_to.clear()
         snapshots_filtered = self.snapshots.filter_for(self.sid, self.path, self.snapshots_list)
@@ -381,6 +415,48 @@ class SnapshotsDialog( QDialog ):
             self.sid = sid
         super(SnapshotsDialog, self).accept()
 
+    def done(self, result):
+        self.stop_update_snapshots()
+        super(SnapshotsDialog, self).done(result)
+
+class FilterForThread(QThread):
+    """
+    run :py:meth:`snapshots.Snapshots.iter_filter_for` in background and
+    add matching snapshots progressively. Deep check might take a long
+    time so it can be canceled whenever the filter changes.
+    """
+    addSnapshot = pyqtSignal(object)
+
+    def __init__(self, parent, list_diff_only, flag_deep_check, list_equal_to):
+        self.snapshots = parent.snapshots
+        self.sid = parent.sid
+        self.path = parent.path
+        self.snapshots_list = parent.snapshots_list
+        self.list_diff_only = list_diff_only
+        self.flag_deep_check = flag_deep_check
+        self.list_equal_to = list_equal_to
+        self.cancelEvent = threading.Event()
+        super(FilterForThread, self).__init__(parent)
+
+    def cancel(self):
+        self.cancelEvent.set()
+
+    def run(self):
+        it = self.snapshots.iter_filter_for(self.sid, self.path,
+                                            self.snapshots_list,
+                                            self.list_diff_only,
+                                            self.flag_deep_check,
+                                            self.list_equal_to,
+                                            self.cancelEvent)
+        try:
+            for sid in it:
+                if self.cancelEvent.is_set():
+                    break
+                self.addSnapshot.emit(sid)
+        finally:
+            #close hash cache in this thread
+            it.close()
+
 class RemoveFileThread(QThread):
     """
     remove files in background thread so GUI will not freeze
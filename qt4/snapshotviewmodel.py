@@ -0,0 +1,188 @@
+#    Back In Time
+#    Copyright (C) 2012-2016 Germar Reitze
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import gettext
+import stat
+
+from PyQt4.QtGui import *
+from PyQt4.QtCore import *
+
+import snapshots
+import restoreplan
+import logger
+
+_=gettext.gettext
+
+
+class SnapshotViewModel(QAbstractTableModel):
+    """
+    Files view model for one folder inside a snapshot. Unlike
+    QFileSystemModel this doesn't go through the sshfs/encfs mount for
+    every item but uses :py:class:`snapshots.SnapshotView`, which caches
+    folder listings and shows owner, group and permissions from
+    fileinfo. Folders are listed in background.
+
+    The first four columns match QFileSystemModel.
+    """
+    COL_NAME, COL_SIZE, COL_TYPE, COL_DATE, COL_USER, COL_GROUP, COL_MODE = range(7)
+
+    directoryLoaded = pyqtSignal()
+    directoryFailed = pyqtSignal()
+
+    def __init__(self, parent):
+        super(SnapshotViewModel, self).__init__(parent)
+        self.snapshots = parent.snapshots
+        self.headers = [_('Name'), _('Size'), _('Type'), _('Date Modified'),
+                        _('Owner'), _('Group'), _('Permissions')]
+        self.view = None
+        self.path = None
+        self.entries = []
+        self.thread = None
+        self.sortColumn = self.COL_NAME
+        self.sortOrder = Qt.AscendingOrder
+        iconProvider = QFileIconProvider()
+        self.icons = {stat.S_IFDIR: iconProvider.icon(QFileIconProvider.Folder),
+                      stat.S_IFREG: iconProvider.icon(QFileIconProvider.File)}
+
+    def snapshotView(self, sid):
+        if self.view is None or self.view.sid != sid or self.view.sid.profileID != sid.profileID:
+            self.view = snapshots.SnapshotView(self.snapshots, sid)
+        return self.view
+
+    def setPath(self, sid, path):
+        """
+        Show folder `path` from snapshot `sid`. :py:attr:`directoryLoaded`
+        will be emitted as soon as the folder is listed or
+        :py:attr:`directoryFailed` if `path` is no folder in `sid`.
+        """
+        view = self.snapshotView(sid)
+        self.path = path
+        self.beginResetModel()
+        self.entries = []
+        self.endResetModel()
+        if not self.thread is None:
+            self.thread.finished.disconnect(self.on_thread_finished)
+        self.thread = ListDirThread(self, view, path)
+        self.thread.finished.connect(self.on_thread_finished)
+        self.thread.start()
+
+    def on_thread_finished(self):
+        thread = self.thread
+        self.thread = None
+        if thread is None or thread.path != self.path:
+            return
+        if thread.error:
+            logger.debug('Failed to list %s: %s' %(thread.path, thread.error), self)
+            self.directoryFailed.emit()
+            return
+        self.beginResetModel()
+        self.entries = self.sorted(thread.entries)
+        self.endResetModel()
+        self.directoryLoaded.emit()
+
+    def rowCount(self, parent = QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.entries)
+
+    def columnCount(self, parent = QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role = Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == self.COL_NAME:
+                return entry.name
+            if column == self.COL_SIZE:
+                if stat.S_ISDIR(entry.mode):
+                    return ''
+                return restoreplan.formatSize(entry.size)
+            if column == self.COL_TYPE:
+                return self.typeName(entry)
+            if column == self.COL_DATE:
+                return QDateTime.fromTime_t(int(entry.mtime)).toString(Qt.SystemLocaleShortDate)
+            if column == self.COL_USER:
+                return entry.user
+            if column == self.COL_GROUP:
+                return entry.group
+            if column == self.COL_MODE:
+                return stat.filemode(entry.mode)
+        elif role == Qt.DecorationRole and column == self.COL_NAME:
+            return self.icons.get(stat.S_IFMT(entry.mode), self.icons[stat.S_IFREG])
+        elif role == Qt.ToolTipRole and column == self.COL_NAME and entry.target is not None:
+            return '%s -> %s' %(entry.name, entry.target)
+        elif role == Qt.TextAlignmentRole and column == self.COL_SIZE:
+            return Qt.AlignRight | Qt.AlignVCenter
+        return None
+
+    def typeName(self, entry):
+        if stat.S_ISDIR(entry.mode):
+            return _('Folder')
+        if stat.S_ISLNK(entry.mode):
+            return _('Symlink')
+        return _('File')
+
+    def sort(self, column, order = Qt.AscendingOrder):
+        self.sortColumn = column
+        self.sortOrder = order
+        self.layoutAboutToBeChanged.emit()
+        self.entries = self.sorted(self.entries)
+        self.layoutChanged.emit()
+
+    def sorted(self, entries):
+        """
+        Sort like QFileSystemModel with folders first.
+        """
+        keys = {self.COL_SIZE: lambda e: e.size,
+                self.COL_TYPE: self.typeName,
+                self.COL_DATE: lambda e: e.mtime,
+                self.COL_USER: lambda e: e.user,
+                self.COL_GROUP: lambda e: e.group,
+                self.COL_MODE: lambda e: e.mode}
+        key = keys.get(self.sortColumn, lambda e: e.name.lower())
+        reverse = self.sortOrder == Qt.DescendingOrder
+        ret = sorted(entries, key = lambda e: (key(e), e.name), reverse = reverse)
+        ret.sort(key = lambda e: not stat.S_ISDIR(e.mode))
+        return ret
+
+class ListDirThread(QThread):
+    """
+    list one folder in background.
+    """
+    def __init__(self, parent, view, path):
+        self.view = view
+        self.path = path
+        self.entries = []
+        self.error = None
+        super(ListDirThread, self).__init__(parent)
+
+    def run(self):
+        try:
+            self.entries = self.view.listdir(self.path)
+        except OSError as e:
+            self.error = str(e)